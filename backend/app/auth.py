@@ -0,0 +1,165 @@
+# backend/app/auth.py
+"""
+Verificação local (in-process) dos JWTs emitidos pelo Supabase Auth.
+
+Evita o round-trip `supabase.auth.get_user(token)` em cada requisição:
+- Tokens HS256 são verificados com o segredo do projeto (SUPABASE_JWT_SECRET).
+- Tokens assimétricos (RS256/ES256) são verificados com o JWKS do projeto, mantido em cache.
+- Tokens já verificados ficam num cache TTL limitado, válido no máximo até o `exp` do token.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import jwt
+from cachetools import TLRUCache
+from gotrue.types import User
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+# "local": verifica assinatura/expiração no processo. "remote": sempre usa supabase.auth.get_user.
+AUTH_MODE: str = os.getenv("SUPABASE_AUTH_MODE", "local").strip().lower()
+# Só recorre ao get_user remoto quando a verificação local não é possível (sem segredo/JWKS) e isto estiver ativo.
+AUTH_REMOTE_FALLBACK: bool = os.getenv("SUPABASE_AUTH_REMOTE_FALLBACK", "false").strip().lower() in ("1", "true", "yes")
+JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+JWT_AUDIENCE: str = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_LEEWAY_SECONDS: int = int(os.getenv("SUPABASE_JWT_LEEWAY_SECONDS", "10"))
+_supabase_url: str = os.getenv("SUPABASE_URL", "")
+JWKS_URL: str = os.getenv("SUPABASE_JWKS_URL", "") or (
+    f"{_supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json" if _supabase_url else ""
+)
+JWKS_CACHE_TTL_SECONDS: int = int(os.getenv("SUPABASE_JWKS_CACHE_TTL_SECONDS", "600"))
+TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_TOKEN_CACHE_MAX_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL_SECONDS: int = int(os.getenv("AUTH_TOKEN_CACHE_MAX_TTL_SECONDS", "300"))
+
+_ASYMMETRIC_ALGORITHMS = ["RS256", "RS384", "RS512", "ES256", "ES384", "ES512", "EdDSA"]
+
+
+class TokenVerificationError(Exception):
+    """Token inválido, expirado ou com claims inesperadas."""
+    pass
+
+
+class LocalVerificationUnavailable(TokenVerificationError):
+    """Não há material de chave (segredo ou JWKS) para verificar o token localmente."""
+    pass
+
+
+def _token_ttu(_key: str, value: Tuple[User, float], now: float) -> float:
+    # Cada entrada expira no `exp` do token, limitado pelo TTL máximo configurado.
+    _, exp = value
+    return min(exp, now + TOKEN_CACHE_MAX_TTL_SECONDS)
+
+
+# Cache de tokens já verificados: sha256(token) -> (User, exp). Acessado apenas pelo event loop.
+_token_cache: TLRUCache = TLRUCache(maxsize=TOKEN_CACHE_MAX_SIZE, ttu=_token_ttu, timer=time.time)
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+
+def _cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _get_jwks_client() -> jwt.PyJWKClient:
+    global _jwks_client
+    if _jwks_client is None:
+        _jwks_client = jwt.PyJWKClient(JWKS_URL, cache_keys=True, lifespan=JWKS_CACHE_TTL_SECONDS)
+    return _jwks_client
+
+
+def _user_from_claims(claims: Dict[str, Any]) -> User:
+    """Monta o objeto gotrue User a partir das claims do JWT do Supabase."""
+    aud = claims.get("aud", "")
+    if isinstance(aud, list):
+        aud = aud[0] if aud else ""
+    issued_at = datetime.fromtimestamp(claims.get("iat", time.time()), tz=timezone.utc)
+    return User(
+        id=claims["sub"],
+        app_metadata=claims.get("app_metadata") or {},
+        user_metadata=claims.get("user_metadata") or {},
+        aud=aud,
+        email=claims.get("email") or None,
+        phone=claims.get("phone") or None,
+        role=claims.get("role"),
+        is_anonymous=bool(claims.get("is_anonymous", False)),
+        created_at=issued_at,
+    )
+
+
+def _decode(token: str, key: Any, algorithms: list) -> Dict[str, Any]:
+    return jwt.decode(
+        token,
+        key,
+        algorithms=algorithms,
+        audience=JWT_AUDIENCE or None,
+        leeway=JWT_LEEWAY_SECONDS,
+        options={"require": ["exp", "sub"], "verify_aud": bool(JWT_AUDIENCE)},
+    )
+
+
+def _decode_with_jwks(token: str, algorithm: str) -> Dict[str, Any]:
+    # PyJWKClient faz I/O síncrono quando a chave não está em cache; por isso roda em thread.
+    signing_key = _get_jwks_client().get_signing_key_from_jwt(token)
+    return _decode(token, signing_key.key, [algorithm])
+
+
+def get_cached_user(token: str) -> Optional[User]:
+    """Retorna o usuário de um token já verificado e ainda válido, ou None."""
+    entry = _token_cache.get(_cache_key(token))
+    return entry[0] if entry else None
+
+
+def cache_verified_user(token: str, user: User, exp: Optional[float] = None) -> None:
+    """Guarda um usuário verificado (localmente ou via get_user remoto) até o `exp` do token."""
+    if exp is None:
+        try:
+            exp = float(jwt.decode(token, options={"verify_signature": False}).get("exp", 0))
+        except jwt.PyJWTError:
+            return
+    if exp > time.time():
+        _token_cache[_cache_key(token)] = (user, exp)
+
+
+def clear_token_cache() -> None:
+    _token_cache.clear()
+
+
+async def verify_token_locally(token: str) -> User:
+    """
+    Verifica assinatura, expiração e audiência do JWT sem chamar o Supabase Auth.
+    Levanta TokenVerificationError se o token for inválido e
+    LocalVerificationUnavailable se não houver segredo/JWKS configurado para o algoritmo do token.
+    """
+    cached = get_cached_user(token)
+    if cached is not None:
+        return cached
+
+    try:
+        algorithm = jwt.get_unverified_header(token).get("alg", "")
+    except jwt.PyJWTError as e:
+        raise TokenVerificationError(f"Cabeçalho JWT inválido: {e}") from e
+
+    try:
+        if algorithm == "HS256":
+            if not JWT_SECRET:
+                raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET não configurado para tokens HS256.")
+            claims = _decode(token, JWT_SECRET, ["HS256"])
+        elif algorithm in _ASYMMETRIC_ALGORITHMS:
+            if not JWKS_URL:
+                raise LocalVerificationUnavailable("URL do JWKS não configurada (SUPABASE_URL ou SUPABASE_JWKS_URL).")
+            claims = await asyncio.to_thread(_decode_with_jwks, token, algorithm)
+        else:
+            raise TokenVerificationError(f"Algoritmo JWT não suportado: '{algorithm}'.")
+    except jwt.PyJWKClientConnectionError as e:
+        raise LocalVerificationUnavailable(f"Falha ao obter o JWKS: {e}") from e
+    except jwt.PyJWTError as e:
+        raise TokenVerificationError(str(e)) from e
+
+    user = _user_from_claims(claims)
+    cache_verified_user(token, user, float(claims["exp"]))
+    return user
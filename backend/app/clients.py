@@ -0,0 +1,176 @@
+# backend/app/clients.py
+"""
+Clientes de longa duração compartilhados por todo o processo.
+
+O `lifespan` de app/main.py chama `startup()`/`shutdown()`; as rotas acessam os clientes
+pelas dependências de app/dependencies.py e os serviços por `get_supabase()`/`get_db_pool()`.
+Assim, sessões HTTP (TLS) e conexões Postgres são reutilizadas entre requisições.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+from supabase import create_client, Client as SupabaseClient
+from supabase.lib.client_options import SyncClientOptions
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Use 0 com o pooler do Supabase em modo "transaction" (pgbouncer não suporta prepared statements).
+DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_MAX_INACTIVE_CONNECTION_LIFETIME: float = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+DB_COMMAND_TIMEOUT: float = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+# Intervalo (s) do health check periódico do pool. 0 desativa.
+DB_HEALTH_CHECK_INTERVAL: float = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+DB_CLOSE_TIMEOUT: float = float(os.getenv("DB_CLOSE_TIMEOUT", "10"))
+
+_supabase_client: Optional[SupabaseClient] = None
+_db_pool: Optional[asyncpg.Pool] = None
+_db_healthy: bool = False
+_health_task: Optional[asyncio.Task] = None
+
+
+def _supabase_settings() -> tuple:
+    return os.getenv("SUPABASE_URL", ""), os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+
+
+def _db_dsn() -> str:
+    return os.getenv("SUPABASE_DB_CONNECTION_STRING", "")
+
+
+def get_supabase() -> Optional[SupabaseClient]:
+    """
+    Retorna o cliente Supabase compartilhado. É criado no lifespan; se o lifespan não rodou
+    (ex: testes com ASGITransport), é criado sob demanda na primeira chamada.
+    Retorna None se SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY não estiverem configuradas.
+    """
+    global _supabase_client
+    if _supabase_client is None:
+        url, key = _supabase_settings()
+        if not url or not key:
+            return None
+        # Cliente de servidor (service role): sem persistência/refresh de sessão de usuário.
+        options = SyncClientOptions(auto_refresh_token=False, persist_session=False)
+        _supabase_client = create_client(url, key, options=options)
+        logger.info("Cliente Supabase compartilhado criado.")
+    return _supabase_client
+
+
+def get_db_pool() -> Optional[asyncpg.Pool]:
+    """Retorna o pool asyncpg compartilhado, ou None se não foi inicializado."""
+    return _db_pool
+
+
+def is_db_healthy() -> bool:
+    return _db_pool is not None and _db_healthy
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # JSON/JSONB decodificados como objetos Python (ex: documents.metadata).
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def init_db_pool() -> Optional[asyncpg.Pool]:
+    """Cria o pool asyncpg para SUPABASE_DB_CONNECTION_STRING (idempotente)."""
+    global _db_pool, _db_healthy
+    if _db_pool is not None:
+        return _db_pool
+    dsn = _db_dsn()
+    if "postgres" not in dsn:
+        logger.warning("SUPABASE_DB_CONNECTION_STRING ausente ou inválida; pool de banco não será criado.")
+        return None
+    try:
+        _db_pool = await asyncpg.create_pool(
+            dsn,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            timeout=DB_CONNECT_TIMEOUT,
+            init=_init_connection,
+        )
+        _db_healthy = True
+        logger.info(f"Pool asyncpg criado (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE}, statement_cache={DB_STATEMENT_CACHE_SIZE}).")
+    except Exception as e:
+        logger.error(f"Falha ao criar pool asyncpg: {e}", exc_info=True)
+        _db_pool = None
+    return _db_pool
+
+
+async def connect() -> asyncpg.Connection:
+    """Conexão dedicada, fora do pool (ex: LISTEN/NOTIFY), com os mesmos codecs das conexões do pool."""
+    conn = await asyncpg.connect(_db_dsn(), timeout=DB_CONNECT_TIMEOUT, statement_cache_size=DB_STATEMENT_CACHE_SIZE)
+    await _init_connection(conn)
+    return conn
+
+
+async def check_db_health() -> bool:
+    """Executa um `SELECT 1` no pool e atualiza o estado de saúde."""
+    global _db_healthy
+    if _db_pool is None:
+        return False
+    try:
+        async with _db_pool.acquire(timeout=DB_CONNECT_TIMEOUT) as conn:
+            await conn.fetchval("SELECT 1")
+        if not _db_healthy:
+            logger.info("Conexão com o banco restabelecida.")
+        _db_healthy = True
+    except Exception as e:
+        if _db_healthy:
+            logger.warning(f"Health check do banco falhou: {e}")
+        _db_healthy = False
+    return _db_healthy
+
+
+async def _health_check_loop() -> None:
+    while True:
+        await asyncio.sleep(DB_HEALTH_CHECK_INTERVAL)
+        await check_db_health()
+
+
+async def startup() -> None:
+    """Inicializa os clientes compartilhados. Chamado pelo lifespan."""
+    global _health_task
+    try:
+        if get_supabase() is None:
+            logger.warning("Cliente Supabase não criado: SUPABASE_URL/SUPABASE_SERVICE_ROLE_KEY ausentes.")
+    except Exception as e:
+        logger.error(f"Falha ao criar cliente Supabase: {e}", exc_info=True)
+    pool = await init_db_pool()
+    if pool is not None and DB_HEALTH_CHECK_INTERVAL > 0:
+        _health_task = asyncio.create_task(_health_check_loop(), name="db-health-check")
+
+
+async def shutdown() -> None:
+    """Fecha os clientes compartilhados. Chamado pelo lifespan."""
+    global _supabase_client, _db_pool, _db_healthy, _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+        _health_task = None
+    if _db_pool is not None:
+        try:
+            await asyncio.wait_for(_db_pool.close(), timeout=DB_CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Timeout ao fechar o pool asyncpg; encerrando conexões à força.")
+            _db_pool.terminate()
+        _db_pool = None
+        _db_healthy = False
+        logger.info("Pool asyncpg fechado.")
+    if _supabase_client is not None:
+        try:
+            _supabase_client.postgrest.aclose()
+        except Exception as e:
+            logger.debug(f"Erro ao fechar sessão HTTP do Supabase: {e}")
+        _supabase_client = None
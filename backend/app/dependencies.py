@@ -1,15 +1,20 @@
 # backend/app/dependencies.py (VERSÃO CORRIGIDA para supabase-py)
 
 import os
+import asyncio
 import logging
+import asyncpg
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 # Imports corrigidos para supabase-py
-from supabase import create_client, Client as SupabaseClient
+from supabase import Client as SupabaseClient
 # from supabase import create_client, Client as SupabaseClient, SupabaseAuthError # REMOVIDO SupabaseAuthError
 from gotrue.types import User
 # from gotrue.errors import AuthApiError # REMOVIDO
 
+from . import auth, clients
+from .metrics import stage_timer
+
 logger = logging.getLogger(__name__)
 
 # Esquema para extrair o token Bearer do cabeçalho Authorization
@@ -29,57 +34,104 @@ if not supabase_url or not supabase_key:
     # Dependendo da sua aplicação, você pode querer lançar um erro aqui para impedir a inicialização
 
 async def get_supabase_client() -> SupabaseClient:
-    """Dependência para obter um cliente Supabase."""
+    """Dependência para obter o cliente Supabase compartilhado (criado no lifespan)."""
     if not supabase_url or not supabase_key:
          raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Configuração do Supabase ausente no servidor."
         )
     try:
-        # create_client é síncrono, mas retorna um cliente que pode fazer chamadas async
-        supabase: SupabaseClient = create_client(supabase_url, supabase_key)
-        return supabase
+        # Reutiliza o mesmo cliente (e suas sessões HTTP) entre requisições
+        supabase = clients.get_supabase()
     except Exception as e:
         logger.error(f"Falha ao criar cliente Supabase: {e}", exc_info=True)
+        supabase = None
+    if supabase is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Não foi possível conectar ao serviço de backend."
         )
+    return supabase
+
+async def get_db_pool() -> asyncpg.Pool:
+    """Dependência para obter o pool asyncpg compartilhado (SUPABASE_DB_CONNECTION_STRING)."""
+    pool = clients.get_db_pool()
+    if pool is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Banco de dados indisponível no momento."
+        )
+    return pool
+
+async def _get_user_remote(access_token: str) -> User:
+    """Valida o token no Supabase Auth (round-trip de rede). Usado no modo 'remote' ou como fallback."""
+    supabase = await get_supabase_client()
+    try:
+        # Nota: A chamada get_user é SÍNCRONA na v2 da lib; roda em thread para não bloquear o event loop.
+        response = await asyncio.to_thread(supabase.auth.get_user, access_token)
+        user = response.user if response else None
+    # Capturar exceção genérica ao obter usuário como falha de autenticação
+    except Exception as e:
+        # Logar o tipo real da exceção para depuração futura
+        logger.warning(f"Erro ao validar token JWT com Supabase (Tipo: {type(e).__name__}): {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido ou expirado.", # Mensagem genérica
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não encontrado ou token inválido.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    auth.cache_verified_user(access_token, user)
+    return user
 
 async def get_authenticated_user(
     token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    supabase: SupabaseClient = Depends(get_supabase_client)
 ) -> User:
     """
-    Verifica o token JWT usando o cliente Supabase e retorna o objeto User.
+    Verifica o token JWT e retorna o objeto User.
+    No modo padrão ('local'), a assinatura e a expiração são verificadas no próprio processo
+    (segredo do projeto ou JWKS em cache) e tokens já verificados são servidos do cache.
+    O get_user remoto só é usado com SUPABASE_AUTH_MODE=remote ou, quando a verificação local
+    não é possível, com SUPABASE_AUTH_REMOTE_FALLBACK=true.
     Levanta HTTPException 401 se o token for inválido ou expirado.
     """
+    with stage_timer("auth"):
+        return await _authenticate(token)
+
+async def _authenticate(token: HTTPAuthorizationCredentials) -> User:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token de autenticação não fornecido.",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    access_token = token.credentials
+
+    if auth.AUTH_MODE == "remote":
+        cached = auth.get_cached_user(access_token)
+        return cached if cached is not None else await _get_user_remote(access_token)
+
     try:
-        # Tentar obter o usuário. A biblioteca supabase-py pode levantar
-        # exceções genéricas ou específicas do gotrue em caso de falha.
-        # Nota: A chamada get_user é SÍNCRONA na v2 da lib.
-        response = supabase.auth.get_user(token.credentials)
-        user = response.user
-        if not user:
-             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Usuário não encontrado ou token inválido.",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        logger.debug(f"Usuário autenticado: {user.id} via get_authenticated_user")
+        user = await auth.verify_token_locally(access_token)
+        logger.debug(f"Usuário autenticado: {user.id} via get_authenticated_user (verificação local)")
         return user
-    # Capturar exceção genérica ao obter usuário como falha de autenticação
-    except Exception as e:
-        # Logar o tipo real da exceção para depuração futura
-        logger.warning(f"Erro ao validar token JWT com Supabase (Tipo: {type(e).__name__}): {e}")
+    except auth.LocalVerificationUnavailable as e:
+        if not auth.AUTH_REMOTE_FALLBACK:
+            logger.error(f"Verificação local de JWT indisponível e fallback remoto desativado: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Configuração de autenticação ausente no servidor.",
+            )
+        logger.warning(f"Verificação local de JWT indisponível ({e}); usando get_user remoto.")
+        return await _get_user_remote(access_token)
+    except auth.TokenVerificationError as e:
+        logger.warning(f"Token JWT rejeitado na verificação local: {e}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Token inválido ou expirado.", # Mensagem genérica
+            detail="Token inválido ou expirado.", # Mensagem genérica
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,92 @@
+# backend/app/lazy.py
+"""
+Carregamento preguiçoso dos módulos de serviço.
+
+Importar `app.main` não deve arrastar openai, numpy, hnswlib (e, quando as implementações reais
+chegarem, crewai/guardrails/langchain/torch): isso aumenta o cold start e o tempo de spawn de cada
+worker. Os routers e o `main` referenciam os serviços por um `LazyModule`, que só importa o módulo
+real no primeiro acesso a um atributo. O lifespan pode aquecer uma lista configurável de módulos
+(APP_PRELOAD_MODULES) antes — ou logo depois, em background — de aceitar requisições.
+
+Como o proxy resolve o atributo a cada acesso, `unittest.mock.patch("app.services.x.func")`
+continua valendo para quem chama `x.func(...)` através dele.
+
+Um módulo aparece em `sys.modules` assim que sua importação começa. Enquanto o preload ainda o executa
+em background, o proxy passa por `importlib.import_module`, que espera a trava de importação do módulo
+em vez de devolver um módulo pela metade; `sys.modules` só é atalho depois que a importação terminou.
+"""
+import sys
+import time
+import asyncio
+import logging
+import importlib
+from types import ModuleType
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+def _imported(name: str):
+    """O módulo, se a importação já terminou (ainda em execução, `__spec__._initializing` fica ligado)."""
+    module = sys.modules.get(name)
+    if module is None or getattr(getattr(module, "__spec__", None), "_initializing", False):
+        return None
+    return module
+
+
+class LazyModule:
+    """Proxy de um módulo importado somente no primeiro acesso a um atributo."""
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+
+    def _load(self) -> ModuleType:
+        module = _imported(self._name)
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            logger.info(f"[lazy] Módulo '{self._name}' carregado sob demanda em {(time.perf_counter() - started) * 1000:.0f} ms.")
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return _imported(self._name) is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<LazyModule '{self._name}' ({'carregado' if self.is_loaded else 'pendente'})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    return _imported(name) is not None
+
+
+async def preload(names: Iterable[str]) -> Dict[str, float]:
+    """
+    Importa os módulos em uma thread (o event loop segue livre) e devolve o tempo de cada um em ms.
+    Falhas são registradas e não interrompem o startup: o módulo volta a ser tentado no primeiro uso.
+    """
+    timings: Dict[str, float] = {}
+    for name in names:
+        if _imported(name) is not None:
+            continue
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(importlib.import_module, name)
+        except Exception as e:
+            logger.error(f"[lazy] Falha ao pré-carregar '{name}': {e}", exc_info=True)
+            continue
+        timings[name] = (time.perf_counter() - started) * 1000
+    if timings:
+        summary = ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items())
+        logger.info(f"[lazy] Pré-carregados {len(timings)} módulos: {summary}")
+    return timings
@@ -1,10 +1,13 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/main.py:
 import os
 import sys
+import asyncio
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import logging
+import contextlib
 from contextlib import asynccontextmanager
 import importlib # Para importar routers dinamicamente
 
@@ -27,6 +30,34 @@ print(f"Tentando carregar .env de: {dotenv_path}, Existe: {os.path.exists(dotenv
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
 logger = logging.getLogger(__name__) # Logger para este módulo
 
+from . import clients # Clientes compartilhados (Supabase, pool asyncpg)
+from . import metrics # Métricas Prometheus (/metrics) e tracing OTLP opcional
+from . import rate_limit # Token buckets por usuário/rota (/api/v1)
+from .responses import CompressionMiddleware, ModelJSONResponse, COMPRESSION_ENABLED # JSON rápido + gzip/zstd
+from . import lazy # Carregamento sob demanda / warmup dos serviços pesados
+from .services import spec_registry # Specs de saída estruturada (app/specs)
+vector_store = lazy.lazy_module("app.services.vector_store") # Backend vetorial do RAG (pgvector ou índice local)
+job_service = lazy.lazy_module("app.services.job_service") # Fila de jobs das Crews
+llm_gateway = lazy.lazy_module("app.services.llm_gateway") # Cliente LLM compartilhado
+session_memory = lazy.lazy_module("app.services.session_memory") # Sessões de conversa do RAG
+items_indexer = lazy.lazy_module("app.services.items_indexer") # LISTEN/NOTIFY de public.items -> public.documents
+semantic_cache = lazy.lazy_module("app.services.semantic_cache") # Cache de respostas do RAG (invalidação entre processos)
+
+# --- Warmup ---
+# Módulos importados pelo lifespan (separados por vírgula; vazio = tudo sob demanda no primeiro uso).
+# Com VECTOR_BACKEND=local, mantenha app.services.vector_store na lista: o snapshot do índice é carregado no warmup.
+APP_PRELOAD_MODULES = [
+    name.strip()
+    for name in os.getenv(
+        "APP_PRELOAD_MODULES",
+        "app.services.vector_store,app.services.rag_service,app.services.feedback_analyzer_service,"
+        "app.services.guardrails_service,app.services.job_service",
+    ).split(",")
+    if name.strip()
+]
+# true = aceita requisições imediatamente e aquece em background (autoscaling/serverless)
+APP_PRELOAD_IN_BACKGROUND = os.getenv("APP_PRELOAD_IN_BACKGROUND", "false").lower() == "true"
+
 # --- Importação de Routers ---
 # Tenta importar os routers definidos. Se falhar, a API ainda funciona, mas sem esses endpoints.
 router_modules = []
@@ -41,6 +72,16 @@ except Exception as e:
     logger.error(f"Erro inesperado ao importar routers: {e}", exc_info=True)
 
 
+async def _warmup() -> None:
+    await lazy.preload(APP_PRELOAD_MODULES)
+    if vector_store.is_loaded:
+        await vector_store.startup()
+    # Só importa o indexador de itens quando há banco (ele mesmo confere ITEMS_INDEX_ENABLED e o backend)
+    if clients.get_db_pool() is not None:
+        await items_indexer.startup()
+        await semantic_cache.startup()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Código de inicialização (ex: carregar modelos, conectar DBs)
@@ -54,16 +95,53 @@ async def lifespan(app: FastAPI):
         logger.warning("Chave OPENAI_API_KEY não encontrada ou muito curta no .env!")
     if not supabase_conn_present:
          logger.warning("String de conexão SUPABASE_DB_CONNECTION_STRING não encontrada ou inválida no .env!")
+    # Cria uma única vez o cliente Supabase e o pool asyncpg usados por todas as requisições
+    await clients.startup()
+    # Compila uma única vez as specs de /generate-structured (e observa app/specs em background)
+    await spec_registry.startup()
+    # Monitor de atraso do event loop (gauge em /metrics)
+    await metrics.startup()
+    # Importa os serviços pesados (e carrega o snapshot do índice vetorial local, se houver)
+    warmup = asyncio.create_task(_warmup()) if APP_PRELOAD_IN_BACKGROUND else None
+    if warmup is None:
+        await _warmup()
     yield
     # Código de finalização (ex: fechar conexões)
     logger.info("API Finalizando...")
+    if warmup is not None:
+        if not warmup.done():
+            warmup.cancel()
+        # Espera o cancelamento (ou a falha) do warmup antes de fechar os clientes que ele pode estar usando
+        with contextlib.suppress(asyncio.CancelledError):
+            try:
+                await warmup
+            except Exception as e:
+                logger.error(f"Falha no warmup em background: {e}", exc_info=True)
+    await metrics.shutdown()
+    await rate_limit.shutdown()
+    await spec_registry.shutdown()
+    if items_indexer.is_loaded:
+        await items_indexer.shutdown()
+    if semantic_cache.is_loaded:
+        await semantic_cache.shutdown()
+    # Só finaliza o que chegou a ser carregado (não importa módulos no shutdown)
+    if job_service.is_loaded:
+        await job_service.shutdown()
+    if session_memory.is_loaded:
+        await session_memory.shutdown()
+    if llm_gateway.is_loaded:
+        await llm_gateway.shutdown()
+    if vector_store.is_loaded:
+        await vector_store.shutdown()
+    await clients.shutdown()
 
 # Cria a instância da aplicação FastAPI
 app = FastAPI(
     title="Backend API de IA",
     description="API para servir funcionalidades de RAG, CrewAI e Guardrails.",
     version="0.1.1", # Versão atualizada
-    lifespan=lifespan # Associa o ciclo de vida
+    lifespan=lifespan, # Associa o ciclo de vida
+    default_response_class=ModelJSONResponse # orjson / serializador do pydantic-core em vez de json.dumps
 )
 
 # --- Configuração de CORS ---
@@ -101,6 +179,16 @@ app.add_middleware(
     allow_headers=["*"],    # Permite todos os headers HTTP
 )
 
+# --- Compressão negociada (Accept-Encoding: zstd/gzip) ---
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# --- Métricas e tracing ---
+# Adicionado por último = middleware mais externo: mede a requisição inteira, inclusive CORS
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+metrics.setup_tracing(app)
+
 # --- Inclusão de Routers ---
 # Inclui os endpoints definidos nos módulos de router importados
 # api_prefix = "/api/v1" # Não precisamos mais definir aqui
@@ -119,14 +207,25 @@ async def read_root():
     logger.info("Endpoint raiz ('/') acessado.")
     return {"message": "API de IA está operacional!"}
 
-# --- Execução com Uvicorn (para desenvolvimento local/Codespaces) ---
-# Esta parte só executa se o script for rodado diretamente (python backend/app/main.py)
+# --- Health check (clientes compartilhados) ---
+@app.get("/health")
+async def read_health():
+    """ Informa o estado dos clientes compartilhados (pool do banco). """
+    db_configured = clients.get_db_pool() is not None
+    db_ok = await clients.check_db_health() if db_configured else False
+    return {"status": "ok" if db_ok or not db_configured else "degraded", "database": {"configured": db_configured, "healthy": db_ok}}
+
+# --- Métricas (formato texto do Prometheus) ---
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """ Histogramas de latência por rota e estágio, tokens por modelo, taxas de acerto dos caches e atraso do event loop. """
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desativadas (METRICS_ENABLED=false).")
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+# --- Execução direta ---
+# python -m app.main [--reload] delega para o launcher (app/server.py): multi-worker por padrão,
+# um processo com reload em desenvolvimento. Em produção prefira: python -m app.server
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000)) # Usa a porta 8000 por padrão
-    host = os.getenv("HOST", "0.0.0.0") # Ouve em todas as interfaces
-    logger.info(f"Iniciando servidor Uvicorn em {host}:{port} (Modo de execução direta)")
-    # Use reload=True apenas para desenvolvimento
-    # O Uvicorn espera o caminho no formato 'modulo:objeto'
-    # Ajuste: Usar 'app.main:app' as uvicorn espera o caminho a partir da pasta onde é executado (backend/)
-    uvicorn.run("app.main:app", host=host, port=port, reload=True)
\ No newline at end of file
+    from app.server import main as run_server
+    sys.exit(run_server())
@@ -0,0 +1,339 @@
+# backend/app/metrics.py
+"""
+Instrumentação do caminho quente da API.
+
+- Histogramas de latência por rota (middleware ASGI, inclui o corpo de respostas em streaming) e por
+  estágio (`stage_timer`: auth, embedding, retrieval, llm, validation).
+- Contadores de tokens de prompt/completion por modelo (alimentados pelo llm_gateway).
+- Taxas de acerto dos caches (result_cache, embeddings, cache semântico, coalescência), lidas no scrape.
+- Gauge de atraso do event loop, medido por uma tarefa de fundo.
+Tudo é exportado em formato texto do Prometheus em GET /metrics. Os valores são do processo que atendeu
+o scrape: com vários workers (app.server), cada um tem suas séries, então o Prometheus deve coletar cada
+worker (ou agregar com sum/rate); os contadores de cache levam o rótulo `worker` (pid) para que séries de
+processos diferentes não se misturem nem pareçam reinícios. Com OTEL_EXPORTER_OTLP_ENDPOINT definido
+(e os pacotes opentelemetry instalados), requisições e estágios também geram spans OTLP.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+METRICS_LOOP_LAG_INTERVAL_SECONDS: float = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+OTEL_EXPORTER_OTLP_ENDPOINT: str = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+OTEL_SERVICE_NAME: str = os.getenv("OTEL_SERVICE_NAME", "meu-app-ai-backend")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Contador incrementado via `inc` ou, para totais mantidos por outro módulo, lido no scrape por `callback`."""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                logger.warning(f"[metrics] Falha ao coletar {self.name}: {e}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Gauge(Metric):
+    """Gauge com valores definidos via `set` ou calculados no scrape por `callback` -> {label_values: valor}."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        if self._callback is not None:
+            try:
+                values.update(self._callback())
+            except Exception as e:
+                logger.warning(f"[metrics] Falha ao coletar {self.name}: {e}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {} # contagens por bucket + [soma, total]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {int(count)}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(series[-1])}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+
+def _cache_stats() -> Dict[str, Tuple[float, float]]:
+    """(acertos, erros) de cada cache da aplicação; só consulta serviços já carregados (o scrape não força imports)."""
+    services = {name: sys.modules.get(f"app.services.{name}") for name in ("embedding_service", "feedback_analyzer_service", "rag_service", "guardrails_service", "semantic_cache")}
+
+    stats: Dict[str, Tuple[float, float]] = {}
+    flights = []
+    feedback_analyzer_service = services["feedback_analyzer_service"]
+    if feedback_analyzer_service is not None:
+        feedback = feedback_analyzer_service.feedback_cache.stats()
+        stats["feedback_analysis"] = (feedback["memory_hits"] + feedback["persistent_hits"], feedback["misses"])
+        flights.append(feedback_analyzer_service.feedback_flight)
+    embedding_service = services["embedding_service"]
+    if embedding_service is not None and embedding_service._engine is not None:
+        engine = embedding_service._engine.stats()
+        stats["embeddings"] = (engine["cache_hits"], engine["cache_misses"])
+    semantic_cache = services["semantic_cache"]
+    if semantic_cache is not None and semantic_cache._cache is not None:
+        semantic = semantic_cache._cache.stats()
+        stats["semantic_answers"] = (semantic["hits"], semantic["misses"])
+    if services["rag_service"] is not None:
+        flights.append(services["rag_service"].rag_flight)
+    if services["guardrails_service"] is not None:
+        flights.append(services["guardrails_service"].guardrails_flight)
+    # Coalescência: "acerto" = requisição que reaproveitou uma execução em andamento
+    for flight in flights:
+        stats[f"singleflight_{flight.name}"] = (flight.coalesced, flight.executions)
+    return stats
+
+
+def _cache_ratio_samples() -> Dict[LabelValues, float]:
+    return {(name,): hits / (hits + misses) if hits + misses else 0.0 for name, (hits, misses) in _cache_stats().items()}
+
+
+def _cache_lookup_samples() -> Dict[LabelValues, float]:
+    worker = str(os.getpid())
+    samples: Dict[LabelValues, float] = {}
+    for name, (hits, misses) in _cache_stats().items():
+        samples[(name, "hit", worker)] = hits
+        samples[(name, "miss", worker)] = misses
+    return samples
+
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "Latência das requisições HTTP por rota (inclui o corpo em streaming).", ("method", "route", "status"))
+STAGE_DURATION = Histogram("ai_stage_duration_seconds", "Latência por estágio do processamento (auth, embedding, retrieval, llm, validation).", ("stage",))
+LLM_REQUEST_DURATION = Histogram("llm_request_duration_seconds", "Latência das chamadas ao LLM (até a resposta ou o início do stream).", ("model", "operation", "outcome"))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens consumidos por modelo e tipo (prompt/completion).", ("model", "kind"))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Taxa de acerto de cada cache desde o início do processo.", ("cache",), callback=_cache_ratio_samples)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Consultas a cada cache por resultado (hit/miss) e worker (pid), desde o início do processo.", ("cache", "result", "worker"), callback=_cache_lookup_samples)
+EVENT_LOOP_LAG = Gauge("event_loop_lag_seconds", "Atraso mais recente do event loop em relação ao agendado.")
+EVENT_LOOP_LAG_HISTOGRAM = Histogram("event_loop_lag_distribution_seconds", "Distribuição do atraso do event loop.", buckets=LAG_BUCKETS)
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- Tracing (OpenTelemetry opcional) ---
+_tracer = None
+
+
+def _start_span(name: str):
+    if _tracer is None:
+        return None
+    return _tracer.start_as_current_span(name)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Mede um estágio do processamento (histograma e, com OTel ativo, um span filho)."""
+    span = _start_span(f"ai.{stage}")
+    started = time.perf_counter()
+    try:
+        if span is not None:
+            with span:
+                yield
+        else:
+            yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_llm_call(model: str, operation: str, duration: float, outcome: str) -> None:
+    LLM_REQUEST_DURATION.observe(duration, model=model, operation=operation, outcome=outcome)
+
+
+def record_llm_usage(model: str, usage) -> None:
+    """Contabiliza o `usage` retornado pela API (prompt_tokens / completion_tokens)."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt_tokens, int):
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if isinstance(completion_tokens, int):
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def setup_tracing(app) -> bool:
+    """Ativa spans OTLP (requisições FastAPI + estágios) se OTEL_EXPORTER_OTLP_ENDPOINT estiver definido."""
+    global _tracer
+    if not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    except ImportError as e:
+        logger.warning(f"[metrics] OTEL_EXPORTER_OTLP_ENDPOINT definido, mas pacotes opentelemetry indisponíveis: {e}")
+        return False
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,health")
+    _tracer = trace.get_tracer("app.metrics")
+    logger.info(f"[metrics] Tracing OTLP ativo (endpoint={OTEL_EXPORTER_OTLP_ENDPOINT}).")
+    return True
+
+
+# --- Middleware HTTP ---
+class MetricsMiddleware:
+    """Middleware ASGI: mede cada requisição até o último byte do corpo, rotulada pelo template da rota."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched" # Evita um rótulo por URL
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=str(status_holder["status"])
+            )
+
+
+# --- Atraso do event loop ---
+_lag_task: Optional[asyncio.Task] = None
+
+
+async def _monitor_event_loop_lag(interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+async def startup() -> None:
+    global _lag_task
+    if METRICS_ENABLED and _lag_task is None:
+        _lag_task = asyncio.create_task(_monitor_event_loop_lag(METRICS_LOOP_LAG_INTERVAL_SECONDS), name="event-loop-lag")
+
+
+async def shutdown() -> None:
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
@@ -1,16 +1,35 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/models/ai_models.py:
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 
 # --- Modelos para RAG ---
 class RagQueryInput(BaseModel):
     question: str = Field(..., description="Pergunta para a base RAG", examples=["Qual o status do projeto X?"])
-    session_id: Optional[str] = Field(None, description="ID de sessão opcional para histórico")
+    session_id: Optional[str] = Field(None, max_length=128, description="ID de sessão opcional: a conversa da sessão (resumo + turnos recentes) entra no prompt")
 
 class RagResponse(BaseModel):
     answer: str = Field(..., description="Resposta gerada pelo RAG")
     sources: Optional[List[Dict[str, Any]]] = Field([], description="Lista de fontes usadas")
 
+class RagSearchInput(BaseModel):
+    query: str = Field(..., description="Texto a buscar na base RAG (sem geração de resposta)")
+    k: int = Field(5, ge=1, le=50, description="Número de chunks retornados")
+    sources: Optional[List[str]] = Field(None, max_length=50, description="Restringe a estas fontes (metadata.source)")
+    tags: Optional[List[str]] = Field(None, max_length=50, description="Restringe a chunks com alguma destas tags (metadata.tags)")
+    created_after: Optional[datetime] = Field(None, description="Só documentos criados a partir deste momento")
+    created_before: Optional[datetime] = Field(None, description="Só documentos criados antes deste momento")
+    owner_only: bool = Field(False, description="Só os documentos privados do usuário (ex: seus itens)")
+
+class RagSearchResult(BaseModel):
+    id: int = Field(..., description="ID do chunk em public.documents")
+    content: str = Field(..., description="Texto do chunk")
+    similarity: float = Field(..., description="Similaridade de cosseno com a busca")
+    metadata: Dict[str, Any] = Field({}, description="Metadados do chunk (fonte, tags, dono...)")
+
+class RagSearchResponse(BaseModel):
+    results: List[RagSearchResult] = Field(..., description="Chunks em ordem de similaridade")
+
 # --- Modelos para CrewAI ---
 class CrewInput(BaseModel):
     topic: str = Field(..., description="Tópico ou objetivo para a Crew executar")
@@ -20,6 +39,17 @@ class CrewResponse(BaseModel):
     result: Any = Field(..., description="Resultado final da execução da Crew")
     logs: Optional[List[str]] = Field([], description="Logs ou métricas da execução (opcional)")
 
+class CrewJobResponse(BaseModel):
+    job_id: str = Field(..., description="Identificador do job de execução da Crew")
+    status: str = Field(..., description="Estado do job: queued, running, succeeded ou failed")
+    topic: str = Field(..., description="Tópico enviado para a Crew")
+    result: Any = Field(None, description="Resultado final da Crew, quando o job termina com sucesso")
+    error: Optional[str] = Field(None, description="Mensagem de erro se o job falhar")
+    logs: List[str] = Field([], description="Logs produzidos até o momento")
+    created_at: float = Field(..., description="Momento da submissão (epoch, segundos)")
+    started_at: Optional[float] = Field(None, description="Início da execução (epoch, segundos)")
+    finished_at: Optional[float] = Field(None, description="Fim da execução (epoch, segundos)")
+
 # --- Modelos para Guardrails ---
 class GuardrailsInput(BaseModel):
     prompt: str = Field(..., description="Prompt para gerar a saída estruturada")
@@ -29,6 +59,7 @@ class GuardrailsInput(BaseModel):
 class GuardrailsResponse(BaseModel):
      validated_data: Optional[Dict | List | str] = Field(None, description="Dados validados e estruturados")
      error: Optional[str] = Field(None, description="Mensagem de erro se a validação falhar")
+     metrics: Optional[Dict[str, Any]] = Field(None, description="Contadores da geração (tentativas, re-asks, tokens gerados/economizados)")
 
 # Novos modelos para o Analisador de Feedback
 class FeedbackAnalysisRequest(BaseModel):
@@ -41,4 +72,16 @@ class FeedbackAnalysisRequest(BaseModel):
 class FeedbackAnalysisResponse(BaseModel):
     sentiment: str = Field(..., description="Sentimento detectado (Positivo, Negativo ou Neutro)")
     summary: str = Field(..., description="Resumo de uma frase do feedback")
-    topics: List[str] = Field(..., description="Lista dos 3 principais tópicos mencionados")
\ No newline at end of file
+    topics: List[str] = Field(..., description="Lista dos 3 principais tópicos mencionados")
+
+# Modelos para a análise de feedback em lote
+class FeedbackBatchItemResult(BaseModel):
+    index: int = Field(..., description="Posição do item no lote enviado (base 0)")
+    result: Optional[FeedbackAnalysisResponse] = Field(None, description="Análise do item, se bem-sucedida")
+    error: Optional[str] = Field(None, description="Mensagem de erro se a análise do item falhar")
+
+class FeedbackBatchResponse(BaseModel):
+    results: List[FeedbackBatchItemResult] = Field(..., description="Resultados por item, na ordem do lote")
+    total: int = Field(..., description="Número de itens recebidos")
+    succeeded: int = Field(..., description="Número de itens analisados com sucesso")
+    failed: int = Field(..., description="Número de itens com erro")
@@ -0,0 +1,218 @@
+# backend/app/rate_limit.py
+"""
+Rate limiting por usuário e por rota (token bucket) para /api/v1.
+
+`enforce_rate_limit` é uma dependência do router: reaproveita o usuário já resolvido por
+`get_authenticated_user` (o FastAPI faz cache da dependência na requisição) e consome 1 token de
+dois baldes: o da rota (template, ex: /api/v1/feedback/analyze) e o global do usuário ("*"). Leituras
+(GET/HEAD, ex: estado e logs de um job de Crew) não chamam o LLM e só passam pelo balde da rota: um
+cliente acompanhando um job não gasta a cota que protege as rotas de IA. Sem token disponível,
+responde 429 com Retry-After. Também registra o usuário e seu peso no ContextVar
+do fair_scheduler, que intercala as chamadas ao LLM entre usuários.
+
+Configuração:
+- RATE_LIMIT_RULES (JSON): {"<rota ou *>": {"capacity": rajada, "per_minute": reposição}}, mesclado
+  sobre DEFAULT_RULES. Rotas sem regra só passam pelo balde global.
+- RATE_LIMIT_ROLE_WEIGHTS (JSON): {"<papel>": peso}. O papel vem de app_metadata["role"] (definido
+  pelo service role no Supabase; o usuário não consegue alterar). O peso multiplica capacidade e
+  reposição dos baldes e a fatia do usuário no fair share.
+- RATE_LIMIT_BACKEND: "memory" (padrão, por processo) ou "sqlite" (arquivo em RATE_LIMIT_SQLITE_PATH,
+  compartilhado pelos workers do mesmo host). Outros backends implementam `BucketStore.take`.
+"""
+import os
+import json
+import math
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Request, status
+from gotrue.types import User
+
+from . import metrics
+from .dependencies import get_authenticated_user
+from .services.fair_scheduler import Principal, set_current_principal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES: Dict[str, Dict[str, float]] = {
+    "*": {"capacity": 60, "per_minute": 60},
+    "/api/v1/feedback/analyze": {"capacity": 20, "per_minute": 20},
+    "/api/v1/feedback/analyze/stream": {"capacity": 20, "per_minute": 20},
+    "/api/v1/feedback/analyze-batch": {"capacity": 3, "per_minute": 3},
+    "/api/v1/rag-query": {"capacity": 20, "per_minute": 30},
+    "/api/v1/rag-query/stream": {"capacity": 20, "per_minute": 30},
+    "/api/v1/generate-structured": {"capacity": 10, "per_minute": 10},
+    "/api/v1/run-crew": {"capacity": 3, "per_minute": 2},
+    # Polling de jobs: fora do balde global, com limite próprio e folgado
+    "/api/v1/run-crew/{job_id}": {"capacity": 120, "per_minute": 120},
+    "/api/v1/run-crew/{job_id}/logs": {"capacity": 30, "per_minute": 30},
+}
+# Métodos que não consomem o balde global "*" (nenhuma rota de leitura chama o LLM)
+GLOBAL_BUCKET_EXEMPT_METHODS = ("GET", "HEAD")
+
+# --- Configuração (variáveis de ambiente) ---
+RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+RATE_LIMIT_RULES: Dict[str, Dict[str, float]] = {**DEFAULT_RULES, **json.loads(os.getenv("RATE_LIMIT_RULES", "{}"))}
+RATE_LIMIT_ROLE_WEIGHTS: Dict[str, float] = json.loads(os.getenv("RATE_LIMIT_ROLE_WEIGHTS", '{"admin": 4, "pro": 2}'))
+RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower() # "memory" ou "sqlite"
+RATE_LIMIT_SQLITE_PATH: str = os.getenv("RATE_LIMIT_SQLITE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "rate_limits.sqlite3"))
+RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+REJECTIONS = metrics.Counter("rate_limit_rejections_total", "Requisições recusadas com 429 por balde", ("route", "bucket"))
+
+
+@dataclass
+class Rule:
+    capacity: float
+    per_second: float
+
+    @classmethod
+    def from_config(cls, config: Dict[str, float], weight: float) -> "Rule":
+        return cls(capacity=float(config["capacity"]) * weight, per_second=float(config["per_minute"]) * weight / 60)
+
+
+class BucketStore(ABC):
+    """Estado dos baldes. `take` consome `cost` tokens se houver; senão retorna em quantos segundos haverá."""
+
+    @abstractmethod
+    async def take(self, key: str, rule: Rule, cost: float = 1.0) -> Tuple[bool, float]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+def _refill(tokens: float, updated: float, now: float, rule: Rule) -> float:
+    return min(rule.capacity, tokens + (now - updated) * rule.per_second)
+
+
+def _decide(tokens: float, rule: Rule, cost: float) -> Tuple[bool, float, float]:
+    """(permitido, retry_after, tokens restantes)."""
+    if tokens >= cost:
+        return True, 0.0, tokens - cost
+    retry_after = (cost - tokens) / rule.per_second if rule.per_second > 0 else math.inf
+    return False, retry_after, tokens
+
+
+class MemoryBucketStore(BucketStore):
+    """Baldes em memória (por processo). Baldes ociosos expiram: cheios de novo, não precisam ser guardados."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, idle_ttl_seconds: float = 3600):
+        self._buckets: TTLCache = TTLCache(maxsize=max_keys, ttl=idle_ttl_seconds)
+
+    async def take(self, key: str, rule: Rule, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (rule.capacity, now))
+        allowed, retry_after, remaining = _decide(_refill(tokens, updated, now, rule), rule, cost)
+        self._buckets[key] = (remaining, now)
+        return allowed, retry_after
+
+
+class SQLiteBucketStore(BucketStore):
+    """Baldes num arquivo SQLite (WAL) compartilhado pelos workers do host; leitura e escrita numa transação IMMEDIATE."""
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def _take(self, key: str, rule: Rule, cost: float) -> Tuple[bool, float]:
+        with self._lock:
+            conn = self._connection()
+            now = time.time() # relógio de parede: os workers não compartilham o monotonic
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(row[0], row[1], now, rule) if row else rule.capacity
+                allowed, retry_after, remaining = _decide(tokens, rule, cost)
+                conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, remaining, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return allowed, retry_after
+
+    async def take(self, key: str, rule: Rule, cost: float = 1.0) -> Tuple[bool, float]:
+        return await asyncio.to_thread(self._take, key, rule, cost)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_store: Optional[BucketStore] = None
+
+
+def get_bucket_store() -> BucketStore:
+    global _store
+    if _store is None:
+        if RATE_LIMIT_BACKEND == "sqlite":
+            _store = SQLiteBucketStore()
+        elif RATE_LIMIT_BACKEND == "memory":
+            _store = MemoryBucketStore()
+        else:
+            raise ValueError(f"RATE_LIMIT_BACKEND desconhecido: '{RATE_LIMIT_BACKEND}' (use 'memory' ou 'sqlite').")
+    return _store
+
+
+def set_bucket_store(store: Optional[BucketStore]) -> None:
+    """Substitui o backend global (útil em testes)."""
+    global _store
+    _store = store
+
+
+def user_weight(user: User) -> float:
+    role = (user.app_metadata or {}).get("role")
+    return float(RATE_LIMIT_ROLE_WEIGHTS.get(role, 1.0)) if role else 1.0
+
+
+async def enforce_rate_limit(request: Request, user: User = Depends(get_authenticated_user)) -> None:
+    """Dependência do router /api/v1: aplica os baldes do usuário e define o principal do fair share."""
+    weight = user_weight(user)
+    set_current_principal(Principal(str(user.id), weight))
+    if not RATE_LIMIT_ENABLED:
+        return
+    route = getattr(request.scope.get("route"), "path", None) or request.url.path
+    store = get_bucket_store()
+    # Rota primeiro: uma recusa nela não gasta o balde global do usuário
+    buckets = (route,) if request.method in GLOBAL_BUCKET_EXEMPT_METHODS else (route, "*")
+    for bucket in buckets:
+        config = RATE_LIMIT_RULES.get(bucket)
+        if config is None:
+            continue
+        allowed, retry_after = await store.take(f"{user.id}:{bucket}", Rule.from_config(config, weight))
+        if not allowed:
+            REJECTIONS.inc(route=route, bucket="user" if bucket == "*" else "route")
+            retry_seconds = max(1, math.ceil(retry_after)) if math.isfinite(retry_after) else 3600
+            logger.info(f"[rate_limit] Usuário {user.id} excedeu o limite de '{bucket}' (retry em {retry_seconds}s).")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Limite de requisições excedido. Tente novamente em instantes.",
+                headers={"Retry-After": str(retry_seconds)},
+            )
+
+
+async def shutdown() -> None:
+    if _store is not None:
+        await _store.close()
@@ -0,0 +1,207 @@
+# backend/app/responses.py
+"""
+Codificação rápida das respostas JSON e compressão negociada (Accept-Encoding).
+
+- `ModelJSONResponse`: classe de resposta padrão da app. Modelos Pydantic são serializados direto
+  para bytes pelo serializador do pydantic-core (sem `model_dump` -> dict -> `jsonable_encoder`);
+  dicts/listas vão pelo orjson. As rotas de /api/v1 devolvem a instância da resposta já pronta,
+  o que faz o FastAPI pular a revalidação/conversão do `response_model` (que segue documentando o
+  schema no OpenAPI).
+- `CompressionMiddleware`: comprime com zstd (se `zstandard` estiver instalado) ou gzip, conforme
+  o Accept-Encoding do cliente e apenas acima de COMPRESSION_MIN_SIZE bytes. SSE (text/event-stream)
+  não é comprimido: cada evento precisa chegar ao cliente assim que é produzido.
+"""
+import os
+import gzip
+import zlib
+import asyncio
+import logging
+from typing import Any, List, Optional, Tuple
+
+import orjson
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from app import metrics
+
+try:
+    import zstandard
+except ImportError: # opcional: sem ele, só gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024")) # bytes; abaixo disso o cabeçalho custa mais que o ganho
+COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+COMPRESSION_THREAD_MIN_SIZE: int = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", str(256 * 1024))) # corpos maiores são comprimidos fora do event loop
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv", "application/problem+json")
+
+RESPONSE_BYTES = metrics.Counter(
+    "http_response_body_bytes_total", "Bytes de corpo das respostas antes (identity) e depois da compressão", ("encoding", "stage")
+)
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _orjson_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON compacto em bytes (UTF-8, sem escapar acentos)."""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    return orjson.dumps(content, default=_orjson_default, option=_ORJSON_OPTIONS)
+
+
+class ModelJSONResponse(JSONResponse):
+    """JSONResponse que aceita modelos Pydantic e usa o serializador nativo (Rust) em vez de json.dumps."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# --- Compressão ---
+def _parse_accept_encoding(header: str) -> List[Tuple[str, float]]:
+    encodings = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings.append((name.strip().lower(), quality))
+    return encodings
+
+
+def negotiate_encoding(header: str) -> Optional[str]:
+    """Escolhe "zstd" ou "gzip" pelo Accept-Encoding (maior q; empate favorece zstd). None = identity."""
+    available = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    qualities = dict(_parse_accept_encoding(header))
+    wildcard = qualities.get("*")
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, wildcard if wildcard is not None else 0.0)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    """Compressão incremental para respostas em streaming; cada chunk é liberado (flush) ao ser enviado."""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(self._flush_mode)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI de compressão negociada; respostas pequenas, SSE e já codificadas passam intactas."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith("text/event-stream")
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message # adiado até saber o tamanho do corpo
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None and compressor is None and not more_body:
+                # Corpo inteiro em uma mensagem: decide pelo tamanho
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if len(body) < self.minimum_size:
+                    await send(start_message)
+                    await send(message)
+                    return
+                if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+                    compressed = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                RESPONSE_BYTES.inc(len(body), encoding=encoding, stage="identity")
+                RESPONSE_BYTES.inc(len(compressed), encoding=encoding, stage="encoded")
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            if compressor is None:
+                # Streaming: comprime chunk a chunk, sem Content-Length
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                compressor = _StreamCompressor(encoding)
+                await send(start_message)
+                start_message = None
+            data = compressor.chunk(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            RESPONSE_BYTES.inc(len(body), encoding=encoding, stage="identity")
+            RESPONSE_BYTES.inc(len(data), encoding=encoding, stage="encoded")
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,36 +1,53 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/routers/ai_routes.py:
-from fastapi import APIRouter, HTTPException, Body, status, Depends
+from fastapi import APIRouter, HTTPException, Body, status, Depends, Request
+import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 # Importe os models Pydantic
 from ..models.ai_models import (
     RagQueryInput,
     RagResponse,
+    RagSearchInput,
+    RagSearchResult,
+    RagSearchResponse,
     CrewInput,
-    CrewResponse,
+    CrewJobResponse,
     GuardrailsInput,
     GuardrailsResponse,
     FeedbackAnalysisRequest,
-    FeedbackAnalysisResponse
+    FeedbackAnalysisResponse,
+    FeedbackBatchItemResult,
+    FeedbackBatchResponse
 )
 # Importe os services (a lógica real estará lá)
-# Estes imports podem dar erro no editor AGORA, mas devem funcionar quando a API rodar
-from ..services import rag_service, crew_service, guardrails_service, feedback_analyzer_service
+# Carregados sob demanda (ou no warmup do lifespan): importar o router não arrasta as dependências pesadas
+from ..lazy import lazy_module
+rag_service = lazy_module("app.services.rag_service")
+guardrails_service = lazy_module("app.services.guardrails_service")
+feedback_analyzer_service = lazy_module("app.services.feedback_analyzer_service")
+job_service = lazy_module("app.services.job_service")
+# Respostas serializadas direto do modelo (sem revalidação/dict intermediário do response_model)
+from ..responses import ModelJSONResponse, dumps
 # Importa a dependência de autenticação
 from ..dependencies import get_authenticated_user
+# Rate limit por usuário/rota (429 + Retry-After) e identificação do usuário para o fair share do LLM
+from ..rate_limit import enforce_rate_limit
+from gotrue.types import User
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api/v1", tags=["AI Endpoints"])
+router = APIRouter(prefix="/api/v1", tags=["AI Endpoints"], dependencies=[Depends(enforce_rate_limit)])
 
-@router.post("/rag-query", response_model=RagResponse, summary="Consulta RAG", dependencies=[Depends(get_authenticated_user)])
-async def handle_rag_query(query: RagQueryInput = Body(...)):
-    """Recebe uma pergunta e retorna uma resposta via RAG."""
+@router.post("/rag-query", response_model=RagResponse, summary="Consulta RAG")
+async def handle_rag_query(query: RagQueryInput = Body(...), user: User = Depends(get_authenticated_user)):
+    """Recebe uma pergunta e retorna uma resposta via RAG. Com session_id, a conversa da sessão do usuário entra no prompt."""
     logger.info(f"Recebida consulta RAG: {query.question}")
     try:
         # Chama o serviço RAG (implementação virá na Fase 7)
         # Await necessário pois as funções de serviço serão async
-        answer, sources = await rag_service.query_knowledge_base(query.question)
-        return RagResponse(answer=answer, sources=sources)
+        answer, sources = await rag_service.query_knowledge_base(query.question, user_id=str(user.id), session_id=query.session_id)
+        return ModelJSONResponse(RagResponse(answer=answer, sources=sources))
     except rag_service.VectorStoreNotReadyError as e: # Exemplo de erro específico
          logger.warning(f"Erro RAG (Vector Store não pronto): {e}")
          raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
@@ -38,38 +55,101 @@ async def handle_rag_query(query: RagQueryInput = Body(...)):
         logger.error(f"Erro inesperado na consulta RAG: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao processar consulta RAG.")
 
-@router.post("/run-crew", response_model=CrewResponse, summary="Executa uma Crew AI", dependencies=[Depends(get_authenticated_user)])
-async def handle_run_crew(crew_input: CrewInput = Body(...)):
-    """Inicia uma tarefa complexa usando uma equipe de agentes AI."""
+@router.post("/rag-search", response_model=RagSearchResponse, summary="Busca vetorial filtrada (sem geração)")
+async def handle_rag_search(search: RagSearchInput = Body(...), user: User = Depends(get_authenticated_user)):
+    """Retorna os chunks mais próximos da busca entre os documentos compartilhados e os do próprio usuário, com filtros opcionais."""
+    # O dono vem sempre do token, nunca do corpo: um usuário não consegue buscar nos documentos de outro
+    search_filter = rag_service.SearchFilter(
+        user_id=str(user.id),
+        sources=tuple(search.sources) if search.sources is not None else None,
+        tags=tuple(search.tags) if search.tags is not None else None,
+        created_after=search.created_after, created_before=search.created_before, owner_only=search.owner_only,
+    )
+    try:
+        results = await rag_service.retrieve(search.query, search.k, search_filter)
+    except rag_service.VectorStoreNotReadyError as e:
+        logger.warning(f"Erro RAG (Vector Store não pronto): {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro inesperado na busca RAG: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao processar busca RAG.")
+    return ModelJSONResponse(RagSearchResponse(results=[
+        RagSearchResult(id=r.id, content=r.content, similarity=r.similarity, metadata=r.metadata) for r in results
+    ]))
+
+def _job_response(job: "job_service.CrewJob") -> CrewJobResponse:
+    return CrewJobResponse(
+        job_id=job.id, status=job.status, topic=job.topic, result=job.result, error=job.error, logs=job.logs,
+        created_at=job.created_at, started_at=job.started_at, finished_at=job.finished_at,
+    )
+
+async def _get_owned_job(job_id: str, user: User) -> "job_service.CrewJob":
+    job = await job_service.get_job_manager().get(job_id)
+    # Jobs de outros usuários são tratados como inexistentes
+    if job is None or job.owner_id != str(user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    return job
+
+@router.post(
+    "/run-crew",
+    response_model=CrewJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Enfileira a execução de uma Crew AI"
+)
+async def handle_run_crew(crew_input: CrewInput = Body(...), user: User = Depends(get_authenticated_user)):
+    """
+    Enfileira uma tarefa complexa para uma equipe de agentes AI e retorna imediatamente o id do job.
+    Acompanhe com GET /run-crew/{job_id} e GET /run-crew/{job_id}/logs (SSE).
+    """
     logger.info(f"Recebido pedido para rodar crew sobre: {crew_input.topic}")
     try:
-        # Chama o serviço CrewAI (implementação virá na Fase 7)
-        result, logs = await crew_service.run_specific_crew(crew_input.topic, crew_input.parameters)
-        return CrewResponse(result=result, logs=logs)
-    except ValueError as e: # Exemplo: Tópico não suportado
-         logger.warning(f"Erro Crew (Input inválido): {e}")
-         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        job = await job_service.get_job_manager().submit(crew_input.topic, crew_input.parameters, owner_id=str(user.id))
+        return ModelJSONResponse(_job_response(job), status_code=status.HTTP_202_ACCEPTED)
+    except job_service.JobQueueFullError as e:
+        logger.warning(f"Erro Crew (fila cheia): {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
-        logger.error(f"Erro inesperado ao rodar Crew: {e}", exc_info=True)
+        logger.error(f"Erro inesperado ao enfileirar Crew: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao executar a Crew AI.")
 
+@router.get("/run-crew/{job_id}", response_model=CrewJobResponse, summary="Consulta estado e resultado de um job de Crew")
+async def handle_get_crew_job(job_id: str, user: User = Depends(get_authenticated_user)):
+    """Retorna o estado atual do job, seus logs até o momento e, se concluído, o resultado ou erro."""
+    return ModelJSONResponse(_job_response(await _get_owned_job(job_id, user)))
+
+@router.get("/run-crew/{job_id}/logs", summary="Acompanha os logs de um job de Crew em streaming (SSE)")
+async def handle_stream_crew_logs(job_id: str, user: User = Depends(get_authenticated_user)):
+    """Envia cada linha de log como um evento "log" assim que é produzida e termina com um evento "done" com o job."""
+    await _get_owned_job(job_id, user)
+    manager = job_service.get_job_manager()
+
+    async def events():
+        async for line in manager.stream_logs(job_id):
+            yield "log", {"text": line}
+        job = await manager.get(job_id)
+        yield "done", _job_response(job)
+
+    return await _sse_response(events(), "/run-crew/logs")
+
 @router.post("/generate-structured", response_model=GuardrailsResponse, summary="Gera dados estruturados com validação", dependencies=[Depends(get_authenticated_user)])
 async def handle_generate_structured(guard_input: GuardrailsInput = Body(...)):
     """Usa Guardrails para gerar e validar dados a partir de um prompt."""
     logger.info(f"Recebido pedido para gerar dados estruturados com spec: {guard_input.spec_name}")
+    metrics = guardrails_service.GenerationMetrics()
     try:
-        # Chama o serviço Guardrails (implementação virá na Fase 7)
+        # Chama o serviço Guardrails (placeholder ou geração em streaming com validação incremental)
         validated_data = await guardrails_service.generate_and_validate(
             guard_input.prompt,
             guard_input.spec_name,
-            guard_input.num_reasks
+            guard_input.num_reasks,
+            metrics=metrics
         )
         # Retorna sucesso com os dados validados
-        return GuardrailsResponse(validated_data=validated_data, error=None)
+        return ModelJSONResponse(GuardrailsResponse(validated_data=validated_data, error=None, metrics=metrics.as_dict()))
     except guardrails_service.GuardrailsValidationError as e: # Exemplo erro específico
         logger.warning(f"Erro Guardrails (Validação falhou): {e}")
         # Retorna sucesso (status 200), mas com erro na resposta
-        return GuardrailsResponse(validated_data=None, error=str(e))
+        return ModelJSONResponse(GuardrailsResponse(validated_data=None, error=str(e), metrics=metrics.as_dict()))
     except FileNotFoundError as e: # Exemplo: Spec não encontrada
          logger.error(f"Erro Guardrails (Spec não encontrada): {e}")
          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -94,11 +174,167 @@ async def handle_feedback_analysis(
     try:
         # Chama a função do serviço que criamos
         analysis_result = await feedback_analyzer_service.analyze_feedback_text(payload.text)
-        return analysis_result
+        return ModelJSONResponse(FeedbackAnalysisResponse.model_validate(analysis_result, from_attributes=True))
     except HTTPException as http_exc:
          # Re-levanta exceções HTTP que podem vir do serviço (para manter status code e detail)
          raise http_exc
     except Exception as e:
          # Captura qualquer outro erro inesperado
          logger.error(f"Erro não tratado na rota /feedback/analyze: {e}", exc_info=True)
-         raise HTTPException(status_code=500, detail="Erro interno do servidor ao processar o feedback.")
\ No newline at end of file
+         raise HTTPException(status_code=500, detail="Erro interno do servidor ao processar o feedback.")
+
+# --- Análise de feedback em lote ---
+# Cada item recebido vira (texto, None) se válido ou (None, erro) se inválido.
+BatchInputItem = Tuple[Optional[str], Optional[str]]
+
+def _parse_batch_item(raw: Any) -> BatchInputItem:
+    """Valida um item do lote: aceita {"text": "..."} ou uma string JSON simples."""
+    if isinstance(raw, str):
+        raw = {"text": raw}
+    try:
+        return FeedbackAnalysisRequest.model_validate(raw).text, None
+    except ValidationError as e:
+        return None, f"Item inválido: {e.errors()[0].get('msg', 'formato inesperado')}"
+
+def _check_batch_size(count: int) -> None:
+    if count > feedback_analyzer_service.FEEDBACK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Lote excede o limite de {feedback_analyzer_service.FEEDBACK_BATCH_MAX_ITEMS} itens."
+        )
+
+async def _read_jsonl_items(request: Request) -> List[BatchInputItem]:
+    """Lê um upload JSONL em streaming, uma linha por item, sem carregar o corpo inteiro de uma vez."""
+    items: List[BatchInputItem] = []
+    buffer = b""
+
+    def consume(line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            items.append(_parse_batch_item(json.loads(line)))
+        except json.JSONDecodeError:
+            items.append((None, "Linha JSONL inválida."))
+        _check_batch_size(len(items))
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            consume(line)
+    consume(buffer)
+    return items
+
+@router.post(
+    "/feedback/analyze-batch",
+    response_model=FeedbackBatchResponse,
+    summary="Analisa um lote de feedbacks (array JSON ou upload JSONL)",
+    dependencies=[Depends(get_authenticated_user)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": FeedbackAnalysisRequest.model_json_schema()}},
+                "application/x-ndjson": {"schema": {"type": "string", "description": "Um objeto {\"text\": ...} por linha"}},
+            },
+        }
+    },
+)
+async def handle_feedback_batch_analysis(request: Request):
+    """
+    Recebe vários feedbacks (array JSON ou JSONL com Content-Type application/x-ndjson),
+    analisa-os em packs com concorrência limitada e retorna um resultado ou erro por item.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = await _read_jsonl_items(request)
+    else:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Corpo JSON inválido.")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="O corpo deve ser um array JSON de feedbacks.")
+        _check_batch_size(len(body))
+        items = [_parse_batch_item(raw) for raw in body]
+
+    logger.info(f"Recebido lote de {len(items)} feedbacks para análise")
+    valid_indexes = [i for i, (text, _) in enumerate(items) if text is not None]
+    try:
+        analyses = await feedback_analyzer_service.analyze_feedback_batch([items[i][0] for i in valid_indexes])
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        logger.error(f"Erro não tratado na rota /feedback/analyze-batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor ao processar o lote de feedbacks.")
+
+    results = [FeedbackBatchItemResult(index=i, error=error) for i, (_, error) in enumerate(items)]
+    for i, (analysis, error) in zip(valid_indexes, analyses):
+        results[i] = FeedbackBatchItemResult(index=i, result=analysis, error=error)
+    succeeded = sum(1 for r in results if r.result is not None)
+    return ModelJSONResponse(FeedbackBatchResponse(results=results, total=len(results), succeeded=succeeded, failed=len(results) - succeeded))
+
+# --- Streaming (Server-Sent Events) ---
+# Os eventos são ("token", {"text": ...}) durante a geração e ("done", ...) com o resultado final.
+# Erros antes do primeiro evento viram respostas HTTP normais; depois disso, um evento "error".
+# Quando o cliente desconecta, o Starlette cancela o envio da resposta e o cancelamento chega ao
+# serviço, que fecha o stream da OpenAI (a geração para de consumir tokens).
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+async def _sse_response(events: AsyncIterator[Tuple[str, Any]], route: str) -> StreamingResponse:
+    first = await anext(events, None) # Propaga erros de configuração/retrieval como status HTTP
+
+    async def body():
+        try:
+            if first is not None:
+                yield _format_sse(*first)
+            async for event, data in events:
+                yield _format_sse(event, data)
+        except HTTPException as e:
+            yield _format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error(f"Erro não tratado durante o streaming em {route}: {e}", exc_info=True)
+            yield _format_sse("error", {"status_code": 500, "detail": "Erro interno durante o streaming."})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/rag-query/stream", summary="Consulta RAG em streaming (SSE)")
+async def handle_rag_query_stream(query: RagQueryInput = Body(...), user: User = Depends(get_authenticated_user)):
+    """Igual a /rag-query, mas envia os tokens da resposta via SSE e termina com um evento "done" com as fontes."""
+    logger.info(f"Recebida consulta RAG (stream): {query.question}")
+    try:
+        events = rag_service.stream_knowledge_base(query.question, user_id=str(user.id), session_id=query.session_id)
+        return await _sse_response(events, "/rag-query/stream")
+    except rag_service.VectorStoreNotReadyError as e:
+         logger.warning(f"Erro RAG (Vector Store não pronto): {e}")
+         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except HTTPException as http_exc:
+         raise http_exc
+    except Exception as e:
+        logger.error(f"Erro inesperado na consulta RAG (stream): {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao processar consulta RAG.")
+
+@router.post(
+    "/feedback/analyze/stream",
+    summary="Analisa texto de feedback em streaming (SSE)",
+    dependencies=[Depends(get_authenticated_user)]
+)
+async def handle_feedback_analysis_stream(payload: FeedbackAnalysisRequest = Body(...)):
+    """
+    Igual a /feedback/analyze, mas envia os fragmentos do JSON gerado via SSE e termina com um
+    evento "done" contendo a análise validada (mesmo formato de FeedbackAnalysisResponse).
+    """
+    logger.info(f"Recebida requisição para analisar feedback (stream): '{payload.text[:50]}...'")
+    try:
+        return await _sse_response(feedback_analyzer_service.stream_feedback_analysis(payload.text), "/feedback/analyze/stream")
+    except HTTPException as http_exc:
+         raise http_exc
+    except Exception as e:
+         logger.error(f"Erro não tratado na rota /feedback/analyze/stream: {e}", exc_info=True)
+         raise HTTPException(status_code=500, detail="Erro interno do servidor ao processar o feedback.")
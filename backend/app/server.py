@@ -0,0 +1,149 @@
+# backend/app/server.py
+"""
+Launcher de produção da API (multi-worker).
+
+    python -m app.server [--workers N] [--port 8000] [--reload] [--dry-run]
+
+Sobe N processos uvicorn atrás do mesmo socket, com uvloop/httptools (fixados no requirements.txt;
+se não estiverem instalados, cai para asyncio/h11 com um aviso). Toda a configuração vem de
+variáveis de ambiente (SERVER_*), com os argumentos de linha de comando por cima:
+
+- SERVER_WORKERS: padrão = CPUs utilizáveis pelo processo (afinidade + cota de CPU do cgroup), no
+  mínimo 1. A app é async: um worker por core; mais que isso só disputa CPU.
+- SERVER_MAX_REQUESTS: recicla cada worker após N requisições (limita crescimento de memória);
+  o supervisor do uvicorn sobe um substituto. 0 (padrão) desativa: a fila de jobs das Crews roda dentro
+  dos workers e só é recuperada uma vez por boot, então os jobs que aguardavam na fila de um worker
+  reciclado só voltam a rodar no próximo boot (os que estavam em execução são marcados como falhos).
+- SERVER_GRACEFUL_TIMEOUT_SECONDS: no SIGTERM, tempo para drenar requisições/streams em andamento
+  antes de fechar as conexões; o lifespan roda em seguida (fila de jobs, gateway, índice vetorial).
+- SERVER_KEEPALIVE_SECONDS / SERVER_BACKLOG / SERVER_LIMIT_CONCURRENCY: keep-alive deve ser maior que
+  o idle timeout do load balancer, senão o LB reaproveita conexões que o worker já fechou.
+
+Os workers são criados por spawn (não fork), então nada é compartilhado copy-on-write. O que é seguro
+preparar uma única vez fica no processo mestre: a validação da configuração, o bytecode de app/
+(compilado antes de subir N processos que o importariam ao mesmo tempo) e um SERVER_BOOT_ID para
+que só o primeiro worker de cada boot recupere a fila de jobs. O índice vetorial local é lido via
+memmap, então suas páginas já são compartilhadas pelo cache do SO entre os workers.
+"""
+import os
+import sys
+import json
+import uuid
+import logging
+import argparse
+import compileall
+import importlib.util
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def available_cpus() -> int:
+    """CPUs que este processo pode usar: afinidade do scheduler limitada pela cota do cgroup v2 (containers)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError: # macOS/Windows
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _optional(module: str, preferred: str, fallback: str) -> str:
+    return preferred if importlib.util.find_spec(module) is not None else fallback
+
+
+# --- Configuração (variáveis de ambiente) ---
+SERVER_HOST: str = os.getenv("SERVER_HOST", os.getenv("HOST", "0.0.0.0"))
+SERVER_PORT: int = int(os.getenv("SERVER_PORT", os.getenv("PORT", "8000")))
+SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "0")) # 0 = available_cpus()
+SERVER_LOOP: str = os.getenv("SERVER_LOOP", _optional("uvloop", "uvloop", "asyncio"))
+SERVER_HTTP: str = os.getenv("SERVER_HTTP", _optional("httptools", "httptools", "h11"))
+SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", "2048"))
+SERVER_KEEPALIVE_SECONDS: int = int(os.getenv("SERVER_KEEPALIVE_SECONDS", "75"))
+SERVER_LIMIT_CONCURRENCY: int = int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0")) # 0 = sem limite (responde 503 acima dele)
+SERVER_MAX_REQUESTS: int = int(os.getenv("SERVER_MAX_REQUESTS", "0")) # 0 = sem reciclagem (ver docstring)
+SERVER_GRACEFUL_TIMEOUT_SECONDS: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "30"))
+SERVER_PROXY_HEADERS: bool = os.getenv("SERVER_PROXY_HEADERS", "true").lower() == "true"
+SERVER_FORWARDED_ALLOW_IPS: str = os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+SERVER_ACCESS_LOG: bool = os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true"
+SERVER_LOG_LEVEL: str = os.getenv("SERVER_LOG_LEVEL", "info")
+
+
+def build_config(workers: Optional[int] = None, host: Optional[str] = None, port: Optional[int] = None, reload: bool = False) -> Dict[str, Any]:
+    """Argumentos de `uvicorn.run` para o modo produção (ou desenvolvimento, com reload)."""
+    if reload:
+        # Desenvolvimento: um processo, recarrega ao salvar (workers/reciclagem não se aplicam)
+        return {"app": "app.main:app", "host": host or SERVER_HOST, "port": port or SERVER_PORT, "reload": True, "reload_dirs": [os.path.join(BACKEND_DIR, "app")]}
+    workers = workers or SERVER_WORKERS or available_cpus()
+    if workers < 1:
+        raise ValueError(f"Número de workers inválido: {workers}")
+    return {
+        "app": "app.main:app",
+        "host": host or SERVER_HOST,
+        "port": port or SERVER_PORT,
+        "workers": workers,
+        "loop": SERVER_LOOP,
+        "http": SERVER_HTTP,
+        "backlog": SERVER_BACKLOG,
+        "timeout_keep_alive": SERVER_KEEPALIVE_SECONDS,
+        "limit_concurrency": SERVER_LIMIT_CONCURRENCY or None,
+        "limit_max_requests": SERVER_MAX_REQUESTS or None,
+        "timeout_graceful_shutdown": SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "proxy_headers": SERVER_PROXY_HEADERS,
+        "forwarded_allow_ips": SERVER_FORWARDED_ALLOW_IPS,
+        "access_log": SERVER_ACCESS_LOG,
+        "log_level": SERVER_LOG_LEVEL,
+    }
+
+
+def prepare_master() -> str:
+    """Preparação única no processo mestre, antes de subir os workers. Retorna o SERVER_BOOT_ID."""
+    if SERVER_MAX_REQUESTS:
+        logger.warning(f"[server] Reciclagem de workers ativa (SERVER_MAX_REQUESTS={SERVER_MAX_REQUESTS}): jobs na fila de um worker reciclado só voltam a rodar no próximo boot.")
+    if SERVER_LOOP == "asyncio" or SERVER_HTTP == "h11":
+        logger.warning(f"[server] uvloop/httptools indisponíveis (loop={SERVER_LOOP}, http={SERVER_HTTP}); instale o requirements.txt para o modo produção.")
+    compileall.compile_dir(os.path.join(BACKEND_DIR, "app"), quiet=1)
+    boot_id = os.environ.setdefault("SERVER_BOOT_ID", uuid.uuid4().hex)
+    return boot_id
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Servidor de produção da API (uvicorn multi-worker).")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: SERVER_WORKERS ou CPUs disponíveis)")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--reload", action="store_true", help="Modo desenvolvimento: um processo com reload")
+    parser.add_argument("--dry-run", action="store_true", help="Só imprime a configuração resolvida")
+    args = parser.parse_args(argv)
+
+    config = build_config(workers=args.workers, host=args.host, port=args.port, reload=args.reload)
+    if args.dry_run:
+        print(json.dumps(config, indent=2))
+        return 0
+
+    import uvicorn
+
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR) # "app.main:app" é resolvido a partir de backend/, também nos workers
+    if not args.reload:
+        boot_id = prepare_master()
+        logger.info(
+            f"[server] Iniciando {config['workers']} workers em {config['host']}:{config['port']} "
+            f"(loop={config['loop']}, http={config['http']}, reciclagem={config['limit_max_requests']}, boot={boot_id[:8]})"
+        )
+    uvicorn.run(**config)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+    sys.exit(main())
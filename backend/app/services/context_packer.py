@@ -0,0 +1,172 @@
+# backend/app/services/context_packer.py
+"""
+Empacotamento do contexto do RAG dentro de um orçamento de tokens.
+
+Os chunks recuperados chegam ordenados por relevância. Antes de montar o prompt:
+1. Chunks quase duplicados (similaridade de cosseno entre os embeddings >= RAG_CONTEXT_DEDUP_SIMILARITY,
+   ou texto idêntico após normalização quando não há embedding) são descartados, mantendo o mais relevante.
+2. Os blocos "[i] (fonte: ...)\\n<conteúdo>" são adicionados gulosamente, em ordem de relevância, enquanto
+   couberem em RAG_CONTEXT_TOKEN_BUDGET; um chunk que não cabe é pulado e os seguintes (menores) ainda
+   são tentados. Se nem o mais relevante couber, ele entra truncado (o contexto nunca fica vazio).
+
+Os tokens são contados com o tiktoken (encoding do modelo de chat). O arquivo BPE é baixado na primeira
+utilização e guardado em TIKTOKEN_CACHE_DIR; sem rede e sem cache, cai para a estimativa de ~4 caracteres
+por token (a mesma do llm_gateway), registrando um aviso.
+"""
+import os
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from app.services.result_cache import normalize_text
+from app.services.vector_store import SearchResult
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+RAG_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2000"))
+RAG_CONTEXT_DEDUP_SIMILARITY: float = float(os.getenv("RAG_CONTEXT_DEDUP_SIMILARITY", "0.95")) # > 1 desativa
+RAG_TOKENIZER_ENCODING: str = os.getenv("RAG_TOKENIZER_ENCODING", "") # vazio = encoding do modelo de chat
+
+TRUNCATION_MARKER = " [...]"
+
+
+class _ApproximateEncoding:
+    """Fallback sem tiktoken/arquivo BPE: ~4 caracteres por token."""
+    name = "approx-4-chars"
+
+    def encode(self, text: str) -> List[int]:
+        return [0] * (len(text) // 4 + 1)
+
+    def decode(self, tokens: List[int]) -> str:
+        raise NotImplementedError
+
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model: str):
+    """Encoding do tiktoken para `model` (ou RAG_TOKENIZER_ENCODING), carregado uma vez por processo."""
+    key = RAG_TOKENIZER_ENCODING or model
+    encoding = _encodings.get(key)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        if key not in _encodings:
+            try:
+                import tiktoken
+                if RAG_TOKENIZER_ENCODING:
+                    _encodings[key] = tiktoken.get_encoding(RAG_TOKENIZER_ENCODING)
+                else:
+                    try:
+                        _encodings[key] = tiktoken.encoding_for_model(model)
+                    except KeyError: # modelo desconhecido pelo tiktoken
+                        _encodings[key] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"[context_packer] tiktoken indisponível para '{key}' ({type(e).__name__}: {e}); usando estimativa de ~4 caracteres/token.")
+                _encodings[key] = _ApproximateEncoding()
+    return _encodings[key]
+
+
+def set_encoding(model: str, encoding) -> None:
+    """Substitui o encoding de um modelo (útil em testes)."""
+    _encodings[RAG_TOKENIZER_ENCODING or model] = encoding
+
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode(text))
+
+
+def format_block(index: int, result: SearchResult) -> str:
+    return f"[{index}] (fonte: {result.metadata.get('source', 'desconhecida')})\n{result.content}"
+
+
+@dataclass
+class PackedChunk:
+    result: SearchResult
+    tokens: int
+    truncated: bool = False
+
+
+@dataclass
+class PackedContext:
+    chunks: List[PackedChunk] = field(default_factory=list)
+    text: str = ""
+    tokens: int = 0
+    budget: int = 0
+    duplicates_dropped: int = 0
+    over_budget_dropped: int = 0
+
+    @property
+    def results(self) -> List[SearchResult]:
+        return [chunk.result for chunk in self.chunks]
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def deduplicate(results: List[SearchResult], threshold: float = RAG_CONTEXT_DEDUP_SIMILARITY) -> List[SearchResult]:
+    """Remove quase duplicados, mantendo a primeira ocorrência (a mais relevante)."""
+    kept: List[SearchResult] = []
+    kept_vectors: List[np.ndarray] = []
+    kept_texts = set()
+    for result in results:
+        text = normalize_text(result.content)
+        if text in kept_texts:
+            continue
+        if result.embedding is not None and threshold <= 1.0:
+            vector = _unit(result.embedding)
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= threshold:
+                continue
+            kept_vectors.append(vector)
+        kept_texts.add(text)
+        kept.append(result)
+    return kept
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Corta `text` para caber em `max_tokens` tokens (com o marcador de truncamento)."""
+    encoding = get_encoding(model)
+    if isinstance(encoding, _ApproximateEncoding):
+        return text[: max(0, max_tokens * 4 - len(TRUNCATION_MARKER))] + TRUNCATION_MARKER
+    return encoding.decode(encoding.encode(text)[: max(0, max_tokens - count_tokens(TRUNCATION_MARKER, model))]) + TRUNCATION_MARKER
+
+
+def pack_context(
+    results: List[SearchResult],
+    model: str,
+    budget: int = RAG_CONTEXT_TOKEN_BUDGET,
+    max_chunks: Optional[int] = None,
+    dedup_threshold: float = RAG_CONTEXT_DEDUP_SIMILARITY,
+    formatter: Callable[[int, SearchResult], str] = format_block,
+) -> PackedContext:
+    """Deduplica e preenche o orçamento de tokens com os chunks, em ordem de relevância."""
+    candidates = deduplicate(sorted(results, key=lambda r: r.similarity, reverse=True), dedup_threshold)
+    packed = PackedContext(budget=budget, duplicates_dropped=len(results) - len(candidates))
+    separator_tokens = count_tokens("\n\n", model)
+    blocks: List[str] = []
+    for result in candidates:
+        if max_chunks is not None and len(packed.chunks) >= max_chunks:
+            break
+        block = formatter(len(packed.chunks) + 1, result)
+        tokens = count_tokens(block, model) + (separator_tokens if blocks else 0)
+        if packed.tokens + tokens <= budget:
+            blocks.append(block)
+            packed.chunks.append(PackedChunk(result, tokens))
+            packed.tokens += tokens
+        elif not packed.chunks:
+            block = truncate_to_tokens(block, budget, model)
+            tokens = count_tokens(block, model)
+            blocks.append(block)
+            packed.chunks.append(PackedChunk(result, tokens, truncated=True))
+            packed.tokens += tokens
+        else:
+            packed.over_budget_dropped += 1
+    packed.text = "\n\n".join(blocks)
+    return packed
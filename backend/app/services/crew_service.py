@@ -1,12 +1,16 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/services/crew_service.py:
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Callable, Dict, Any, Optional, List, Tuple
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Marcar a função como async
-async def run_specific_crew(topic: str, parameters: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[List[str]]]:
+async def run_specific_crew(
+    topic: str,
+    parameters: Optional[Dict[str, Any]] = None,
+    on_log: Optional[Callable[[str], None]] = None,
+) -> Tuple[Any, Optional[List[str]]]:
     """
     Placeholder para executar uma crew AI específica.
     Na Fase 7, esta função conterá a lógica para:
@@ -16,14 +20,27 @@ async def run_specific_crew(topic: str, parameters: Optional[Dict[str, Any]] = N
     4. Instanciar a Crew (com agents, tasks, process).
     5. Executar a Crew com `crew.kickoff(inputs={...})`.
     6. Formatar e retornar o resultado e logs/métricas.
+    Cada linha de log também é entregue a `on_log` assim que é produzida (ex: step_callback da Crew),
+    para que a fila de jobs possa transmiti-la ao vivo.
     """
     logger.info(f"[crew_service] Iniciando crew (placeholder) para tópico: '{topic}' com params: {parameters}")
-    await asyncio.sleep(0.3) # Simula execução assíncrona
+    logs: List[str] = []
+
+    def emit(line: str) -> None:
+        logs.append(line)
+        if on_log is not None:
+            on_log(line)
+
+    emit(f"INFO: Crew para '{topic}' iniciada.")
+    await asyncio.sleep(0.15) # Simula execução assíncrona
+    emit("DEBUG: Agente Pesquisador buscando...")
+    await asyncio.sleep(0.15)
+    emit("DEBUG: Agente Escritor formatando...")
     result = {
         "summary": f"Resultado placeholder para a análise do tópico '{topic}'.",
         "details": "Esta é uma resposta simulada pela crew placeholder.",
         "confidence": 0.5
     }
-    logs = [f"INFO: Crew para '{topic}' iniciada.", "DEBUG: Agente Pesquisador buscando...", "DEBUG: Agente Escritor formatando...", f"INFO: Crew para '{topic}' finalizada."]
+    emit(f"INFO: Crew para '{topic}' finalizada.")
     logger.info(f"[crew_service] Crew (placeholder) finalizada.")
     return result, logs
\ No newline at end of file
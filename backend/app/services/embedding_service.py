@@ -0,0 +1,227 @@
+# backend/app/services/embedding_service.py
+"""
+Motor de embeddings plugável usado pelo RAG.
+
+- Backends: API remota da OpenAI ("openai") ou modelo local em CPU via sentence-transformers
+  ("local", runtime torch ou ONNX).
+- Micro-batching: chamadas concorrentes a `embed()` são agrupadas numa única chamada à API
+  ou num único forward pass (até EMBEDDING_BATCH_MAX_SIZE textos ou EMBEDDING_BATCH_MAX_WAIT_MS).
+- Cache: embeddings são memoizados pelo hash do conteúdo (modelo + dimensão + texto).
+Os vetores são retornados como arrays NumPy float32.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+from app.services import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "openai").strip().lower() # "openai" ou "local"
+EMBEDDING_MODEL: str = os.getenv(
+    "EMBEDDING_MODEL",
+    "text-embedding-3-small" if EMBEDDING_BACKEND == "openai" else "sentence-transformers/all-MiniLM-L6-v2",
+)
+# Deve corresponder à coluna public.documents.embedding (vector(1536) na migração inicial).
+# No backend local o padrão é 0 = dimensão nativa do modelo (384 no all-MiniLM-L6-v2).
+EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "1536" if EMBEDDING_BACKEND == "openai" else "0"))
+EMBEDDING_LOCAL_RUNTIME: str = os.getenv("EMBEDDING_LOCAL_RUNTIME", "torch").strip().lower() # "torch" ou "onnx"
+EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+EMBEDDING_BATCH_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EMBEDDING_CACHE_MAX_SIZE: int = int(os.getenv("EMBEDDING_CACHE_MAX_SIZE", "50000"))
+EMBEDDING_CACHE_TTL_SECONDS: float = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400"))
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class EmbeddingBackend(ABC):
+    """Interface dos backends: recebe uma lista de textos e devolve uma matriz (n, dim) float32."""
+    name: str = "base"
+    model: str = ""
+    dim: int = 0
+
+    @abstractmethod
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings via API compatível com a OpenAI, pelo gateway compartilhado (limites, retries, circuit breaker)."""
+    name = "openai"
+
+    def __init__(self, model: str, dim: int):
+        self.model = model
+        self.dim = dim
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        kwargs = {}
+        # Somente a família text-embedding-3 aceita reduzir a dimensão no servidor
+        if self.model.startswith("text-embedding-3"):
+            kwargs["dimensions"] = self.dim
+        response = await llm_gateway.get_llm_gateway().embeddings(model=self.model, input=texts, **kwargs)
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """Modelo sentence-transformers em CPU (runtime torch ou ONNX), executado fora do event loop."""
+    name = "local"
+
+    def __init__(self, model: str, dim: int, runtime: str = "torch"):
+        # Import pesado (torch/transformers) só acontece quando o backend local é usado
+        from sentence_transformers import SentenceTransformer
+
+        self.model = model
+        kwargs = {"device": "cpu"}
+        if runtime == "onnx":
+            kwargs["backend"] = "onnx"
+        self._model = SentenceTransformer(model, **kwargs)
+        native_dim = self._model.get_sentence_embedding_dimension()
+        if dim and dim < native_dim:
+            self._model.truncate_dim = dim # Matryoshka/truncamento para a dimensão configurada
+        elif dim and dim > native_dim:
+            raise EmbeddingError(f"EMBEDDING_DIM={dim} é maior que a dimensão nativa do modelo '{model}' ({native_dim}).")
+        self.dim = dim or native_dim
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, batch_size=len(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.to_thread(self._encode, texts)
+
+
+class EmbeddingEngine:
+    """Agrupa pedidos concorrentes em lotes e memoiza os embeddings por hash de conteúdo."""
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS,
+        cache_max_size: int = EMBEDDING_CACHE_MAX_SIZE,
+        cache_ttl_seconds: float = EMBEDDING_CACHE_TTL_SECONDS,
+    ):
+        self.backend = backend
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._cache: TTLCache = TTLCache(maxsize=cache_max_size, ttl=cache_ttl_seconds)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending: List[Tuple[str, str]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set() # referências fortes: o loop só guarda referências fracas das tasks
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+
+    @property
+    def dim(self) -> int:
+        return self.backend.dim
+
+    def content_hash(self, text: str) -> str:
+        return hashlib.sha256(f"{self.backend.name}:{self.backend.model}:{self.dim}:{text}".encode("utf-8")).hexdigest()
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Retorna o embedding (dim,) de um texto, usando cache e micro-batching."""
+        key = self.content_hash(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        future = self._inflight.get(key)
+        if future is None:
+            self.cache_misses += 1
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append((key, text))
+            self._schedule_flush()
+        # shield: o cancelamento de um chamador não cancela o lote compartilhado
+        return await asyncio.shield(future)
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Retorna a matriz (len(texts), dim) dos embeddings, na ordem de `texts`."""
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        vectors = await asyncio.gather(*(self.embed(text) for text in texts))
+        return np.stack(vectors)
+
+    def _schedule_flush(self) -> None:
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, str]]) -> None:
+        self.batches += 1
+        try:
+            matrix = await self.backend.embed_batch([text for _, text in batch])
+            if matrix.shape != (len(batch), self.dim):
+                raise EmbeddingError(f"Backend retornou shape {matrix.shape}, esperado {(len(batch), self.dim)}.")
+        except Exception as e:
+            logger.error(f"[embedding_service] Falha ao gerar lote de {len(batch)} embeddings: {e}", exc_info=True)
+            for key, _ in batch:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        for (key, _), vector in zip(batch, matrix):
+            vector.setflags(write=False) # vetores em cache são compartilhados entre chamadores
+            self._cache[key] = vector
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cache_size": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "batches": self.batches,
+        }
+
+
+_engine: Optional[EmbeddingEngine] = None
+
+
+def create_backend(backend: str = EMBEDDING_BACKEND, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM) -> EmbeddingBackend:
+    if backend == "openai":
+        return OpenAIEmbeddingBackend(model, dim)
+    if backend == "local":
+        return LocalEmbeddingBackend(model, dim, EMBEDDING_LOCAL_RUNTIME)
+    raise EmbeddingError(f"EMBEDDING_BACKEND desconhecido: '{backend}' (use 'openai' ou 'local').")
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """Retorna o motor de embeddings do processo, criado na primeira chamada a partir da configuração."""
+    global _engine
+    if _engine is None:
+        _engine = EmbeddingEngine(create_backend())
+        logger.info(f"[embedding_service] Motor de embeddings: backend={_engine.backend.name}, modelo={_engine.backend.model}, dim={_engine.dim}")
+        if _engine.dim != 1536:
+            logger.warning("[embedding_service] Dimensão diferente de 1536: ajuste a coluna public.documents.embedding para o mesmo tamanho.")
+    return _engine
+
+
+def set_embedding_engine(engine: Optional[EmbeddingEngine]) -> None:
+    """Substitui o motor global (útil em testes e benchmarks)."""
+    global _engine
+    _engine = engine
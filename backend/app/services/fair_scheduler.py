@@ -0,0 +1,121 @@
+# backend/app/services/fair_scheduler.py
+"""
+Escalonamento justo (fair share) das vagas de concorrência dos modelos no llm_gateway.
+
+Com um semáforo comum, a ordem de atendimento é a de chegada: um usuário que dispara 50 análises
+ocupa a fila inteira e todos os outros esperam atrás dele. `FairSemaphore` mantém uma fila por
+usuário e, quando uma vaga abre, atende o usuário com menor tempo virtual (stride scheduling):
+cada atendimento soma 1/peso ao tempo virtual do usuário, então, sob disputa, cada um recebe vagas
+proporcionais ao seu peso (papel em `app_metadata`, ver app.rate_limit) e as chamadas se intercalam.
+Sem disputa (vaga livre e ninguém esperando), o custo é o mesmo de um asyncio.Semaphore.
+
+O usuário da requisição atual chega ao gateway por um ContextVar (`set_current_principal`), definido
+pela dependência de rate limit nas rotas e pelos workers de jobs ao executar cada job.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = "anonymous" # chamadas fora de uma requisição autenticada (ingestão, warmup, scripts)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: str
+    weight: float = 1.0
+
+
+_current: contextvars.ContextVar[Optional[Principal]] = contextvars.ContextVar("llm_principal", default=None)
+
+
+def set_current_principal(principal: Optional[Principal]) -> contextvars.Token:
+    return _current.set(principal)
+
+
+def current_principal() -> Principal:
+    return _current.get() or Principal(ANONYMOUS)
+
+
+class FairSemaphore:
+    """Semáforo com filas por usuário atendidas por tempo virtual ponderado."""
+
+    def __init__(self, value: int):
+        self._value = max(1, int(value))
+        self.capacity = self._value
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._weights: Dict[str, float] = {}
+        self._vtime: Dict[str, float] = {} # tempo virtual de cada usuário com pedidos na fila
+        self._clock = 0.0 # tempo virtual do último atendimento (novos usuários entram a partir dele)
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def locked(self) -> bool:
+        return self._value == 0
+
+    def _charge(self, principal: Principal) -> None:
+        start = max(self._vtime.get(principal.id, 0.0), self._clock)
+        self._clock = start
+        self._vtime[principal.id] = start + 1.0 / max(principal.weight, 0.01)
+
+    async def acquire(self, principal: Optional[Principal] = None) -> bool:
+        principal = principal or current_principal()
+        if self._value > 0 and not self._queues:
+            self._value -= 1
+            self._charge(principal)
+            return True
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(principal.id)
+        if queue is None:
+            queue = self._queues[principal.id] = deque()
+            # Quem volta a disputar não acumula crédito do tempo em que ficou ocioso
+            self._vtime[principal.id] = max(self._vtime.get(principal.id, 0.0), self._clock)
+        self._weights[principal.id] = principal.weight
+        queue.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # a vaga chegou junto com o cancelamento: repassa
+            else:
+                self._discard(principal.id, future)
+            raise
+        return True
+
+    def _discard(self, key: str, future: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[key]
+
+    def release(self) -> None:
+        while self._queues:
+            key = min(self._queues, key=lambda k: self._vtime.get(k, 0.0))
+            queue = self._queues[key]
+            future = queue.popleft()
+            if not queue:
+                del self._queues[key]
+            if future.done(): # cancelado enquanto esperava
+                continue
+            self._charge(Principal(key, self._weights.get(key, 1.0)))
+            future.set_result(True)
+            return
+        self._value = min(self.capacity, self._value + 1)
+        if not self._queues and len(self._vtime) > 10_000:
+            self._vtime.clear() # ninguém esperando: o histórico pode ser descartado
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
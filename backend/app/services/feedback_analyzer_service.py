@@ -2,33 +2,29 @@
 
 import os
 import json
+import asyncio
+import hashlib
 import logging
-from openai import AsyncOpenAI, OpenAIError # Importa a lib da OpenAI
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from openai import OpenAIError # Erros da OpenAI (o gateway também os utiliza)
 from fastapi import HTTPException
 
+from app.metrics import stage_timer
 from app.models.ai_models import FeedbackAnalysisResponse
+from app.services import llm_gateway
+from app.services.result_cache import ResultCache, content_key, normalize_text
+from app.services.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-# Inicializa o cliente OpenAI fora da função para reutilização
-# Pega a chave da variável de ambiente configurada no .env
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.warning("OPENAI_API_KEY não encontrada. A análise de feedback não funcionará.")
-    # Você pode decidir lançar um erro aqui ou permitir que continue (mas falhará na chamada)
-    # raise ValueError("Chave da API OpenAI não configurada.")
+# As chamadas ao LLM passam pelo gateway compartilhado (pool de conexões, limites por modelo, retries
+# e circuit breaker); o endpoint e a chave vêm de LLM_BASE_URL / OPENAI_API_KEY.
+FEEDBACK_MODEL = os.getenv("FEEDBACK_MODEL", "gpt-3.5-turbo") # Modelo recomendado para custo/benefício
+FEEDBACK_TEMPERATURE = 0.2 # Baixa temperatura para respostas mais consistentes/determinísticas
+SYSTEM_PROMPT = "Você é um assistente útil que analisa feedback de clientes e retorna a análise em formato JSON."
 
-# Usar AsyncOpenAI para chamadas assíncronas
-client = AsyncOpenAI(api_key=api_key)
-
-async def analyze_feedback_text(text: str) -> FeedbackAnalysisResponse:
-    """
-    Analisa o texto do feedback usando a API da OpenAI.
-    """
-    if not client.api_key:
-         raise HTTPException(status_code=500, detail="Configuração da API OpenAI ausente no servidor.")
-
-    prompt = f"""
+# Templates de prompt (qualquer alteração muda FEEDBACK_PROMPT_VERSION e invalida o cache de resultados)
+FEEDBACK_PROMPT_TEMPLATE = """
     Analise o seguinte feedback de cliente:
     ---
     {text}
@@ -43,15 +39,121 @@ async def analyze_feedback_text(text: str) -> FeedbackAnalysisResponse:
     Não inclua nenhuma explicação ou texto adicional fora do objeto JSON.
     """
 
+FEEDBACK_PACK_PROMPT_TEMPLATE = """
+    Analise CADA UM dos feedbacks de clientes abaixo (lista JSON; cada item tem um "id" e um "text"):
+    ---
+    {items}
+    ---
+
+    Sua tarefa é retornar SOMENTE um objeto JSON válido com a seguinte estrutura, com exatamente um resultado por "id":
+    {{
+      "results": [
+        {{
+          "id": 0,            // O mesmo "id" do feedback analisado.
+          "sentiment": "...", // Classifique o sentimento como Positivo, Negativo ou Neutro.
+          "summary": "...",   // Gere um resumo conciso de uma frase do ponto principal.
+          "topics": ["...", "...", "..."] // Liste os 3 tópicos ou palavras-chave mais importantes mencionados. Se houver menos de 3, liste os que encontrar.
+        }}
+      ]
+    }}
+    Analise cada feedback de forma independente. Não inclua nenhuma explicação ou texto adicional fora do objeto JSON.
+    """
+
+FEEDBACK_PROMPT_VERSION = os.getenv("FEEDBACK_PROMPT_VERSION") or hashlib.sha256(
+    (SYSTEM_PROMPT + FEEDBACK_PROMPT_TEMPLATE + FEEDBACK_PACK_PROMPT_TEMPLATE).encode("utf-8")
+).hexdigest()[:16]
+
+# Cache de resultados: memória (LRU + TTL) e, opcionalmente, um arquivo SQLite local
+feedback_cache = ResultCache(
+    name="feedback_analysis",
+    version=FEEDBACK_PROMPT_VERSION,
+    max_size=int(os.getenv("FEEDBACK_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("FEEDBACK_CACHE_TTL_SECONDS", "86400")),
+    sqlite_path=os.getenv("FEEDBACK_CACHE_SQLITE_PATH", ""),
+    persistent_ttl_seconds=float(os.getenv("FEEDBACK_CACHE_PERSISTENT_TTL_SECONDS", str(30 * 24 * 3600))),
+)
+
+# Coalescência de análises idênticas em andamento (mesma chave do cache)
+feedback_flight = SingleFlight("feedback_analysis")
+
+# Configuração da análise em lote: quantos feedbacks vão em cada prompt ("pack")
+# e quantos packs podem estar em andamento ao mesmo tempo.
+FEEDBACK_BATCH_PACK_SIZE = int(os.getenv("FEEDBACK_BATCH_PACK_SIZE", "10"))
+FEEDBACK_BATCH_CONCURRENCY = int(os.getenv("FEEDBACK_BATCH_CONCURRENCY", "4"))
+FEEDBACK_BATCH_MAX_ITEMS = int(os.getenv("FEEDBACK_BATCH_MAX_ITEMS", "1000"))
+
+# Limite global de packs em andamento, compartilhado por todos os lotes (criado no primeiro uso, por event loop)
+_batch_semaphore: Optional[asyncio.Semaphore] = None
+_batch_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Resultado por item de um lote: (análise, None) em caso de sucesso ou (None, mensagem de erro)
+BatchItemResult = Tuple[Optional[FeedbackAnalysisResponse], Optional[str]]
+
+
+def _build_analysis(analysis_data: dict) -> FeedbackAnalysisResponse:
+    """Valida minimamente o JSON retornado pela IA e monta a resposta. Levanta ValueError."""
+    with stage_timer("validation"):
+        return _validate_analysis(analysis_data)
+
+
+def _validate_analysis(analysis_data: dict) -> FeedbackAnalysisResponse:
+    if not isinstance(analysis_data, dict):
+        raise ValueError("Resposta da IA não é um objeto JSON.")
+    if not all(key in analysis_data for key in ["sentiment", "summary", "topics"]):
+        raise ValueError("Estrutura JSON da resposta da IA está incompleta.")
+    if not isinstance(analysis_data.get("topics"), list):
+        raise ValueError("Campo 'topics' na resposta da IA não é uma lista.")
+    # Usamos .get com fallback para evitar KeyErrors se a IA falhar em incluir um campo
+    return FeedbackAnalysisResponse(
+        sentiment=analysis_data.get("sentiment", "Erro na Análise"),
+        summary=analysis_data.get("summary", "Erro na Análise"),
+        topics=analysis_data.get("topics", ["Erro na Análise"])
+    )
+
+def feedback_cache_key(text: str) -> str:
+    """Chave do cache: hash do texto normalizado + modelo + versão do prompt + temperatura."""
+    return content_key(normalize_text(text), FEEDBACK_MODEL, feedback_cache.version, FEEDBACK_TEMPERATURE)
+
+async def invalidate_feedback_cache(new_prompt_version: Optional[str] = None) -> int:
+    """Invalida o cache de análises (ex: após mudar o template do prompt sem reiniciar o processo)."""
+    return await feedback_cache.invalidate(new_prompt_version)
+
+async def analyze_feedback_text(text: str) -> FeedbackAnalysisResponse:
+    """
+    Analisa o texto do feedback usando a API da OpenAI.
+    Resultados ficam no cache endereçado por conteúdo; textos equivalentes não chamam a API de novo,
+    nem mesmo quando chegam ao mesmo tempo (coalescência via SingleFlight).
+    """
+    if not llm_gateway.get_llm_gateway().is_configured():
+         raise HTTPException(status_code=500, detail="Configuração da API OpenAI ausente no servidor.")
+
+    cache_key = feedback_cache_key(text)
+    cached = await feedback_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Análise de feedback servida do cache: '{text[:50]}...'")
+        return FeedbackAnalysisResponse.model_validate(cached)
+
+    # Textos equivalentes analisados ao mesmo tempo compartilham uma única chamada ao LLM
+    return await feedback_flight.do(cache_key, lambda: _analyze_and_cache(text, cache_key))
+
+async def _analyze_and_cache(text: str, cache_key: str) -> FeedbackAnalysisResponse:
+    analysis = await _analyze_uncached(text)
+    await feedback_cache.set(cache_key, analysis.model_dump())
+    return analysis
+
+async def _analyze_uncached(text: str) -> FeedbackAnalysisResponse:
+    analysis_content = None
+    prompt = FEEDBACK_PROMPT_TEMPLATE.format(text=text)
+
     try:
         logger.info(f"Chamando API OpenAI para analisar feedback: '{text[:50]}...'")
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo", # Modelo recomendado para custo/benefício
+        response = await llm_gateway.get_llm_gateway().chat_completion(
+            model=FEEDBACK_MODEL,
             messages=[
-                {"role": "system", "content": "Você é um assistente útil que analisa feedback de clientes e retorna a análise em formato JSON."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.2, # Baixa temperatura para respostas mais consistentes/determinísticas
+            temperature=FEEDBACK_TEMPERATURE,
             response_format={"type": "json_object"} # Solicita explicitamente JSON
         )
 
@@ -65,19 +167,7 @@ async def analyze_feedback_text(text: str) -> FeedbackAnalysisResponse:
         analysis_data = json.loads(analysis_content)
 
         # Validar minimamente a estrutura esperada (Pydantic fará validação mais completa na resposta da rota)
-        if not all(key in analysis_data for key in ["sentiment", "summary", "topics"]):
-             raise ValueError("Estrutura JSON da resposta da IA está incompleta.")
-        if not isinstance(analysis_data.get("topics"), list):
-             raise ValueError("Campo 'topics' na resposta da IA não é uma lista.")
-
-
-        # Retorna os dados parseados (a rota os transformará em FeedbackAnalysisResponse)
-        # Usamos .get com fallback para evitar KeyErrors se a IA falhar em incluir um campo
-        return FeedbackAnalysisResponse(
-             sentiment=analysis_data.get("sentiment", "Erro na Análise"),
-             summary=analysis_data.get("summary", "Erro na Análise"),
-             topics=analysis_data.get("topics", ["Erro na Análise"])
-         )
+        return _build_analysis(analysis_data)
 
 
     except OpenAIError as e:
@@ -91,4 +181,164 @@ async def analyze_feedback_text(text: str) -> FeedbackAnalysisResponse:
          raise HTTPException(status_code=500, detail=f"Dados inválidos recebidos do serviço de IA: {e}")
     except Exception as e:
         logger.error(f"Erro inesperado na análise de feedback: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Erro interno no servidor ao analisar feedback.") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erro interno no servidor ao analisar feedback.")
+
+
+async def stream_feedback_analysis(text: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Versão em streaming de analyze_feedback_text: emite ("token", {"text": ...}) com os fragmentos do JSON
+    à medida que o modelo os gera e, por último, ("done", análise validada).
+    Fechar o iterador (ex: cliente desconectou) fecha o stream da OpenAI e interrompe a geração.
+    """
+    if not llm_gateway.get_llm_gateway().is_configured():
+         raise HTTPException(status_code=500, detail="Configuração da API OpenAI ausente no servidor.")
+
+    cache_key = feedback_cache_key(text)
+    cached = await feedback_cache.get(cache_key)
+    if cached is not None:
+        yield "done", cached
+        return
+
+    try:
+        logger.info(f"Chamando API OpenAI (stream) para analisar feedback: '{text[:50]}...'")
+        stream = await llm_gateway.get_llm_gateway().chat_completion(
+            model=FEEDBACK_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": FEEDBACK_PROMPT_TEMPLATE.format(text=text)}
+            ],
+            temperature=FEEDBACK_TEMPERATURE,
+            response_format={"type": "json_object"},
+            stream=True
+        )
+    except OpenAIError as e:
+        logger.error(f"Erro na API OpenAI: {e}", exc_info=True)
+        raise HTTPException(status_code=502, detail=f"Erro ao comunicar com o serviço de IA: {e}")
+
+    parts: List[str] = []
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield "token", {"text": delta}
+    except OpenAIError as e:
+        logger.error(f"Erro na API OpenAI durante o stream: {e}", exc_info=True)
+        raise HTTPException(status_code=502, detail=f"Erro ao comunicar com o serviço de IA: {e}")
+    finally:
+        await stream.close()
+
+    analysis_content = "".join(parts)
+    try:
+        analysis = _build_analysis(json.loads(analysis_content))
+    except json.JSONDecodeError:
+        logger.error(f"Erro ao parsear JSON da resposta da IA: {analysis_content}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Formato inválido na resposta do serviço de IA.")
+    except ValueError as e:
+        logger.error(f"Erro de validação nos dados da IA: {e} - Dados: {analysis_content}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Dados inválidos recebidos do serviço de IA: {e}")
+    await feedback_cache.set(cache_key, analysis.model_dump())
+    yield "done", analysis.model_dump()
+
+
+def _get_batch_semaphore() -> asyncio.Semaphore:
+    """Semáforo de FEEDBACK_BATCH_CONCURRENCY do processo: lotes simultâneos dividem o mesmo limite."""
+    global _batch_semaphore, _batch_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _batch_semaphore is None or _batch_semaphore_loop is not loop:
+        _batch_semaphore = asyncio.Semaphore(max(1, FEEDBACK_BATCH_CONCURRENCY))
+        _batch_semaphore_loop = loop
+    return _batch_semaphore
+
+
+def _build_pack_prompt(texts: List[str]) -> str:
+    items = json.dumps([{"id": i, "text": t} for i, t in enumerate(texts)], ensure_ascii=False)
+    return FEEDBACK_PACK_PROMPT_TEMPLATE.format(items=items)
+
+
+async def _analyze_pack(texts: List[str], semaphore: asyncio.Semaphore) -> List[BatchItemResult]:
+    """Analisa vários feedbacks numa única chamada ao LLM (structured output com um resultado por id)."""
+    async with semaphore:
+        try:
+            logger.info(f"Chamando API OpenAI para analisar pack de {len(texts)} feedbacks")
+            response = await llm_gateway.get_llm_gateway().chat_completion(
+                model=FEEDBACK_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _build_pack_prompt(texts)}
+                ],
+                temperature=FEEDBACK_TEMPERATURE,
+                response_format={"type": "json_object"}
+            )
+            content = response.choices[0].message.content
+            if not content:
+                raise ValueError("Resposta vazia da API de IA.")
+            pack_results = json.loads(content).get("results")
+            if not isinstance(pack_results, list):
+                raise ValueError("Campo 'results' ausente na resposta da IA.")
+        except OpenAIError as e:
+            logger.error(f"Erro na API OpenAI ao analisar pack: {e}", exc_info=True)
+            return [(None, f"Erro ao comunicar com o serviço de IA: {e}")] * len(texts)
+        except (json.JSONDecodeError, ValueError, AttributeError) as e:
+            logger.error(f"Resposta inválida da IA para pack de {len(texts)} feedbacks: {e}", exc_info=True)
+            return [(None, "Formato inválido na resposta do serviço de IA.")] * len(texts)
+        except Exception as e:
+            # Falha inesperada em um pack não derruba o lote inteiro (asyncio.gather sem proteção)
+            logger.error(f"Erro inesperado ao analisar pack de {len(texts)} feedbacks: {e}", exc_info=True)
+            return [(None, "Erro interno no servidor ao analisar feedback.")] * len(texts)
+
+    by_id = {item.get("id"): item for item in pack_results if isinstance(item, dict)}
+    results: List[BatchItemResult] = []
+    for i in range(len(texts)):
+        item = by_id.get(i)
+        if item is None:
+            results.append((None, "Item ausente na resposta do serviço de IA."))
+            continue
+        try:
+            results.append((_build_analysis(item), None))
+        except ValueError as e:
+            results.append((None, f"Dados inválidos recebidos do serviço de IA: {e}"))
+        except Exception as e:
+            logger.error(f"Erro inesperado ao montar a análise do item {i} do pack: {e}", exc_info=True)
+            results.append((None, "Erro interno no servidor ao analisar feedback."))
+    return results
+
+
+async def analyze_feedback_batch(texts: List[str]) -> List[BatchItemResult]:
+    """
+    Analisa uma lista de feedbacks agrupando FEEDBACK_BATCH_PACK_SIZE textos por chamada ao LLM,
+    com no máximo FEEDBACK_BATCH_CONCURRENCY chamadas simultâneas no processo (somando todos os lotes).
+    Itens já presentes no cache (ou repetidos no próprio lote) não são enviados ao LLM.
+    Retorna, na mesma ordem de `texts`, um (resultado, erro) por item; falhas não interrompem o lote.
+    """
+    if not llm_gateway.get_llm_gateway().is_configured():
+         raise HTTPException(status_code=500, detail="Configuração da API OpenAI ausente no servidor.")
+    if not texts:
+        return []
+
+    keys = [feedback_cache_key(text) for text in texts]
+    resolved: dict = {}
+    pending: dict = {} # chave -> texto representativo (deduplica o lote)
+    for key, text in zip(keys, texts):
+        if key in resolved or key in pending:
+            continue
+        cached = await feedback_cache.get(key)
+        if cached is not None:
+            resolved[key] = (FeedbackAnalysisResponse.model_validate(cached), None)
+        else:
+            pending[key] = text
+
+    if pending:
+        pending_keys = list(pending)
+        pending_texts = [pending[key] for key in pending_keys]
+        pack_size = max(1, FEEDBACK_BATCH_PACK_SIZE)
+        semaphore = _get_batch_semaphore()
+        packs = [pending_texts[i:i + pack_size] for i in range(0, len(pending_texts), pack_size)]
+        pack_results = await asyncio.gather(*(_analyze_pack(pack, semaphore) for pack in packs))
+        for key, (analysis, error) in zip(pending_keys, (item for pack in pack_results for item in pack)):
+            resolved[key] = (analysis, error)
+            if analysis is not None:
+                await feedback_cache.set(key, analysis.model_dump())
+
+    logger.info(f"Lote de {len(texts)} feedbacks: {len(pending)} enviados ao LLM, {len(texts) - len(pending)} do cache/duplicados")
+    return [resolved[key] for key in keys]
@@ -1,40 +1,273 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/services/guardrails_service.py:
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Tuple, Union
+from dataclasses import dataclass, field
+import os
+import json
 import asyncio
 import logging
 
+from pydantic import ValidationError
+
+from app.services import llm_gateway, spec_registry
+from app.services.result_cache import content_key
+from app.services.singleflight import SingleFlight
+from app.services.spec_registry import CompiledSpec
+
 logger = logging.getLogger(__name__)
 
+# "placeholder" (padrão): resposta simulada a partir do exemplo da spec.
+# "streaming": gera com o LLM em streaming, validando cada campo assim que ele termina de chegar.
+GUARDRAILS_GENERATION_MODE = os.getenv("GUARDRAILS_GENERATION_MODE", "placeholder").strip().lower()
+GUARDRAILS_MODEL = os.getenv("GUARDRAILS_MODEL", "gpt-3.5-turbo")
+GUARDRAILS_TEMPERATURE = float(os.getenv("GUARDRAILS_TEMPERATURE", "0"))
+GUARDRAILS_SYSTEM_PROMPT = (
+    "Você gera SOMENTE um objeto JSON válido, sem texto adicional, que segue exatamente este JSON Schema:\n{schema}"
+)
+GUARDRAILS_REASK_TEMPLATE = (
+    "Alguns campos da sua resposta anterior são inválidos:\n{errors}\n"
+    "Os demais campos já foram aceitos e não devem ser repetidos. "
+    "Retorne SOMENTE um objeto JSON contendo apenas os campos: {fields}."
+)
+
 # Exceção customizada para Guardrails (exemplo)
 class GuardrailsValidationError(ValueError):
-    pass
+    metrics: Optional["GenerationMetrics"] = None # Contadores da geração que falhou
+
+@dataclass
+class GenerationMetrics:
+    """Contadores por requisição (um chunk do stream da OpenAI corresponde a aproximadamente um token)."""
+    mode: str = GUARDRAILS_GENERATION_MODE
+    attempts: int = 0
+    reasks: int = 0
+    tokens_generated: int = 0
+    tokens_saved: int = 0 # estimativa: tokens não gerados graças ao abort e aos re-asks parciais
+    aborted_fields: List[str] = field(default_factory=list)
+    coalesced: bool = False # True quando a requisição reaproveitou uma geração idêntica em andamento
+
+    def copy_from(self, other: "GenerationMetrics", coalesced: bool) -> None:
+        self.__dict__.update(other.__dict__, aborted_fields=list(other.aborted_fields), coalesced=coalesced)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "coalesced": self.coalesced,
+            "attempts": self.attempts,
+            "reasks": self.reasks,
+            "tokens_generated": self.tokens_generated,
+            "tokens_saved": self.tokens_saved,
+            "aborted_fields": self.aborted_fields,
+        }
+
+# Coalescência de gerações idênticas em andamento (mesmo prompt, spec e nº de re-asks)
+guardrails_flight = SingleFlight("guardrails")
 
 # Marcar a função como async
-async def generate_and_validate(prompt: str, spec_name: str, num_reasks: int = 1) -> Optional[Union[Dict, List, str]]:
+async def generate_and_validate(
+    prompt: str,
+    spec_name: str,
+    num_reasks: int = 1,
+    metrics: Optional[GenerationMetrics] = None,
+) -> Optional[Union[Dict, List, str]]:
     """
-    Placeholder para geração validada usando Guardrails.
-    Na Fase 7, esta função conterá a lógica para:
-    1. Carregar a especificação Guardrails (arquivo .rail ou modelo Pydantic de app/specs).
-    2. Inicializar o objeto `Guard` com a especificação.
-    3. Chamar o LLM através do método `guard()` ou `guard.parse()`.
-    4. Tratar o resultado (output validado ou erro/histórico de validação).
-    5. Retornar os dados validados ou levantar `GuardrailsValidationError`.
+    Geração validada de dados estruturados.
+    A spec (arquivo .rail ou modelo Pydantic de app/specs) já vem compilada do spec_registry:
+    o `Guard`/validador é construído uma vez no startup e reconstruído só quando o arquivo muda.
+    Spec desconhecida levanta spec_registry.SpecNotFoundError (um FileNotFoundError).
+    Com GUARDRAILS_GENERATION_MODE=streaming, usa `_generate_streaming` (validação incremental por campo,
+    abort antecipado e re-ask só dos campos inválidos); caso contrário, responde em modo placeholder.
+    Pedidos idênticos simultâneos compartilham uma única geração.
+    Os contadores da geração são gravados em `metrics`, se informado.
     """
-    logger.info(f"[guardrails_service] Gerando e validando (placeholder) prompt com spec '{spec_name}' (reasks={num_reasks})")
+    spec = spec_registry.get_spec_registry().get(spec_name)
+    # Só espaços são normalizados: caixa e acentos do prompt podem aparecer na saída extraída
+    key = content_key(" ".join(prompt.split()), spec.name, num_reasks, GUARDRAILS_GENERATION_MODE)
+    coalesced = guardrails_flight.is_inflight(key)
+    try:
+        data, shared_metrics = await guardrails_flight.do(key, lambda: _generate(prompt, spec, num_reasks))
+    except GuardrailsValidationError as e:
+        if metrics is not None and e.metrics is not None:
+            metrics.copy_from(e.metrics, coalesced)
+        raise
+    if metrics is not None:
+        metrics.copy_from(shared_metrics, coalesced)
+    return data
+
+async def _generate(prompt: str, spec: CompiledSpec, num_reasks: int) -> Tuple[Optional[Union[Dict, List, str]], GenerationMetrics]:
+    metrics = GenerationMetrics(mode=GUARDRAILS_GENERATION_MODE)
+    try:
+        if GUARDRAILS_GENERATION_MODE == "streaming":
+            return await _generate_streaming(prompt, spec, num_reasks, metrics), metrics
+        return await _generate_placeholder(spec, num_reasks), metrics
+    except GuardrailsValidationError as e:
+        e.metrics = metrics
+        raise
+
+async def _generate_placeholder(spec: CompiledSpec, num_reasks: int) -> Optional[Union[Dict, List, str]]:
+    logger.info(f"[guardrails_service] Gerando e validando (placeholder) prompt com spec '{spec.name}' ({spec.kind}, reasks={num_reasks})")
     await asyncio.sleep(0.2) # Simula chamada LLM + validação assíncrona
 
-    # Simula um resultado validado baseado na spec (exemplo)
-    if spec_name == "UserProfileSpec":
-        logger.debug(f"Retornando placeholder para UserProfileSpec")
-        return {"name": "Placeholder User", "age": 30, "interests": ["AI", "Cloud"]}
-    elif spec_name == "InvalidSpecExample":
-         logger.warning(f"Simulando falha de validação para InvalidSpecExample")
-         raise GuardrailsValidationError(f"Falha na validação (placeholder) para a spec '{spec_name}'. Campo 'X' está faltando.")
-    elif spec_name.endswith(".rail"): # Exemplo para arquivo .rail
-        logger.debug(f"Retornando placeholder para spec RAIL '{spec_name}'")
-        return f"Resultado placeholder validado para spec RAIL '{spec_name}'."
-    else:
-        logger.debug(f"Retornando placeholder genérico para spec Pydantic/outra '{spec_name}'")
-        return f"Resultado placeholder validado para spec '{spec_name}'."
-
-# Funções auxiliares para carregar specs podem ser adicionadas aqui na Fase 7
\ No newline at end of file
+    # Simula um resultado validado a partir do exemplo declarado na spec
+    example = spec.example()
+    if example is None:
+        logger.debug(f"Spec '{spec.name}' sem exemplo; retornando placeholder genérico")
+        return f"Resultado placeholder validado para spec '{spec.name}'."
+    try:
+        return spec.validate(example)
+    except ValidationError as e:
+        raise GuardrailsValidationError(f"Falha na validação (placeholder) para a spec '{spec.name}': {e.errors()[0].get('msg')}") from e
+
+# --- Modo streaming ---
+class IncrementalObjectParser:
+    """
+    Lê um objeto JSON aos pedaços e devolve cada membro de primeiro nível ("campo": valor) assim
+    que ele termina (vírgula ou chave de fechamento no nível 1), sem esperar o restante do objeto.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Retorna os membros concluídos neste trecho. Levanta json.JSONDecodeError se um membro for inválido."""
+        self.buffer += text
+        members: List[Tuple[str, Any]] = []
+        while self._pos < len(self.buffer) and not self.complete:
+            char = self.buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+            elif char in "}]":
+                if self._depth == 1:
+                    members.extend(self._close_member())
+                    self.complete = True
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                members.extend(self._close_member())
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return members
+
+    def _close_member(self) -> List[Tuple[str, Any]]:
+        text = self.buffer[self._member_start:self._pos].strip() if self._member_start is not None else ""
+        if not text:
+            return []
+        return list(json.loads("{" + text + "}").items())
+
+@dataclass
+class _AttemptResult:
+    valid: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    field_tokens: Dict[str, int] = field(default_factory=dict)
+    complete: bool = False
+
+async def _stream_attempt(messages: List[Dict[str, str]], spec: CompiledSpec, metrics: GenerationMetrics) -> _AttemptResult:
+    """Executa uma geração em streaming e a interrompe no primeiro campo inválido."""
+    metrics.attempts += 1
+    attempt = _AttemptResult()
+    parser = IncrementalObjectParser()
+    tokens = 0
+    member_start_tokens = 0
+    stream = await llm_gateway.get_llm_gateway().chat_completion(
+        model=GUARDRAILS_MODEL,
+        messages=messages,
+        temperature=GUARDRAILS_TEMPERATURE,
+        response_format={"type": "json_object"},
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            tokens += 1
+            try:
+                members = parser.feed(delta)
+            except json.JSONDecodeError as e:
+                attempt.errors["__json__"] = f"JSON inválido: {e.msg}"
+                break
+            for name, value in members:
+                attempt.field_tokens[name] = tokens - member_start_tokens
+                member_start_tokens = tokens
+                if name not in spec.model.model_fields:
+                    continue # Campos fora da spec são descartados
+                try:
+                    attempt.valid[name] = spec.validate_field(name, value)
+                except ValidationError as e:
+                    attempt.errors[name] = e.errors()[0].get("msg", "valor inválido")
+            if attempt.errors:
+                break # Abort antecipado: não vale a pena pagar pelo restante da geração
+            if parser.complete:
+                attempt.complete = True
+                break
+    finally:
+        await stream.close()
+    metrics.tokens_generated += tokens
+
+    if attempt.errors and not parser.complete:
+        metrics.aborted_fields.extend(name for name in attempt.errors if name not in metrics.aborted_fields)
+        # Estima o tamanho da resposta completa pela média de tokens por campo já recebido
+        fields_seen = max(1, len(attempt.field_tokens))
+        expected_fields = max(fields_seen, len(spec.model.model_fields))
+        metrics.tokens_saved += round(tokens / fields_seen * (expected_fields - fields_seen))
+    return attempt
+
+def _build_messages(prompt: str, spec: CompiledSpec) -> List[Dict[str, str]]:
+    schema = json.dumps(spec.model.model_json_schema(), ensure_ascii=False)
+    return [
+        {"role": "system", "content": GUARDRAILS_SYSTEM_PROMPT.format(schema=schema)},
+        {"role": "user", "content": prompt},
+    ]
+
+async def _generate_streaming(prompt: str, spec: CompiledSpec, num_reasks: int, metrics: GenerationMetrics) -> Dict[str, Any]:
+    """
+    Gera em streaming validando cada campo de primeiro nível assim que ele chega. No primeiro campo inválido
+    a geração é interrompida e o re-ask pede somente os campos inválidos ou ainda ausentes, mantendo os válidos.
+    """
+    logger.info(f"[guardrails_service] Gerando (streaming) com spec '{spec.name}' (reasks={num_reasks})")
+    messages = _build_messages(prompt, spec)
+    accepted: Dict[str, Any] = {}
+    accepted_tokens = 0
+    while True:
+        attempt = await _stream_attempt(messages, spec, metrics)
+        accepted.update(attempt.valid)
+        accepted_tokens += sum(attempt.field_tokens.get(name, 0) for name in attempt.valid)
+        missing = [name for name in spec.required_fields if name not in accepted]
+        if not attempt.errors and not missing:
+            try:
+                return spec.validate(accepted)
+            except ValidationError as e: # Validações entre campos (model_validator)
+                attempt.errors["__root__"] = e.errors()[0].get("msg", "objeto inválido")
+        if metrics.reasks >= num_reasks:
+            errors = attempt.errors or {name: "campo ausente" for name in missing}
+            raise GuardrailsValidationError(
+                f"Falha na validação para a spec '{spec.name}' após {metrics.reasks} re-ask(s): "
+                + "; ".join(f"{name}: {msg}" for name, msg in errors.items())
+            )
+
+        metrics.reasks += 1
+        # Campos já aceitos não são gerados de novo no re-ask
+        metrics.tokens_saved += accepted_tokens
+        pending = [name for name in spec.model.model_fields if name not in accepted]
+        errors = {**attempt.errors, **{name: "campo ausente" for name in missing if name not in attempt.errors}}
+        messages = messages + [
+            {"role": "assistant", "content": json.dumps(accepted, ensure_ascii=False)},
+            {"role": "user", "content": GUARDRAILS_REASK_TEMPLATE.format(
+                errors="\n".join(f"- {name}: {msg}" for name, msg in errors.items()),
+                fields=", ".join(pending) or ", ".join(spec.model.model_fields),
+            )},
+        ]
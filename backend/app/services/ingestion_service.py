@@ -0,0 +1,340 @@
+# backend/app/services/ingestion_service.py
+"""
+Pipeline de ingestão incremental para o RAG (public.documents).
+
+Tudo é feito em streaming com geradores, então o uso de memória não depende do tamanho do corpus:
+arquivos (md, txt, pdf) -> segmentos de texto -> chunks -> lotes -> embeddings -> COPY em massa.
+
+Cada chunk recebe um `content_hash` (sha256 de fonte + conteúdo). Chunks cujo hash já está
+indexado são pulados antes de gerar embeddings, o que torna as re-execuções incrementais;
+chunks que sumiram de um arquivo reprocessado são removidos (prune).
+"""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app import clients
+from app.services import semantic_cache
+from app.services.embedding_service import get_embedding_engine
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+RAG_DATA_DIR: str = os.getenv("RAG_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data"))
+RAG_CHUNK_SIZE: int = int(os.getenv("RAG_CHUNK_SIZE", "1000")) # em caracteres
+RAG_CHUNK_OVERLAP: int = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+RAG_INGEST_BATCH_SIZE: int = int(os.getenv("RAG_INGEST_BATCH_SIZE", "128")) # chunks por lote de embedding/COPY
+SUPPORTED_EXTENSIONS = (".md", ".markdown", ".txt", ".pdf")
+_TEXT_READ_BLOCK = 64 * 1024
+
+
+@dataclass
+class Chunk:
+    content: str
+    metadata: Dict[str, Any]
+    content_hash: str
+
+
+@dataclass
+class IngestionStats:
+    files: int = 0
+    chunks_seen: int = 0
+    chunks_skipped: int = 0
+    chunks_indexed: int = 0
+    chunks_pruned: int = 0
+    sources: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "chunks_seen": self.chunks_seen,
+            "chunks_skipped": self.chunks_skipped,
+            "indexed_count": self.chunks_indexed,
+            "chunks_pruned": self.chunks_pruned,
+        }
+
+
+def chunk_content_hash(source: str, content: str) -> str:
+    """Hash estável de um chunk. Equivale a encode(sha256(convert_to(source || E'\\n' || content, 'UTF8')), 'hex') no Postgres."""
+    return hashlib.sha256(f"{source}\n{content}".encode("utf-8")).hexdigest()
+
+
+# --- Etapa 1: descoberta e leitura de arquivos (geradores) ---
+def iter_source_files(paths: Iterable[str], extensions: Sequence[str] = SUPPORTED_EXTENSIONS) -> Iterator[str]:
+    """Percorre arquivos e diretórios (recursivamente, em ordem estável) filtrando por extensão."""
+    for path in paths:
+        if os.path.isfile(path):
+            if path.lower().endswith(tuple(extensions)):
+                yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(tuple(extensions)):
+                    yield os.path.join(root, name)
+
+
+def _iter_text_file(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(_TEXT_READ_BLOCK)
+            if not block:
+                break
+            yield block, {}
+
+
+def _iter_pdf_pages(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    try:
+        import pdfplumber
+    except ImportError:
+        pdfplumber = None
+    if pdfplumber is not None:
+        with pdfplumber.open(path) as pdf:
+            for number, page in enumerate(pdf.pages, start=1):
+                yield page.extract_text() or "", {"page": number}
+                page.flush_cache() # libera objetos da página já processada
+        return
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages, start=1):
+        yield page.extract_text() or "", {"page": number}
+
+
+def iter_segments(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Gera (texto, metadados) em blocos: páginas para PDF, blocos de leitura para md/txt."""
+    if path.lower().endswith(".pdf"):
+        return _iter_pdf_pages(path)
+    return _iter_text_file(path)
+
+
+# --- Etapa 2: chunking preguiçoso ---
+def _split_point(text: str, limit: int) -> int:
+    """Posição de corte <= limit, preferindo quebra de parágrafo, de linha ou espaço."""
+    if len(text) <= limit:
+        return len(text)
+    for separator in ("\n\n", "\n", " "):
+        cut = text.rfind(separator, limit // 2, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+def iter_chunks(
+    segments: Iterable[Tuple[str, Dict[str, Any]]],
+    chunk_size: int = RAG_CHUNK_SIZE,
+    overlap: int = RAG_CHUNK_OVERLAP,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Converte um fluxo de segmentos em chunks de até `chunk_size` caracteres com `overlap`.
+    Só mantém em memória o texto ainda não emitido (no máximo ~2 chunks).
+    Segmentos com metadados diferentes (ex: páginas de PDF) não são misturados num mesmo chunk.
+    """
+    overlap = min(overlap, chunk_size // 2)
+    buffer, buffer_meta = "", None
+
+    def drain(final: bool) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        nonlocal buffer
+        while len(buffer) > chunk_size or (final and buffer.strip()):
+            cut = _split_point(buffer, chunk_size)
+            chunk = buffer[:cut].strip()
+            if chunk:
+                yield chunk, dict(buffer_meta or {})
+            if cut >= len(buffer):
+                buffer = ""
+                break
+            # Recomeça `overlap` caracteres antes do corte (sem overlap se isso não fizer o buffer avançar)
+            buffer = buffer[cut - overlap:] if cut - overlap > 0 else buffer[cut:]
+
+    for text, meta in segments:
+        if buffer_meta is not None and meta != buffer_meta:
+            yield from drain(final=True)
+            buffer = ""
+        buffer_meta = meta
+        buffer += text
+        yield from drain(final=False)
+    yield from drain(final=True)
+
+
+def iter_file_chunks(path: str, source: str) -> Iterator[Chunk]:
+    for index, (content, meta) in enumerate(iter_chunks(iter_segments(path))):
+        metadata = {"source": source, "chunk": index, **meta}
+        yield Chunk(content=content, metadata=metadata, content_hash=chunk_content_hash(source, content))
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- Etapa 3: destino (sink) dos chunks ---
+class VectorSink(ABC):
+    """Destino dos chunks indexados. Implementações: PgVectorSink (public.documents) e vector_store.LocalVectorStore."""
+
+    @abstractmethod
+    async def existing_hashes(self, hashes: List[str]) -> Set[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def write(self, chunks: List[Chunk], embeddings: np.ndarray) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def prune(self, source: str, keep_hashes: Set[str]) -> int:
+        """Remove chunks de `source` que não estão em `keep_hashes` (conteúdo alterado ou removido)."""
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        """Chamado ao fim da ingestão (ex: snapshot do índice local)."""
+        pass
+
+
+def vector_literal(vector: np.ndarray) -> str:
+    """Formato textual do pgvector: '[0.1,0.2,...]'."""
+    return "[" + ",".join(map(str, vector.tolist())) + "]"
+
+
+async def copy_chunks(conn, chunks: List[Chunk], embeddings: np.ndarray) -> int:
+    """COPY binário para uma tabela temporária + INSERT ... SELECT em public.documents. Deve rodar dentro de uma transação."""
+    records = [
+        (chunk.content, json.dumps(chunk.metadata, ensure_ascii=False), vector_literal(vector), chunk.content_hash)
+        for chunk, vector in zip(chunks, embeddings)
+    ]
+    await conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS _documents_ingest_staging ("
+        " content text, metadata text, embedding text, content_hash text"
+        ") ON COMMIT DELETE ROWS"
+    )
+    await conn.copy_records_to_table(
+        "_documents_ingest_staging",
+        records=records,
+        columns=["content", "metadata", "embedding", "content_hash"],
+    )
+    result = await conn.execute(
+        "INSERT INTO public.documents (content, metadata, embedding, content_hash)"
+        " SELECT content, metadata::jsonb, embedding::vector, content_hash FROM _documents_ingest_staging"
+        " ON CONFLICT (content_hash) DO NOTHING"
+    )
+    return int(result.split()[-1])
+
+
+class PgVectorSink(VectorSink):
+    """Grava em public.documents via COPY binário para uma tabela temporária + INSERT ... SELECT."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def existing_hashes(self, hashes: List[str]) -> Set[str]:
+        rows = await self.pool.fetch(
+            "SELECT content_hash FROM public.documents WHERE content_hash = ANY($1::text[])", hashes
+        )
+        return {row["content_hash"] for row in rows}
+
+    async def write(self, chunks: List[Chunk], embeddings: np.ndarray) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                return await copy_chunks(conn, chunks, embeddings)
+
+    async def prune(self, source: str, keep_hashes: Set[str]) -> int:
+        result = await self.pool.execute(
+            "DELETE FROM public.documents WHERE metadata->>'source' = $1 AND NOT (content_hash = ANY($2::text[]))",
+            source, list(keep_hashes),
+        )
+        return int(result.split()[-1])
+
+
+def get_default_sink() -> VectorSink:
+    """Destino conforme VECTOR_BACKEND: índice local ou public.documents (pgvector)."""
+    from app.services import vector_store # import tardio: vector_store depende deste módulo
+    store = vector_store.get_vector_store()
+    if isinstance(store, VectorSink):
+        return store
+    pool = clients.get_db_pool()
+    if pool is None:
+        from app.services.rag_service import VectorStoreNotReadyError
+        raise VectorStoreNotReadyError("Pool do banco não inicializado; não é possível indexar em public.documents.")
+    return PgVectorSink(pool)
+
+
+# --- Orquestração ---
+async def _next_batch(iterator: Iterator[List[Chunk]]) -> Optional[List[Chunk]]:
+    # Leitura/parsing de arquivos (especialmente PDF) é bloqueante: roda em thread
+    return await asyncio.to_thread(next, iterator, None)
+
+
+async def index_file(path: str, source: str, sink: VectorSink, stats: IngestionStats, batch_size: int = RAG_INGEST_BATCH_SIZE) -> None:
+    engine = get_embedding_engine()
+    changed_before = stats.chunks_indexed + stats.chunks_pruned
+    seen_hashes: Set[str] = set()
+    batches = batched(iter_file_chunks(path, source), batch_size)
+    while (batch := await _next_batch(batches)) is not None:
+        stats.chunks_seen += len(batch)
+        # Deduplica dentro do lote e descarta o que já está indexado ANTES de gerar embeddings
+        unique: Dict[str, Chunk] = {}
+        for chunk in batch:
+            if chunk.content_hash not in seen_hashes:
+                unique.setdefault(chunk.content_hash, chunk)
+            seen_hashes.add(chunk.content_hash)
+        existing = await sink.existing_hashes(list(unique)) if unique else set()
+        new_chunks = [chunk for h, chunk in unique.items() if h not in existing]
+        stats.chunks_skipped += len(batch) - len(new_chunks)
+        if not new_chunks:
+            continue
+        embeddings = await engine.embed_many([chunk.content for chunk in new_chunks])
+        stats.chunks_indexed += await sink.write(new_chunks, embeddings)
+    stats.chunks_pruned += await sink.prune(source, seen_hashes)
+    if stats.chunks_indexed + stats.chunks_pruned > changed_before:
+        # Respostas em cache baseadas na versão anterior deste documento deixam de valer
+        await semantic_cache.publish_invalidation([source])
+
+
+async def index_paths(
+    paths: Optional[Sequence[str]] = None,
+    sink: Optional[VectorSink] = None,
+    batch_size: int = RAG_INGEST_BATCH_SIZE,
+) -> IngestionStats:
+    """Indexa (incrementalmente) todos os arquivos suportados em `paths` (padrão: RAG_DATA_DIR)."""
+    paths = list(paths or [RAG_DATA_DIR])
+    sink = sink or get_default_sink()
+    stats = IngestionStats()
+    for path in iter_source_files(paths):
+        base = next((p for p in paths if path.startswith(p) and os.path.isdir(p)), os.path.dirname(path))
+        source = os.path.relpath(path, base)
+        logger.info(f"[ingestion_service] Indexando '{source}'")
+        await index_file(path, source, sink, stats, batch_size)
+        stats.files += 1
+        stats.sources.append(source)
+    await sink.flush()
+    logger.info(f"[ingestion_service] Ingestão concluída: {stats.as_dict()}")
+    return stats
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.ingestion_service [caminhos...]  (executar de dentro de backend/)
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(RAG_DATA_DIR), ".env"))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(name)s] - %(message)s')
+
+    async def _main() -> None:
+        await clients.init_db_pool()
+        try:
+            stats = await index_paths(sys.argv[1:] or None)
+            print(json.dumps(stats.as_dict(), indent=2))
+        finally:
+            await clients.shutdown()
+
+    asyncio.run(_main())
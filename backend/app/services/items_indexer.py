@@ -0,0 +1,301 @@
+# backend/app/services/items_indexer.py
+"""
+Indexação incremental e contínua de public.items (notas/tarefas dos usuários) em public.documents.
+
+Um trigger em public.items (supabase/migrations) publica `pg_notify(ITEMS_INDEX_CHANNEL, {"id", "op"})`
+a cada insert/delete e a cada update que muda título, descrição ou dono. Um worker iniciado pelo
+lifespan escuta o canal numa conexão dedicada e:
+1. Acumula os ids notificados (debounce): o lote é processado após ITEMS_INDEX_DEBOUNCE_SECONDS sem
+   novas notificações, ou ITEMS_INDEX_MAX_DELAY_SECONDS após a primeira, ou ao atingir ITEMS_INDEX_BATCH_SIZE.
+2. Lê os itens do lote e compara o hash de cada um (dono + título + descrição) com o `item_hash` dos
+   seus chunks já indexados. Só itens alterados geram embeddings (em lote).
+3. Substitui os chunks dos itens alterados ou removidos numa única transação (DELETE + COPY).
+
+Os chunks levam `user_id` nos metadados: são privados do dono (match_documents só os retorna quando o
+filtro traz o mesmo user_id, ver vector_store.OWNER_KEY). Ao conectar (startup e reconexões), uma
+consulta de reconciliação enfileira os itens cujo hash não bate com o indexado e os chunks órfãos:
+cobre o backfill inicial e as notificações perdidas enquanto o worker estava fora.
+
+Com vários workers do uvicorn, só um escuta (advisory lock de sessão na conexão do LISTEN); os outros
+tentam assumir a cada ITEMS_INDEX_LEADER_RETRY_SECONDS. LISTEN precisa de conexão direta ao Postgres
+(porta 5432): o pooler do Supabase em modo transação não entrega notificações.
+"""
+import os
+import json
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app import clients
+from app.services import semantic_cache
+from app.services.embedding_service import get_embedding_engine
+from app.services.ingestion_service import Chunk, chunk_content_hash, copy_chunks, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+ITEMS_INDEX_ENABLED: bool = os.getenv("ITEMS_INDEX_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+ITEMS_INDEX_CHANNEL: str = os.getenv("ITEMS_INDEX_CHANNEL", "items_changed") # deve ser o mesmo do trigger
+ITEMS_INDEX_DEBOUNCE_SECONDS: float = float(os.getenv("ITEMS_INDEX_DEBOUNCE_SECONDS", "1.0"))
+ITEMS_INDEX_MAX_DELAY_SECONDS: float = float(os.getenv("ITEMS_INDEX_MAX_DELAY_SECONDS", "5.0"))
+ITEMS_INDEX_BATCH_SIZE: int = int(os.getenv("ITEMS_INDEX_BATCH_SIZE", "128"))
+ITEMS_INDEX_RETRY_SECONDS: float = float(os.getenv("ITEMS_INDEX_RETRY_SECONDS", "5"))
+ITEMS_INDEX_LEADER_RETRY_SECONDS: float = float(os.getenv("ITEMS_INDEX_LEADER_RETRY_SECONDS", "30"))
+ITEMS_INDEX_KEEPALIVE_SECONDS: float = float(os.getenv("ITEMS_INDEX_KEEPALIVE_SECONDS", "30"))
+
+SOURCE_PREFIX = "items/"
+LEADER_LOCK_NAME = "items_indexer"
+
+# Itens com hash diferente do indexado e chunks de itens que não existem mais.
+# O hash em SQL é o mesmo de `item_hash` (ver ingestion_service.chunk_content_hash).
+STALE_ITEMS_QUERY = """
+SELECT i.id::text AS item_id FROM public.items i
+WHERE NOT EXISTS (
+    SELECT 1 FROM public.documents d
+    WHERE d.metadata ? 'item_id' AND d.metadata->>'item_id' = i.id::text
+      AND d.metadata->>'item_hash' = encode(sha256(convert_to(
+          i.user_id::text || E'\\n' || i.title || E'\\n' || coalesce(i.description, ''), 'UTF8')), 'hex')
+)
+UNION
+SELECT d.metadata->>'item_id' FROM public.documents d
+WHERE d.metadata ? 'item_id'
+  AND NOT EXISTS (SELECT 1 FROM public.items i WHERE i.id::text = d.metadata->>'item_id')
+"""
+
+
+@dataclass
+class ItemSyncStats:
+    items_seen: int = 0
+    items_unchanged: int = 0
+    items_indexed: int = 0
+    items_removed: int = 0
+    chunks_written: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+def item_hash(user_id: str, title: str, description: Optional[str]) -> str:
+    return chunk_content_hash(user_id, f"{title}\n{description or ''}")
+
+
+def item_chunks(row: Any) -> List[Chunk]:
+    """Chunks de um item (título + descrição), com o dono e o hash do item nos metadados."""
+    item_id, user_id = str(row["id"]), str(row["user_id"])
+    source = f"{SOURCE_PREFIX}{item_id}"
+    text = f"{row['title']}\n\n{row['description']}" if row["description"] else row["title"]
+    base = {
+        "source": source, "kind": "item", "item_id": item_id, "user_id": user_id, "title": row["title"],
+        "item_hash": item_hash(user_id, row["title"], row["description"]),
+    }
+    return [
+        Chunk(content=content, metadata={**base, "chunk": index}, content_hash=chunk_content_hash(source, content))
+        for index, (content, _) in enumerate(iter_chunks([(text, {})]))
+    ]
+
+
+def _parse_item_id(payload: str) -> Optional[str]:
+    try:
+        return str(uuid.UUID(str(json.loads(payload)["id"])))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class ItemsIndexer:
+    def __init__(
+        self,
+        channel: str = ITEMS_INDEX_CHANNEL,
+        debounce_seconds: float = ITEMS_INDEX_DEBOUNCE_SECONDS,
+        max_delay_seconds: float = ITEMS_INDEX_MAX_DELAY_SECONDS,
+        batch_size: int = ITEMS_INDEX_BATCH_SIZE,
+    ):
+        self.channel = channel
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.batch_size = max(1, batch_size)
+        self.is_leader = False
+        self.totals = ItemSyncStats()
+        self._pending: Dict[str, None] = {} # ids em ordem de chegada, sem repetição
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Fila com debounce ---
+    def enqueue(self, item_ids: Iterable[str]) -> None:
+        for item_id in item_ids:
+            self._pending[item_id] = None
+        if self._pending:
+            self._wake.set()
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        item_id = _parse_item_id(payload)
+        if item_id is None:
+            logger.debug(f"[items_indexer] Notificação ignorada: {payload!r}")
+            return
+        self.enqueue([item_id])
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def next_batch(self, keepalive=None) -> List[str]:
+        """Espera a primeira notificação e então até o lote "acalmar" (debounce), encher ou atingir o atraso máximo."""
+        while not self._pending:
+            self._wake.clear()
+            try:
+                async with asyncio.timeout(ITEMS_INDEX_KEEPALIVE_SECONDS):
+                    await self._wake.wait()
+            except TimeoutError:
+                if keepalive is not None:
+                    await keepalive() # detecta conexão de LISTEN morta mesmo sem tráfego
+        deadline = asyncio.get_running_loop().time() + self.max_delay_seconds
+        while len(self._pending) < self.batch_size:
+            self._wake.clear()
+            remaining = min(self.debounce_seconds, deadline - asyncio.get_running_loop().time())
+            if remaining <= 0:
+                break
+            try:
+                async with asyncio.timeout(remaining):
+                    await self._wake.wait()
+            except TimeoutError:
+                break # nenhuma notificação nova na janela de debounce
+        batch = list(islice(self._pending, self.batch_size))
+        for item_id in batch:
+            del self._pending[item_id]
+        return batch
+
+    # --- Sincronização de um lote ---
+    async def sync(self, item_ids: List[str]) -> ItemSyncStats:
+        """Reindexa os itens alterados do lote e remove os chunks dos itens apagados."""
+        pool = clients.get_db_pool()
+        if pool is None:
+            raise RuntimeError("Pool do banco indisponível para indexar public.items.")
+        stats = ItemSyncStats(items_seen=len(item_ids))
+        rows = await pool.fetch(
+            "SELECT id::text AS id, user_id::text AS user_id, title, description FROM public.items WHERE id = ANY($1::uuid[])",
+            item_ids,
+        )
+        indexed: Dict[str, set] = {}
+        for row in await pool.fetch(
+            "SELECT DISTINCT metadata->>'item_id' AS item_id, metadata->>'item_hash' AS item_hash FROM public.documents"
+            " WHERE metadata ? 'item_id' AND metadata->>'item_id' = ANY($1::text[])",
+            item_ids,
+        ):
+            indexed.setdefault(row["item_id"], set()).add(row["item_hash"])
+
+        current = {row["id"]: row for row in rows}
+        changed = [row for item_id, row in current.items() if indexed.get(item_id) != {item_hash(row["user_id"], row["title"], row["description"])}]
+        removed = [item_id for item_id in item_ids if item_id not in current and item_id in indexed]
+        stats.items_unchanged = len(current) - len(changed)
+        if not changed and not removed:
+            return stats
+
+        chunks = [chunk for row in changed for chunk in item_chunks(row)]
+        embeddings = await get_embedding_engine().embed_many([chunk.content for chunk in chunks]) if chunks else np.empty((0, 0))
+        replaced = [row["id"] for row in changed] + removed
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM public.documents WHERE metadata ? 'item_id' AND metadata->>'item_id' = ANY($1::text[])", replaced
+                )
+                stats.chunks_written = await copy_chunks(conn, chunks, embeddings) if chunks else 0
+        stats.items_indexed, stats.items_removed = len(changed), len(removed)
+        await semantic_cache.publish_invalidation(f"{SOURCE_PREFIX}{item_id}" for item_id in replaced)
+        return stats
+
+    async def _sync_batch(self, batch: List[str]) -> None:
+        try:
+            stats = await self.sync(batch)
+        except Exception as e:
+            logger.warning(f"[items_indexer] Falha ao indexar {len(batch)} item(ns) ({type(e).__name__}: {e}); nova tentativa em {ITEMS_INDEX_RETRY_SECONDS}s.")
+            self.enqueue(batch)
+            await asyncio.sleep(ITEMS_INDEX_RETRY_SECONDS)
+            return
+        for key, value in stats.as_dict().items():
+            setattr(self.totals, key, getattr(self.totals, key) + value)
+        if stats.items_indexed or stats.items_removed:
+            logger.info(f"[items_indexer] Lote sincronizado: {stats.as_dict()}")
+
+    # --- Conexão de LISTEN ---
+    async def _listen(self) -> float:
+        """Uma sessão de LISTEN; retorna quanto esperar antes da próxima tentativa."""
+        conn = await clients.connect()
+        try:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", LEADER_LOCK_NAME):
+                return ITEMS_INDEX_LEADER_RETRY_SECONDS # outro worker já indexa
+            self.is_leader = True
+            await conn.add_listener(self.channel, self._on_notify)
+            # Backfill / notificações perdidas enquanto ninguém escutava
+            stale = [row["item_id"] for row in await conn.fetch(STALE_ITEMS_QUERY)]
+            if stale:
+                logger.info(f"[items_indexer] Reconciliação: {len(stale)} item(ns) para (re)indexar.")
+                self.enqueue(stale)
+            logger.info(f"[items_indexer] Escutando '{self.channel}'.")
+            while True:
+                batch = await self.next_batch(keepalive=lambda: conn.fetchval("SELECT 1"))
+                await self._sync_batch(batch)
+        finally:
+            self.is_leader = False
+            try:
+                await conn.close(timeout=5) # fechar a sessão libera o advisory lock
+            except Exception:
+                conn.terminate()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = ITEMS_INDEX_RETRY_SECONDS
+                logger.warning(f"[items_indexer] Conexão de LISTEN perdida ({type(e).__name__}: {e}); reconectando em {delay}s.")
+            await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="items_indexer")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_indexer: Optional[ItemsIndexer] = None
+
+
+def get_items_indexer() -> ItemsIndexer:
+    global _indexer
+    if _indexer is None:
+        _indexer = ItemsIndexer()
+    return _indexer
+
+
+def set_items_indexer(indexer: Optional[ItemsIndexer]) -> None:
+    """Substitui o indexador global (útil em testes)."""
+    global _indexer
+    _indexer = indexer
+
+
+async def startup() -> None:
+    """Inicia o worker (chamado pelo lifespan) se habilitado, com banco configurado e backend pgvector."""
+    from app.services import vector_store # import tardio: vector_store depende de ingestion_service
+    if not ITEMS_INDEX_ENABLED:
+        return
+    if clients.get_db_pool() is None or vector_store.VECTOR_BACKEND != "pgvector":
+        logger.info("[items_indexer] Desativado: requer o pool do banco e VECTOR_BACKEND=pgvector.")
+        return
+    get_items_indexer().start()
+
+
+async def shutdown() -> None:
+    if _indexer is not None:
+        await _indexer.stop()
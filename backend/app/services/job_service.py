@@ -0,0 +1,385 @@
+# backend/app/services/job_service.py
+"""
+Fila de jobs assíncronos para execução de Crews.
+
+`POST /run-crew` apenas registra o job e devolve o id; um pool limitado de workers (CREW_JOB_WORKERS)
+consome a fila (até CREW_JOB_QUEUE_MAX_SIZE jobs aguardando) e executa `crew_service.run_specific_crew`.
+Estado, resultado e logs ficam numa tabela SQLite local, então sobrevivem a reinícios do processo:
+jobs que estavam na fila são reenfileirados e jobs interrompidos no meio da execução são marcados como falhos.
+Com vários workers (app.server), só o primeiro processo de cada boot (SERVER_BOOT_ID) faz essa recuperação:
+um worker reciclado não pode falhar nem reexecutar os jobs que os outros estão processando. Por isso cada
+worker, ao encerrar, marca como falhos os jobs que ele mesmo interrompeu; os que aguardavam na fila voltam
+a rodar no próximo boot (a reciclagem de workers vem desativada por padrão, ver app.server).
+Os logs também são publicados em memória para que os clientes acompanhem a execução ao vivo, e gravados no
+SQLite à medida que chegam: um cliente atendido por outro worker acompanha o job consultando o banco.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+from app.services import crew_service
+from app.services.fair_scheduler import Principal, current_principal, set_current_principal
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+CREW_JOB_WORKERS: int = int(os.getenv("CREW_JOB_WORKERS", "2"))
+CREW_JOB_QUEUE_MAX_SIZE: int = int(os.getenv("CREW_JOB_QUEUE_MAX_SIZE", "100"))
+CREW_JOB_TIMEOUT_SECONDS: float = float(os.getenv("CREW_JOB_TIMEOUT_SECONDS", "1800"))
+CREW_JOB_RETENTION_SECONDS: float = float(os.getenv("CREW_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+CREW_JOB_POLL_SECONDS: float = float(os.getenv("CREW_JOB_POLL_SECONDS", "0.5")) # jobs de outros workers são acompanhados pelo SQLite
+SERVER_BOOT_ID: Optional[str] = os.getenv("SERVER_BOOT_ID") or None # definido pelo launcher multi-worker
+CREW_JOB_DB_PATH: str = os.getenv("CREW_JOB_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "crew_jobs.sqlite3"))
+
+# Estados possíveis de um job
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+@dataclass
+class CrewJob:
+    id: str
+    topic: str
+    parameters: Dict[str, Any]
+    owner_id: Optional[str]
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    logs: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class JobStore:
+    """Persistência dos jobs em SQLite (chamadas síncronas, executadas em thread pelo JobManager)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS crew_jobs ("
+                " id TEXT PRIMARY KEY, topic TEXT NOT NULL, parameters TEXT NOT NULL, owner_id TEXT,"
+                " status TEXT NOT NULL, result TEXT, error TEXT, logs TEXT NOT NULL,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS crew_jobs_status_idx ON crew_jobs (status, created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS crew_jobs_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def save(self, job: CrewJob) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO crew_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.topic, json.dumps(job.parameters, ensure_ascii=False), job.owner_id, job.status,
+                    json.dumps(job.result, ensure_ascii=False, default=str) if job.result is not None else None,
+                    job.error, json.dumps(job.logs, ensure_ascii=False), job.created_at, job.started_at, job.finished_at,
+                ),
+            )
+            conn.commit()
+
+    def append_log(self, job_id: str, logs: List[str]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE crew_jobs SET logs = ? WHERE id = ?", (json.dumps(logs, ensure_ascii=False), job_id))
+            conn.commit()
+
+    @staticmethod
+    def _from_row(row: tuple) -> CrewJob:
+        return CrewJob(
+            id=row[0], topic=row[1], parameters=json.loads(row[2]), owner_id=row[3], status=row[4],
+            result=json.loads(row[5]) if row[5] is not None else None, error=row[6], logs=json.loads(row[7]),
+            created_at=row[8], started_at=row[9], finished_at=row[10],
+        )
+
+    def get(self, job_id: str) -> Optional[CrewJob]:
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM crew_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def recover(self, retention_seconds: float, boot_id: Optional[str] = None) -> List[CrewJob]:
+        """
+        Prepara a tabela após um reinício: remove jobs antigos, falha os interrompidos e retorna os que aguardavam na fila.
+        Com `boot_id`, só o primeiro processo daquele boot recupera; os demais recebem lista vazia.
+        """
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            if boot_id is not None:
+                # Upsert atômico (trava de escrita do SQLite): só muda a linha se o boot registrado for outro
+                claimed = conn.execute(
+                    "INSERT INTO crew_jobs_meta (key, value) VALUES ('recovered_boot', ?)"
+                    " ON CONFLICT(key) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+                    (boot_id,),
+                ).rowcount
+                if not claimed:
+                    conn.commit()
+                    return []
+            conn.execute("DELETE FROM crew_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - retention_seconds,))
+            conn.execute(
+                "UPDATE crew_jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?",
+                (FAILED, "Execução interrompida por reinício do servidor.", now, RUNNING),
+            )
+            conn.commit()
+            rows = conn.execute("SELECT * FROM crew_jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobManager:
+    """Fila limitada + pool de workers; os workers são iniciados na primeira submissão."""
+
+    def __init__(
+        self,
+        db_path: str = CREW_JOB_DB_PATH,
+        workers: int = CREW_JOB_WORKERS,
+        queue_max_size: int = CREW_JOB_QUEUE_MAX_SIZE,
+        timeout_seconds: float = CREW_JOB_TIMEOUT_SECONDS,
+        boot_id: Optional[str] = SERVER_BOOT_ID,
+    ):
+        self.store = JobStore(db_path)
+        self.boot_id = boot_id
+        self.workers = max(1, workers)
+        self.queue_max_size = max(1, queue_max_size)
+        self.timeout_seconds = timeout_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._live: Dict[str, CrewJob] = {} # jobs na fila ou em execução neste processo
+        self._changed: Dict[str, asyncio.Event] = {} # sinaliza novos logs/mudança de estado por job
+        self._recovered = False
+        self._backlog: Deque[CrewJob] = deque() # recuperados que não couberam na fila: entram conforme abrem vagas
+        self._reserved = 0 # vagas da fila reservadas por submissões que ainda estão gravando o job
+        self._principals: Dict[str, Principal] = {} # quem submeteu (e seu peso): as chamadas ao LLM do job entram no fair share dele
+        self._log_flushes: Dict[str, asyncio.Task] = {} # gravação de logs em andamento por job
+        self._logs_dirty: Set[str] = set() # jobs com logs novos chegados durante a gravação
+
+    async def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        # Fila e workers pertencem ao event loop em que foram criados
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_max_size)
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"crew-job-worker-{i}") for i in range(self.workers)]
+        if not self._recovered:
+            self._recovered = True
+            self._backlog.extend(await asyncio.to_thread(self.store.recover, CREW_JOB_RETENTION_SECONDS, self.boot_id))
+            self._drain_backlog()
+            if self._live:
+                logger.info(f"[job_service] {len(self._live)} jobs reenfileirados após reinício.")
+            if self._backlog:
+                logger.warning(f"[job_service] {len(self._backlog)} jobs recuperados aguardam vaga na fila (máx. {self.queue_max_size}).")
+        logger.info(f"[job_service] {self.workers} workers iniciados (fila máx. {self.queue_max_size}).")
+
+    def _track(self, job: CrewJob) -> None:
+        self._live[job.id] = job
+        self._changed[job.id] = asyncio.Event()
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.get(job_id)
+        if event is not None:
+            event.set()
+            self._changed[job_id] = asyncio.Event()
+
+    def _drain_backlog(self) -> None:
+        """Move jobs recuperados para a fila enquanto houver vaga (sem tomar vagas já reservadas por submissões)."""
+        while self._backlog and self._queue.qsize() + self._reserved < self.queue_max_size:
+            job = self._backlog.popleft()
+            self._track(job)
+            self._queue.put_nowait(job.id)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, topic: str, parameters: Optional[Dict[str, Any]] = None, owner_id: Optional[str] = None) -> CrewJob:
+        await self._ensure_started()
+        # A vaga é reservada antes de gravar: submissões simultâneas não podem ultrapassar o limite da fila
+        if self._queue.qsize() + self._reserved >= self.queue_max_size:
+            raise JobQueueFullError(f"Fila de jobs cheia ({self.queue_max_size} aguardando). Tente novamente mais tarde.")
+        job = CrewJob(id=uuid.uuid4().hex, topic=topic, parameters=parameters or {}, owner_id=owner_id)
+        self._reserved += 1
+        try:
+            await asyncio.to_thread(self.store.save, job)
+        finally:
+            self._reserved -= 1
+        self._track(job)
+        self._principals[job.id] = current_principal()
+        self._queue.put_nowait(job.id)
+        logger.info(f"[job_service] Job {job.id} enfileirado (tópico='{topic}', fila={self._queue.qsize()}).")
+        return job
+
+    async def get(self, job_id: str) -> Optional[CrewJob]:
+        job = self._live.get(job_id)
+        if job is not None:
+            return job
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def stream_logs(self, job_id: str) -> AsyncIterator[str]:
+        """Emite os logs já existentes e, enquanto o job não terminar, os novos à medida que são produzidos."""
+        sent = 0
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            changed = self._changed.get(job_id)
+            for line in job.logs[sent:]:
+                yield line
+            sent = len(job.logs)
+            if job.finished:
+                return
+            if changed is None:
+                # O job pertence a outro worker: os logs chegam pelo SQLite
+                await asyncio.sleep(CREW_JOB_POLL_SECONDS)
+                continue
+            await changed.wait()
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._drain_backlog() # a vaga liberada vai primeiro para os recuperados que ficaram de fora
+            try:
+                job = self._live.get(job_id)
+                if job is not None:
+                    await self._run(job)
+            except Exception as e:
+                logger.error(f"[job_service] Worker {index} falhou ao processar job {job_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: CrewJob) -> None:
+        principal = self._principals.pop(job.id, None) or Principal(job.owner_id or "anonymous")
+        set_current_principal(principal) # o worker é uma task de longa duração: o contexto é por job
+        job.status, job.started_at = RUNNING, time.time()
+        await asyncio.to_thread(self.store.save, job)
+        self._notify(job.id)
+
+        def on_log(line: str) -> None:
+            job.logs.append(line)
+            self._persist_logs(job)
+            self._notify(job.id)
+
+        outcome: Dict[str, Any] = {}
+        try:
+            # asyncio.timeout em vez de wait_for: no Python 3.11, wait_for pode engolir o cancelamento do
+            # worker (shutdown) quando a Crew termina no mesmo instante, deixando o worker vivo.
+            async with asyncio.timeout(self.timeout_seconds):
+                result, logs = await crew_service.run_specific_crew(job.topic, job.parameters, on_log=on_log)
+            # Logs retornados no final que não passaram pelo callback também são registrados
+            for line in (logs or [])[len(job.logs):]:
+                job.logs.append(line)
+            outcome = {"status": SUCCEEDED, "result": result}
+        except TimeoutError:
+            outcome = {"status": FAILED, "error": f"Tempo limite de {self.timeout_seconds:.0f}s excedido."}
+        except ValueError as e: # Ex: tópico não suportado
+            outcome = {"status": FAILED, "error": str(e)}
+        except Exception as e:
+            logger.error(f"[job_service] Erro ao executar job {job.id}: {e}", exc_info=True)
+            outcome = {"status": FAILED, "error": "Erro ao executar a Crew AI."}
+        flush = self._log_flushes.get(job.id)
+        if flush is not None:
+            # Uma gravação de logs atrasada não pode sobrescrever os logs do estado final
+            self._logs_dirty.discard(job.id)
+            await asyncio.gather(flush, return_exceptions=True)
+        # O estado final só fica visível depois de gravado: quem vê o job terminado encontra o mesmo estado no SQLite
+        final = replace(job, logs=list(job.logs), finished_at=time.time(), **outcome)
+        await asyncio.to_thread(self.store.save, final)
+        job.status, job.result, job.error, job.finished_at = final.status, final.result, final.error, final.finished_at
+        logger.info(f"[job_service] Job {job.id} finalizado com status '{job.status}' em {job.finished_at - job.started_at:.1f}s.")
+        self._live.pop(job.id, None)
+        self._notify(job.id)
+        self._changed.pop(job.id, None)
+
+    def _persist_logs(self, job: CrewJob) -> None:
+        """Agenda a gravação dos logs; linhas que chegam durante uma gravação entram na próxima (uma por vez, em ordem)."""
+        if job.id in self._log_flushes:
+            self._logs_dirty.add(job.id)
+            return
+        self._log_flushes[job.id] = asyncio.create_task(self._flush_logs(job))
+
+    async def _flush_logs(self, job: CrewJob) -> None:
+        try:
+            while True:
+                self._logs_dirty.discard(job.id)
+                await asyncio.to_thread(self.store.append_log, job.id, list(job.logs))
+                if job.id not in self._logs_dirty:
+                    return
+        except Exception as e:
+            logger.warning(f"[job_service] Falha ao gravar logs do job {job.id}: {e}")
+        finally:
+            self._log_flushes.pop(job.id, None)
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._log_flushes:
+            await asyncio.gather(*self._log_flushes.values(), return_exceptions=True)
+        # Um worker reciclado não passa pela recuperação do boot: os jobs que ele interrompeu falham aqui mesmo,
+        # senão ficariam 'running' para sempre. Os que estavam só na fila seguem 'queued' até o próximo boot.
+        now = time.time()
+        for job in [job for job in self._live.values() if job.status == RUNNING]:
+            interrupted = replace(job, logs=list(job.logs), status=FAILED, error="Execução interrompida pelo encerramento do worker.", finished_at=now)
+            try:
+                await asyncio.to_thread(self.store.save, interrupted)
+            except Exception as e:
+                logger.error(f"[job_service] Falha ao marcar o job interrompido {job.id}: {e}")
+            self._live.pop(job.id, None)
+        self.store.close()
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
+
+
+def set_job_manager(manager: Optional[JobManager]) -> None:
+    """Substitui o gerenciador global (útil em testes)."""
+    global _manager
+    _manager = manager
+
+
+async def shutdown() -> None:
+    if _manager is not None:
+        await _manager.shutdown()
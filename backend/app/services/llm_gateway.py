@@ -0,0 +1,391 @@
+# backend/app/services/llm_gateway.py
+"""
+Gateway único para chamadas a LLMs (chat e embeddings) usado por todos os serviços.
+
+- Um só cliente AsyncOpenAI por processo, sobre um httpx.AsyncClient com pool de conexões keep-alive.
+- LLM_BASE_URL aponta para qualquer endpoint compatível com a API da OpenAI (ex: um servidor local),
+  e LLM_MODEL_ALIASES troca nomes de modelo por configuração (ex: {"gpt-3.5-turbo": "llama3.1"}).
+- Por modelo: semáforo de concorrência e limite de tokens por minuto (token bucket), configuráveis
+  em LLM_MODEL_LIMITS (JSON), com padrões LLM_DEFAULT_CONCURRENCY e LLM_DEFAULT_TOKENS_PER_MINUTE.
+  As vagas de concorrência são distribuídas de forma justa entre usuários (fair_scheduler), com peso
+  por papel: a rajada de um usuário não passa na frente das chamadas dos demais.
+- Retries com backoff exponencial e jitter (tenacity) para 429, timeouts, erros de conexão e 5xx,
+  respeitando o header Retry-After quando presente.
+- Circuit breaker por modelo: após LLM_CIRCUIT_FAILURE_THRESHOLD falhas seguidas, as chamadas falham
+  imediatamente com CircuitOpenError por LLM_CIRCUIT_RESET_SECONDS; depois uma chamada de teste decide
+  se o circuito fecha de novo.
+- Latência por chamada e tokens de prompt/completion por modelo vão para app.metrics (GET /metrics).
+Os erros do gateway herdam de openai.OpenAIError, então os tratamentos existentes continuam valendo.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from openai import (
+    AsyncOpenAI,
+    OpenAIError,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from app import metrics
+from app.services.fair_scheduler import FairSemaphore
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+LLM_BASE_URL: Optional[str] = os.getenv("LLM_BASE_URL") or None # None = API da OpenAI
+LLM_API_KEY: Optional[str] = os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
+LLM_MODEL_ALIASES: Dict[str, str] = json.loads(os.getenv("LLM_MODEL_ALIASES", "{}"))
+LLM_MODEL_LIMITS: Dict[str, Dict[str, float]] = json.loads(os.getenv("LLM_MODEL_LIMITS", "{}"))
+LLM_DEFAULT_CONCURRENCY: int = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "16"))
+LLM_DEFAULT_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_DEFAULT_TOKENS_PER_MINUTE", "0")) # 0 = sem limite
+LLM_DEFAULT_COMPLETION_TOKENS: int = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", "512")) # Estimativa quando max_tokens não é informado
+LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "false").strip().lower() in ("1", "true", "yes")
+LLM_MAX_ATTEMPTS: int = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_RETRY_MAX_WAIT_SECONDS: float = float(os.getenv("LLM_RETRY_MAX_WAIT_SECONDS", "20"))
+LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS: float = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+# Pede o `usage` no último chunk dos streams (stream_options). Desative para endpoints que não suportam a opção.
+LLM_STREAM_INCLUDE_USAGE: bool = os.getenv("LLM_STREAM_INCLUDE_USAGE", "true").strip().lower() in ("1", "true", "yes")
+
+# Falhas transitórias: repetidas com backoff e contadas pelo circuit breaker
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class LLMGatewayError(OpenAIError):
+    pass
+
+
+class CircuitOpenError(LLMGatewayError):
+    pass
+
+
+class TokenRateLimiter:
+    """Token bucket em tokens por minuto; reserva uma estimativa antes da chamada e acerta depois pelo uso real."""
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: int) -> None:
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock: # Ordem de chegada: um pedido grande não é ultrapassado pelos pequenos
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: int) -> None:
+        """Debita (delta > 0) ou devolve (delta < 0) a diferença entre o uso real e o estimado."""
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = LLM_CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                raise CircuitOpenError(f"Circuito aberto para '{self.name}': provedor degradado, tente novamente em instantes.")
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                raise CircuitOpenError(f"Circuito em teste para '{self.name}': aguardando a chamada de verificação.")
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"[llm_gateway] Circuito de '{self.name}' fechado novamente.")
+        self.state, self.failures, self._trial_in_flight = self.CLOSED, 0, False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"[llm_gateway] Circuito de '{self.name}' aberto após {self.failures} falhas seguidas.")
+            self.state, self._opened_at = self.OPEN, time.monotonic()
+
+    def release_trial(self) -> None:
+        """Chamada abandonada (ex: cancelada) sem resultado: libera a vaga de teste sem mudar o estado."""
+        self._trial_in_flight = False
+
+
+class _ModelLane:
+    """Limites e estado de um modelo: concorrência, tokens por minuto e circuit breaker."""
+
+    def __init__(self, model: str):
+        limits = LLM_MODEL_LIMITS.get(model, {})
+        self.semaphore = FairSemaphore(int(limits.get("concurrency", LLM_DEFAULT_CONCURRENCY)))
+        self.rate_limiter = TokenRateLimiter(limits.get("tokens_per_minute", LLM_DEFAULT_TOKENS_PER_MINUTE))
+        self.breaker = CircuitBreaker(model)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Estimativa barata (~4 caracteres por token) do prompt mais a saída máxima."""
+    if "messages" in kwargs:
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in kwargs["messages"])
+        completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or LLM_DEFAULT_COMPLETION_TOKENS
+    else:
+        inputs = kwargs.get("input")
+        prompt_chars = sum(len(text) for text in inputs) if isinstance(inputs, list) else len(str(inputs or ""))
+        completion = 0
+    return prompt_chars // 4 + 1 + completion
+
+
+def _retry_wait(retry_state) -> float:
+    """Backoff exponencial com jitter, respeitando o Retry-After enviado pelo provedor."""
+    wait = wait_random_exponential(multiplier=0.5, max=LLM_RETRY_MAX_WAIT_SECONDS)(retry_state)
+    error = retry_state.outcome.exception() if retry_state.outcome else None
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(wait, min(float(retry_after), LLM_RETRY_MAX_WAIT_SECONDS)) if retry_after else wait
+    except ValueError:
+        return wait
+
+
+def _record_usage(lane: _ModelLane, model: str, usage: Any, estimate: int) -> None:
+    metrics.record_llm_usage(model, usage)
+    if isinstance(getattr(usage, "total_tokens", None), int):
+        lane.rate_limiter.adjust(usage.total_tokens - estimate)
+
+
+class GatewayStream:
+    """
+    Envolve o stream da OpenAI para liberar a vaga de concorrência do modelo quando o stream termina ou é fechado
+    e para contabilizar o `usage` enviado no último chunk.
+    """
+
+    def __init__(self, stream: Any, gateway: "LLMGateway", lane: _ModelLane, model: str = "", estimate: int = 0):
+        self._stream = stream
+        self._gateway = gateway
+        self._lane = lane
+        self._model = model
+        self._estimate = estimate
+        self._released = False
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        try:
+            async for chunk in self._stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    _record_usage(self._lane, self._model, usage, self._estimate)
+                yield chunk
+        except RETRYABLE_ERRORS:
+            self._lane.breaker.record_failure()
+            self._lane.failures += 1
+            raise
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            await self._stream.close()
+        finally:
+            self._lane.semaphore.release()
+
+
+class LLMGateway:
+    def __init__(self, client: Optional[Any] = None, base_url: Optional[str] = LLM_BASE_URL, api_key: Optional[str] = LLM_API_KEY):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client = client
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._lanes: Dict[str, _ModelLane] = {}
+
+    def is_configured(self) -> bool:
+        # Endpoints locais compatíveis com a OpenAI normalmente não exigem chave
+        return self._client is not None or bool(self.api_key) or bool(self.base_url)
+
+    def resolve_model(self, model: str) -> str:
+        return LLM_MODEL_ALIASES.get(model, model)
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            self._http_client = httpx.AsyncClient(
+                http2=LLM_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or "sem-chave",
+                base_url=self.base_url,
+                http_client=self._http_client,
+                max_retries=0, # Retries ficam a cargo do gateway (com circuit breaker)
+            )
+            logger.info(f"[llm_gateway] Cliente criado (endpoint={self.base_url or 'OpenAI'}, conexões={LLM_MAX_CONNECTIONS})")
+        return self._client
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _ModelLane(model)
+        return lane
+
+    async def _call(self, lane: _ModelLane, create, kwargs: Dict[str, Any], operation: str) -> Any:
+        lane.breaker.before_call()
+        lane.calls += 1
+        attempts = 0
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(RETRYABLE_ERRORS),
+                wait=_retry_wait,
+                stop=stop_after_attempt(max(1, LLM_MAX_ATTEMPTS)),
+                reraise=True,
+            ):
+                with attempt:
+                    attempts += 1
+                    result = await create(**kwargs)
+        except RETRYABLE_ERRORS:
+            lane.breaker.record_failure()
+            lane.failures += 1
+            raise
+        except Exception:
+            # Erros do cliente (400, 401...) não indicam degradação do provedor, mas também não provam
+            # que ele se recuperou: em meio-aberto, só libera a vaga de teste para a próxima chamada
+            lane.breaker.release_trial()
+            raise
+        except BaseException:
+            # Cancelamento: nada se sabe sobre o provedor, mas a verificação em meio-aberto não pode ficar presa
+            lane.breaker.release_trial()
+            raise
+        else:
+            outcome = "success"
+        finally:
+            lane.retries += max(0, attempts - 1)
+            metrics.record_llm_call(kwargs["model"], operation, time.perf_counter() - started, outcome)
+        lane.breaker.record_success()
+        return result
+
+    async def chat_completion(self, **kwargs: Any) -> Any:
+        """
+        Mesma assinatura de `client.chat.completions.create`. Com stream=True, retorna um GatewayStream
+        (o estágio "llm" das métricas mede até o início do stream).
+        """
+        model = kwargs["model"] = self.resolve_model(kwargs["model"])
+        if kwargs.get("stream") and LLM_STREAM_INCLUDE_USAGE and "stream_options" not in kwargs:
+            kwargs["stream_options"] = {"include_usage": True}
+        lane = self._lane(model)
+        estimate = _estimate_tokens(kwargs)
+        with metrics.stage_timer("llm"):
+            # Vaga justa primeiro: quem espera pelo token bucket já foi escolhido pelo fair share
+            await lane.semaphore.acquire()
+            try:
+                await lane.rate_limiter.acquire(estimate)
+                result = await self._call(lane, self._get_client().chat.completions.create, kwargs, "chat")
+            except BaseException:
+                lane.semaphore.release()
+                raise
+        if kwargs.get("stream"):
+            return GatewayStream(result, self, lane, model, estimate) # A vaga é liberada quando o stream termina
+        lane.semaphore.release()
+        usage = getattr(result, "usage", None)
+        if usage is not None:
+            _record_usage(lane, model, usage, estimate)
+        return result
+
+    async def embeddings(self, **kwargs: Any) -> Any:
+        """Mesma assinatura de `client.embeddings.create`."""
+        kwargs["model"] = self.resolve_model(kwargs["model"])
+        lane = self._lane(kwargs["model"])
+        async with lane.semaphore:
+            await lane.rate_limiter.acquire(_estimate_tokens(kwargs))
+            result = await self._call(lane, self._get_client().embeddings.create, kwargs, "embeddings")
+        metrics.record_llm_usage(kwargs["model"], getattr(result, "usage", None))
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            model: {
+                "calls": lane.calls,
+                "failures": lane.failures,
+                "retries": lane.retries,
+                "circuit": lane.breaker.state,
+                "available_tokens": round(lane.rate_limiter.tokens) if lane.rate_limiter.capacity > 0 else None,
+                "waiting": lane.semaphore.waiting(),
+            }
+            for model, lane in self._lanes.items()
+        }
+
+    async def close(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            self._client = None
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+        if not _gateway.is_configured():
+            logger.warning("[llm_gateway] Nem OPENAI_API_KEY/LLM_API_KEY nem LLM_BASE_URL configurados; chamadas ao LLM falharão.")
+    return _gateway
+
+
+def set_llm_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Substitui o gateway global (útil em testes e benchmarks)."""
+    global _gateway
+    _gateway = gateway
+
+
+async def shutdown() -> None:
+    if _gateway is not None:
+        await _gateway.close()
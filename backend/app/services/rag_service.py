@@ -1,7 +1,20 @@
 # Copie e cole para criar/atualizar o arquivo backend/app/services/rag_service.py:
+import os
 import asyncio
 import logging
-from typing import List, Dict, Any, Tuple
+from contextlib import aclosing
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+
+import asyncpg
+import numpy as np
+
+from app.metrics import stage_timer
+from app.services import context_packer, llm_gateway, semantic_cache, session_memory, vector_store
+from app.services.embedding_service import get_embedding_engine
+from app.services.result_cache import content_key, normalize_text
+from app.services.session_memory import SessionHistory
+from app.services.singleflight import SingleFlight
+from app.services.vector_store import SearchFilter, SearchResult
 
 logger = logging.getLogger(__name__)
 
@@ -9,17 +22,220 @@ logger = logging.getLogger(__name__)
 class VectorStoreNotReadyError(Exception):
     pass
 
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5")) # máximo de chunks no contexto
+RAG_CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", str(RAG_TOP_K * 2))) # recuperados antes da deduplicação/orçamento
+RAG_CHAT_MODEL = os.getenv("RAG_CHAT_MODEL", "gpt-3.5-turbo")
+RAG_TEMPERATURE = float(os.getenv("RAG_TEMPERATURE", "0.2"))
+RAG_SYSTEM_PROMPT = (
+    "Você é um assistente que responde perguntas usando SOMENTE o contexto fornecido. "
+    "Se a resposta não estiver no contexto, diga que não encontrou a informação. Responda em português."
+)
+
+NO_RESULTS_ANSWER = "Desculpe, não encontrei informações sobre isso no meu conhecimento atual."
+
+# Eventos emitidos em modo streaming: ("token", {"text": ...}) e, ao final, ("done", {"answer": ..., "sources": [...]})
+StreamEvent = Tuple[str, Dict[str, Any]]
+
+# Coalescência de perguntas idênticas (após normalização) em andamento
+rag_flight = SingleFlight("rag_query")
+
 # Marcar a função como async
-async def query_knowledge_base(question: str) -> Tuple[str, List[Dict[str, Any]]]:
+async def query_knowledge_base(question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Responde a 'question' via RAG (ver `_query_knowledge_base`).
+    Perguntas idênticas, após normalização, feitas ao mesmo tempo compartilham uma única execução.
+    Com `session_id` (e o usuário dono da sessão), o histórico da sessão entra no prompt (ver
+    session_memory) e o turno é registrado antes de retornar.
+    Com `user_id`, a busca também enxerga os documentos privados do usuário (ex: seus itens), então a
+    coalescência é por usuário: a resposta de um nunca é entregue a outro.
+    """
+    if user_id and session_id:
+        memory = session_memory.get_session_memory()
+        history = await memory.history(user_id, session_id)
+        answer, sources = await _query_knowledge_base(question, history, user_id)
+        await memory.record(user_id, session_id, question, answer)
+        return answer, sources
+    return await rag_flight.do(content_key(user_id or "", normalize_text(question)), lambda: _query_knowledge_base(question, user_id=user_id))
+
+async def _query_knowledge_base(question: str, history: Optional[SessionHistory] = None, user_id: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Responde a 'question' via RAG:
+    1. Gera o embedding da 'question' (embedding_service.get_embedding_engine().embed, com micro-batching e cache).
+    Perguntas semanticamente equivalentes a uma já respondida são servidas pelo cache semântico.
+    2. Consulta o Vector Store configurado (pgvector ou índice local, ver vector_store) por similaridade.
+    3. Recupera os chunks mais relevantes e os empacota (context_packer): sem quase duplicados,
+    em ordem de relevância, dentro de RAG_CONTEXT_TOKEN_BUDGET tokens.
+    4. Passa o contexto e a 'question' para um LLM gerar a resposta.
+    5. Retorna a resposta e as fontes usadas (com os tokens de cada uma).
+    Enquanto nenhum Vector Store estiver configurado, responde em modo placeholder.
+    Com histórico de sessão, o cache semântico é ignorado: a resposta depende da conversa, não só da pergunta.
+    Respostas que usaram documentos privados (metadata.user_id) não entram no cache semântico, que é compartilhado.
+    """
+    store = vector_store.get_vector_store()
+    if not store.is_ready():
+        return await _placeholder_answer(question)
+
+    logger.info(f"[rag_service] Processando query: '{question}' (backend={store.name})")
+    with stage_timer("embedding"):
+        embedding = await get_embedding_engine().embed(question)
+    cache = semantic_cache.get_semantic_cache(embedding.shape[0]) if history is None or history.is_empty() else None
+    cached = cache.lookup(embedding) if cache is not None else None
+    if cached is not None:
+        answer, sources, similarity = cached
+        logger.info(f"[rag_service] Resposta servida do cache semântico (similaridade={similarity:.3f})")
+        return answer, sources
+    with stage_timer("retrieval"):
+        results = await _search(store, embedding, user_id)
+    if not results:
+        return NO_RESULTS_ANSWER, []
+
+    packed = await _pack(results)
+    answer = await _generate_answer(question, packed, history)
+    sources = _sources(packed)
+    if cache is not None and not _uses_private_documents(packed):
+        cache.store(embedding, answer, sources)
+    return answer, sources
+
+async def stream_knowledge_base(question: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+    """
+    Versão em streaming de query_knowledge_base: emite os tokens da resposta assim que o LLM os gera
+    e, por último, um evento "done" com a resposta completa e as fontes.
+    Se o consumidor parar de iterar (ex: cliente desconectou), o stream da OpenAI é fechado e a
+    geração é interrompida; respostas incompletas não entram no cache semântico nem na sessão.
     """
-    Placeholder para a função RAG.
-    Na Fase 7, esta função conterá a lógica para:
-    1. Gerar o embedding da 'question'.
-    2. Consultar o Vector Store (Supabase pgvector ou outro) por similaridade.
-    3. Recuperar chunks relevantes.
-    4. Passar os chunks e a 'question' para um LLM gerar a resposta.
-    5. Extrair e retornar a resposta e as fontes.
+    memory = session_memory.get_session_memory() if user_id and session_id else None
+    history = await memory.history(user_id, session_id) if memory is not None else None
+    async with aclosing(_stream_knowledge_base(question, history, user_id)) as events:
+        async for event, data in events:
+            if event == "done" and memory is not None: # turno completo: gravado antes do "done", a próxima pergunta já o vê
+                await memory.record(user_id, session_id, question, data["answer"])
+            yield event, data
+
+async def _stream_knowledge_base(question: str, history: Optional[SessionHistory] = None, user_id: Optional[str] = None) -> AsyncIterator[StreamEvent]:
+    store = vector_store.get_vector_store()
+    if not store.is_ready():
+        answer, sources = await _placeholder_answer(question)
+        yield "token", {"text": answer}
+        yield "done", {"answer": answer, "sources": sources}
+        return
+
+    logger.info(f"[rag_service] Processando query em streaming: '{question}' (backend={store.name})")
+    with stage_timer("embedding"):
+        embedding = await get_embedding_engine().embed(question)
+    cache = semantic_cache.get_semantic_cache(embedding.shape[0]) if history is None or history.is_empty() else None
+    cached = cache.lookup(embedding) if cache is not None else None
+    if cached is not None:
+        answer, sources, _ = cached
+        yield "token", {"text": answer}
+        yield "done", {"answer": answer, "sources": sources}
+        return
+    with stage_timer("retrieval"):
+        results = await _search(store, embedding, user_id)
+    if not results:
+        yield "token", {"text": NO_RESULTS_ANSWER}
+        yield "done", {"answer": NO_RESULTS_ANSWER, "sources": []}
+        return
+
+    packed = await _pack(results)
+    sources = _sources(packed)
+    parts: List[str] = []
+    async for delta in _stream_answer(question, packed, history):
+        parts.append(delta)
+        yield "token", {"text": delta}
+    answer = "".join(parts)
+    if cache is not None and not _uses_private_documents(packed):
+        cache.store(embedding, answer, sources)
+    yield "done", {"answer": answer, "sources": sources}
+
+async def retrieve(query: str, k: int = RAG_TOP_K, search_filter: Optional[SearchFilter] = None) -> List[SearchResult]:
     """
+    Busca vetorial sem geração: os `k` chunks mais próximos de `query` que passam em `search_filter`
+    (dono, fontes, tags, período; ver vector_store.SearchFilter). Os filtros são aplicados dentro da
+    varredura do índice, então um filtro seletivo não devolve menos resultados nem custa um top-k global.
+    """
+    store = vector_store.get_vector_store()
+    if not store.is_ready():
+        raise VectorStoreNotReadyError(f"Base de vetores ({store.name}) ainda não está pronta.")
+    with stage_timer("embedding"):
+        embedding = await get_embedding_engine().embed(query)
+    with stage_timer("retrieval"):
+        return await _search_filtered(store, embedding, k, search_filter or SearchFilter())
+
+async def _search(store: vector_store.VectorStore, embedding: np.ndarray, user_id: Optional[str] = None) -> List[SearchResult]:
+    # Documentos compartilhados + os privados do usuário (sem usuário, só os compartilhados)
+    return await _search_filtered(
+        store, embedding, max(RAG_CONTEXT_CANDIDATES, RAG_TOP_K), SearchFilter(user_id=user_id),
+        with_embeddings=context_packer.RAG_CONTEXT_DEDUP_SIMILARITY <= 1.0,
+    )
+
+async def _search_filtered(store: vector_store.VectorStore, embedding: np.ndarray, k: int, search_filter: SearchFilter, with_embeddings: bool = False) -> List[SearchResult]:
+    try:
+        return await store.search_filtered(embedding, k, search_filter, with_embeddings=with_embeddings)
+    except (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError) as e:
+        raise VectorStoreNotReadyError(f"Base de vetores indisponível: {e}") from e
+
+async def _pack(results: List[SearchResult]) -> context_packer.PackedContext:
+    """Deduplica e encaixa os chunks no orçamento de tokens (em thread: tokenizar/carregar o BPE não bloqueia o loop)."""
+    packed = await asyncio.to_thread(context_packer.pack_context, results, RAG_CHAT_MODEL, max_chunks=RAG_TOP_K)
+    logger.info(
+        f"[rag_service] Contexto: {len(packed.chunks)}/{len(results)} chunks, {packed.tokens}/{packed.budget} tokens "
+        f"({packed.duplicates_dropped} duplicados, {packed.over_budget_dropped} fora do orçamento)"
+    )
+    return packed
+
+def _uses_private_documents(packed: context_packer.PackedContext) -> bool:
+    return any(vector_store.OWNER_KEY in chunk.result.metadata for chunk in packed.chunks)
+
+def _source_from_result(result: SearchResult) -> Dict[str, Any]:
+    source = {"id": result.id, "source": result.metadata.get("source"), "score": round(result.similarity, 4)}
+    if "page" in result.metadata:
+        source["page"] = result.metadata["page"]
+    return source
+
+def _sources(packed: context_packer.PackedContext) -> List[Dict[str, Any]]:
+    """Fontes efetivamente usadas no prompt, com os tokens que cada uma ocupou no contexto."""
+    sources = []
+    for chunk in packed.chunks:
+        source = _source_from_result(chunk.result)
+        source["tokens"] = chunk.tokens
+        if chunk.truncated:
+            source["truncated"] = True
+        sources.append(source)
+    return sources
+
+def _build_messages(question: str, packed: context_packer.PackedContext, history: Optional[SessionHistory] = None) -> List[Dict[str, str]]:
+    """Prompt do sistema, histórico da sessão (resumo + turnos recentes, já no orçamento) e a pergunta com o contexto."""
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        *(history.messages() if history is not None else []),
+        {"role": "user", "content": f"Contexto:\n{packed.text}\n\nPergunta: {question}"},
+    ]
+
+async def _generate_answer(question: str, packed: context_packer.PackedContext, history: Optional[SessionHistory] = None) -> str:
+    response = await llm_gateway.get_llm_gateway().chat_completion(
+        model=RAG_CHAT_MODEL,
+        messages=_build_messages(question, packed, history),
+        temperature=RAG_TEMPERATURE,
+    )
+    return response.choices[0].message.content or ""
+
+async def _stream_answer(question: str, packed: context_packer.PackedContext, history: Optional[SessionHistory] = None) -> AsyncIterator[str]:
+    stream = await llm_gateway.get_llm_gateway().chat_completion(
+        model=RAG_CHAT_MODEL,
+        messages=_build_messages(question, packed, history),
+        temperature=RAG_TEMPERATURE,
+        stream=True,
+    )
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+    finally:
+        await stream.close() # Fecha a conexão HTTP mesmo se o consumidor abandonar o stream
+
+async def _placeholder_answer(question: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Respostas simuladas usadas enquanto não há Vector Store configurado (pool do banco ou índice local)."""
     logger.info(f"[rag_service] Processando query (placeholder): '{question}'")
     await asyncio.sleep(0.2) # Simula I/O assíncrono
     if "supabase" in question.lower():
@@ -30,21 +246,20 @@ async def query_knowledge_base(question: str) -> Tuple[str, List[Dict[str, Any]]
          return "Este é um teste do serviço RAG placeholder.", []
     else:
         logger.debug("Placeholder RAG não encontrou resposta.")
-        # Exemplo de como sinalizar erro específico:
-        # if not vector_store_is_ready(): raise VectorStoreNotReadyError("Base de vetores indisponível.")
         return "Desculpe, não encontrei informações sobre isso no meu conhecimento atual (placeholder).", []
 
 # Marcar a função como async
-async def load_and_index_data():
+async def load_and_index_data(paths: Optional[List[str]] = None) -> Dict[str, Any]:
    """
-   Placeholder para carregar e indexar dados no Vector Store.
-   Na Fase 7, esta função conteria a lógica para:
-   1. Ler dados de fontes (arquivos, DBs, APIs).
-   2. Dividir o texto em chunks (Text Splitters).
-   3. Gerar embeddings para cada chunk (Modelo de Embedding).
-   4. Salvar os chunks e embeddings no Vector Store (tabela 'documents' no Supabase).
+   Carrega e indexa dados no Vector Store (tabela 'documents' no Supabase).
+   Delega ao pipeline em streaming de ingestion_service:
+   1. Lê arquivos md/txt/pdf de `paths` (padrão: RAG_DATA_DIR).
+   2. Divide o texto em chunks de forma preguiçosa.
+   3. Pula chunks cujo content_hash já está indexado (re-execuções incrementais).
+   4. Gera embeddings em lote e grava via COPY em massa.
    """
-   logger.info("[rag_service] Placeholder: Iniciando carregamento e indexação de dados...")
-   await asyncio.sleep(0.5) # Simula processo assíncrono
-   logger.info("[rag_service] Placeholder: Dados carregados e indexados com sucesso!")
-   return {"status": "success", "indexed_count": 10} # Exemplo de retorno
\ No newline at end of file
+   from app.services import ingestion_service # import tardio: evita ciclo com ingestion_service
+   logger.info("[rag_service] Iniciando carregamento e indexação de dados...")
+   stats = await ingestion_service.index_paths(paths)
+   logger.info(f"[rag_service] Dados carregados e indexados com sucesso! {stats.as_dict()}")
+   return {"status": "success", **stats.as_dict()}
@@ -0,0 +1,178 @@
+# backend/app/services/result_cache.py
+"""
+Cache de resultados endereçado por conteúdo, em dois níveis:
+1. Memória: LRU com limite de tamanho e TTL (cachetools.TTLCache).
+2. Persistente (opcional): arquivo SQLite local, compartilhável entre workers da mesma máquina.
+
+As chaves são hashes (ver `content_key`) que já incluem modelo, versão do prompt e parâmetros;
+cada entrada persistente também guarda a `version` para permitir invalidação explícita
+quando o template do prompt muda.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza texto para fins de cache: Unicode NFKC, sem diferença de caixa e com espaços colapsados."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def content_key(*parts: Any) -> str:
+    """Hash SHA-256 estável de uma sequência de partes serializáveis em JSON."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Cache de dois níveis (memória + SQLite opcional) para resultados serializáveis em JSON."""
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        max_size: int = 10000,
+        ttl_seconds: float = 3600,
+        sqlite_path: str = "",
+        persistent_ttl_seconds: float = 30 * 24 * 3600,
+    ):
+        self.name = name
+        self.version = version
+        self.persistent_ttl_seconds = persistent_ttl_seconds
+        self._memory: TTLCache = TTLCache(maxsize=max_size, ttl=ttl_seconds)
+        self._sqlite_path = sqlite_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    # --- Nível persistente (SQLite, executado em thread) ---
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self._sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._sqlite_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " cache_name TEXT NOT NULL, key TEXT NOT NULL, version TEXT NOT NULL,"
+                " value TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (cache_name, key))"
+            )
+            # Invalida entradas geradas por versões anteriores do prompt deste cache
+            deleted = conn.execute(
+                "DELETE FROM cache_entries WHERE cache_name = ? AND version != ?", (self.name, self.version)
+            ).rowcount
+            conn.commit()
+            if deleted:
+                logger.info(f"[result_cache:{self.name}] {deleted} entradas de versões antigas removidas.")
+            self._conn = conn
+        return self._conn
+
+    def _persistent_get(self, key: str) -> Optional[str]:
+        with self._conn_lock:
+            row = self._connection().execute(
+                "SELECT value, created_at FROM cache_entries WHERE cache_name = ? AND key = ? AND version = ?",
+                (self.name, key, self.version),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.persistent_ttl_seconds:
+            return None
+        return row[0]
+
+    def _persistent_set(self, key: str, value: str) -> None:
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (cache_name, key, version, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, key, self.version, value, time.time()),
+            )
+            conn.commit()
+
+    def _persistent_clear(self, only_stale: bool) -> int:
+        with self._conn_lock:
+            conn = self._connection()
+            if only_stale:
+                cursor = conn.execute(
+                    "DELETE FROM cache_entries WHERE cache_name = ? AND (version != ? OR created_at < ?)",
+                    (self.name, self.version, time.time() - self.persistent_ttl_seconds),
+                )
+            else:
+                cursor = conn.execute("DELETE FROM cache_entries WHERE cache_name = ?", (self.name,))
+            conn.commit()
+            return cursor.rowcount
+
+    # --- API pública ---
+    async def get(self, key: str) -> Optional[Any]:
+        """Busca na memória e, se ausente, no SQLite (promovendo o valor para a memória)."""
+        value = self._memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self._sqlite_path:
+            try:
+                raw = await asyncio.to_thread(self._persistent_get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"[result_cache:{self.name}] Falha ao ler cache persistente: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._memory[key] = value
+                self.persistent_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        if self._sqlite_path:
+            try:
+                await asyncio.to_thread(self._persistent_set, key, json.dumps(value, ensure_ascii=False))
+            except sqlite3.Error as e:
+                logger.warning(f"[result_cache:{self.name}] Falha ao gravar cache persistente: {e}")
+
+    async def invalidate(self, new_version: Optional[str] = None) -> int:
+        """
+        Invalida o cache. Com `new_version` (ex: novo template de prompt), passa a usar essa versão e remove
+        as entradas de outras versões; sem ela, remove todas as entradas. Retorna o nº de linhas persistentes removidas.
+        """
+        self._memory.clear()
+        if new_version is not None:
+            self.version = new_version
+        if not self._sqlite_path:
+            return 0
+        return await asyncio.to_thread(self._persistent_clear, new_version is not None)
+
+    def clear_memory(self) -> None:
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "name": self.name,
+            "version": self.version,
+            "memory_size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "persistent_enabled": bool(self._sqlite_path),
+        }
+
+    def close(self) -> None:
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
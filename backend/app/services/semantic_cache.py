@@ -0,0 +1,259 @@
+# backend/app/services/semantic_cache.py
+"""
+Cache semântico de respostas do RAG.
+
+Guarda (embedding da pergunta, resposta, fontes). Uma pergunta nova cuja similaridade de cosseno
+com uma pergunta já respondida for >= SEMANTIC_CACHE_THRESHOLD recebe a resposta em cache, sem
+retrieval nem chamada ao LLM. Entradas expiram por TTL, são removidas por LRU quando o cache
+enche e são invalidadas quando algum dos documentos de origem é reindexado.
+
+Os embeddings ficam numa matriz NumPy pré-alocada (um slot por entrada), então a busca é um
+único produto matriz-vetor.
+
+O cache é por processo. A reindexação avisa os outros processos (workers do uvicorn, a CLI de
+ingestão, o indexador de itens) com `publish_invalidation`: invalida o cache local e publica as
+fontes com pg_notify(SEMANTIC_CACHE_CHANNEL); cada worker escuta o canal (startup, chamado pelo
+lifespan) e invalida as mesmas fontes. Sem banco (VECTOR_BACKEND=local sem Supabase) não há aviso
+entre processos: a defasagem fica limitada por SEMANTIC_CACHE_TTL_SECONDS.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app import clients
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")) # defasagem máxima sem banco
+SEMANTIC_CACHE_CHANNEL: str = os.getenv("SEMANTIC_CACHE_CHANNEL", "semantic_cache_invalidate")
+SEMANTIC_CACHE_RETRY_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_RETRY_SECONDS", "5"))
+SEMANTIC_CACHE_KEEPALIVE_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_KEEPALIVE_SECONDS", "30"))
+NOTIFY_PAYLOAD_MAX_BYTES = 7000 # limite do NOTIFY: 8000 bytes
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    sources: List[Dict[str, Any]]
+    created_at: float
+    source_names: Set[str] = field(default_factory=set)
+    document_ids: Set[Any] = field(default_factory=set)
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        dim: int,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+    ):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._valid = np.zeros(self.max_entries, dtype=bool)
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict() # slot -> entrada, em ordem de uso (LRU)
+        self._free_slots: List[int] = list(range(self.max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _evict(self, slot: int) -> None:
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def lookup(self, embedding: np.ndarray) -> Optional[Tuple[str, List[Dict[str, Any]], float]]:
+        """Retorna (resposta, fontes, similaridade) da entrada mais parecida acima do limiar, ou None."""
+        if not self._entries:
+            self.misses += 1
+            return None
+        similarities = self._matrix @ self._normalize(embedding)
+        similarities[~self._valid] = -np.inf
+        slot = int(np.argmax(similarities))
+        similarity = float(similarities[slot])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+        entry = self._entries[slot]
+        if time.time() - entry.created_at > self.ttl_seconds:
+            self._evict(slot)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(slot)
+        self.hits += 1
+        return entry.answer, entry.sources, similarity
+
+    def store(self, embedding: np.ndarray, answer: str, sources: List[Dict[str, Any]]) -> None:
+        if not self._free_slots:
+            oldest_slot = next(iter(self._entries))
+            self._evict(oldest_slot)
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._matrix[slot] = self._normalize(embedding)
+        self._valid[slot] = True
+        self._entries[slot] = CacheEntry(
+            answer=answer,
+            sources=sources,
+            created_at=time.time(),
+            source_names={s["source"] for s in sources if s.get("source")},
+            document_ids={s["id"] for s in sources if s.get("id") is not None},
+        )
+
+    def invalidate_sources(self, source_names: Iterable[str]) -> int:
+        """Remove respostas que usaram algum dos documentos (fontes) informados."""
+        names = set(source_names)
+        stale = [slot for slot, entry in self._entries.items() if entry.source_names & names]
+        return self._invalidate(stale)
+
+    def invalidate_document_ids(self, document_ids: Iterable[Any]) -> int:
+        ids = set(document_ids)
+        stale = [slot for slot, entry in self._entries.items() if entry.document_ids & ids]
+        return self._invalidate(stale)
+
+    def _invalidate(self, slots: List[int]) -> int:
+        for slot in slots:
+            self._evict(slot)
+        self.invalidations += len(slots)
+        if slots:
+            logger.info(f"[semantic_cache] {len(slots)} respostas invalidadas por reindexação.")
+        return len(slots)
+
+    def clear(self) -> None:
+        for slot in list(self._entries):
+            self._evict(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache(dim: int) -> Optional[SemanticCache]:
+    """Cache do processo para embeddings de dimensão `dim`, ou None se SEMANTIC_CACHE_ENABLED=false."""
+    global _cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _cache is None or _cache.dim != dim:
+        _cache = SemanticCache(dim)
+    return _cache
+
+
+def set_semantic_cache(cache: Optional[SemanticCache]) -> None:
+    global _cache
+    _cache = cache
+
+
+def invalidate_sources(source_names: Iterable[str]) -> int:
+    """Invalidação chamada pela ingestão quando um documento é reindexado."""
+    return _cache.invalidate_sources(source_names) if _cache is not None else 0
+
+
+# --- Invalidação entre processos (LISTEN/NOTIFY) ---
+def _payloads(source_names: List[str]) -> List[str]:
+    """Divide as fontes em payloads JSON abaixo do limite do NOTIFY."""
+    payloads, current = [], []
+    for name in source_names:
+        if current and len(json.dumps(current + [name]).encode("utf-8")) > NOTIFY_PAYLOAD_MAX_BYTES:
+            payloads.append(json.dumps(current))
+            current = []
+        current.append(name)
+    if current:
+        payloads.append(json.dumps(current))
+    return payloads
+
+
+async def publish_invalidation(source_names: Iterable[str]) -> int:
+    """Invalida as fontes neste processo e avisa os demais (se houver banco). Retorna as entradas removidas aqui."""
+    names = sorted(set(source_names))
+    removed = invalidate_sources(names)
+    pool = clients.get_db_pool()
+    if pool is not None and names:
+        try:
+            for payload in _payloads(names):
+                await pool.execute("SELECT pg_notify($1, $2)", SEMANTIC_CACHE_CHANNEL, payload)
+        except Exception as e:
+            logger.warning(f"[semantic_cache] Falha ao publicar invalidação ({type(e).__name__}: {e}); outros processos dependem do TTL.")
+    return removed
+
+
+def _on_notify(connection, pid: int, channel: str, payload: str) -> None:
+    try:
+        names = json.loads(payload)
+    except ValueError:
+        logger.debug(f"[semantic_cache] Notificação ignorada: {payload!r}")
+        return
+    if isinstance(names, list):
+        invalidate_sources(str(name) for name in names)
+
+
+async def _listen_forever() -> None:
+    while True:
+        try:
+            conn = await clients.connect()
+            try:
+                await conn.add_listener(SEMANTIC_CACHE_CHANNEL, _on_notify)
+                while True:
+                    await asyncio.sleep(SEMANTIC_CACHE_KEEPALIVE_SECONDS)
+                    await conn.fetchval("SELECT 1") # detecta conexão morta
+            finally:
+                try:
+                    await conn.close(timeout=5)
+                except Exception:
+                    conn.terminate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[semantic_cache] Conexão de LISTEN perdida ({type(e).__name__}: {e}); reconectando em {SEMANTIC_CACHE_RETRY_SECONDS}s.")
+        await asyncio.sleep(SEMANTIC_CACHE_RETRY_SECONDS)
+
+
+_listener: Optional[asyncio.Task] = None
+
+
+async def startup() -> None:
+    """Escuta as invalidações publicadas por outros processos (chamado pelo lifespan, se houver banco)."""
+    global _listener
+    if not SEMANTIC_CACHE_ENABLED or clients.get_db_pool() is None:
+        return
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen_forever(), name="semantic_cache_listener")
+
+
+async def shutdown() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
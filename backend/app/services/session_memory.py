@@ -0,0 +1,389 @@
+# backend/app/services/session_memory.py
+"""
+Memória de conversa do RAG por sessão (`RagQueryInput.session_id`), com orçamento fixo de tokens.
+
+Cada sessão é identificada por (usuário, session_id): um usuário nunca lê a sessão de outro, mesmo
+repetindo o id. Ela guarda um resumo acumulado (rolling summary) e os turnos recentes (pergunta +
+resposta). O histórico enviado ao LLM é o resumo mais os turnos mais novos que couberem em
+RAG_SESSION_TOKEN_BUDGET, então o prompt não cresce com a conversa. Quando a sessão passa do
+orçamento, os turnos mais antigos são fundidos no resumo por uma chamada ao LLM feita em background,
+depois da resposta: o turno do usuário não espera a compactação. Se o LLM falhar, o resumo é
+substituído por um trecho extraído do resumo anterior e dos turnos, cortado no mesmo limite.
+
+Backends (RAG_SESSION_BACKEND):
+- "memory" (padrão): sessões por processo num TTLCache. Sessões ociosas expiram após
+  RAG_SESSION_TTL_SECONDS e, acima de RAG_SESSION_MAX_SESSIONS, a menos usada recentemente sai.
+- "postgres": tabela public.rag_sessions (supabase/migrations), via pool asyncpg compartilhado.
+  Qualquer worker retoma a sessão. O append de turnos é atômico e a compactação só é aplicada se
+  ninguém compactou a sessão no meio (coluna `compactions`). Sessões expiradas são ignoradas na
+  leitura e apagadas periodicamente.
+"""
+import os
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from cachetools import TTLCache
+
+from app import clients
+from app.services import context_packer, llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+RAG_SESSION_BACKEND: str = os.getenv("RAG_SESSION_BACKEND", "memory").strip().lower() # "memory" ou "postgres"
+RAG_SESSION_TOKEN_BUDGET: int = int(os.getenv("RAG_SESSION_TOKEN_BUDGET", "1200")) # resumo + turnos no prompt
+RAG_SESSION_SUMMARY_MAX_TOKENS: int = int(os.getenv("RAG_SESSION_SUMMARY_MAX_TOKENS", "300"))
+RAG_SESSION_TURN_MAX_TOKENS: int = int(os.getenv("RAG_SESSION_TURN_MAX_TOKENS", "400")) # respostas longas são cortadas
+RAG_SESSION_MAX_SESSIONS: int = int(os.getenv("RAG_SESSION_MAX_SESSIONS", "10000"))
+RAG_SESSION_TTL_SECONDS: float = float(os.getenv("RAG_SESSION_TTL_SECONDS", "3600"))
+RAG_SESSION_PURGE_INTERVAL_SECONDS: float = float(os.getenv("RAG_SESSION_PURGE_INTERVAL_SECONDS", "300"))
+RAG_SESSION_SUMMARY_MODEL: str = os.getenv("RAG_SESSION_SUMMARY_MODEL", os.getenv("RAG_CHAT_MODEL", "gpt-3.5-turbo"))
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Você mantém o resumo de uma conversa entre um usuário e um assistente. Atualize o resumo atual com os "
+    "novos turnos, preservando fatos, nomes, números, preferências e perguntas em aberto necessários para "
+    "entender as próximas perguntas. Seja conciso e responda apenas com o resumo, em português."
+)
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    tokens: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"question": self.question, "answer": self.answer, "tokens": self.tokens}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Turn":
+        return cls(question=data["question"], answer=data["answer"], tokens=int(data["tokens"]))
+
+
+@dataclass
+class SessionHistory:
+    """O que entra no prompt: resumo + turnos recentes, já dentro do orçamento."""
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def messages(self) -> List[Dict[str, str]]:
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+
+@dataclass
+class Session:
+    user_id: str
+    session_id: str
+    summary: str = ""
+    summary_tokens: int = 0
+    turns: List[Turn] = field(default_factory=list)
+    compactions: int = 0 # versão do resumo: compactações concorrentes não se sobrepõem
+
+    @property
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def history(self, budget: int) -> SessionHistory:
+        """Resumo + os turnos mais novos que cabem em `budget` (turnos que não cabem esperam a compactação)."""
+        remaining = budget - self.summary_tokens
+        recent: List[Turn] = []
+        for turn in reversed(self.turns):
+            if turn.tokens > remaining:
+                break
+            recent.append(turn)
+            remaining -= turn.tokens
+        return SessionHistory(summary=self.summary, turns=recent[::-1])
+
+
+class SessionStore(ABC):
+    """Persistência das sessões. `append` é atômico; `compact` só aplica se `compactions` ainda for o esperado."""
+
+    @abstractmethod
+    async def load(self, user_id: str, session_id: str) -> Session:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def append(self, user_id: str, session_id: str, turn: Turn) -> Session:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def compact(self, session: Session, summary: str, summary_tokens: int, folded: int) -> bool:
+        raise NotImplementedError
+
+    async def purge_expired(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessões em memória (por processo), com expiração por ociosidade e LRU."""
+
+    def __init__(self, max_sessions: int = RAG_SESSION_MAX_SESSIONS, ttl_seconds: float = RAG_SESSION_TTL_SECONDS, timer=time.monotonic):
+        self._sessions: TTLCache = TTLCache(maxsize=max(1, max_sessions), ttl=ttl_seconds, timer=timer)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @staticmethod
+    def _snapshot(session: Session) -> Session:
+        return replace(session, turns=list(session.turns))
+
+    async def load(self, user_id: str, session_id: str) -> Session:
+        session = self._sessions.get((user_id, session_id))
+        return self._snapshot(session) if session is not None else Session(user_id, session_id)
+
+    async def append(self, user_id: str, session_id: str, turn: Turn) -> Session:
+        key = (user_id, session_id)
+        session = self._sessions.get(key) or Session(user_id, session_id)
+        session.turns.append(turn)
+        self._sessions[key] = session # reinserir renova o TTL: conta a partir do último turno
+        return self._snapshot(session)
+
+    async def compact(self, session: Session, summary: str, summary_tokens: int, folded: int) -> bool:
+        current = self._sessions.get((session.user_id, session.session_id))
+        if current is None or current.compactions != session.compactions:
+            return False
+        current.summary, current.summary_tokens = summary, summary_tokens
+        current.turns = current.turns[folded:]
+        current.compactions += 1
+        return True
+
+    async def purge_expired(self) -> None:
+        self._sessions.expire()
+
+
+class PostgresSessionStore(SessionStore):
+    """Sessões em public.rag_sessions, compartilhadas entre workers (pool asyncpg de app.clients)."""
+
+    def __init__(self, ttl_seconds: float = RAG_SESSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _pool():
+        pool = clients.get_db_pool()
+        if pool is None:
+            raise RuntimeError("Pool do banco indisponível para as sessões do RAG.")
+        return pool
+
+    @staticmethod
+    def _from_row(user_id: str, session_id: str, row) -> Session:
+        return Session(
+            user_id, session_id, summary=row["summary"], summary_tokens=row["summary_tokens"],
+            turns=[Turn.from_dict(turn) for turn in row["turns"]], compactions=row["compactions"],
+        )
+
+    async def load(self, user_id: str, session_id: str) -> Session:
+        row = await self._pool().fetchrow(
+            "SELECT summary, summary_tokens, turns, compactions FROM public.rag_sessions"
+            " WHERE user_id = $1 AND session_id = $2 AND updated_at > now() - make_interval(secs => $3)",
+            user_id, session_id, self.ttl_seconds,
+        )
+        return self._from_row(user_id, session_id, row) if row else Session(user_id, session_id)
+
+    async def append(self, user_id: str, session_id: str, turn: Turn) -> Session:
+        # Uma sessão expirada que ainda não foi apagada recomeça do zero
+        row = await self._pool().fetchrow(
+            """
+            INSERT INTO public.rag_sessions AS s (user_id, session_id, turns) VALUES ($1, $2, jsonb_build_array($3::jsonb))
+            ON CONFLICT (user_id, session_id) DO UPDATE SET
+                summary = CASE WHEN s.updated_at > now() - make_interval(secs => $4) THEN s.summary ELSE '' END,
+                summary_tokens = CASE WHEN s.updated_at > now() - make_interval(secs => $4) THEN s.summary_tokens ELSE 0 END,
+                turns = CASE WHEN s.updated_at > now() - make_interval(secs => $4) THEN s.turns || excluded.turns ELSE excluded.turns END,
+                updated_at = now()
+            RETURNING summary, summary_tokens, turns, compactions
+            """,
+            user_id, session_id, turn.as_dict(), self.ttl_seconds,
+        )
+        return self._from_row(user_id, session_id, row)
+
+    async def compact(self, session: Session, summary: str, summary_tokens: int, folded: int) -> bool:
+        result = await self._pool().execute(
+            """
+            UPDATE public.rag_sessions SET
+                summary = $4, summary_tokens = $5, compactions = compactions + 1,
+                turns = (
+                    SELECT coalesce(jsonb_agg(t.turn ORDER BY t.pos), '[]'::jsonb)
+                    FROM jsonb_array_elements(turns) WITH ORDINALITY AS t(turn, pos) WHERE t.pos > $6
+                )
+            WHERE user_id = $1 AND session_id = $2 AND compactions = $3
+            """,
+            session.user_id, session.session_id, session.compactions, summary, summary_tokens, folded,
+        )
+        return result.endswith(" 1")
+
+    async def purge_expired(self) -> None:
+        result = await self._pool().execute(
+            "DELETE FROM public.rag_sessions WHERE updated_at < now() - make_interval(secs => $1)", self.ttl_seconds
+        )
+        logger.debug(f"[session_memory] Limpeza de sessões expiradas: {result}")
+
+
+class SessionMemory:
+    """Lê o histórico dentro do orçamento, registra turnos e compacta sessões em background."""
+
+    def __init__(
+        self,
+        store: SessionStore,
+        budget: int = RAG_SESSION_TOKEN_BUDGET,
+        summary_max_tokens: int = RAG_SESSION_SUMMARY_MAX_TOKENS,
+        turn_max_tokens: int = RAG_SESSION_TURN_MAX_TOKENS,
+        model: str = RAG_SESSION_SUMMARY_MODEL,
+    ):
+        self.store = store
+        self.budget = budget
+        self.summary_max_tokens = min(summary_max_tokens, budget)
+        self.turn_max_tokens = turn_max_tokens
+        self.model = model
+        self.compactions = 0
+        self._compacting: Set[Tuple[str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_purge = time.monotonic()
+
+    async def history(self, user_id: str, session_id: str) -> SessionHistory:
+        try:
+            session = await self.store.load(user_id, session_id)
+        except Exception as e:
+            logger.warning(f"[session_memory] Falha ao ler a sessão '{session_id}' ({type(e).__name__}: {e}); seguindo sem histórico.")
+            return SessionHistory()
+        return session.history(self.budget)
+
+    def make_turn(self, question: str, answer: str) -> Turn:
+        tokens = context_packer.count_tokens(question, self.model) + context_packer.count_tokens(answer, self.model)
+        if tokens > self.turn_max_tokens:
+            answer_budget = max(self.turn_max_tokens - context_packer.count_tokens(question, self.model), 0)
+            answer = context_packer.truncate_to_tokens(answer, answer_budget, self.model)
+            tokens = context_packer.count_tokens(question, self.model) + context_packer.count_tokens(answer, self.model)
+        return Turn(question=question, answer=answer, tokens=tokens)
+
+    async def record(self, user_id: str, session_id: str, question: str, answer: str) -> None:
+        """Anexa o turno; se a sessão passou do orçamento, agenda a compactação (sem esperar por ela)."""
+        try:
+            # Contar/truncar tokens de uma resposta longa é CPU: roda numa thread, fora do event loop
+            turn = await asyncio.to_thread(self.make_turn, question, answer)
+            session = await self.store.append(user_id, session_id, turn)
+        except Exception as e:
+            logger.warning(f"[session_memory] Falha ao gravar o turno da sessão '{session_id}' ({type(e).__name__}: {e}).")
+            return
+        key = (user_id, session_id)
+        if session.tokens > self.budget and key not in self._compacting:
+            self._compacting.add(key)
+            self._spawn(self._compact(session))
+        if time.monotonic() - self._last_purge >= RAG_SESSION_PURGE_INTERVAL_SECONDS:
+            self._last_purge = time.monotonic()
+            self._spawn(self._purge())
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _fold_count(self, session: Session) -> int:
+        """Quantos turnos antigos vão para o resumo para que os restantes caibam ao lado de um resumo cheio."""
+        remaining = sum(turn.tokens for turn in session.turns)
+        folded = 0
+        while folded < len(session.turns) and remaining > self.budget - self.summary_max_tokens:
+            remaining -= session.turns[folded].tokens
+            folded += 1
+        return folded
+
+    async def _compact(self, session: Session) -> None:
+        key = (session.user_id, session.session_id)
+        try:
+            folded = self._fold_count(session)
+            if folded == 0:
+                return
+            summary = await self._summarize(session.summary, session.turns[:folded])
+            tokens = context_packer.count_tokens(summary, self.model)
+            if tokens > self.summary_max_tokens:
+                summary = context_packer.truncate_to_tokens(summary, self.summary_max_tokens, self.model)
+                tokens = context_packer.count_tokens(summary, self.model)
+            if await self.store.compact(session, summary, tokens, folded):
+                self.compactions += 1
+                logger.info(f"[session_memory] Sessão '{session.session_id}': {folded} turno(s) fundido(s) no resumo ({tokens} tokens).")
+            else:
+                logger.info(f"[session_memory] Sessão '{session.session_id}' compactada em paralelo; resumo descartado.")
+        except Exception as e:
+            logger.warning(f"[session_memory] Falha ao compactar a sessão '{session.session_id}' ({type(e).__name__}: {e}).")
+        finally:
+            self._compacting.discard(key)
+
+    @staticmethod
+    def _format_turns(turns: List[Turn]) -> str:
+        return "\n".join(f"Usuário: {turn.question}\nAssistente: {turn.answer}" for turn in turns)
+
+    async def _summarize(self, previous: str, turns: List[Turn]) -> str:
+        try:
+            response = await llm_gateway.get_llm_gateway().chat_completion(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Resumo atual:\n{previous or '(vazio)'}\n\nNovos turnos:\n{self._format_turns(turns)}"},
+                ],
+                temperature=0,
+                max_tokens=self.summary_max_tokens,
+            )
+            summary = (response.choices[0].message.content or "").strip()
+            if summary:
+                return summary
+        except Exception as e:
+            logger.warning(f"[session_memory] Resumo via LLM falhou ({type(e).__name__}: {e}); usando resumo extrativo.")
+        return "\n".join(filter(None, [previous, self._format_turns(turns)]))
+
+    async def _purge(self) -> None:
+        try:
+            await self.store.purge_expired()
+        except Exception as e:
+            logger.warning(f"[session_memory] Falha ao limpar sessões expiradas ({type(e).__name__}: {e}).")
+
+    async def drain(self) -> None:
+        """Espera as compactações/limpezas em andamento (testes e shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.drain()
+        await self.store.close()
+
+
+_memory: Optional[SessionMemory] = None
+
+
+def get_session_memory() -> SessionMemory:
+    """Retorna a memória de sessões do processo, com o backend de RAG_SESSION_BACKEND."""
+    global _memory
+    if _memory is None:
+        if RAG_SESSION_BACKEND == "postgres":
+            _memory = SessionMemory(PostgresSessionStore())
+        elif RAG_SESSION_BACKEND == "memory":
+            _memory = SessionMemory(MemorySessionStore())
+        else:
+            raise ValueError(f"RAG_SESSION_BACKEND desconhecido: '{RAG_SESSION_BACKEND}' (use 'memory' ou 'postgres').")
+    return _memory
+
+
+def set_session_memory(memory: Optional[SessionMemory]) -> None:
+    """Substitui a memória global (útil em testes)."""
+    global _memory
+    _memory = memory
+
+
+async def shutdown() -> None:
+    if _memory is not None:
+        await _memory.close()
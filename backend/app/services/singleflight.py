@@ -0,0 +1,72 @@
+# backend/app/services/singleflight.py
+"""
+Coalescência de chamadas idênticas em andamento ("singleflight").
+
+Requisições concorrentes com a mesma chave compartilham uma única execução: a primeira cria a tarefa
+e as demais aguardam o mesmo resultado (ou a mesma exceção). A execução roda numa tarefa própria,
+então o cancelamento de um chamador (ex: cliente desconectou) não afeta os outros; ela só é
+cancelada quando todos os chamadores que a aguardavam desistiram.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+logger = logging.getLogger(__name__)
+
+AI_COALESCING_ENABLED: bool = os.getenv("AI_COALESCING_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = AI_COALESCING_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def is_inflight(self, key: str) -> bool:
+        return self.enabled and key in self._flights
+
+    def _finished(self, key: str, flight: _Flight, task: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception() # Marca a exceção como lida mesmo se nenhum chamador restou
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Executa `fn()` uma única vez por chave entre chamadas concorrentes e devolve o resultado a todas."""
+        if not self.enabled:
+            return await fn()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task, flight=flight: self._finished(key, flight, task))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"[singleflight:{self.name}] Requisição coalescida com execução em andamento ({key[:12]}...)")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Só interrompe a execução compartilhada quando ninguém mais espera por ela
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": len(self._flights), "executions": self.executions, "coalesced": self.coalesced}
@@ -0,0 +1,254 @@
+# backend/app/services/spec_registry.py
+"""
+Registro das especificações de saída estruturada (app/specs) usadas por /generate-structured.
+
+- Arquivos .py: cada subclasse de pydantic.BaseModel definida no módulo vira uma spec com o nome da classe.
+- Arquivos .rail: a spec recebe o nome do arquivo sem extensão; os campos de <output> viram um modelo Pydantic.
+
+Todas as specs são descobertas e compiladas uma única vez (modelo de validação e, se a biblioteca
+guardrails estiver instalada, o `Guard` correspondente). `get()` é só uma consulta ao dicionário em
+memória, sem acessar o disco: a detecção de mudanças roda numa task de background iniciada no lifespan,
+que a cada SPEC_RELOAD_INTERVAL_SECONDS reexamina o diretório (numa thread) e recompila só os arquivos
+com mtime alterado (ou novos/removidos). O dicionário novo substitui o antigo de uma vez, então uma
+requisição nunca vê uma spec sumir no meio da recompilação.
+"""
+import os
+import sys
+import asyncio
+import logging
+import threading
+import importlib.util
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from app.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+SPECS_DIR: str = os.getenv("SPECS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "specs"))
+# 0 desativa o hot reload (specs só são lidas no startup)
+SPEC_RELOAD_INTERVAL_SECONDS: float = float(os.getenv("SPEC_RELOAD_INTERVAL_SECONDS", "2"))
+
+# Tipos de campo RAIL -> tipos Python
+RAIL_FIELD_TYPES: Dict[str, Any] = {
+    "string": str, "integer": int, "float": float, "bool": bool, "date": str, "time": str,
+    "email": str, "url": str, "percentage": str, "enum": str, "list": List[Any], "object": Dict[str, Any],
+}
+
+
+class SpecNotFoundError(FileNotFoundError):
+    pass
+
+
+class SpecCompilationError(Exception):
+    pass
+
+
+@dataclass
+class CompiledSpec:
+    name: str
+    kind: str # "pydantic" ou "rail"
+    path: str
+    model: Type[BaseModel]
+    rail_source: Optional[str] = None
+    guard: Any = None # guardrails.Guard, quando a biblioteca está disponível
+    _field_adapters: Dict[str, TypeAdapter] = field(default_factory=dict, repr=False)
+
+    def validate(self, data: Any) -> Dict[str, Any]:
+        """Valida `data` contra a spec e retorna o objeto normalizado. Levanta pydantic.ValidationError."""
+        with stage_timer("validation"):
+            return self.model.model_validate(data).model_dump()
+
+    @property
+    def required_fields(self) -> List[str]:
+        return [name for name, info in self.model.model_fields.items() if info.is_required()]
+
+    def validate_field(self, name: str, value: Any) -> Any:
+        """Valida um único campo de primeiro nível (tipo + restrições do Field). Levanta pydantic.ValidationError."""
+        adapter = self._field_adapters.get(name)
+        if adapter is None:
+            info = self.model.model_fields[name]
+            adapter = self._field_adapters[name] = TypeAdapter(Annotated[info.annotation, info])
+        with stage_timer("validation"):
+            return adapter.validate_python(value)
+
+    def example(self) -> Optional[Dict[str, Any]]:
+        examples = (self.model.model_config.get("json_schema_extra") or {}).get("examples") or []
+        return examples[0] if examples else None
+
+
+def _build_guard(model: Type[BaseModel], rail_source: Optional[str]) -> Any:
+    try:
+        from guardrails import Guard
+    except ImportError:
+        return None
+    if rail_source is not None:
+        return Guard.for_rail_string(rail_source)
+    return Guard.for_pydantic(output_class=model)
+
+
+def _rail_output_model(name: str, source: str) -> Type[BaseModel]:
+    """Monta um modelo Pydantic com os campos de primeiro nível do elemento <output> de uma spec RAIL."""
+    try:
+        root = ET.fromstring(source)
+    except ET.ParseError as e:
+        raise SpecCompilationError(f"RAIL inválido em '{name}': {e}") from e
+    output = root.find("output")
+    if output is None:
+        raise SpecCompilationError(f"Spec RAIL '{name}' não possui o elemento <output>.")
+    fields: Dict[str, Tuple[Any, Any]] = {}
+    for element in output:
+        if not isinstance(element.tag, str) or "name" not in element.attrib:
+            continue
+        field_type = RAIL_FIELD_TYPES.get(element.tag, Any)
+        required = element.attrib.get("required", "true").lower() != "false"
+        fields[element.attrib["name"]] = (field_type, ...) if required else (Optional[field_type], None)
+    return create_model(name, **fields)
+
+
+def _compile_python(path: str) -> List[CompiledSpec]:
+    module_name = f"app.specs.{os.path.splitext(os.path.basename(path))[0]}"
+    module_spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_name] = module # Necessário para referências adiadas do Pydantic
+    try:
+        module_spec.loader.exec_module(module)
+    except Exception as e:
+        raise SpecCompilationError(f"Falha ao importar '{path}': {e}") from e
+    specs = []
+    for value in vars(module).values():
+        if isinstance(value, type) and issubclass(value, BaseModel) and value.__module__ == module_name:
+            specs.append(CompiledSpec(name=value.__name__, kind="pydantic", path=path, model=value, guard=_build_guard(value, None)))
+    return specs
+
+
+def _compile_rail(path: str) -> List[CompiledSpec]:
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    name = os.path.splitext(os.path.basename(path))[0]
+    model = _rail_output_model(name, source)
+    return [CompiledSpec(name=name, kind="rail", path=path, model=model, rail_source=source, guard=_build_guard(model, source))]
+
+
+class SpecRegistry:
+    def __init__(self, directory: str = SPECS_DIR, reload_interval_seconds: float = SPEC_RELOAD_INTERVAL_SECONDS):
+        self.directory = directory
+        self.reload_interval_seconds = reload_interval_seconds
+        self._specs: Dict[str, CompiledSpec] = {}
+        self._files: Dict[str, Tuple[float, List[str]]] = {} # caminho -> (mtime, nomes das specs do arquivo)
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.compilations = 0
+
+    def _spec_files(self) -> Dict[str, float]:
+        files = {}
+        if not os.path.isdir(self.directory):
+            return files
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and (entry.name.endswith(".rail") or (entry.name.endswith(".py") and not entry.name.startswith("_"))):
+                files[entry.path] = entry.stat().st_mtime
+        return files
+
+    def _load_file(self, path: str, mtime: float, specs: Dict[str, CompiledSpec]) -> None:
+        self._unload_file(path, specs)
+        try:
+            compiled = _compile_rail(path) if path.endswith(".rail") else _compile_python(path)
+        except (SpecCompilationError, OSError) as e:
+            # Mantém o mtime para não tentar recompilar um arquivo quebrado a cada verificação
+            logger.error(f"[spec_registry] {e}")
+            self._files[path] = (mtime, [])
+            return
+        self.compilations += 1
+        for spec in compiled:
+            if spec.name in specs:
+                logger.warning(f"[spec_registry] Spec '{spec.name}' de '{path}' substitui a definida em '{specs[spec.name].path}'.")
+            specs[spec.name] = spec
+        self._files[path] = (mtime, [spec.name for spec in compiled])
+        logger.info(f"[spec_registry] Compiladas de {os.path.basename(path)}: {[spec.name for spec in compiled]}")
+
+    def _unload_file(self, path: str, specs: Dict[str, CompiledSpec]) -> None:
+        _, names = self._files.pop(path, (0.0, []))
+        for name in names:
+            if name in specs and specs[name].path == path:
+                del specs[name]
+
+    def refresh(self) -> None:
+        """Recompila apenas arquivos novos ou com mtime alterado e remove specs de arquivos apagados."""
+        with self._lock:
+            current = self._spec_files()
+            specs = dict(self._specs) # cópia: os leitores continuam no dicionário atual até a troca
+            for path in set(self._files) - set(current):
+                logger.info(f"[spec_registry] Arquivo removido: {path}")
+                self._unload_file(path, specs)
+            for path, mtime in current.items():
+                known = self._files.get(path)
+                if known is None or known[0] != mtime:
+                    self._load_file(path, mtime, specs)
+            self._specs, self._loaded = specs, True
+
+    async def watch(self) -> None:
+        """Detecção de mudanças em background (até ser cancelada); o disco é lido numa thread."""
+        while True:
+            await asyncio.sleep(self.reload_interval_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"[spec_registry] Falha ao reexaminar {self.directory}: {e}", exc_info=True)
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh() # Primeira carga, para registros usados sem o lifespan (scripts, testes)
+
+    def get(self, name: str) -> CompiledSpec:
+        """Retorna a spec compilada. Levanta SpecNotFoundError para nomes desconhecidos."""
+        self._ensure_loaded()
+        spec = self._specs.get(name[:-len(".rail")] if name.endswith(".rail") else name)
+        if spec is None:
+            raise SpecNotFoundError(f"Spec '{name}' não encontrada. Disponíveis: {', '.join(sorted(self._specs)) or 'nenhuma'}.")
+        return spec
+
+    def names(self) -> List[str]:
+        self._ensure_loaded()
+        return sorted(self._specs)
+
+
+_registry: Optional[SpecRegistry] = None
+_watch_task: Optional[asyncio.Task] = None
+
+
+def get_spec_registry() -> SpecRegistry:
+    global _registry
+    if _registry is None:
+        _registry = SpecRegistry()
+    return _registry
+
+
+def set_spec_registry(registry: Optional[SpecRegistry]) -> None:
+    """Substitui o registro global (útil em testes)."""
+    global _registry
+    _registry = registry
+
+
+async def startup() -> None:
+    """Descobre e compila todas as specs no startup da API e inicia a detecção de mudanças (hot reload)."""
+    global _watch_task
+    registry = get_spec_registry()
+    await asyncio.to_thread(registry.refresh)
+    logger.info(f"[spec_registry] {len(registry.names())} specs disponíveis em {registry.directory}.")
+    if registry.reload_interval_seconds > 0 and _watch_task is None:
+        _watch_task = asyncio.create_task(registry.watch(), name="spec-registry-watch")
+
+
+async def shutdown() -> None:
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        try:
+            await _watch_task
+        except asyncio.CancelledError:
+            pass
+        _watch_task = None
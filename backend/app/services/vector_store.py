@@ -0,0 +1,618 @@
+# backend/app/services/vector_store.py
+"""
+Backends de busca vetorial do RAG, selecionáveis por VECTOR_BACKEND:
+
+- "pgvector" (padrão): função match_documents em public.documents (índice HNSW do Postgres).
+  Com VECTOR_PG_QUANTIZATION=halfvec|binary, usa match_documents_quantized: candidatos pelo índice
+  HNSW quantizado (float16 ou 1 bit por dimensão) e rescoring exato com os vetores completos. O número
+  de candidatos (k * VECTOR_PG_CANDIDATE_FACTOR) troca latência por recall; compare os modos com
+  `python -m benchmarks.quantization`.
+  `search_filtered` (SearchFilter: dono, fontes, tags, período) usa match_documents_filtered: os filtros
+  são aplicados dentro da varredura do índice, com ampliação iterativa até sobrarem k resultados.
+- "local": índice no próprio processo, sem round-trip ao banco:
+    * vectors.bin    matriz float32/float16 (n, dim) acessada por memory-map (rescoring exato);
+    * index.hnsw     grafo hnswlib persistido em disco (busca aproximada);
+    * records.jsonl  sidecar append-only com conteúdo/metadados (e marcas de remoção) por id;
+    * manifest.json  dimensão, dtype e parâmetros do índice.
+  O snapshot é carregado no startup; appends incrementais são gravados no fim dos arquivos e o
+  grafo é salvo em `snapshot()`. Itens gravados após o último snapshot são reinseridos no load.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app import clients
+from app.services.ingestion_service import Chunk, VectorSink, vector_literal
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração (variáveis de ambiente) ---
+VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "pgvector").strip().lower() # "pgvector" ou "local"
+VECTOR_LOCAL_DIR: str = os.getenv("VECTOR_LOCAL_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "vector_index"))
+VECTOR_LOCAL_DTYPE: str = os.getenv("VECTOR_LOCAL_DTYPE", "float32").strip().lower() # "float32" ou "float16"
+VECTOR_HNSW_M: int = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION: int = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200"))
+VECTOR_HNSW_EF_SEARCH: int = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+# Com filtro de metadados, busca k * fator candidatos antes de filtrar
+VECTOR_FILTER_OVERFETCH: int = int(os.getenv("VECTOR_FILTER_OVERFETCH", "4"))
+# Máximo de buscas (cada uma com o dobro de vizinhos) quando o filtro descarta quase tudo; limita o custo
+# de um filtro muito seletivo num índice grande, ao preço de devolver menos de k resultados
+VECTOR_FILTER_MAX_ROUNDS: int = int(os.getenv("VECTOR_FILTER_MAX_ROUNDS", "4"))
+RAG_MATCH_THRESHOLD: float = float(os.getenv("RAG_MATCH_THRESHOLD", "0.0"))
+VECTOR_PG_QUANTIZATION: str = os.getenv("VECTOR_PG_QUANTIZATION", "none").strip().lower() # "none", "halfvec" ou "binary"
+VECTOR_PG_CANDIDATE_FACTOR: int = int(os.getenv("VECTOR_PG_CANDIDATE_FACTOR", "10")) # candidatos = k * fator (máx. 1000)
+VECTOR_PG_MAX_CANDIDATES: int = 1000 # limite do hnsw.ef_search
+# Busca filtrada: teto do hnsw.ef_search na ampliação iterativa (custo máximo de um filtro muito seletivo)
+VECTOR_PG_MAX_EF_SEARCH: int = int(os.getenv("VECTOR_PG_MAX_EF_SEARCH", "1000"))
+PG_QUANTIZATIONS = ("none", "halfvec", "binary")
+# Documentos com esta chave nos metadados são privados do dono (ex: public.items, ver items_indexer):
+# só aparecem quando o filtro da busca traz o mesmo valor. Documentos sem ela são compartilhados.
+OWNER_KEY = "user_id"
+
+
+@dataclass
+class SearchResult:
+    id: int
+    content: str
+    similarity: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    embedding: Optional[np.ndarray] = None # só preenchido com search(..., with_embeddings=True)
+
+
+def _metadata_matches(metadata: Dict[str, Any], filter_metadata: Optional[Dict[str, Any]]) -> bool:
+    """Equivalente simplificado do filtro de match_documents: `@>` nas demais chaves e visibilidade por OWNER_KEY."""
+    filter_metadata = filter_metadata or {}
+    owner = metadata.get(OWNER_KEY)
+    if owner is not None and owner != filter_metadata.get(OWNER_KEY):
+        return False
+    return all(metadata.get(key) == value for key, value in filter_metadata.items() if key != OWNER_KEY)
+
+
+def _epoch(value: datetime) -> float:
+    """Timestamp de um datetime; sem fuso, é tratado como UTC (como o asyncpg faz com timestamptz)."""
+    return (value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+@dataclass
+class SearchFilter:
+    """
+    Filtros da busca por tenant (ver match_documents_filtered). `user_id` identifica quem busca:
+    documentos compartilhados + os privados dele; com `owner_only`, só os privados dele.
+    `sources` e `tags` aceitam qualquer um dos valores; o período usa a data de criação do documento.
+    """
+    user_id: Optional[str] = None
+    sources: Optional[Tuple[str, ...]] = None
+    tags: Optional[Tuple[str, ...]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    owner_only: bool = False
+    metadata: Dict[str, Any] = field(default_factory=dict) # igualdade exata (`@>`) nas demais chaves
+
+    def metadata_filter(self) -> Dict[str, Any]:
+        return {**self.metadata, OWNER_KEY: self.user_id} if self.user_id else {k: v for k, v in self.metadata.items() if k != OWNER_KEY}
+
+    def is_restrictive(self) -> bool:
+        """Se o filtro descarta documentos compartilhados (o dono sozinho não descarta nenhum)."""
+        return bool(
+            self.owner_only or self.sources is not None or self.tags is not None or self.created_after or self.created_before
+            or any(key != OWNER_KEY for key in self.metadata)
+        )
+
+    def matches(self, metadata: Dict[str, Any], created_at: Optional[float] = None) -> bool:
+        if not _metadata_matches(metadata, self.metadata_filter()):
+            return False
+        if self.owner_only and metadata.get(OWNER_KEY) is None:
+            return False
+        if self.sources is not None and metadata.get("source") not in self.sources:
+            return False
+        if self.tags is not None and not set(self.tags) & set(metadata.get("tags") or ()):
+            return False
+        if self.created_after is not None and (created_at is None or created_at < _epoch(self.created_after)):
+            return False
+        if self.created_before is not None and (created_at is None or created_at >= _epoch(self.created_before)):
+            return False
+        return True
+
+
+class VectorStore(ABC):
+    name = "base"
+
+    @abstractmethod
+    def is_ready(self) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search(self, embedding: np.ndarray, k: int, filter_metadata: Optional[Dict[str, Any]] = None, with_embeddings: bool = False) -> List[SearchResult]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_filtered(self, embedding: np.ndarray, k: int, search_filter: SearchFilter, with_embeddings: bool = False) -> List[SearchResult]:
+        """Top-k entre os documentos que passam no filtro (o filtro nunca reduz o número de resultados)."""
+        raise NotImplementedError
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class PgVectorStore(VectorStore):
+    """Busca em public.documents via match_documents ou match_documents_quantized (pool asyncpg compartilhado)."""
+    name = "pgvector"
+
+    def __init__(self, quantization: str = VECTOR_PG_QUANTIZATION, candidate_factor: int = VECTOR_PG_CANDIDATE_FACTOR):
+        if quantization not in PG_QUANTIZATIONS:
+            raise ValueError(f"VECTOR_PG_QUANTIZATION desconhecida: '{quantization}' (use {', '.join(PG_QUANTIZATIONS)}).")
+        self.quantization = quantization
+        self.candidate_factor = max(1, candidate_factor)
+
+    def is_ready(self) -> bool:
+        return clients.get_db_pool() is not None
+
+    def candidate_count(self, k: int) -> int:
+        return min(max(k * self.candidate_factor, k), VECTOR_PG_MAX_CANDIDATES)
+
+    def _match_call(self) -> str:
+        """Chamada SQL da busca ($1 vetor, $2 limiar, $3 k, $4 filtro; $5/$6 candidatos/quantização no modo quantizado)."""
+        if self.quantization == "none":
+            return "match_documents($1::vector, $2, $3, $4::jsonb)"
+        return "match_documents_quantized($1::vector, $2, $3, $4::jsonb, $5, $6)"
+
+    async def search(self, embedding: np.ndarray, k: int, filter_metadata: Optional[Dict[str, Any]] = None, with_embeddings: bool = False) -> List[SearchResult]:
+        # O filtro vai como dict: o codec jsonb do pool (clients._init_connection) já serializa
+        args = [vector_literal(embedding), RAG_MATCH_THRESHOLD, k, filter_metadata or {}]
+        if self.quantization != "none":
+            args += [self.candidate_count(k), self.quantization]
+        return await self._fetch(self._match_call(), args, with_embeddings)
+
+    async def search_filtered(self, embedding: np.ndarray, k: int, search_filter: SearchFilter, with_embeddings: bool = False) -> List[SearchResult]:
+        """match_documents_filtered: filtros dentro da varredura HNSW, ampliando hnsw.ef_search até k resultados."""
+        call = "match_documents_filtered($1::vector, $2, $3, $4::jsonb, $5::text[], $6::text[], $7, $8, $9, $10, $11, $12)"
+        args = [
+            vector_literal(embedding), RAG_MATCH_THRESHOLD, k, search_filter.metadata_filter(),
+            list(search_filter.sources) if search_filter.sources is not None else None,
+            list(search_filter.tags) if search_filter.tags is not None else None,
+            search_filter.created_after, search_filter.created_before, search_filter.owner_only,
+            self.quantization, self.candidate_count(k) if self.quantization != "none" else k, VECTOR_PG_MAX_EF_SEARCH,
+        ]
+        return await self._fetch(call, args, with_embeddings)
+
+    async def _fetch(self, call: str, args: List[Any], with_embeddings: bool) -> List[SearchResult]:
+        pool = clients.get_db_pool()
+        if pool is None:
+            from app.services.rag_service import VectorStoreNotReadyError
+            raise VectorStoreNotReadyError("Base de vetores (pgvector) indisponível.")
+        if with_embeddings:
+            # Vetores dos chunks (deduplicação do contexto do RAG) vêm no mesmo round-trip
+            query = (
+                f"SELECT m.id, m.content, m.metadata, m.similarity, d.embedding::text AS embedding"
+                f" FROM {call} m JOIN documents d ON d.id = m.id ORDER BY m.similarity DESC"
+            )
+        else:
+            query = f"SELECT id, content, metadata, similarity FROM {call}"
+        rows = await pool.fetch(query, *args)
+        return [
+            SearchResult(
+                id=row["id"], content=row["content"], similarity=float(row["similarity"]), metadata=_as_dict(row["metadata"]),
+                embedding=_parse_vector(row["embedding"]) if with_embeddings else None,
+            )
+            for row in rows
+        ]
+
+
+def _parse_vector(text: Optional[str]) -> Optional[np.ndarray]:
+    """Converte a representação textual do pgvector ("[0.1,0.2,...]") em float32."""
+    if not text:
+        return None
+    return np.array(text.strip("[]").split(","), dtype=np.float32)
+
+
+def _as_dict(value: Any) -> Dict[str, Any]:
+    if isinstance(value, str):
+        return json.loads(value)
+    return dict(value or {})
+
+
+class _ReadWriteLock:
+    """Vários leitores ou um escritor (com preferência ao escritor); usado por threads, fora do event loop."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class LocalVectorStore(VectorStore, VectorSink):
+    """Índice vetorial local (memmap + hnswlib + sidecar JSONL). Também serve de destino da ingestão."""
+    name = "local"
+
+    def __init__(self, directory: str, dim: int, dtype: str = VECTOR_LOCAL_DTYPE):
+        if dim <= 0:
+            raise ValueError(f"Dimensão inválida para o índice local: {dim}.")
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._index = None
+        self._vectors: Optional[np.ndarray] = None
+        self._count = 0
+        self._offsets: List[int] = [] # id -> offset da linha no sidecar (-1 = removido)
+        self._ids_by_hash: Dict[str, int] = {}
+        self._hashes_by_source: Dict[str, Set[str]] = {}
+        self._reader = None # handles separados: buscas e appends não disputam posição
+        self._reader_lock = threading.Lock() # buscas simultâneas (threads) compartilham o _reader
+        self._writer = None
+        self._records_size = 0
+        self._write_lock = asyncio.Lock() # serializa as escritas entre si (event loop)
+        # Grafo hnswlib, memmap e sidecar: buscas (leitura) nunca rodam durante load/append/remoção/snapshot
+        self._rw = _ReadWriteLock()
+        self._dirty = False
+
+    # --- Caminhos ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def live_count(self) -> int:
+        return len(self._ids_by_hash)
+
+    def is_ready(self) -> bool:
+        return self._index is not None and self.live_count > 0
+
+    # --- Load / snapshot ---
+    def load(self) -> None:
+        """Carrega (ou cria) o índice do diretório, reinserindo itens gravados após o último snapshot."""
+        import hnswlib
+
+        os.makedirs(self.directory, exist_ok=True)
+        manifest_path = self._path("manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["dim"] != self.dim or manifest["dtype"] != self.dtype.name:
+                raise ValueError(
+                    f"Índice local em '{self.directory}' tem dim={manifest['dim']}/dtype={manifest['dtype']}, "
+                    f"configuração atual dim={self.dim}/dtype={self.dtype.name}."
+                )
+        else:
+            self._write_manifest()
+
+        # Sidecar: reconstrói offsets e mapas de hash/fonte (streaming, sem carregar o conteúdo)
+        self._offsets, self._ids_by_hash, self._hashes_by_source = [], {}, {}
+        records_path = self._path("records.jsonl")
+        if os.path.exists(records_path):
+            with open(records_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break # linha incompleta (queda durante um append): descartada abaixo
+                    record_id = record["id"]
+                    if record.get("deleted"):
+                        if record_id < len(self._offsets):
+                            self._forget(record_id, record.get("content_hash"), record.get("source"))
+                    elif record_id == len(self._offsets):
+                        self._offsets.append(offset)
+                        self._remember(record_id, record["content_hash"], record["metadata"].get("source", ""))
+                    offset += len(line)
+            if offset < os.path.getsize(records_path):
+                os.truncate(records_path, offset)
+
+        # Vetores: só conta linhas completas que também têm registro no sidecar
+        vectors_path = self._path("vectors.bin")
+        row_bytes = self.dim * self.dtype.itemsize
+        rows_on_disk = os.path.getsize(vectors_path) // row_bytes if os.path.exists(vectors_path) else 0
+        self._count = min(rows_on_disk, len(self._offsets))
+        if len(self._offsets) > self._count:
+            # Registros sem vetor (queda entre os dois appends) são descartados para que os ids sejam reutilizados
+            os.truncate(records_path, self._offsets[self._count])
+            del self._offsets[self._count:]
+            for content_hash, record_id in list(self._ids_by_hash.items()):
+                if record_id >= self._count:
+                    self._ids_by_hash.pop(content_hash)
+                    for hashes in self._hashes_by_source.values():
+                        hashes.discard(content_hash)
+        self._reopen_vectors()
+
+        index = hnswlib.Index(space="cosine", dim=self.dim)
+        index_path = self._path("index.hnsw")
+        capacity = max(1024, self._count * 2)
+        if os.path.exists(index_path):
+            index.load_index(index_path, max_elements=capacity, allow_replace_deleted=False)
+        else:
+            index.init_index(max_elements=capacity, ef_construction=VECTOR_HNSW_EF_CONSTRUCTION, M=VECTOR_HNSW_M)
+        indexed = index.get_current_count()
+        if indexed < self._count:
+            logger.info(f"[vector_store] Reinserindo {self._count - indexed} vetores gravados após o último snapshot.")
+            index.add_items(np.asarray(self._vectors[indexed:self._count], dtype=np.float32), np.arange(indexed, self._count))
+            self._dirty = True
+        for record_id, offset in enumerate(self._offsets):
+            if offset < 0:
+                try:
+                    index.mark_deleted(record_id)
+                except RuntimeError:
+                    pass # já marcado no snapshot
+        index.set_ef(VECTOR_HNSW_EF_SEARCH)
+        self._index = index
+        self._writer = open(records_path, "ab")
+        self._reader = open(records_path, "rb")
+        self._records_size = os.path.getsize(records_path)
+        logger.info(f"[vector_store] Índice local carregado de '{self.directory}': {self.live_count} itens ativos.")
+
+    def _write_manifest(self) -> None:
+        manifest = {"dim": self.dim, "dtype": self.dtype.name, "space": "cosine", "M": VECTOR_HNSW_M, "ef_construction": VECTOR_HNSW_EF_CONSTRUCTION}
+        tmp_path = self._path("manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path("manifest.json"))
+
+    def _reopen_vectors(self) -> None:
+        if self._count == 0:
+            self._vectors = np.empty((0, self.dim), dtype=self.dtype)
+        else:
+            self._vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+
+    def snapshot(self) -> None:
+        """Persiste o grafo HNSW (escrita atômica) e o manifesto."""
+        if self._index is None or not self._dirty:
+            return
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        tmp_path = self._path("index.hnsw.tmp")
+        self._index.save_index(tmp_path)
+        os.replace(tmp_path, self._path("index.hnsw"))
+        self._write_manifest()
+        self._dirty = False
+        logger.info(f"[vector_store] Snapshot do índice local salvo ({self.live_count} itens ativos).")
+
+    def close(self) -> None:
+        self.snapshot()
+        for handle in (self._writer, self._reader):
+            if handle is not None:
+                handle.close()
+        self._writer = self._reader = None
+        self._index = None
+        self._vectors = None
+
+    # --- Estado em memória ---
+    def _remember(self, record_id: int, content_hash: str, source: str) -> None:
+        self._ids_by_hash[content_hash] = record_id
+        self._hashes_by_source.setdefault(source, set()).add(content_hash)
+
+    def _forget(self, record_id: int, content_hash: Optional[str], source: Optional[str]) -> None:
+        self._offsets[record_id] = -1
+        if content_hash:
+            self._ids_by_hash.pop(content_hash, None)
+            self._hashes_by_source.get(source or "", set()).discard(content_hash)
+
+    def _read_record(self, record_id: int, handle=None) -> Optional[Dict[str, Any]]:
+        offset = self._offsets[record_id]
+        if offset < 0:
+            return None
+        if handle is not None:
+            handle.seek(offset)
+            return json.loads(handle.readline())
+        with self._reader_lock:
+            self._reader.seek(offset)
+            line = self._reader.readline()
+        return json.loads(line)
+
+    def _exclusive(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._rw.write():
+            return fn(*args)
+
+    def _shared(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._rw.read():
+            return fn(*args)
+
+    # --- Escrita (appends incrementais) ---
+    def append(self, chunks: List[Chunk], embeddings: np.ndarray) -> int:
+        if self._index is None:
+            self.load()
+        fresh = [(c, v) for c, v in zip(chunks, embeddings) if c.content_hash not in self._ids_by_hash]
+        if not fresh:
+            return 0
+        vectors = np.asarray([v for _, v in fresh], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        ids = np.arange(self._count, self._count + len(fresh))
+        created_at = time.time()
+
+        # Ordem: sidecar -> vetores -> memmap -> grafo. O load nunca vê vetor sem registro e
+        # uma busca concorrente nunca recebe do grafo um id ainda fora do memmap.
+        for record_id, (chunk, _) in zip(ids, fresh):
+            line = json.dumps({
+                "id": int(record_id), "content": chunk.content, "metadata": chunk.metadata, "content_hash": chunk.content_hash,
+                "created_at": created_at, # filtro por período (SearchFilter.created_after/before)
+            }, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._writer.write(line)
+            self._offsets.append(self._records_size)
+            self._records_size += len(line)
+        self._writer.flush()
+        with open(self._path("vectors.bin"), "ab") as f:
+            f.write(vectors.astype(self.dtype).tobytes())
+        new_count = self._count + len(fresh)
+        self._vectors = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r", shape=(new_count, self.dim))
+
+        if self._index.get_max_elements() < new_count:
+            self._index.resize_index(max(self._index.get_max_elements() * 2, new_count))
+        self._index.add_items(vectors, ids)
+        for record_id, (chunk, _) in zip(ids, fresh):
+            self._remember(int(record_id), chunk.content_hash, chunk.metadata.get("source", ""))
+        self._count = new_count
+        self._dirty = True
+        return len(fresh)
+
+    def delete_hashes(self, hashes: Set[str]) -> int:
+        removed = 0
+        with open(self._path("records.jsonl"), "rb") as handle: # handle próprio: não mexe na posição do _reader das buscas
+            for content_hash in hashes:
+                record_id = self._ids_by_hash.get(content_hash)
+                if record_id is None:
+                    continue
+                record = self._read_record(record_id, handle)
+                source = (record or {}).get("metadata", {}).get("source", "")
+                line = json.dumps({"id": record_id, "deleted": True, "content_hash": content_hash, "source": source}).encode("utf-8") + b"\n"
+                self._writer.write(line)
+                self._records_size += len(line)
+                self._index.mark_deleted(record_id)
+                self._forget(record_id, content_hash, source)
+                removed += 1
+        if removed:
+            self._writer.flush()
+            self._dirty = True
+        return removed
+
+    # --- VectorSink (ingestão) ---
+    async def existing_hashes(self, hashes: List[str]) -> Set[str]:
+        return {h for h in hashes if h in self._ids_by_hash}
+
+    async def write(self, chunks: List[Chunk], embeddings: np.ndarray) -> int:
+        async with self._write_lock:
+            return await asyncio.to_thread(self._exclusive, self.append, chunks, embeddings)
+
+    async def prune(self, source: str, keep_hashes: Set[str]) -> int:
+        async with self._write_lock:
+            stale = self._hashes_by_source.get(source, set()) - keep_hashes
+            return await asyncio.to_thread(self._exclusive, self.delete_hashes, set(stale))
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            await asyncio.to_thread(self._exclusive, self.snapshot)
+
+    # --- Busca ---
+    async def search(self, embedding: np.ndarray, k: int, filter_metadata: Optional[Dict[str, Any]] = None, with_embeddings: bool = False) -> List[SearchResult]:
+        restrictive = any(key != OWNER_KEY for key in (filter_metadata or {})) # o dono sozinho não restringe os compartilhados
+        accept = lambda record: _metadata_matches(record["metadata"], filter_metadata)
+        return await asyncio.to_thread(self._shared, self._search_matching, embedding, k, accept, restrictive, with_embeddings)
+
+    async def search_filtered(self, embedding: np.ndarray, k: int, search_filter: SearchFilter, with_embeddings: bool = False) -> List[SearchResult]:
+        accept = lambda record: search_filter.matches(record["metadata"], record.get("created_at"))
+        return await asyncio.to_thread(self._shared, self._search_matching, embedding, k, accept, search_filter.is_restrictive(), with_embeddings)
+
+    def _search_matching(
+        self, embedding: np.ndarray, k: int, accept: Callable[[Dict[str, Any]], bool], restrictive: bool, with_embeddings: bool,
+    ) -> List[SearchResult]:
+        """
+        Top-k dos registros aceitos por `accept`. Busca k (ou k * VECTOR_FILTER_OVERFETCH com filtro
+        restritivo) vizinhos e dobra a busca enquanto o filtro deixar menos de k, até cobrir o índice
+        ou completar VECTOR_FILTER_MAX_ROUNDS buscas.
+        """
+        if not self.is_ready():
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        fetch = min(self.live_count, k * (VECTOR_FILTER_OVERFETCH if restrictive else 1))
+        rounds = 0
+        while True:
+            rounds += 1
+            labels, _ = self._index.knn_query(query, k=fetch)
+            labels = labels[0].astype(np.int64)
+            # Rescoring exato com a matriz em memory-map
+            similarities = np.asarray(self._vectors[labels], dtype=np.float32) @ query
+            results: List[SearchResult] = []
+            below_threshold = False
+            for position in np.argsort(-similarities):
+                similarity = float(similarities[position])
+                if similarity <= RAG_MATCH_THRESHOLD:
+                    below_threshold = True # vizinhos mais distantes também ficariam abaixo do limiar
+                    break
+                record = self._read_record(int(labels[position]))
+                if record is None or not accept(record):
+                    continue
+                vector = np.asarray(self._vectors[labels[position]], dtype=np.float32) if with_embeddings else None
+                results.append(SearchResult(id=record["id"], content=record["content"], similarity=similarity, metadata=record["metadata"], embedding=vector))
+                if len(results) >= k:
+                    break
+            if len(results) >= k or below_threshold or fetch >= self.live_count:
+                return results
+            if rounds >= max(1, VECTOR_FILTER_MAX_ROUNDS):
+                logger.debug(f"[vector_store] Filtro deixou {len(results)}/{k} resultados após {rounds} buscas ({fetch} vizinhos).")
+                return results
+            fetch = min(self.live_count, fetch * 2)
+
+    async def startup(self) -> None:
+        await asyncio.to_thread(self._exclusive, self.load)
+
+    async def shutdown(self) -> None:
+        async with self._write_lock:
+            await asyncio.to_thread(self._exclusive, self.close)
+
+
+_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """Retorna o backend vetorial configurado em VECTOR_BACKEND (singleton do processo)."""
+    global _store
+    if _store is None:
+        if VECTOR_BACKEND == "local":
+            # Dimensão resolvida pelo motor: EMBEDDING_DIM=0 (padrão do backend local) é a dimensão nativa do modelo
+            from app.services.embedding_service import get_embedding_engine
+            _store = LocalVectorStore(VECTOR_LOCAL_DIR, get_embedding_engine().dim)
+        elif VECTOR_BACKEND == "pgvector":
+            _store = PgVectorStore()
+        else:
+            raise ValueError(f"VECTOR_BACKEND desconhecido: '{VECTOR_BACKEND}' (use 'pgvector' ou 'local').")
+    return _store
+
+
+def set_vector_store(store: Optional[VectorStore]) -> None:
+    """Substitui o backend global (útil em testes e benchmarks)."""
+    global _store
+    _store = store
+
+
+async def startup() -> None:
+    """Carrega o snapshot do backend local no startup (chamado pelo lifespan)."""
+    try:
+        await get_vector_store().startup()
+    except Exception as e:
+        logger.error(f"[vector_store] Falha ao carregar o backend vetorial '{VECTOR_BACKEND}': {e}", exc_info=True)
+
+
+async def shutdown() -> None:
+    if _store is not None:
+        await _store.shutdown()
@@ -0,0 +1,19 @@
+# backend/app/specs/example_spec.py
+"""
+Especificações Pydantic usadas por /generate-structured.
+Cada subclasse de BaseModel definida aqui vira uma spec com o nome da classe (ex: "UserProfileSpec").
+O primeiro item de `examples` é usado como saída no modo placeholder.
+"""
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class UserProfileSpec(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={"examples": [{"name": "Placeholder User", "age": 30, "interests": ["AI", "Cloud"]}]}
+    )
+
+    name: str = Field(..., description="Nome completo do usuário")
+    age: int = Field(..., ge=0, le=130, description="Idade em anos")
+    interests: List[str] = Field(..., description="Interesses mencionados no texto")
@@ -0,0 +1,127 @@
+# backend/app/startup_profile.py
+"""
+Perfil de tempo de import do startup.
+
+    python -m app.startup_profile [--module app.main] [--top 25] [--preload] [--json]
+
+Roda `python -X importtime -c "import <módulo>"` em um processo limpo (sem cache de módulos do
+processo atual) e reporta, por módulo, o tempo próprio e o cumulativo, além do total por pacote
+de topo (openai, numpy, supabase...). Com --preload, mede também, no mesmo processo limpo, quanto
+cada módulo de APP_PRELOAD_MODULES custa no warmup do lifespan depois de `app.main` importado.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PRELOAD_SNIPPET = """
+import json, time, importlib
+started = time.perf_counter()
+import app.main as main
+timings = {"app.main": (time.perf_counter() - started) * 1000}
+for name in main.APP_PRELOAD_MODULES:
+    started = time.perf_counter()
+    importlib.import_module(name)
+    timings[name] = (time.perf_counter() - started) * 1000
+print(json.dumps(timings))
+"""
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """Converte a saída de `-X importtime` ("import time: self | cumulative | módulo") em registros."""
+    timings: List[ImportTiming] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            stripped = name.lstrip()
+            depth = (len(name) - len(stripped) - 1) // 2
+            timings.append(ImportTiming(stripped.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, depth))
+        except ValueError:
+            continue
+    return timings
+
+
+def by_package(timings: List[ImportTiming]) -> List[Tuple[str, float]]:
+    """Soma o tempo próprio por pacote de topo (o cumulativo contaria o mesmo import várias vezes)."""
+    totals: Dict[str, float] = {}
+    for timing in timings:
+        package = timing.module.split(".", 1)[0]
+        totals[package] = totals.get(package, 0.0) + timing.self_ms
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+
+
+def profile_imports(module: str) -> List[ImportTiming]:
+    result = _run(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar '{module}':\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def profile_preload() -> Dict[str, float]:
+    result = _run(["-c", _PRELOAD_SNIPPET])
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha no warmup:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tempo de import por módulo no startup da API.")
+    parser.add_argument("--module", default="app.main", help="Módulo a importar (padrão: app.main)")
+    parser.add_argument("--top", type=int, default=25, help="Quantos módulos/pacotes listar")
+    parser.add_argument("--preload", action="store_true", help="Mede também o warmup de APP_PRELOAD_MODULES")
+    parser.add_argument("--json", action="store_true", help="Saída em JSON")
+    args = parser.parse_args(argv)
+
+    timings = profile_imports(args.module)
+    root = next((t for t in timings if t.module == args.module), None)
+    slowest = sorted(timings, key=lambda t: t.cumulative_ms, reverse=True)[: args.top]
+    packages = by_package(timings)[: args.top]
+    preload = profile_preload() if args.preload else None
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "total_ms": root.cumulative_ms if root else None,
+            "modules": [asdict(t) for t in slowest],
+            "packages": dict(packages),
+            "preload_ms": preload,
+        }, indent=2))
+        return 0
+
+    total = f"{root.cumulative_ms:.0f} ms" if root else "?"
+    print(f"import {args.module}: {total} ({len(timings)} módulos importados)\n")
+    print(f"{'cumulativo':>11} {'próprio':>9}  módulo")
+    for timing in slowest:
+        print(f"{timing.cumulative_ms:9.1f}ms {timing.self_ms:7.1f}ms  {'  ' * timing.depth}{timing.module}")
+    print(f"\n{'próprio':>9}  pacote")
+    for package, self_ms in packages:
+        print(f"{self_ms:7.1f}ms  {package}")
+    if preload is not None:
+        print("\nWarmup (APP_PRELOAD_MODULES, após app.main):")
+        for name, ms in preload.items():
+            print(f"{ms:9.1f}ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
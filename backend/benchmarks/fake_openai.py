@@ -0,0 +1,194 @@
+# backend/benchmarks/fake_openai.py
+"""
+Servidor local compatível com a API da OpenAI, usado pelos benchmarks no lugar do provedor real.
+
+Implementa POST /v1/chat/completions (com e sem stream, incluindo stream_options.include_usage) e
+POST /v1/embeddings. Não faz nenhuma chamada externa: as respostas são geradas a partir do próprio
+pedido (objetos que seguem o JSON Schema do prompt do guardrails, análises de feedback, respostas
+de texto) e a latência segue distribuições configuráveis (ver `LatencyModel.parse`).
+"""
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class LatencyModel:
+    """
+    Distribuição de latência em segundos. Formatos aceitos por `parse`:
+    "0.05" ou "fixed:0.05", "uniform:0.02,0.1", "normal:0.05,0.01" (média, desvio)
+    e "lognormal:0.05,0.5" (mediana, sigma). Valores negativos sorteados viram 0.
+    """
+    kind: str = "fixed"
+    params: List[float] = field(default_factory=lambda: [0.0])
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, raw = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        params = [float(value) for value in raw.split(",") if value.strip()]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Latência inválida '{spec}': use fixed:S, uniform:MIN,MAX, normal:MEDIA,DESVIO ou lognormal:MEDIANA,SIGMA.")
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = median * rng.lognormvariate(0.0, sigma)
+        else:
+            value = self.params[0]
+        return max(0.0, value)
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(str(value) for value in self.params)}"
+
+
+@dataclass
+class FakeOpenAIConfig:
+    first_token_latency: LatencyModel = field(default_factory=lambda: LatencyModel.parse("lognormal:0.05,0.3"))
+    token_latency: LatencyModel = field(default_factory=lambda: LatencyModel.parse("fixed:0.002"))
+    embedding_latency: LatencyModel = field(default_factory=lambda: LatencyModel.parse("lognormal:0.02,0.3"))
+    completion_words: int = 40 # Tamanho das respostas de texto livre
+    chars_per_chunk: int = 4 # ~1 token por chunk no stream
+    seed: int = 1234
+
+
+def _schema_value(schema: Dict[str, Any], defs: Dict[str, Any], name: str = "") -> Any:
+    """Valor de exemplo válido para um JSON Schema (tipos básicos, limites numéricos, enum e $ref)."""
+    if "$ref" in schema:
+        return _schema_value(defs.get(schema["$ref"].split("/")[-1], {}), defs, name)
+    if "anyOf" in schema:
+        return _schema_value(next((s for s in schema["anyOf"] if s.get("type") != "null"), {}), defs, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _schema_value(value, defs, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_schema_value(schema.get("items", {}), defs, name) for _ in range(max(2, schema.get("minItems", 0)))]
+    if kind in ("integer", "number"):
+        low = schema.get("minimum", schema.get("exclusiveMinimum", 0))
+        high = schema.get("maximum", low + 100)
+        value = low + (high - low) / 4
+        return int(value) if kind == "integer" else value
+    if kind == "boolean":
+        return True
+    return f"valor de {name or 'exemplo'}"
+
+
+def build_reply(body: Dict[str, Any], config: FakeOpenAIConfig) -> str:
+    """Conteúdo da resposta conforme o tipo de pedido feito pelos serviços da aplicação."""
+    messages = body.get("messages") or []
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if "JSON Schema:" in system: # guardrails_service
+        schema = json.loads(system.split("JSON Schema:", 1)[1])
+        return json.dumps(_schema_value(schema, schema.get("$defs", {})), ensure_ascii=False)
+    if '"results"' in user: # pack de feedbacks
+        items = json.loads(user.split("---", 2)[1])
+        results = [{"id": item["id"], "sentiment": "Neutro", "summary": "Resumo simulado.", "topics": ["produto", "suporte"]} for item in items]
+        return json.dumps({"results": results}, ensure_ascii=False)
+    if '"sentiment"' in user: # feedback individual
+        return json.dumps({"sentiment": "Positivo", "summary": "Resumo simulado.", "topics": ["produto", "suporte"]}, ensure_ascii=False)
+    return " ".join(f"palavra{i}" for i in range(config.completion_words))
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _usage(prompt_text: str, completion: str) -> Dict[str, int]:
+    prompt_tokens, completion_tokens = _count_tokens(prompt_text), _count_tokens(completion)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _fake_embedding(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(config: Optional[FakeOpenAIConfig] = None) -> FastAPI:
+    config = config or FakeOpenAIConfig()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="OpenAI local (benchmarks)")
+    app.state.config = config
+    app.state.requests = {"chat": 0, "chat_stream": 0, "embeddings": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        content = build_reply(body, config)
+        prompt_text = "".join(str(m.get("content") or "") for m in body.get("messages") or [])
+        model = body.get("model", "fake")
+        created = int(time.time())
+        completion_id = f"chatcmpl-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]}"
+        await asyncio.sleep(config.first_token_latency.sample(rng))
+
+        if not body.get("stream"):
+            app.state.requests["chat"] += 1
+            await asyncio.sleep(sum(config.token_latency.sample(rng) for _ in range(_count_tokens(content))))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": _usage(prompt_text, content),
+            })
+
+        app.state.requests["chat_stream"] += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def event(choices: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None) -> str:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+            if usage is not None:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        def pieces() -> Iterator[str]:
+            for start in range(0, len(content), config.chars_per_chunk):
+                yield content[start:start + config.chars_per_chunk]
+
+        async def stream():
+            yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for piece in pieces():
+                yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                await asyncio.sleep(config.token_latency.sample(rng))
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield event([], _usage(prompt_text, content))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.requests["embeddings"] += 1
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dim = int(body.get("dimensions") or 1536)
+        await asyncio.sleep(config.embedding_latency.sample(rng))
+        data = []
+        for index, text in enumerate(inputs):
+            vector = _fake_embedding(str(text), dim)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(_count_tokens(str(text)) for text in inputs)
+        return JSONResponse({
+            "object": "list", "data": data, "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    return app
@@ -0,0 +1,235 @@
+# backend/benchmarks/quantization.py
+"""
+Compara recall@k, latência e memória da busca vetorial completa (float32) com a busca em duas etapas
+quantizada (halfvec = float16, binary = 1 bit por dimensão, seguida de rescoring exato).
+
+Dois modos:
+- offline (padrão): vetores sintéticos agrupados (--synthetic) ou os de um índice local (--local-index,
+  ver VECTOR_BACKEND=local). Os candidatos são obtidos por força bruta em NumPy na representação
+  quantizada: mede a perda da quantização em si, sem a aproximação do HNSW. Memória = bytes dos vetores.
+- --postgres: public.documents no banco de SUPABASE_DB_CONNECTION_STRING (após a migration
+  add_documents_quantized_search). Executa o mesmo PgVectorStore do RAG em cada modo e compara com a
+  varredura exata (índices desligados). Memória = pg_relation_size de cada índice vetorial.
+
+As perguntas são vetores do corpus com ruído gaussiano (--noise), renormalizados.
+
+Uso (a partir de backend/):
+    python -m benchmarks.quantization                                   # sintético, 20k x 1536
+    python -m benchmarks.quantization --local-index data/vector_index --k 5 --factors 1,4,10,40
+    python -m benchmarks.quantization --postgres --queries 100 --json quantization.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional, Sequence
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+MODES = ("float32", "halfvec", "binary")
+BYTES_PER_DIMENSION = {"float32": 4.0, "halfvec": 2.0, "binary": 1 / 8}
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 64, seed: int = 1234) -> np.ndarray:
+    """Vetores unitários agrupados em torno de `clusters` centros (mais parecido com embeddings do que ruído puro)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    return normalize(centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32))
+
+
+def sample_queries(corpus: np.ndarray, count: int, noise: float, seed: int = 1234) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = corpus[rng.integers(0, len(corpus), count)]
+    return normalize(picked + noise * rng.standard_normal(picked.shape, dtype=np.float32) / np.sqrt(corpus.shape[1]))
+
+
+def binary_quantize(matrix: np.ndarray) -> np.ndarray:
+    """1 bit por dimensão (> 0), empacotado em bytes: o mesmo que binary_quantize() do pgvector."""
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+def hamming_distances(packed_query: np.ndarray, packed_matrix: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[np.bitwise_xor(packed_matrix, packed_query)].sum(axis=1, dtype=np.int32)
+
+
+def _top(scores: np.ndarray, count: int) -> np.ndarray:
+    """Índices dos `count` maiores scores, em ordem decrescente."""
+    count = min(count, len(scores))
+    candidates = np.argpartition(-scores, count - 1)[:count]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class QuantizedIndex:
+    """Representações de um corpus normalizado para busca exata e em duas etapas (força bruta)."""
+
+    def __init__(self, corpus: np.ndarray):
+        self.full = normalize(corpus)
+        self.half = self.full.astype(np.float16).astype(np.float32) # perda de precisão do halfvec
+        self.bits = binary_quantize(self.full)
+
+    def exact(self, query: np.ndarray, k: int) -> np.ndarray:
+        return _top(self.full @ query, k)
+
+    def two_stage(self, query: np.ndarray, k: int, candidates: int, mode: str) -> np.ndarray:
+        if mode == "float32":
+            return self.exact(query, k)
+        if mode == "halfvec":
+            pool = _top(self.half @ query.astype(np.float16).astype(np.float32), max(candidates, k))
+        elif mode == "binary":
+            pool = _top(-hamming_distances(binary_quantize(query), self.bits).astype(np.float32), max(candidates, k))
+        else:
+            raise ValueError(f"Modo desconhecido: '{mode}' (use {', '.join(MODES)}).")
+        return pool[_top(self.full[pool] @ query, k)] # rescoring exato com os vetores completos
+
+
+def recall_at_k(truth: Sequence[int], found: Sequence[int]) -> float:
+    return len(set(truth) & set(found)) / len(truth) if len(truth) else 1.0
+
+
+def _percentile(values: List[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def offline_report(corpus: np.ndarray, queries: np.ndarray, k: int, factors: Sequence[int]) -> List[Dict[str, Any]]:
+    index = QuantizedIndex(corpus)
+    truths = [index.exact(query, k) for query in queries]
+    n, dim = index.full.shape
+    rows = []
+    for mode in MODES:
+        for factor in (factors if mode != "float32" else [1]):
+            latencies, recalls = [], []
+            for query, truth in zip(queries, truths):
+                started = time.perf_counter()
+                found = index.two_stage(query, k, k * factor, mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                recalls.append(recall_at_k(truth, found))
+            rows.append({
+                "mode": mode, "candidates": k * factor if mode != "float32" else k, "recall": float(np.mean(recalls)),
+                "p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95),
+                "bytes": int(n * dim * BYTES_PER_DIMENSION[mode]),
+            })
+    return rows
+
+
+def load_local_index(directory: str) -> np.ndarray:
+    """Vetores de um índice local (manifest.json + vectors.bin, incluindo removidos) sem abrir o hnswlib."""
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    dim = int(manifest["dim"])
+    vectors = np.memmap(os.path.join(directory, "vectors.bin"), dtype=np.dtype(manifest["dtype"]), mode="r")
+    count = len(vectors) // dim
+    return np.asarray(vectors[: count * dim].reshape(count, dim), dtype=np.float32)
+
+
+async def postgres_report(k: int, factors: Sequence[int], queries_count: int, noise: float, seed: int) -> List[Dict[str, Any]]:
+    from app import clients
+    from app.services.ingestion_service import vector_literal
+    from app.services.vector_store import PgVectorStore, _parse_vector
+
+    pool = await clients.init_db_pool()
+    if pool is None:
+        raise SystemExit("SUPABASE_DB_CONNECTION_STRING ausente ou banco inacessível.")
+    try:
+        rows = await pool.fetch("SELECT embedding::text AS embedding FROM public.documents ORDER BY random() LIMIT $1", queries_count)
+        queries = sample_queries(np.stack([_parse_vector(row["embedding"]) for row in rows]), len(rows), noise, seed)
+        truths = []
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Verdade de referência: varredura sequencial exata (sem HNSW)
+                await conn.execute("SET LOCAL enable_indexscan = off")
+                await conn.execute("SET LOCAL enable_bitmapscan = off")
+                for query in queries:
+                    found = await conn.fetch(
+                        "SELECT id FROM public.documents ORDER BY embedding <=> $1::vector LIMIT $2", vector_literal(query), k
+                    )
+                    truths.append([row["id"] for row in found])
+        sizes = {
+            row["name"]: int(row["size"])
+            for row in await pool.fetch(
+                "SELECT indexrelid::regclass::text AS name, pg_relation_size(indexrelid) AS size"
+                " FROM pg_index WHERE indrelid = 'public.documents'::regclass"
+            )
+        }
+        index_for_mode = {
+            "float32": "documents_embedding_hnsw_idx",
+            "halfvec": "documents_embedding_halfvec_hnsw_idx",
+            "binary": "documents_embedding_binary_hnsw_idx",
+        }
+        report = []
+        for mode in MODES:
+            for factor in (factors if mode != "float32" else [1]):
+                store = PgVectorStore(quantization="none" if mode == "float32" else mode, candidate_factor=factor)
+                latencies, recalls = [], []
+                for query, truth in zip(queries, truths):
+                    started = time.perf_counter()
+                    found = await store.search(query, k)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    recalls.append(recall_at_k(truth, [result.id for result in found]))
+                report.append({
+                    "mode": mode, "candidates": store.candidate_count(k) if mode != "float32" else k,
+                    "recall": float(np.mean(recalls)), "p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95),
+                    "bytes": sizes.get(f"public.{index_for_mode[mode]}", sizes.get(index_for_mode[mode], 0)),
+                })
+        return report
+    finally:
+        await clients.shutdown()
+
+
+def format_report(rows: List[Dict[str, Any]], k: int, memory_label: str) -> str:
+    baseline = next((row["bytes"] for row in rows if row["mode"] == "float32"), 0) or 1
+    lines = [f"{'modo':<8} {'candidatos':>10} {f'recall@{k}':>10} {'p50 ms':>9} {'p95 ms':>9} {memory_label:>14} {'vs float32':>10}"]
+    for row in rows:
+        lines.append(
+            f"{row['mode']:<8} {row['candidates']:>10} {row['recall']:>10.4f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}"
+            f" {row['bytes'] / 2**20:>11.1f} MB {row['bytes'] / baseline:>9.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Recall@k, latência e memória: float32 x halfvec x binary (duas etapas).")
+    parser.add_argument("--postgres", action="store_true", help="Mede public.documents no banco configurado.")
+    parser.add_argument("--local-index", default="", help="Diretório de um índice local (VECTOR_LOCAL_DIR).")
+    parser.add_argument("--synthetic", type=int, default=20000, help="Tamanho do corpus sintético (modo offline).")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--factors", default="1,4,10,40", help="Candidatos = k * fator, separados por vírgula.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="Desvio do ruído somado aos vetores usados como pergunta.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_output", default="", help="Arquivo para gravar os resultados em JSON.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    factors = [int(f) for f in args.factors.split(",") if f.strip()]
+    if args.postgres:
+        rows = asyncio.run(postgres_report(args.k, factors, args.queries, args.noise, args.seed))
+        print(format_report(rows, args.k, "índice"))
+    else:
+        corpus = load_local_index(args.local_index) if args.local_index else synthetic_corpus(args.synthetic, args.dim, seed=args.seed)
+        rows = offline_report(corpus, sample_queries(corpus, args.queries, args.noise, args.seed), args.k, factors)
+        print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} (força bruta NumPy; mede a perda da quantização, não o HNSW)")
+        print(format_report(rows, args.k, "vetores"))
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "postgres": args.postgres, "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
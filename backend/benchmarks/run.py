@@ -0,0 +1,434 @@
+# backend/benchmarks/run.py
+"""
+Benchmark de carga das rotas /api/v1, totalmente offline.
+
+O provedor OpenAI é substituído pelo servidor local de benchmarks/fake_openai.py (uvicorn em 127.0.0.1,
+porta efêmera) e a autenticação é sobrescrita como nos testes. A aplicação é exercitada em processo
+via httpx.ASGITransport, com concorrência configurável. O RAG usa um índice vetorial local temporário,
+populado no início com um corpus sintético.
+
+Para cada cenário são reportados p50/p95/p99 de latência, requisições por segundo e a memória alocada
+por requisição (pico medido com tracemalloc numa passada sequencial separada, para não distorcer a
+latência). O resultado é comparado com benchmarks/baseline.json: regressões acima da tolerância fazem
+o processo terminar com código 1.
+
+Uso (a partir de backend/):
+    python -m benchmarks.run                      # roda e compara com a baseline
+    python -m benchmarks.run --scenarios rag_query,feedback_analyze --concurrency 32
+    python -m benchmarks.run --update-baseline    # grava os resultados como nova baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import platform
+import tempfile
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_openai import FakeOpenAIConfig, LatencyModel, create_app as create_fake_openai
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCES = {"latency": 0.25, "rps": 0.20, "alloc": 0.25}
+AUTH_HEADERS = {"Authorization": "Bearer BENCHMARK-TOKEN"}
+
+logger = logging.getLogger("benchmarks")
+
+# Cada requisição recebe um índice único: os textos não se repetem, então os caches
+# (resultados, embeddings, cache semântico) e a coalescência não mascaram o caminho completo.
+RequestFn = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: RequestFn
+    requests: int = 200 # Total de requisições na passada cronometrada
+    expected_status: Tuple[int, ...] = (200,)
+    setup: Optional[Callable[[httpx.AsyncClient], Awaitable[None]]] = None
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rps: float
+    alloc_kib_per_request: float
+    error_samples: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(self.p50_ms, 2),
+            "p95_ms": round(self.p95_ms, 2),
+            "p99_ms": round(self.p99_ms, 2),
+            "rps": round(self.rps, 1),
+            "alloc_kib_per_request": round(self.alloc_kib_per_request, 1),
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por interpolação linear (mesmo método padrão do numpy)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+# --- Cenários (um por rota /api/v1) ---
+FEEDBACK_TEXT = "O aplicativo travou duas vezes ao finalizar a compra, mas o suporte resolveu rápido. Pedido {i}."
+RAG_QUESTION = "Como funciona o processo número {i} descrito na documentação interna?"
+
+
+def _post(path: str, payload: Callable[[int], Any], **kwargs) -> RequestFn:
+    async def request(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        return await client.post(path, json=payload(i), headers=AUTH_HEADERS, **kwargs)
+    return request
+
+
+_crew_job: Dict[str, str] = {}
+
+
+async def _crew_setup(client: httpx.AsyncClient) -> None:
+    """Cria e aguarda um job de Crew concluído, consultado pelos cenários de status e logs."""
+    if "job_id" in _crew_job:
+        return
+    response = await client.post("/api/v1/run-crew", json={"topic": "Benchmark"}, headers=AUTH_HEADERS)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    for _ in range(200):
+        status = (await client.get(f"/api/v1/run-crew/{job_id}", headers=AUTH_HEADERS)).json()["status"]
+        if status in ("succeeded", "failed"):
+            break
+        await asyncio.sleep(0.05)
+    _crew_job["job_id"] = job_id
+
+
+def build_scenarios() -> Dict[str, Scenario]:
+    def crew_get(suffix: str) -> RequestFn:
+        async def request(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            return await client.get(f"/api/v1/run-crew/{_crew_job['job_id']}{suffix}", headers=AUTH_HEADERS)
+        return request
+
+    scenarios = [
+        Scenario("rag_query", _post("/api/v1/rag-query", lambda i: {"question": RAG_QUESTION.format(i=i)})),
+        Scenario("rag_query_stream", _post("/api/v1/rag-query/stream", lambda i: {"question": RAG_QUESTION.format(i=i) + " (stream)"})),
+        Scenario("feedback_analyze", _post("/api/v1/feedback/analyze", lambda i: {"text": FEEDBACK_TEXT.format(i=i)})),
+        Scenario("feedback_analyze_stream", _post("/api/v1/feedback/analyze/stream", lambda i: {"text": FEEDBACK_TEXT.format(i=i) + " (stream)"})),
+        Scenario(
+            "feedback_analyze_batch",
+            _post("/api/v1/feedback/analyze-batch", lambda i: [{"text": FEEDBACK_TEXT.format(i=f"{i}.{j}")} for j in range(10)]),
+            requests=50,
+        ),
+        Scenario(
+            "generate_structured",
+            _post("/api/v1/generate-structured", lambda i: {"prompt": f"Extraia o perfil: Ana, {20 + i % 50} anos, gosta de IA. #{i}", "spec_name": "UserProfileSpec"}),
+        ),
+        Scenario("run_crew_status", crew_get(""), setup=_crew_setup),
+        Scenario("run_crew_logs", crew_get("/logs"), setup=_crew_setup),
+        # A fila de jobs é limitada: a submissão pode responder 503 quando ela enche, o que também é medido.
+        # Fica por último porque os jobs submetidos continuam executando em segundo plano.
+        Scenario("run_crew_submit", _post("/api/v1/run-crew", lambda i: {"topic": f"Tópico {i}"}), requests=100, expected_status=(202, 503)),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+# --- Ambiente offline ---
+class FakeOpenAIServer:
+    """Sobe o servidor OpenAI falso no mesmo event loop, numa porta efêmera de 127.0.0.1."""
+
+    def __init__(self, config: FakeOpenAIConfig):
+        self.app = create_fake_openai(config)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> str:
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    async def __aexit__(self, *exc) -> None:
+        self.server.should_exit = True
+        await self._task
+
+
+async def _seed_vector_index(directory: str) -> None:
+    """Índice vetorial local com um corpus sintético (os embeddings vêm do servidor falso)."""
+    from app.services import ingestion_service, vector_store
+    from app.services.embedding_service import get_embedding_engine
+
+    corpus_dir = os.path.join(directory, "corpus")
+    os.makedirs(corpus_dir)
+    for doc in range(20):
+        with open(os.path.join(corpus_dir, f"documento_{doc}.md"), "w", encoding="utf-8") as f:
+            for section in range(10):
+                f.write(f"## Seção {section} do documento {doc}\n\n")
+                f.write(f"O processo {doc * 10 + section} descreve etapas, responsáveis e prazos da operação. " * 8 + "\n\n")
+    store = vector_store.LocalVectorStore(os.path.join(directory, "index"), get_embedding_engine().dim)
+    await store.startup()
+    vector_store.set_vector_store(store)
+    stats = await ingestion_service.index_paths([corpus_dir], sink=store)
+    logger.info(f"Índice local populado: {stats.as_dict()}")
+
+
+async def _override_user():
+    from datetime import datetime, timezone
+    from gotrue.types import User
+
+    now = datetime.now(timezone.utc)
+    return User(
+        id="benchmark-user", app_metadata={}, user_metadata={}, aud="authenticated",
+        email="bench@example.com", created_at=now, role="authenticated", identities=[],
+    )
+
+
+async def prepare_app(base_url: str, workdir: str):
+    """Importa a aplicação apontando o gateway, a fila de jobs e o RAG para recursos locais."""
+    from app.main import app
+    from app.dependencies import get_authenticated_user
+    from app import rate_limit
+    from app.services import guardrails_service, job_service, llm_gateway, semantic_cache
+
+    app.dependency_overrides[get_authenticated_user] = _override_user
+    llm_gateway.set_llm_gateway(llm_gateway.LLMGateway(base_url=base_url, api_key="benchmark"))
+    job_service.set_job_manager(job_service.JobManager(db_path=os.path.join(workdir, "crew_jobs.sqlite3")))
+    semantic_cache.set_semantic_cache(None)
+    rate_limit.RATE_LIMIT_ENABLED = False # Um único usuário sintético: mede a API, não os limites por usuário
+    guardrails_service.GUARDRAILS_GENERATION_MODE = "streaming" # Exercita o LLM em vez do placeholder
+    await _seed_vector_index(workdir)
+    return app
+
+
+# --- Execução ---
+async def _timed_pass(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, offset: int) -> Tuple[List[float], List[str], float]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    counter = iter(range(scenario.requests))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await scenario.request(client, offset + i)
+                ok = response.status_code in scenario.expected_status
+                detail = f"HTTP {response.status_code}: {response.text[:120]}"
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors.append(detail)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def _allocation_pass(client: httpx.AsyncClient, scenario: Scenario, samples: int, offset: int) -> float:
+    """Média do pico de memória alocada (KiB) por requisição, uma requisição por vez."""
+    if samples <= 0:
+        return 0.0
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        for i in range(samples):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await scenario.request(client, offset + i)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks) / 1024
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, warmup: int, alloc_samples: int, requests: Optional[int]) -> ScenarioResult:
+    if requests:
+        scenario.requests = requests
+    if scenario.setup is not None:
+        await scenario.setup(client)
+    offset = random.randrange(1_000_000) * 1000 # Textos inéditos a cada execução do benchmark
+    for i in range(warmup):
+        await scenario.request(client, offset + scenario.requests + alloc_samples + i)
+    latencies, errors, elapsed = await _timed_pass(client, scenario, concurrency, offset)
+    alloc = await _allocation_pass(client, scenario, alloc_samples, offset + scenario.requests)
+    return ScenarioResult(
+        name=scenario.name,
+        requests=len(latencies),
+        errors=len(errors),
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        rps=len(latencies) / elapsed if elapsed else 0.0,
+        alloc_kib_per_request=alloc,
+        error_samples=errors[:3],
+    )
+
+
+# --- Baseline ---
+def compare(results: Dict[str, ScenarioResult], baseline: Dict[str, Any], tolerances: Dict[str, float]) -> List[str]:
+    """Lista as regressões de `results` em relação à baseline."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            continue
+        current = result.as_dict()
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = reference[metric] * (1 + tolerances["latency"])
+            if current[metric] > limit:
+                regressions.append(f"{name}: {metric} {current[metric]:.1f} > {limit:.1f} (baseline {reference[metric]:.1f})")
+        limit = reference["rps"] * (1 - tolerances["rps"])
+        if current["rps"] < limit:
+            regressions.append(f"{name}: rps {current['rps']:.1f} < {limit:.1f} (baseline {reference['rps']:.1f})")
+        limit = reference["alloc_kib_per_request"] * (1 + tolerances["alloc"])
+        if reference["alloc_kib_per_request"] and current["alloc_kib_per_request"] > limit:
+            regressions.append(
+                f"{name}: alloc_kib_per_request {current['alloc_kib_per_request']:.1f} > {limit:.1f} (baseline {reference['alloc_kib_per_request']:.1f})"
+            )
+        if result.errors:
+            regressions.append(f"{name}: {result.errors} requisições com erro (ex: {result.error_samples[0]})")
+    return regressions
+
+
+def _print_table(results: Dict[str, ScenarioResult], baseline: Dict[str, Any]) -> None:
+    header = f"{'cenário':<26}{'req':>6}{'erros':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'KiB/req':>10}{'Δp95':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        delta = f"{(result.p95_ms / reference['p95_ms'] - 1) * 100:+.0f}%" if reference and reference.get("p95_ms") else "-"
+        print(
+            f"{name:<26}{result.requests:>6}{result.errors:>7}{result.p50_ms:>10.1f}{result.p95_ms:>10.1f}"
+            f"{result.p99_ms:>10.1f}{result.rps:>10.1f}{result.alloc_kib_per_request:>10.1f}{delta:>9}"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de carga offline das rotas /api/v1.")
+    parser.add_argument("--scenarios", default="", help="Lista separada por vírgulas (padrão: todos).")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=0, help="Requisições por cenário (padrão: o de cada cenário).")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--alloc-samples", type=int, default=20)
+    parser.add_argument("--llm-first-token-latency", default="lognormal:0.05,0.3", help="Ver LatencyModel.parse.")
+    parser.add_argument("--llm-token-latency", default="fixed:0.002")
+    parser.add_argument("--embedding-latency", default="lognormal:0.02,0.3")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Grava os resultados como nova baseline.")
+    parser.add_argument("--json", dest="json_output", default="", help="Arquivo para gravar os resultados em JSON.")
+    return parser.parse_args(argv)
+
+
+def _run_config(args: argparse.Namespace) -> Dict[str, Any]:
+    """Parâmetros que precisam coincidir para a comparação com a baseline fazer sentido."""
+    return {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "llm_first_token_latency": str(LatencyModel.parse(args.llm_first_token_latency)),
+        "llm_token_latency": str(LatencyModel.parse(args.llm_token_latency)),
+        "embedding_latency": str(LatencyModel.parse(args.embedding_latency)),
+        "seed": args.seed,
+    }
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(logging.INFO)
+    random.seed(args.seed)
+    config = FakeOpenAIConfig(
+        first_token_latency=LatencyModel.parse(args.llm_first_token_latency),
+        token_latency=LatencyModel.parse(args.llm_token_latency),
+        embedding_latency=LatencyModel.parse(args.embedding_latency),
+        seed=args.seed,
+    )
+    scenarios = build_scenarios()
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()] or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        print(f"Cenários desconhecidos: {', '.join(unknown)}. Disponíveis: {', '.join(scenarios)}", file=sys.stderr)
+        return 2
+
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    run_config = _run_config(args)
+
+    results: Dict[str, ScenarioResult] = {}
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        async with FakeOpenAIServer(config) as base_url:
+            app = await prepare_app(base_url, workdir)
+            from app.services import job_service, llm_gateway
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+                for name in selected:
+                    logger.info(f"Cenário {name}...")
+                    results[name] = await run_scenario(client, scenarios[name], args.concurrency, args.warmup, args.alloc_samples, args.requests)
+            await job_service.shutdown()
+            await llm_gateway.shutdown()
+
+    _print_table(results, baseline)
+    output = {
+        "config": run_config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "scenarios": {name: result.as_dict() for name, result in results.items()},
+    }
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+
+    if args.update_baseline:
+        merged = {**baseline.get("scenarios", {}), **output["scenarios"]} if baseline.get("config") == run_config else output["scenarios"]
+        output["scenarios"] = merged
+        output["tolerances"] = baseline.get("tolerances", DEFAULT_TOLERANCES)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nBaseline atualizada em {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"\nSem baseline em {args.baseline}; rode com --update-baseline para criá-la.")
+        return 0
+    if baseline.get("config") != run_config:
+        print(f"\nConfiguração diferente da baseline ({baseline.get('config')}); comparação ignorada.")
+        return 0
+    regressions = compare(results, baseline, {**DEFAULT_TOLERANCES, **baseline.get("tolerances", {})})
+    if regressions:
+        print("\nREGRESSÕES em relação à baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\nSem regressões em relação à baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
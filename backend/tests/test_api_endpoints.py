@@ -1,10 +1,12 @@
 # backend/tests/test_api_endpoints.py
+import asyncio
 import pytest
 from httpx import AsyncClient, ASGITransport
 from fastapi import FastAPI
 
 # Importar dependências necessárias para override
 from app.dependencies import get_authenticated_user
+from app.services import job_service
 from .test_feedback_analyzer import override_get_authenticated_user
 
 # --- Testes para Endpoints da API ---
@@ -36,14 +38,27 @@ async def test_rag_query_placeholder_success(test_client: AsyncClient, test_app:
 
 # Usar test_client e test_app de conftest.py
 @pytest.mark.asyncio
-async def test_run_crew_placeholder_success(test_client: AsyncClient, test_app: FastAPI, authenticated_headers: dict):
+async def test_run_crew_placeholder_success(test_client: AsyncClient, test_app: FastAPI, authenticated_headers: dict, tmp_path):
+    job_service.set_job_manager(job_service.JobManager(db_path=str(tmp_path / "jobs.sqlite3"), workers=1))
     test_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user # Aplica override
-    payload = {"topic": "Análise de mercado"}
-    response = await test_client.post("/api/v1/run-crew", json=payload, headers=authenticated_headers)
-    test_app.dependency_overrides = {} # Limpa override
-    assert response.status_code == 200
-    data = response.json()
-    assert "result" in data
+    try:
+        payload = {"topic": "Análise de mercado"}
+        response = await test_client.post("/api/v1/run-crew", json=payload, headers=authenticated_headers)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.json()["status"] == "queued"
+
+        # A execução acontece em segundo plano: consulta o estado até o job terminar
+        for _ in range(50):
+            data = (await test_client.get(f"/api/v1/run-crew/{job_id}", headers=authenticated_headers)).json()
+            if data["status"] in ("succeeded", "failed"):
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        test_app.dependency_overrides = {} # Limpa override
+        await job_service.get_job_manager().shutdown()
+        job_service.set_job_manager(None)
+    assert data["status"] == "succeeded"
     assert "summary" in data["result"]
     # <<< CORREÇÃO: Ajusta a asserção para o valor real retornado pelo placeholder
     expected_summary = "Resultado placeholder para a análise do tópico 'Análise de mercado'."
@@ -51,6 +66,7 @@ async def test_run_crew_placeholder_success(test_client: AsyncClient, test_app:
         f"Esperado '{expected_summary}', recebido '{data['result'].get('summary')}'"
     assert "logs" in data
     assert isinstance(data["logs"], list)
+    assert data["logs"][-1] == "INFO: Crew para 'Análise de mercado' finalizada."
 
 # Usar test_client e test_app de conftest.py
 @pytest.mark.asyncio
@@ -86,4 +102,58 @@ async def test_rag_query_invalid_input(test_client: AsyncClient, test_app: FastA
     test_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user # Aplica override
     response = await test_client.post("/api/v1/rag-query", json=payload, headers=authenticated_headers)
     test_app.dependency_overrides = {} # Limpa override
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+# --- Teste do health check (sem banco configurado) ---
+@pytest.mark.asyncio
+async def test_health_without_database(test_client: AsyncClient, test_app: FastAPI):
+    test_app.dependency_overrides = {}
+    response = await test_client.get("/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert data["database"] == {"configured": False, "healthy": False}
+
+@pytest.mark.asyncio
+async def test_rag_query_stream_placeholder(test_client: AsyncClient, test_app: FastAPI, authenticated_headers: dict):
+    test_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+    response = await test_client.post("/api/v1/rag-query/stream", json={"question": "O que é Supabase?"}, headers=authenticated_headers)
+    test_app.dependency_overrides = {}
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: token" in response.text
+    done = response.text.strip().split("\n\n")[-1]
+    assert done.startswith("event: done")
+    assert "docs/supabase_intro.md" in done
+
+@pytest.mark.asyncio
+async def test_generate_structured_unknown_spec(test_client: AsyncClient, test_app: FastAPI, authenticated_headers: dict):
+    test_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+    payload = {"prompt": "Extraia dados", "spec_name": "SpecInexistente"}
+    response = await test_client.post("/api/v1/generate-structured", json=payload, headers=authenticated_headers)
+    test_app.dependency_overrides = {}
+    assert response.status_code == 404
+    assert "UserProfileSpec" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_rag_search_scopes_the_filter_to_the_authenticated_user(test_client: AsyncClient, test_app: FastAPI, authenticated_headers: dict, monkeypatch):
+    from app.services import rag_service
+    from app.services.vector_store import SearchResult
+    seen = []
+
+    async def fake_retrieve(query, k, search_filter):
+        seen.append(search_filter)
+        return [SearchResult(id=1, content="nota", similarity=0.9, metadata={"source": "items/1"})]
+
+    monkeypatch.setattr(rag_service, "retrieve", fake_retrieve)
+    test_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+    payload = {"query": "notas", "k": 3, "tags": ["casa"], "owner_only": True, "created_after": "2025-01-01T00:00:00Z"}
+    response = await test_client.post("/api/v1/rag-search", json=payload, headers=authenticated_headers)
+    invalid = await test_client.post("/api/v1/rag-search", json={"query": "notas", "k": 0}, headers=authenticated_headers)
+    test_app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    assert response.json()["results"][0]["content"] == "nota"
+    user = await override_get_authenticated_user()
+    assert seen[0].user_id == str(user.id) and seen[0].tags == ("casa",) and seen[0].owner_only
+    assert seen[0].created_after.year == 2025
+    assert invalid.status_code == 422
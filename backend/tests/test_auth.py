@@ -0,0 +1,91 @@
+# backend/tests/test_auth.py
+import time
+import pytest
+import jwt
+from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import auth
+from app.dependencies import get_authenticated_user
+
+pytestmark = pytest.mark.asyncio
+
+TEST_SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+
+
+def make_token(exp_offset: int = 3600, secret: str = TEST_SECRET, **extra) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": "fake-user-id-123",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": "test@example.com",
+        "app_metadata": {"provider": "email"},
+        "user_metadata": {"name": "Test User"},
+        "iat": now,
+        "exp": now + exp_offset,
+    }
+    claims.update(extra)
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def credentials(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture(autouse=True)
+def local_auth_config(monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_MODE", "local")
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", False)
+    monkeypatch.setattr(auth, "JWT_SECRET", TEST_SECRET)
+    auth.clear_token_cache()
+    yield
+    auth.clear_token_cache()
+
+
+async def test_valid_token_is_verified_locally():
+    user = await get_authenticated_user(credentials(make_token()))
+    assert user.id == "fake-user-id-123"
+    assert user.email == "test@example.com"
+    assert user.app_metadata == {"provider": "email"}
+
+
+async def test_verified_token_is_served_from_cache():
+    token = make_token()
+    await get_authenticated_user(credentials(token))
+    with patch("app.auth.jwt.decode") as mock_decode:
+        user = await get_authenticated_user(credentials(token))
+    mock_decode.assert_not_called()
+    assert user.id == "fake-user-id-123"
+
+
+@pytest.mark.parametrize("token_factory", [
+    lambda: make_token(exp_offset=-3600),
+    lambda: make_token(secret="outro-segredo-qualquer-com-mais-de-32-chars"),
+    lambda: make_token(aud="anon"),
+    lambda: "isto-nao-e-um-jwt",
+])
+async def test_invalid_tokens_are_rejected(token_factory):
+    with pytest.raises(HTTPException) as exc_info:
+        await get_authenticated_user(credentials(token_factory()))
+    assert exc_info.value.status_code == 401
+
+
+async def test_missing_secret_without_fallback_fails_closed(monkeypatch):
+    monkeypatch.setattr(auth, "JWT_SECRET", "")
+    with pytest.raises(HTTPException) as exc_info:
+        await get_authenticated_user(credentials(make_token()))
+    assert exc_info.value.status_code == 500
+
+
+async def test_missing_secret_uses_remote_fallback_when_enabled(monkeypatch):
+    monkeypatch.setattr(auth, "JWT_SECRET", "")
+    monkeypatch.setattr(auth, "AUTH_REMOTE_FALLBACK", True)
+    remote_user = MagicMock(id="remote-user-id")
+    mock_client = MagicMock()
+    mock_client.auth.get_user.return_value = MagicMock(user=remote_user)
+    with patch("app.dependencies.get_supabase_client", return_value=mock_client):
+        user = await get_authenticated_user(credentials(make_token()))
+    assert user.id == "remote-user-id"
+    mock_client.auth.get_user.assert_called_once()
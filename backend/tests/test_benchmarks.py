@@ -0,0 +1,81 @@
+# backend/tests/test_benchmarks.py
+import json
+import random
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.services import spec_registry
+from benchmarks.fake_openai import FakeOpenAIConfig, LatencyModel, create_app
+from benchmarks.run import ScenarioResult, compare, percentile
+
+
+def fake_client() -> AsyncOpenAI:
+    config = FakeOpenAIConfig(first_token_latency=LatencyModel.parse("0"), token_latency=LatencyModel.parse("0"), embedding_latency=LatencyModel.parse("0"))
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(config)), base_url="http://fake")
+    return AsyncOpenAI(api_key="x", base_url="http://fake/v1", http_client=http_client, max_retries=0)
+
+
+def test_latency_model_parsing():
+    rng = random.Random(1)
+    assert LatencyModel.parse("0.05").sample(rng) == 0.05
+    assert 0.02 <= LatencyModel.parse("uniform:0.02,0.1").sample(rng) <= 0.1
+    assert LatencyModel.parse("normal:-1,0").sample(rng) == 0.0
+    with pytest.raises(ValueError):
+        LatencyModel.parse("lognormal:0.05")
+
+
+@pytest.mark.asyncio
+async def test_fake_openai_follows_guardrails_schema():
+    spec = spec_registry.get_spec_registry().get("UserProfileSpec")
+    schema = json.dumps(spec.model.model_json_schema())
+    client = fake_client()
+    response = await client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "system", "content": f"Siga este JSON Schema:\n{schema}"}, {"role": "user", "content": "Ana, 30"}],
+    )
+    assert spec.validate(json.loads(response.choices[0].message.content))["interests"]
+    assert response.usage.total_tokens > 0
+
+
+@pytest.mark.asyncio
+async def test_fake_openai_stream_and_embeddings():
+    client = fake_client()
+    stream = await client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": "Olá"}], stream=True, stream_options={"include_usage": True}
+    )
+    chunks = [chunk async for chunk in stream]
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    assert text.startswith("palavra0 palavra1")
+    assert chunks[-1].usage.completion_tokens > 0
+
+    first = await client.embeddings.create(model="text-embedding-3-small", input=["a", "b"], dimensions=8)
+    second = await client.embeddings.create(model="text-embedding-3-small", input="a", dimensions=8)
+    assert len(first.data) == 2 and len(first.data[0].embedding) == 8
+    assert first.data[0].embedding == second.data[0].embedding # determinístico por texto
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    def result(p95, rps, errors=0):
+        return ScenarioResult("rag_query", 100, errors, 10, p95, p95, rps, 100, ["HTTP 500"] * errors)
+
+    baseline = {"scenarios": {"rag_query": {"p50_ms": 10, "p95_ms": 100, "p99_ms": 100, "rps": 50, "alloc_kib_per_request": 100}}}
+    tolerances = {"latency": 0.25, "rps": 0.2, "alloc": 0.25}
+    assert compare({"rag_query": result(120, 45)}, baseline, tolerances) == []
+    regressions = compare({"rag_query": result(130, 30, errors=1)}, baseline, tolerances)
+    assert any("p95_ms" in line for line in regressions)
+    assert any("rps" in line for line in regressions)
+    assert any("erro" in line for line in regressions)
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+
+
+def test_quantization_recall_improves_with_more_rescoring_candidates():
+    from benchmarks.quantization import offline_report, sample_queries, synthetic_corpus
+
+    corpus = synthetic_corpus(2000, 128, seed=7)
+    rows = offline_report(corpus, sample_queries(corpus, 30, 0.5, seed=7), k=5, factors=[1, 40])
+    by_mode = {(row["mode"], row["candidates"]): row for row in rows}
+    assert by_mode[("float32", 5)]["recall"] == 1.0
+    assert by_mode[("halfvec", 5)]["recall"] >= 0.95
+    assert by_mode[("binary", 200)]["recall"] > by_mode[("binary", 5)]["recall"]
+    assert by_mode[("binary", 200)]["bytes"] * 32 == by_mode[("float32", 5)]["bytes"]
@@ -0,0 +1,70 @@
+# backend/tests/test_context_packer.py
+import numpy as np
+import pytest
+
+from app.services import context_packer
+from app.services.context_packer import count_tokens, deduplicate, pack_context
+from app.services.vector_store import SearchResult
+
+MODEL = "modelo-de-teste"
+
+
+class WordEncoding:
+    """Encoding determinístico para os testes: um token por palavra (ou separador)."""
+    def encode(self, text):
+        return text.replace("\n", " \n ").split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens).replace(" \n ", "\n")
+
+
+@pytest.fixture(autouse=True)
+def word_encoding():
+    context_packer.set_encoding(MODEL, WordEncoding())
+    yield
+    context_packer._encodings.pop(MODEL, None)
+
+
+def result(id, content, similarity, vector=None):
+    embedding = None if vector is None else np.asarray(vector, dtype=np.float32)
+    return SearchResult(id=id, content=content, similarity=similarity, metadata={"source": f"doc{id}.md"}, embedding=embedding)
+
+
+def test_near_duplicates_are_dropped_keeping_the_most_relevant():
+    results = [
+        result(1, "Postgres guarda os vetores", 0.9, [1, 0, 0]),
+        result(2, "Postgres guarda vetores", 0.8, [0.99, 0.05, 0]),
+        result(3, "Supabase tem autenticação", 0.7, [0, 1, 0]),
+        result(4, "  postgres guarda os VETORES ", 0.6), # sem embedding: compara o texto normalizado
+    ]
+    assert [r.id for r in deduplicate(results, 0.95)] == [1, 3]
+    assert [r.id for r in deduplicate(results, 1.01)] == [1, 2, 3] # > 1 desativa a comparação por embedding
+
+
+def test_budget_is_filled_greedily_in_relevance_order():
+    long_text = " ".join(["palavra"] * 40)
+    results = [
+        result(1, "curto e relevante", 0.9),
+        result(2, long_text, 0.8), # não cabe: é pulado
+        result(3, "outro trecho curto", 0.7), # ainda cabe
+    ]
+    packed = pack_context(results, MODEL, budget=30)
+    assert [chunk.result.id for chunk in packed.chunks] == [1, 3]
+    assert packed.over_budget_dropped == 1
+    assert packed.tokens == sum(chunk.tokens for chunk in packed.chunks) <= 30
+    assert packed.text.startswith("[1] (fonte: doc1.md)\ncurto e relevante\n\n[2] (fonte: doc3.md)")
+    assert count_tokens(packed.text, MODEL) <= packed.tokens # a soma por bloco é um limite superior
+
+
+def test_most_relevant_chunk_is_truncated_when_nothing_fits():
+    packed = pack_context([result(1, " ".join(["palavra"] * 100), 0.9)], MODEL, budget=20)
+    assert packed.chunks[0].truncated
+    assert packed.text.endswith(context_packer.TRUNCATION_MARKER)
+    assert packed.tokens <= 20
+
+
+def test_max_chunks_and_unknown_tokenizer_fallback():
+    packed = pack_context([result(i, f"trecho {i}", 1 - i / 10) for i in range(5)], MODEL, budget=1000, max_chunks=2)
+    assert len(packed.chunks) == 2
+    approx = context_packer._ApproximateEncoding()
+    assert len(approx.encode("a" * 40)) == 11
@@ -0,0 +1,90 @@
+# backend/tests/test_embedding_service.py
+import asyncio
+import pytest
+import numpy as np
+
+from app.services.embedding_service import EmbeddingBackend, EmbeddingEngine
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeBackend(EmbeddingBackend):
+    """Backend determinístico que registra o tamanho de cada lote recebido."""
+    name = "fake"
+    model = "fake-model"
+    dim = 4
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def embed_batch(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("backend indisponível")
+        return np.array([[len(t), 1, 0, 0] for t in texts], dtype=np.float32)
+
+
+async def test_concurrent_requests_are_micro_batched():
+    backend = FakeBackend()
+    engine = EmbeddingEngine(backend, max_batch_size=8, max_wait_ms=5)
+
+    vectors = await asyncio.gather(*(engine.embed(f"texto {i}") for i in range(5)))
+
+    assert len(backend.calls) == 1
+    assert len(backend.calls[0]) == 5
+    assert all(v.dtype == np.float32 and v.shape == (4,) for v in vectors)
+
+
+async def test_batches_are_split_at_max_size_and_results_keep_order():
+    backend = FakeBackend()
+    engine = EmbeddingEngine(backend, max_batch_size=2, max_wait_ms=5)
+
+    matrix = await engine.embed_many(["a", "bb", "ccc"])
+
+    assert [len(call) for call in backend.calls] == [2, 1]
+    assert matrix.shape == (3, 4)
+    assert matrix[:, 0].tolist() == [1, 2, 3]
+
+
+async def test_embeddings_are_memoized_by_content():
+    backend = FakeBackend()
+    engine = EmbeddingEngine(backend, max_wait_ms=0)
+
+    first = await engine.embed("mesmo texto")
+    second, third = await asyncio.gather(engine.embed("mesmo texto"), engine.embed("mesmo texto"))
+
+    assert len(backend.calls) == 1
+    assert np.array_equal(first, second) and np.array_equal(second, third)
+    assert engine.stats()["cache_hits"] == 2
+
+
+async def test_backend_errors_reach_every_waiter():
+    engine = EmbeddingEngine(FakeBackend(fail=True), max_wait_ms=1)
+
+    results = await asyncio.gather(engine.embed("x"), engine.embed("y"), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    # Falhas não ficam em cache
+    assert engine.stats()["cache_size"] == 0
+
+
+async def test_in_flight_batches_are_kept_alive_until_done():
+    import gc
+    release = asyncio.Event()
+
+    class SlowBackend(FakeBackend):
+        async def embed_batch(self, texts):
+            await release.wait()
+            return await super().embed_batch(texts)
+
+    engine = EmbeddingEngine(SlowBackend(), max_wait_ms=0)
+    pending = asyncio.ensure_future(engine.embed("texto"))
+    await asyncio.sleep(0.01)
+    gc.collect() # sem referência forte, a task do lote poderia ser coletada aqui
+    assert len(engine._tasks) == 1
+    release.set()
+    assert (await pending).shape == (4,)
+    await asyncio.sleep(0)
+    assert not engine._tasks
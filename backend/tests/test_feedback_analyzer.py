@@ -1,4 +1,5 @@
 # backend/tests/test_feedback_analyzer.py
+import json
 import pytest
 from httpx import AsyncClient
 from unittest.mock import patch, MagicMock
@@ -105,4 +106,203 @@ async def test_analyze_feedback_service_error(mock_analyze_service, test_client:
      fastapi_app.dependency_overrides = {}
 
      assert response.status_code == 500
-     assert "Erro interno do servidor" in response.json()["detail"] 
\ No newline at end of file
+     assert "Erro interno do servidor" in response.json()["detail"] 
+
+# --- Testes da análise em lote ---
+from app.models.ai_models import FeedbackAnalysisResponse
+from app.services import feedback_analyzer_service, llm_gateway
+
+def use_fake_llm(monkeypatch, fake_create):
+    """Instala um gateway LLM cujo cliente OpenAI responde com `fake_create`."""
+    client = MagicMock()
+    client.chat.completions.create = fake_create
+    monkeypatch.setattr(llm_gateway, "_gateway", llm_gateway.LLMGateway(client=client))
+
+def make_analysis(summary: str) -> FeedbackAnalysisResponse:
+    return FeedbackAnalysisResponse(sentiment="Positivo", summary=summary, topics=["produto"])
+
+@patch("app.services.feedback_analyzer_service.analyze_feedback_batch")
+async def test_analyze_batch_json_array_with_item_errors(mock_batch_service, test_client: AsyncClient, authenticated_headers: dict):
+    mock_batch_service.return_value = [(make_analysis("um"), None), (None, "Item ausente na resposta do serviço de IA.")]
+    fastapi_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+
+    payload = [{"text": "Ótimo"}, {"text": "a" * 501}, "Ruim"]
+    response = await test_client.post("/api/v1/feedback/analyze-batch", json=payload, headers=authenticated_headers)
+
+    fastapi_app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["total"], data["succeeded"], data["failed"]) == (3, 1, 2)
+    assert data["results"][0]["result"]["summary"] == "um"
+    assert data["results"][1]["error"].startswith("Item inválido")
+    assert data["results"][2]["error"] == "Item ausente na resposta do serviço de IA."
+    # Itens inválidos não são enviados ao serviço
+    mock_batch_service.assert_called_once_with(["Ótimo", "Ruim"])
+
+@patch("app.services.feedback_analyzer_service.analyze_feedback_batch")
+async def test_analyze_batch_jsonl_upload(mock_batch_service, test_client: AsyncClient, authenticated_headers: dict):
+    mock_batch_service.side_effect = lambda texts: [(make_analysis(t), None) for t in texts]
+    fastapi_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+
+    body = '{"text": "primeiro"}\n\nnão é json\n{"text": "segundo"}'
+    headers = {**authenticated_headers, "Content-Type": "application/x-ndjson"}
+    response = await test_client.post("/api/v1/feedback/analyze-batch", content=body.encode(), headers=headers)
+
+    fastapi_app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["index"] for r in data["results"]] == [0, 1, 2]
+    assert data["results"][0]["result"]["summary"] == "primeiro"
+    assert data["results"][1]["error"] == "Linha JSONL inválida."
+    assert data["results"][2]["result"]["summary"] == "segundo"
+
+async def test_analyze_batch_packs_items_per_llm_call(monkeypatch):
+    monkeypatch.setattr(feedback_analyzer_service, "FEEDBACK_BATCH_PACK_SIZE", 2)
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    calls = []
+
+    async def fake_create(**kwargs):
+        calls.append(kwargs)
+        # Responde apenas ao primeiro id de cada pack para exercitar o erro por item
+        content = '{"results": [{"id": 0, "sentiment": "Neutro", "summary": "ok", "topics": ["x"]}]}'
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+    use_fake_llm(monkeypatch, fake_create)
+    results = await feedback_analyzer_service.analyze_feedback_batch(["a", "b", "c"])
+
+    assert len(calls) == 2
+    assert [analysis is not None for analysis, _ in results] == [True, False, True]
+    assert results[1][1] == "Item ausente na resposta do serviço de IA."
+
+async def test_concurrent_batches_share_the_pack_concurrency_limit(monkeypatch):
+    import asyncio
+    monkeypatch.setattr(feedback_analyzer_service, "FEEDBACK_BATCH_PACK_SIZE", 1)
+    monkeypatch.setattr(feedback_analyzer_service, "FEEDBACK_BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(feedback_analyzer_service, "_batch_semaphore", None)
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    active, peak = 0, 0
+
+    async def fake_create(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        content = '{"results": [{"id": 0, "sentiment": "Neutro", "summary": "ok", "topics": ["x"]}]}'
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+    use_fake_llm(monkeypatch, fake_create)
+    batches = [[f"lote {b} item {i}" for i in range(3)] for b in range(4)]
+    await asyncio.gather(*(feedback_analyzer_service.analyze_feedback_batch(texts) for texts in batches))
+    assert peak == 2 # 4 lotes simultâneos, mas no máximo 2 packs no processo
+
+async def test_one_failing_pack_does_not_fail_the_batch(monkeypatch):
+    monkeypatch.setattr(feedback_analyzer_service, "FEEDBACK_BATCH_PACK_SIZE", 1)
+    await feedback_analyzer_service.invalidate_feedback_cache()
+
+    async def fake_create(**kwargs):
+        if "quebra" in kwargs["messages"][1]["content"]:
+            # Erro fora de OpenAIError (ex: do httpx/gateway) em um dos packs
+            raise RuntimeError("conexão derrubada")
+        content = '{"results": [{"id": 0, "sentiment": "Neutro", "summary": "ok", "topics": ["x"]}]}'
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+    use_fake_llm(monkeypatch, fake_create)
+    results = await feedback_analyzer_service.analyze_feedback_batch(["bom", "quebra", "ótimo"])
+
+    assert [analysis is not None for analysis, _ in results] == [True, False, True]
+    assert results[1][1] == "Erro interno no servidor ao analisar feedback."
+
+# --- Testes do cache de resultados ---
+async def test_equivalent_texts_hit_the_cache(monkeypatch):
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    calls = []
+
+    async def fake_create(**kwargs):
+        calls.append(kwargs)
+        content = '{"sentiment": "Positivo", "summary": "Gostou.", "topics": ["produto"]}'
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+    use_fake_llm(monkeypatch, fake_create)
+    first = await feedback_analyzer_service.analyze_feedback_text("Adorei o  produto!")
+    second = await feedback_analyzer_service.analyze_feedback_text("  adorei o produto!\n")
+    batch = await feedback_analyzer_service.analyze_feedback_batch(["ADOREI O PRODUTO!"])
+
+    assert len(calls) == 1
+    assert first == second == batch[0][0]
+    assert feedback_analyzer_service.feedback_cache.stats()["memory_hits"] >= 2
+
+# --- Testes do streaming (SSE) ---
+class FakeChatStream:
+    """Imita o AsyncStream da OpenAI: itera chunks com delta.content e registra o close()."""
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for delta in self.deltas:
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+async def test_analyze_feedback_stream_emits_tokens_then_validated_result(monkeypatch, test_client: AsyncClient, authenticated_headers: dict):
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    stream = FakeChatStream(['{"sentiment": "Positivo", ', '"summary": "Gostou.", ', '"topics": ["produto"]}'])
+
+    async def fake_create(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    use_fake_llm(monkeypatch, fake_create)
+    fastapi_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+    response = await test_client.post("/api/v1/feedback/analyze/stream", json=valid_payload, headers=authenticated_headers)
+    fastapi_app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["token", "token", "token", "done"]
+    assert events[-1][1] == {"sentiment": "Positivo", "summary": "Gostou.", "topics": ["produto"]}
+    assert stream.closed
+
+async def test_abandoned_feedback_stream_closes_the_llm_stream(monkeypatch):
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    stream = FakeChatStream(['{"sentiment": ', '"Neutro"', "}"])
+
+    async def fake_create(**kwargs):
+        return stream
+
+    use_fake_llm(monkeypatch, fake_create)
+    events = feedback_analyzer_service.stream_feedback_analysis("Texto qualquer")
+    assert (await anext(events))[0] == "token"
+    await events.aclose() # equivalente ao cancelamento quando o cliente desconecta
+
+    assert stream.closed
+    assert feedback_analyzer_service.feedback_cache.stats()["memory_size"] == 0
+
+async def test_invalid_json_in_stream_becomes_error_event(monkeypatch, test_client: AsyncClient, authenticated_headers: dict):
+    await feedback_analyzer_service.invalidate_feedback_cache()
+
+    async def fake_create(**kwargs):
+        return FakeChatStream(["não é json"])
+
+    use_fake_llm(monkeypatch, fake_create)
+    fastapi_app.dependency_overrides[get_authenticated_user] = override_get_authenticated_user
+    response = await test_client.post("/api/v1/feedback/analyze/stream", json=valid_payload, headers=authenticated_headers)
+    fastapi_app.dependency_overrides = {}
+
+    events = parse_sse(response.text)
+    assert events[-1] == ("error", {"status_code": 500, "detail": "Formato inválido na resposta do serviço de IA."})
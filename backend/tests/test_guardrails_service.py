@@ -0,0 +1,86 @@
+# backend/tests/test_guardrails_service.py
+import pytest
+from unittest.mock import MagicMock
+
+from app.services import guardrails_service, llm_gateway
+from app.services.guardrails_service import GenerationMetrics, GuardrailsValidationError, IncrementalObjectParser
+
+
+def test_parser_emits_members_as_soon_as_they_close():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"name": "Ana, a') == []
+    assert parser.feed('lta", "tags": ["x", ') == [("name", "Ana, alta")]
+    assert parser.feed('"y"], "meta": {"a": "}"}') == [("tags", ["x", "y"])]
+    assert parser.feed("}") == [("meta", {"a": "}"})]
+    assert parser.complete
+
+
+class ScriptedStreams:
+    """Fake de chat.completions.create: cada chamada devolve o próximo roteiro de tokens."""
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.calls = []
+        self.consumed = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        tokens = self.scripts.pop(0)
+        consumed = []
+        self.consumed.append(consumed)
+
+        class Stream:
+            def __aiter__(self_inner):
+                return self_inner._iterate()
+
+            async def _iterate(self_inner):
+                for token in tokens:
+                    consumed.append(token)
+                    yield MagicMock(choices=[MagicMock(delta=MagicMock(content=token))])
+
+            async def close(self_inner):
+                pass
+
+        return Stream()
+
+
+@pytest.fixture
+def streaming_mode(monkeypatch):
+    monkeypatch.setattr(guardrails_service, "GUARDRAILS_GENERATION_MODE", "streaming")
+
+    def install(*scripts):
+        fake = ScriptedStreams(*scripts)
+        client = MagicMock()
+        client.chat.completions.create = fake.create
+        monkeypatch.setattr(llm_gateway, "_gateway", llm_gateway.LLMGateway(client=client))
+        return fake
+    return install
+
+
+@pytest.mark.asyncio
+async def test_invalid_field_aborts_and_reasks_only_failing_fields(streaming_mode):
+    fake = streaming_mode(
+        ['{"name": "Ana",', ' "age": 200,', ' "interests": ', '["IA"', ', "Nuvem"]', "}"],
+        ['{"age": 31, ', '"interests": ["IA"]}'],
+    )
+    metrics = GenerationMetrics()
+    data = await guardrails_service.generate_and_validate("Ana, 31 anos, gosta de IA", "UserProfileSpec", 1, metrics=metrics)
+
+    assert data == {"name": "Ana", "age": 31, "interests": ["IA"]}
+    # A primeira geração para no campo inválido, sem consumir o restante do stream
+    assert fake.consumed[0] == ['{"name": "Ana",', ' "age": 200,']
+    reask = fake.calls[1]["messages"][-1]["content"]
+    # O re-ask pede só o campo inválido e o que não chegou a ser gerado; "name" já foi aceito
+    assert reask.split("campos:")[-1].strip() == "age, interests."
+    assert (metrics.attempts, metrics.reasks) == (2, 1)
+    assert metrics.aborted_fields == ["age"]
+    assert metrics.tokens_saved > 0
+
+
+@pytest.mark.asyncio
+async def test_exhausted_reasks_raise_validation_error(streaming_mode):
+    streaming_mode(['{"name": "Ana", "age": -1}'])
+    metrics = GenerationMetrics()
+    with pytest.raises(GuardrailsValidationError) as exc:
+        await guardrails_service.generate_and_validate("x", "UserProfileSpec", 0, metrics=metrics)
+    assert "age" in str(exc.value)
+    assert metrics.reasks == 0 and metrics.tokens_generated == 1
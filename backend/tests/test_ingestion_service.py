@@ -0,0 +1,102 @@
+# backend/tests/test_ingestion_service.py
+import pytest
+import numpy as np
+
+from app.services import ingestion_service
+from app.services.embedding_service import EmbeddingBackend, EmbeddingEngine, set_embedding_engine
+from app.services.ingestion_service import VectorSink, iter_chunks, index_paths
+
+
+class FakeBackend(EmbeddingBackend):
+    name = "fake"
+    model = "fake-model"
+    dim = 3
+
+    def __init__(self):
+        self.texts = []
+
+    async def embed_batch(self, texts):
+        self.texts.extend(texts)
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+class MemorySink(VectorSink):
+    """Sink em memória que imita public.documents (content_hash único)."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def existing_hashes(self, hashes):
+        return {h for h in hashes if h in self.rows}
+
+    async def write(self, chunks, embeddings):
+        for chunk, vector in zip(chunks, embeddings):
+            self.rows[chunk.content_hash] = (chunk.content, chunk.metadata, vector)
+        return len(chunks)
+
+    async def prune(self, source, keep_hashes):
+        stale = [h for h, (_, meta, _) in self.rows.items() if meta["source"] == source and h not in keep_hashes]
+        for h in stale:
+            del self.rows[h]
+        return len(stale)
+
+
+@pytest.fixture
+def fake_backend():
+    backend = FakeBackend()
+    set_embedding_engine(EmbeddingEngine(backend, max_wait_ms=0))
+    yield backend
+    set_embedding_engine(None)
+
+
+def test_chunks_respect_size_overlap_and_segment_metadata():
+    words = " ".join(f"palavra{i}" for i in range(200))
+    chunks = list(iter_chunks([(words, {"page": 1}), ("fim da página dois", {"page": 2})], chunk_size=300, overlap=50))
+
+    assert all(len(text) <= 300 for text, _ in chunks)
+    assert chunks[-1] == ("fim da página dois", {"page": 2})
+    assert {meta["page"] for text, meta in chunks[:-1]} == {1}
+    # O início de cada chunk repete o final do anterior (overlap)
+    assert chunks[1][0].split()[0] in chunks[0][0]
+
+
+def test_chunking_is_lazy():
+    def endless_segments():
+        while True:
+            yield "texto " * 100, {}
+
+    iterator = iter_chunks(endless_segments(), chunk_size=200, overlap=0)
+    assert len([next(iterator) for _ in range(5)]) == 5
+
+
+@pytest.mark.asyncio
+async def test_reindex_is_incremental_and_prunes_removed_chunks(tmp_path, fake_backend):
+    doc = tmp_path / "guia.md"
+    doc.write_text("Primeiro parágrafo sobre Supabase.\n\nSegundo parágrafo sobre pgvector.", encoding="utf-8")
+    (tmp_path / "ignorado.csv").write_text("a,b", encoding="utf-8")
+    sink = MemorySink()
+
+    first = await index_paths([str(tmp_path)], sink=sink)
+    assert (first.files, first.chunks_indexed) == (1, 1)
+    assert list(sink.rows.values())[0][1]["source"] == "guia.md"
+
+    second = await index_paths([str(tmp_path)], sink=sink)
+    assert (second.chunks_indexed, second.chunks_skipped) == (0, 1)
+    assert len(fake_backend.texts) == 1 # nenhum embedding novo na re-execução
+
+    doc.write_text("Conteúdo totalmente novo.", encoding="utf-8")
+    third = await index_paths([str(tmp_path)], sink=sink)
+    assert (third.chunks_indexed, third.chunks_pruned) == (1, 1)
+    assert [content for content, _, _ in sink.rows.values()] == ["Conteúdo totalmente novo."]
+
+
+def test_sink_missing_a_method_fails_at_instantiation():
+    class NoPruneSink(VectorSink):
+        async def existing_hashes(self, hashes):
+            return set()
+
+        async def write(self, chunks, embeddings):
+            return len(chunks)
+
+    with pytest.raises(TypeError, match="prune"):
+        NoPruneSink()
@@ -0,0 +1,115 @@
+# backend/tests/test_items_indexer.py
+import json
+import asyncio
+import pytest
+import numpy as np
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from app import clients
+from app.services import items_indexer
+from app.services.items_indexer import ItemsIndexer, item_chunks, item_hash
+
+ITEM_A = "00000000-0000-0000-0000-00000000000a"
+ITEM_B = "00000000-0000-0000-0000-00000000000b"
+ITEM_C = "00000000-0000-0000-0000-00000000000c"
+
+
+def item(item_id, title, description=None, user_id="u1"):
+    return {"id": item_id, "user_id": user_id, "title": title, "description": description}
+
+
+class FakePool:
+    """Responde às duas consultas de `sync` e registra o que foi apagado dentro da transação."""
+
+    def __init__(self, items, indexed):
+        self.items, self.indexed = items, indexed
+        self.deleted = []
+
+    async def fetch(self, query, ids):
+        if "FROM public.items" in query:
+            return [row for row in self.items if row["id"] in ids]
+        return [{"item_id": item_id, "item_hash": h} for item_id, h in self.indexed.items() if item_id in ids]
+
+    async def execute(self, query, ids):
+        self.deleted.extend(ids)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+
+def test_item_chunks_carry_owner_and_item_hash():
+    chunks = item_chunks(item(ITEM_A, "Comprar leite", "integral"))
+    assert chunks[0].content == "Comprar leite\n\nintegral"
+    assert chunks[0].metadata == {
+        "source": f"items/{ITEM_A}", "kind": "item", "item_id": ITEM_A, "user_id": "u1", "title": "Comprar leite",
+        "item_hash": item_hash("u1", "Comprar leite", "integral"), "chunk": 0,
+    }
+    assert item_hash("u1", "t", None) == item_hash("u1", "t", "") != item_hash("u2", "t", None)
+
+
+@pytest.mark.asyncio
+async def test_notifications_are_debounced_into_one_batch():
+    indexer = ItemsIndexer(debounce_seconds=0.05, max_delay_seconds=1, batch_size=10)
+
+    async def burst():
+        for item_id in (ITEM_A, ITEM_B, ITEM_A, "lixo"):
+            payload = json.dumps({"id": item_id, "op": "UPDATE"}) if item_id != "lixo" else "{"
+            indexer._on_notify(None, 0, indexer.channel, payload)
+            await asyncio.sleep(0.01)
+
+    burst_task = asyncio.create_task(burst())
+    batch = await indexer.next_batch()
+    await burst_task
+    assert batch == [ITEM_A, ITEM_B] # ids repetidos e payloads inválidos descartados
+    assert indexer.pending() == 0
+
+    small = ItemsIndexer(batch_size=2)
+    small.enqueue([ITEM_A, ITEM_B, ITEM_C])
+    assert await small.next_batch() == [ITEM_A, ITEM_B] # lote cheio não espera o debounce
+    assert small.pending() == 1
+
+
+@pytest.mark.asyncio
+async def test_sync_reembeds_only_changed_items_and_removes_deleted_ones(monkeypatch):
+    unchanged = item(ITEM_A, "Igual")
+    edited = item(ITEM_B, "Novo título", "descrição")
+    pool = FakePool(
+        items=[unchanged, edited],
+        indexed={ITEM_A: item_hash("u1", "Igual", None), ITEM_B: "hash-antigo", ITEM_C: "hash-apagado"},
+    )
+    embedded, written, invalidated = [], [], []
+
+    async def embed_many(texts):
+        embedded.extend(texts)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    async def fake_copy(conn, chunks, embeddings):
+        written.extend(chunks)
+        return len(chunks)
+
+    monkeypatch.setattr(clients, "get_db_pool", lambda: pool)
+    monkeypatch.setattr(items_indexer, "get_embedding_engine", lambda: SimpleNamespace(embed_many=embed_many))
+    monkeypatch.setattr(items_indexer, "copy_chunks", fake_copy)
+    async def publish_invalidation(names):
+        invalidated.extend(names)
+
+    monkeypatch.setattr(items_indexer.semantic_cache, "publish_invalidation", publish_invalidation)
+
+    stats = await ItemsIndexer().sync([ITEM_A, ITEM_B, ITEM_C])
+
+    assert embedded == ["Novo título\n\ndescrição"] # o item sem mudanças não gera embedding
+    assert [chunk.metadata["item_id"] for chunk in written] == [ITEM_B]
+    assert sorted(pool.deleted) == [ITEM_B, ITEM_C]
+    assert sorted(invalidated) == [f"items/{ITEM_B}", f"items/{ITEM_C}"]
+    assert (stats.items_unchanged, stats.items_indexed, stats.items_removed, stats.chunks_written) == (1, 1, 1, 1)
+
+    pool.indexed = {ITEM_A: item_hash("u1", "Igual", None)}
+    pool.deleted.clear()
+    assert (await ItemsIndexer().sync([ITEM_A])).items_unchanged == 1
+    assert pool.deleted == [] # nada a fazer: nenhuma transação
@@ -0,0 +1,182 @@
+# backend/tests/test_job_service.py
+import asyncio
+import pytest
+
+from app.services import crew_service, job_service
+from app.services.job_service import CrewJob, JobManager, JobQueueFullError, JobStore
+
+
+async def wait_finished(manager: JobManager, job_id: str) -> job_service.CrewJob:
+    for _ in range(100):
+        job = await manager.get(job_id)
+        if job.finished:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError("job não terminou a tempo")
+
+
+@pytest.mark.asyncio
+async def test_logs_are_streamed_live_and_job_is_persisted(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    manager = JobManager(db_path=db_path, workers=1)
+    job = await manager.submit("Mercado", {"ano": 2025}, owner_id="u1")
+
+    streamed = [line async for line in manager.stream_logs(job.id)]
+    finished = await wait_finished(manager, job.id)
+    await manager.shutdown()
+
+    assert finished.status == job_service.SUCCEEDED
+    assert streamed == finished.logs
+    assert streamed[0] == "INFO: Crew para 'Mercado' iniciada."
+    # Um novo processo enxerga o resultado gravado no SQLite
+    reloaded = await JobManager(db_path=db_path).get(job.id)
+    assert reloaded.status == job_service.SUCCEEDED
+    assert reloaded.result["summary"].startswith("Resultado placeholder")
+    assert reloaded.parameters == {"ano": 2025}
+
+
+@pytest.mark.asyncio
+async def test_queue_limit_and_restart_recovery(tmp_path, monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_crew(topic, parameters=None, on_log=None):
+        await release.wait()
+        return {"topic": topic}, []
+
+    monkeypatch.setattr(crew_service, "run_specific_crew", slow_crew)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    manager = JobManager(db_path=db_path, workers=1, queue_max_size=1)
+    running = await manager.submit("a")
+    await asyncio.sleep(0.05) # o worker retira "a" da fila
+    queued = await manager.submit("b")
+    with pytest.raises(JobQueueFullError):
+        await manager.submit("c")
+    await manager.shutdown()
+
+    # Após o reinício: o job interrompido falha e o que estava na fila é executado
+    release.set()
+    restarted = JobManager(db_path=db_path, workers=1)
+    await restarted._ensure_started()
+    assert (await restarted.get(running.id)).status == job_service.FAILED
+    assert (await wait_finished(restarted, queued.id)).result == {"topic": "b"}
+    await restarted.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submissions_respect_queue_limit(tmp_path, monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_crew(topic, parameters=None, on_log=None):
+        await release.wait()
+        return {"topic": topic}, []
+
+    monkeypatch.setattr(crew_service, "run_specific_crew", slow_crew)
+    manager = JobManager(db_path=str(tmp_path / "jobs.sqlite3"), workers=1, queue_max_size=3)
+    await manager._ensure_started()
+    results = await asyncio.gather(*(manager.submit(f"t{i}") for i in range(10)), return_exceptions=True)
+    accepted = [r for r in results if not isinstance(r, Exception)]
+    # Nenhuma submissão falha com asyncio.QueueFull: as excedentes recebem JobQueueFullError
+    assert all(isinstance(r, JobQueueFullError) for r in results if isinstance(r, Exception))
+    assert 3 <= len(accepted) <= 4 # 3 na fila + no máximo 1 já retirado pelo worker
+    release.set()
+    await manager.shutdown()
+
+
+def test_only_first_worker_of_a_boot_recovers(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(db_path)
+    store.save(CrewJob(id="r", topic="a", parameters={}, owner_id=None, status=job_service.RUNNING))
+    store.save(CrewJob(id="q", topic="b", parameters={}, owner_id=None))
+
+    assert [job.id for job in store.recover(3600, boot_id="boot-1")] == ["q"]
+    assert store.get("r").status == job_service.FAILED
+    # Outro worker (ou um reciclado) do mesmo boot não toca na fila nem nos jobs em execução
+    store.save(CrewJob(id="r2", topic="c", parameters={}, owner_id=None, status=job_service.RUNNING))
+    assert JobStore(db_path).recover(3600, boot_id="boot-1") == []
+    assert store.get("r2").status == job_service.RUNNING
+    # Novo boot: recupera de novo
+    assert [job.id for job in JobStore(db_path).recover(3600, boot_id="boot-2")] == ["q"]
+    assert store.get("r2").status == job_service.FAILED
+
+
+@pytest.mark.asyncio
+async def test_job_of_another_worker_is_streamed_from_the_store(tmp_path, monkeypatch):
+    step = asyncio.Event()
+
+    async def chatty_crew(topic, parameters=None, on_log=None):
+        on_log("primeira")
+        await step.wait()
+        on_log("segunda")
+        return {"topic": topic}, ["primeira", "segunda"]
+
+    monkeypatch.setattr(crew_service, "run_specific_crew", chatty_crew)
+    monkeypatch.setattr(job_service, "CREW_JOB_POLL_SECONDS", 0.01)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    owner = JobManager(db_path=db_path, workers=1)
+    other = JobManager(db_path=db_path, workers=1) # outro worker, mesmo arquivo
+    job = await owner.submit("Mercado")
+
+    streamed: list = []
+
+    async def consume():
+        async for line in other.stream_logs(job.id):
+            streamed.append(line)
+
+    consumer = asyncio.create_task(consume())
+    for _ in range(100):
+        if streamed:
+            break
+        await asyncio.sleep(0.01)
+    # A primeira linha chega pelo SQLite enquanto o job ainda está em execução no outro worker
+    assert streamed == ["primeira"]
+    assert not consumer.done()
+
+    step.set()
+    await asyncio.wait_for(consumer, timeout=2)
+    assert streamed == ["primeira", "segunda"]
+    assert (await other.get(job.id)).status == job_service.SUCCEEDED
+    await owner.shutdown()
+    await other.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_worker_shutdown_fails_its_running_jobs_and_keeps_the_queue(tmp_path, monkeypatch):
+    async def slow_crew(topic, parameters=None, on_log=None):
+        on_log("começou")
+        await asyncio.sleep(60)
+        return {"topic": topic}, []
+
+    monkeypatch.setattr(crew_service, "run_specific_crew", slow_crew)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    # Worker reciclado: o boot não muda, então nenhum outro processo recupera os jobs dele
+    manager = JobManager(db_path=db_path, workers=1, boot_id="boot-1")
+    running = await manager.submit("a")
+    await asyncio.sleep(0.05)
+    queued = await manager.submit("b")
+    await manager.shutdown()
+
+    store = JobStore(db_path)
+    interrupted = store.get(running.id)
+    assert interrupted.status == job_service.FAILED
+    assert interrupted.logs == ["começou"]
+    assert store.get(queued.id).status == job_service.QUEUED
+
+
+@pytest.mark.asyncio
+async def test_recovered_jobs_beyond_the_queue_limit_run_as_slots_free_up(tmp_path, monkeypatch):
+    async def quick_crew(topic, parameters=None, on_log=None):
+        return {"topic": topic}, []
+
+    monkeypatch.setattr(crew_service, "run_specific_crew", quick_crew)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(db_path)
+    for i in range(4):
+        store.save(CrewJob(id=f"q{i}", topic=f"t{i}", parameters={}, owner_id=None, created_at=float(i)))
+    store.close()
+
+    manager = JobManager(db_path=db_path, workers=1, queue_max_size=1)
+    await manager._ensure_started()
+    # Nenhum job recuperado é descartado: os que não couberam entram na fila conforme o worker libera vagas
+    for i in range(4):
+        assert (await wait_finished(manager, f"q{i}")).result == {"topic": f"t{i}"}
+    await manager.shutdown()
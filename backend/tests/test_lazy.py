@@ -0,0 +1,97 @@
+# backend/tests/test_lazy.py
+import sys
+import asyncio
+import subprocess
+import pytest
+from unittest.mock import patch
+
+from app import lazy
+from app.startup_profile import BACKEND_DIR, by_package, parse_importtime
+
+
+def test_lazy_module_imports_on_first_attribute_access(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    proxy = lazy.lazy_module("colorsys")
+    assert not proxy.is_loaded
+    assert proxy.rgb_to_hsv(0, 0, 0) == (0, 0, 0)
+    assert proxy.is_loaded
+
+
+def test_patches_on_the_real_module_are_seen_through_the_proxy():
+    proxy = lazy.lazy_module("app.services.feedback_analyzer_service")
+    with patch("app.services.feedback_analyzer_service.normalize_text", return_value="mock"):
+        assert proxy.normalize_text("x") == "mock"
+
+
+@pytest.mark.asyncio
+async def test_preload_reports_timings_and_survives_missing_modules(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    timings = await lazy.preload(["colorsys", "app.modulo_inexistente"])
+    assert list(timings) == ["colorsys"]
+    assert lazy.is_loaded("colorsys")
+
+
+def test_importing_app_main_does_not_load_heavy_services():
+    code = "import sys, app.main; print(sorted(m for m in ('openai', 'numpy', 'app.services.rag_service') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-1000:]
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_parse_importtime_output():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |     numpy.core",
+        "import time:       400 |        500 |   numpy",
+        "import time:      1000 |       1500 | app.main",
+    ])
+    timings = parse_importtime(stderr)
+    assert [(t.module, t.depth) for t in timings] == [("numpy.core", 2), ("numpy", 1), ("app.main", 0)]
+    assert timings[-1].cumulative_ms == 1.5
+    assert by_package(timings)[0] == ("app", 1.0)
+    assert dict(by_package(timings))["numpy"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_proxy_waits_for_a_module_still_being_preloaded(tmp_path, monkeypatch):
+    (tmp_path / "lento_preload.py").write_text("import time\ntime.sleep(0.3)\nVALOR = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lento_preload", raising=False)
+    proxy = lazy.lazy_module("lento_preload")
+
+    preloading = asyncio.create_task(lazy.preload(["lento_preload"]))
+    while "lento_preload" not in sys.modules: # importação em andamento na thread do preload
+        await asyncio.sleep(0.005)
+    assert not proxy.is_loaded
+    # O acesso espera o fim da importação em vez de ver o módulo pela metade (AttributeError)
+    assert proxy.VALOR == 42
+    assert proxy.is_loaded
+    await preloading
+    monkeypatch.delitem(sys.modules, "lento_preload")
+
+
+@pytest.mark.asyncio
+async def test_shutdown_waits_for_the_cancelled_background_warmup(monkeypatch):
+    from app import clients, main
+
+    events = []
+    started = asyncio.Event()
+
+    async def slow_warmup():
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            await asyncio.sleep(0.05) # limpeza assíncrona do warmup
+            events.append("warmup")
+
+    async def clients_shutdown():
+        events.append("clients")
+
+    monkeypatch.setattr(main, "APP_PRELOAD_IN_BACKGROUND", True)
+    monkeypatch.setattr(main, "_warmup", slow_warmup)
+    monkeypatch.setattr(clients, "shutdown", clients_shutdown)
+    async with main.lifespan(main.app):
+        await started.wait()
+    # O warmup termina de cancelar antes de os clientes serem fechados
+    assert events == ["warmup", "clients"]
@@ -0,0 +1,185 @@
+# backend/tests/test_llm_gateway.py
+import asyncio
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from openai import APIConnectionError, BadRequestError, RateLimitError
+
+from app.services import llm_gateway
+from app.services.llm_gateway import CircuitBreaker, CircuitOpenError, LLMGateway, TokenRateLimiter
+
+REQUEST = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+
+
+def rate_limited():
+    return RateLimitError("limite", response=httpx.Response(429, request=REQUEST), body=None)
+
+
+def make_gateway(create):
+    client = MagicMock()
+    client.chat.completions.create = create
+    return LLMGateway(client=client)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "_retry_wait", lambda retry_state: 0)
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried():
+    outcomes = [rate_limited(), APIConnectionError(request=REQUEST), "ok"]
+
+    async def create(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return MagicMock(usage=None, content=outcome)
+
+    gateway = make_gateway(create)
+    response = await gateway.chat_completion(model="gpt-3.5-turbo", messages=[{"role": "user", "content": "oi"}])
+    assert response.content == "ok"
+    assert gateway.stats()["gpt-3.5-turbo"]["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_consecutive_failures_and_fails_fast():
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise APIConnectionError(request=REQUEST)
+
+    gateway = make_gateway(create)
+    gateway._lane("m").breaker = CircuitBreaker("m", failure_threshold=2, reset_seconds=60)
+    for _ in range(2):
+        with pytest.raises(APIConnectionError):
+            await gateway.chat_completion(model="m", messages=[])
+    attempts = len(calls)
+
+    with pytest.raises(CircuitOpenError):
+        await gateway.chat_completion(model="m", messages=[])
+    assert len(calls) == attempts # Nenhuma chamada ao provedor com o circuito aberto
+    assert gateway.stats()["m"]["circuit"] == "open"
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_the_circuit():
+    async def create(**kwargs):
+        raise BadRequestError("ruim", response=httpx.Response(400, request=REQUEST), body=None)
+
+    gateway = make_gateway(create)
+    gateway._lane("m").breaker = CircuitBreaker("m", failure_threshold=1, reset_seconds=60)
+    for _ in range(2):
+        with pytest.raises(BadRequestError):
+            await gateway.chat_completion(model="m", messages=[])
+    assert gateway.stats()["m"]["circuit"] == "closed"
+
+
+@pytest.mark.asyncio
+async def test_per_model_concurrency_and_stream_slot_release(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MODEL_LIMITS", {"lento": {"concurrency": 1}})
+    closed = []
+
+    class Stream:
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            yield MagicMock()
+
+        async def close(self):
+            closed.append(True)
+
+    async def create(**kwargs):
+        return Stream()
+
+    gateway = make_gateway(create)
+    stream = await gateway.chat_completion(model="lento", messages=[], stream=True)
+    second = asyncio.ensure_future(gateway.chat_completion(model="lento", messages=[], stream=True))
+    await asyncio.sleep(0.01)
+    assert not second.done() # A única vaga do modelo está ocupada pelo stream aberto
+
+    await stream.close()
+    await (await asyncio.wait_for(second, 1)).close()
+    assert closed == [True, True]
+
+
+@pytest.mark.asyncio
+async def test_model_aliases_select_local_models(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MODEL_ALIASES", {"gpt-3.5-turbo": "llama3.1"})
+    seen = []
+
+    async def create(**kwargs):
+        seen.append(kwargs["model"])
+        return MagicMock(usage=None)
+
+    await make_gateway(create).chat_completion(model="gpt-3.5-turbo", messages=[])
+    assert seen == ["llama3.1"]
+
+
+@pytest.mark.asyncio
+async def test_token_rate_limiter_waits_for_refill():
+    limiter = TokenRateLimiter(tokens_per_minute=600) # 10 tokens/s
+    await limiter.acquire(600)
+    started = asyncio.get_running_loop().time()
+    await limiter.acquire(1)
+    assert asyncio.get_running_loop().time() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_does_not_block_the_circuit():
+    started, mode = asyncio.Event(), ["falha"]
+
+    async def create(**kwargs):
+        if mode[0] == "falha":
+            raise APIConnectionError(request=REQUEST)
+        if mode[0] == "trava":
+            started.set()
+            await asyncio.sleep(60) # verificação que será cancelada
+        return MagicMock(usage=None, content="ok")
+
+    gateway = make_gateway(create)
+    breaker = gateway._lane("m").breaker = CircuitBreaker("m", failure_threshold=1, reset_seconds=0)
+    with pytest.raises(APIConnectionError):
+        await gateway.chat_completion(model="m", messages=[])
+    assert breaker.state == CircuitBreaker.OPEN
+
+    mode[0] = "trava"
+    trial = asyncio.ensure_future(gateway.chat_completion(model="m", messages=[]))
+    await started.wait()
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    mode[0] = "ok"
+    # A próxima chamada assume a verificação em vez de receber CircuitOpenError para sempre
+    response = await gateway.chat_completion(model="m", messages=[])
+    assert response.content == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_client_error_during_half_open_trial_keeps_the_circuit_open_for_testing():
+    mode = ["falha"]
+
+    async def create(**kwargs):
+        if mode[0] == "falha":
+            raise APIConnectionError(request=REQUEST)
+        if mode[0] == "400":
+            raise BadRequestError("ruim", response=httpx.Response(400, request=REQUEST), body=None)
+        return MagicMock(usage=None, content="ok")
+
+    gateway = make_gateway(create)
+    breaker = gateway._lane("m").breaker = CircuitBreaker("m", failure_threshold=1, reset_seconds=0)
+    with pytest.raises(APIConnectionError):
+        await gateway.chat_completion(model="m", messages=[])
+
+    mode[0] = "400"
+    with pytest.raises(BadRequestError):
+        await gateway.chat_completion(model="m", messages=[])
+    # Um 4xx não prova que o provedor voltou: o circuito continua em teste, com a vaga livre
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    mode[0] = "ok"
+    assert (await gateway.chat_completion(model="m", messages=[])).content == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,120 @@
+# backend/tests/test_metrics.py
+import os
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from app import metrics
+from app.metrics import Counter, Histogram
+from app.services.llm_gateway import LLMGateway
+
+
+def usage(prompt, completion):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion)
+
+
+class UsageStream:
+    """Stream falso cujo último chunk traz apenas o `usage` (como com stream_options.include_usage)."""
+    def __init__(self):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="oi"))], usage=None),
+            SimpleNamespace(choices=[], usage=usage(7, 3)),
+        ]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        pass
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "teste", ("route",), buckets=(0.1, 1.0))
+    metrics.REGISTRY.remove(histogram)
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    text = histogram.render()
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{route="/a"} 2' in text
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_escape_total", "teste", ("value",))
+    metrics.REGISTRY.remove(counter)
+    counter.inc(value='a"b\\c')
+    assert 'test_escape_total{value="a\\"b\\\\c"} 1' in counter.render()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_uses_route_template(test_client):
+    before = metrics.HTTP_REQUEST_DURATION.count(method="GET", route="/health", status="200")
+    await test_client.get("/health")
+    await test_client.get("/rota-inexistente-123")
+    assert metrics.HTTP_REQUEST_DURATION.count(method="GET", route="/health", status="200") == before + 1
+
+    response = await test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/health",status="200",le="+Inf"}' in text
+    assert 'route="unmatched"' in text and "rota-inexistente-123" not in text # URL não vira rótulo
+    assert 'cache_hit_ratio{cache="feedback_analysis"}' in text
+    assert "# TYPE cache_lookups_total counter" in text
+    assert f'cache_lookups_total{{cache="feedback_analysis",result="hit",worker="{os.getpid()}"}}' in text
+    assert "# TYPE event_loop_lag_seconds gauge" in text
+
+
+@pytest.mark.asyncio
+async def test_gateway_records_tokens_and_latency():
+    async def create(**kwargs):
+        return MagicMock(usage=usage(11, 5))
+
+    client = MagicMock()
+    client.chat.completions.create = create
+    gateway = LLMGateway(client=client)
+    prompt_before = metrics.LLM_TOKENS.value(model="modelo-metricas", kind="prompt")
+    await gateway.chat_completion(model="modelo-metricas", messages=[{"role": "user", "content": "oi"}])
+    assert metrics.LLM_TOKENS.value(model="modelo-metricas", kind="prompt") == prompt_before + 11
+    assert metrics.LLM_TOKENS.value(model="modelo-metricas", kind="completion") >= 5
+    assert metrics.LLM_REQUEST_DURATION.count(model="modelo-metricas", operation="chat", outcome="success") >= 1
+    assert metrics.STAGE_DURATION.count(stage="llm") >= 1
+
+
+@pytest.mark.asyncio
+async def test_gateway_stream_counts_usage_chunk():
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return UsageStream()
+
+    client = MagicMock()
+    client.chat.completions.create = create
+    gateway = LLMGateway(client=client)
+    stream = await gateway.chat_completion(model="modelo-stream", messages=[{"role": "user", "content": "oi"}], stream=True)
+    async for _ in stream:
+        pass
+    assert calls[0]["stream_options"] == {"include_usage": True}
+    assert metrics.LLM_TOKENS.value(model="modelo-stream", kind="prompt") == 7
+    assert metrics.LLM_TOKENS.value(model="modelo-stream", kind="completion") == 3
+
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_monitor(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_LOOP_LAG_INTERVAL_SECONDS", 0.01)
+    before = metrics.EVENT_LOOP_LAG_HISTOGRAM.count()
+    await metrics.startup()
+    try:
+        await asyncio.sleep(0.05)
+    finally:
+        await metrics.shutdown()
+    assert metrics.EVENT_LOOP_LAG_HISTOGRAM.count() > before
+    assert metrics._lag_task is None
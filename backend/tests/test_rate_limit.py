@@ -0,0 +1,123 @@
+# backend/tests/test_rate_limit.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app import rate_limit
+from app.dependencies import get_authenticated_user
+from app.main import app as fastapi_app
+from app.rate_limit import MemoryBucketStore, Rule, SQLiteBucketStore
+from app.services.fair_scheduler import FairSemaphore, Principal
+from tests.test_feedback_analyzer import create_mock_user
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_allows_burst_then_reports_retry_after():
+    store = MemoryBucketStore()
+    rule = Rule(capacity=2, per_second=0.5)
+    assert (await store.take("u:/x", rule))[0]
+    assert (await store.take("u:/x", rule))[0]
+    allowed, retry_after = await store.take("u:/x", rule)
+    assert not allowed and 1.9 < retry_after <= 2.0
+    assert (await store.take("outro:/x", rule))[0] # baldes independentes por chave
+
+
+@pytest.mark.asyncio
+async def test_sqlite_buckets_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    first, second = SQLiteBucketStore(path), SQLiteBucketStore(path) # dois workers
+    rule = Rule(capacity=1, per_second=0.01)
+    assert (await first.take("u:*", rule))[0]
+    assert not (await second.take("u:*", rule))[0]
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_route_returns_429_with_retry_after(test_client, authenticated_headers, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_RULES", {"/api/v1/feedback/analyze": {"capacity": 2, "per_minute": 6}})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    rate_limit.set_bucket_store(MemoryBucketStore())
+    fastapi_app.dependency_overrides[get_authenticated_user] = lambda: create_mock_user()
+    analysis = {"sentiment": "Positivo", "summary": "ok", "topics": ["a"]}
+    try:
+        with patch("app.services.feedback_analyzer_service.analyze_feedback_text", AsyncMock(return_value=analysis)):
+            statuses = [
+                (await test_client.post("/api/v1/feedback/analyze", json={"text": "bom"}, headers=authenticated_headers))
+                for _ in range(3)
+            ]
+    finally:
+        fastapi_app.dependency_overrides = {}
+        rate_limit.set_bucket_store(None)
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert statuses[-1].headers["retry-after"] == "10"
+
+
+@pytest.mark.asyncio
+async def test_polling_a_job_does_not_consume_the_global_llm_quota(test_client, authenticated_headers, monkeypatch, tmp_path):
+    from app.services import job_service
+
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_RULES", {"*": {"capacity": 1, "per_minute": 1}, "/api/v1/run-crew/{job_id}": {"capacity": 100, "per_minute": 100}})
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    rate_limit.set_bucket_store(MemoryBucketStore())
+    job_service.set_job_manager(job_service.JobManager(db_path=str(tmp_path / "jobs.sqlite3"), workers=1))
+    fastapi_app.dependency_overrides[get_authenticated_user] = lambda: create_mock_user()
+    analysis = {"sentiment": "Positivo", "summary": "ok", "topics": ["a"]}
+    try:
+        polls = [await test_client.get("/api/v1/run-crew/inexistente", headers=authenticated_headers) for _ in range(5)]
+        with patch("app.services.feedback_analyzer_service.analyze_feedback_text", AsyncMock(return_value=analysis)):
+            work = await test_client.post("/api/v1/feedback/analyze", json={"text": "bom"}, headers=authenticated_headers)
+            exhausted = await test_client.post("/api/v1/feedback/analyze", json={"text": "bom"}, headers=authenticated_headers)
+    finally:
+        fastapi_app.dependency_overrides = {}
+        rate_limit.set_bucket_store(None)
+        job_service.set_job_manager(None)
+    assert all(r.status_code == 404 for r in polls) # consultas não recebem 429
+    assert work.status_code == 200 # o único token global continuava disponível para a rota de IA
+    assert exhausted.status_code == 429
+
+def test_role_weight_comes_from_app_metadata(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ROLE_WEIGHTS", {"pro": 3})
+    user = create_mock_user()
+    assert rate_limit.user_weight(user) == 1.0
+    user.app_metadata["role"] = "pro"
+    assert rate_limit.user_weight(user) == 3.0
+    assert Rule.from_config({"capacity": 2, "per_minute": 60}, 3.0) == Rule(capacity=6.0, per_second=3.0)
+
+
+@pytest.mark.asyncio
+async def test_fair_semaphore_interleaves_users_by_weight():
+    semaphore = FairSemaphore(1)
+    order = []
+
+    async def call(user: Principal):
+        await semaphore.acquire(user)
+        order.append(user.id)
+        await asyncio.sleep(0)
+        semaphore.release()
+
+    heavy, light, pro = Principal("rajada"), Principal("outro"), Principal("pro", weight=2)
+    await semaphore.acquire(Principal("inicial")) # ocupa a vaga: todos os pedidos abaixo entram na fila
+    tasks = [asyncio.create_task(call(heavy)) for _ in range(6)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call(light)) for _ in range(3)]
+    tasks += [asyncio.create_task(call(pro)) for _ in range(4)]
+    await asyncio.sleep(0)
+    semaphore.release()
+    await asyncio.gather(*tasks)
+
+    # A rajada chegou primeiro, mas não monopoliza: os outros são intercalados e "pro" recebe o dobro da fatia
+    assert order == ["rajada", "outro", "pro", "pro", "rajada", "outro", "pro", "pro", "rajada", "outro", "rajada", "rajada", "rajada"]
+
+
+@pytest.mark.asyncio
+async def test_fair_semaphore_cancelled_waiter_does_not_leak_the_slot():
+    semaphore = FairSemaphore(1)
+    await semaphore.acquire(Principal("a"))
+    waiter = asyncio.create_task(semaphore.acquire(Principal("b")))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    semaphore.release()
+    assert not semaphore.locked() and semaphore.waiting() == 0
@@ -0,0 +1,88 @@
+# backend/tests/test_responses.py
+import json
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.models.ai_models import RagResponse
+from app.responses import CompressionMiddleware, ModelJSONResponse, dumps, negotiate_encoding
+
+LARGE = {"answer": "resposta " * 400, "sources": [{"id": i, "conteúdo": "trecho " * 20} for i in range(50)]}
+
+
+def make_client() -> httpx.AsyncClient:
+    app = FastAPI(default_response_class=ModelJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/large")
+    async def large():
+        return ModelJSONResponse(RagResponse(**LARGE))
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/sse")
+    async def sse():
+        return StreamingResponse(iter(["data: x\n\n"] * 300), media_type="text/event-stream")
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([json.dumps(LARGE)[i:i + 1000] for i in range(0, len(json.dumps(LARGE)), 1000)]), media_type="application/json")
+
+    @app.get("/text")
+    async def text():
+        return PlainTextResponse("a" * 2000, headers={"Content-Encoding": "identity"})
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_model_serialization_matches_pydantic_and_keeps_accents():
+    model = RagResponse(answer="ação", sources=[{"score": 0.5}])
+    assert dumps(model) == model.model_dump_json().encode()
+    assert dumps({"ação": 1, 2: [model]}) == '{"ação":1,"2":[{"answer":"ação","sources":[{"score":0.5}]}]}'.encode()
+
+
+def test_accept_encoding_negotiation():
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("gzip;q=1.0, zstd;q=0.5") == "gzip"
+    assert negotiate_encoding("zstd;q=0, gzip") == "gzip"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_compressed_and_small_ones_are_not():
+    async with make_client() as client:
+        gzipped = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["content-encoding"] == "gzip"
+        assert gzipped.headers["vary"] == "Accept-Encoding"
+        assert int(gzipped.headers["content-length"]) < len(dumps(RagResponse(**LARGE))) / 4
+        assert gzipped.json()["answer"] == LARGE["answer"] # httpx descomprime gzip
+
+        zstd = await client.get("/large", headers={"Accept-Encoding": "zstd, gzip"})
+        assert zstd.headers["content-encoding"] == "zstd"
+        assert zstd.json()["sources"][0]["conteúdo"].startswith("trecho") # httpx descomprime zstd com zstandard instalado
+
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers and small.json() == {"ok": True}
+
+        identity = await client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in identity.headers
+
+
+@pytest.mark.asyncio
+async def test_streams_are_compressed_incrementally_except_sse():
+    async with make_client() as client:
+        sse = await client.get("/sse", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in sse.headers
+
+        streamed = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert streamed.headers["content-encoding"] == "gzip"
+        assert "content-length" not in streamed.headers
+        assert streamed.json() == json.loads(json.dumps(LARGE))
+
+        already_encoded = await client.get("/text", headers={"Accept-Encoding": "gzip"})
+        assert already_encoded.text == "a" * 2000
@@ -0,0 +1,40 @@
+# backend/tests/test_result_cache.py
+import pytest
+
+from app.services.result_cache import ResultCache, content_key, normalize_text
+
+
+def test_normalized_texts_share_the_same_key():
+    assert normalize_text("  Olá\tMUNDO \n") == "olá mundo"
+    assert content_key(normalize_text("Olá  mundo"), "m", "v1", 0.2) == content_key(normalize_text("olá mundo"), "m", "v1", 0.2)
+    assert content_key("olá mundo", "m", "v1", 0.2) != content_key("olá mundo", "m", "v2", 0.2)
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(name="teste", version="v1", sqlite_path=path)
+    await cache.set("k", {"valor": 1})
+    cache.close()
+
+    reopened = ResultCache(name="teste", version="v1", sqlite_path=path)
+    assert await reopened.get("k") == {"valor": 1}
+    assert await reopened.get("k") == {"valor": 1}
+    assert await reopened.get("ausente") is None
+    stats = reopened.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_prompt_version_change_invalidates_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(name="teste", version="v1", sqlite_path=path)
+    await cache.set("k", {"valor": 1})
+    assert await cache.invalidate(new_version="v2") == 1
+    assert await cache.get("k") is None
+    cache.close()
+
+    # Abrir com outra versão também descarta as entradas antigas
+    await ResultCache(name="teste", version="v2", sqlite_path=path).set("k2", {"valor": 2})
+    assert await ResultCache(name="teste", version="v3", sqlite_path=path).get("k2") is None
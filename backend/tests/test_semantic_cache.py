@@ -0,0 +1,83 @@
+# backend/tests/test_semantic_cache.py
+import numpy as np
+import pytest
+
+from app.services.semantic_cache import SemanticCache
+
+
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_question_hits_and_dissimilar_misses():
+    cache = SemanticCache(dim=3, threshold=0.9)
+    cache.store(vec(1, 0, 0), "resposta", [{"id": 1, "source": "a.md"}])
+
+    answer, sources, similarity = cache.lookup(vec(0.99, 0.05, 0))
+    assert answer == "resposta" and sources[0]["source"] == "a.md"
+    assert similarity > 0.9
+    assert cache.lookup(vec(0, 1, 0)) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = SemanticCache(dim=3, threshold=0.99, max_entries=2)
+    cache.store(vec(1, 0, 0), "x", [])
+    cache.store(vec(0, 1, 0), "y", [])
+    assert cache.lookup(vec(1, 0, 0))[0] == "x" # "x" passa a ser o mais recente
+    cache.store(vec(0, 0, 1), "z", [])
+
+    assert cache.lookup(vec(0, 1, 0)) is None
+    assert cache.lookup(vec(1, 0, 0))[0] == "x"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiration(monkeypatch):
+    cache = SemanticCache(dim=3, threshold=0.9, ttl_seconds=10)
+    cache.store(vec(1, 0, 0), "antiga", [])
+    monkeypatch.setattr("app.services.semantic_cache.time.time", lambda: 10**12)
+    assert cache.lookup(vec(1, 0, 0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_reindexed_sources_invalidate_entries():
+    cache = SemanticCache(dim=3, threshold=0.9)
+    cache.store(vec(1, 0, 0), "de a", [{"id": 1, "source": "a.md"}])
+    cache.store(vec(0, 1, 0), "de b", [{"id": 2, "source": "b.md"}])
+
+    assert cache.invalidate_sources(["a.md"]) == 1
+    assert cache.lookup(vec(1, 0, 0)) is None
+    assert cache.invalidate_document_ids([2]) == 1
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_published_to_other_processes(monkeypatch):
+    from app import clients
+    from app.services import semantic_cache
+
+    notified = []
+
+    class FakePool:
+        async def execute(self, query, channel, payload):
+            notified.append((channel, payload))
+
+    monkeypatch.setattr(clients, "get_db_pool", lambda: FakePool())
+    monkeypatch.setattr(semantic_cache, "NOTIFY_PAYLOAD_MAX_BYTES", 40)
+    await semantic_cache.publish_invalidation([f"documento-{i}.md" for i in range(5)])
+    assert {channel for channel, _ in notified} == {semantic_cache.SEMANTIC_CACHE_CHANNEL}
+    assert len(notified) > 1 and all(len(payload) <= 40 for _, payload in notified) # dividido abaixo do limite
+
+    # Outro worker: recebe as notificações e remove as respostas que usaram essas fontes
+    other = SemanticCache(dim=2)
+    other.store(vec(1, 0), "velha", [{"source": "documento-3.md", "id": 1}])
+    other.store(vec(0, 1), "ok", [{"source": "outro.md", "id": 2}])
+    semantic_cache.set_semantic_cache(other)
+    try:
+        for channel, payload in notified:
+            semantic_cache._on_notify(None, 0, channel, payload)
+        semantic_cache._on_notify(None, 0, semantic_cache.SEMANTIC_CACHE_CHANNEL, "{inválido")
+    finally:
+        semantic_cache.set_semantic_cache(None)
+    assert other.lookup(vec(1, 0)) is None
+    assert other.lookup(vec(0, 1))[0] == "ok"
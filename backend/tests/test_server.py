@@ -0,0 +1,36 @@
+# backend/tests/test_server.py
+import json
+import pytest
+
+from app import server
+
+
+def test_production_config_defaults_to_available_cpus(monkeypatch):
+    monkeypatch.setattr(server, "SERVER_WORKERS", 0)
+    monkeypatch.setattr(server, "available_cpus", lambda: 3)
+    monkeypatch.setattr(server, "SERVER_MAX_REQUESTS", 500)
+    monkeypatch.setattr(server, "SERVER_LIMIT_CONCURRENCY", 0)
+    config = server.build_config()
+    assert config["app"] == "app.main:app"
+    assert config["workers"] == 3
+    assert config["limit_max_requests"] == 500
+    assert config["limit_concurrency"] is None
+    assert config["timeout_graceful_shutdown"] == server.SERVER_GRACEFUL_TIMEOUT_SECONDS
+    assert "reload" not in config
+    assert server.build_config(workers=2, port=9000)["workers"] == 2
+    with pytest.raises(ValueError):
+        server.build_config(workers=-1)
+
+
+def test_reload_mode_is_single_process():
+    config = server.build_config(reload=True)
+    assert config["reload"] is True and "workers" not in config
+
+
+def test_available_cpus_is_positive():
+    assert server.available_cpus() >= 1
+
+
+def test_dry_run_prints_resolved_config(capsys):
+    assert server.main(["--dry-run", "--workers", "4"]) == 0
+    assert json.loads(capsys.readouterr().out)["workers"] == 4
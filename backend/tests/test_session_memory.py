@@ -0,0 +1,137 @@
+# backend/tests/test_session_memory.py
+import threading
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from app.services import context_packer, rag_service, session_memory
+from app.services.context_packer import PackedContext
+from app.services.session_memory import MemorySessionStore, SessionMemory, Turn
+
+MODEL = "modelo-de-teste"
+
+
+class WordEncoding:
+    """Um token por palavra: contas exatas e previsíveis nos testes."""
+    name = "words"
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens():
+    context_packer.set_encoding(MODEL, WordEncoding())
+    yield
+    context_packer._encodings.pop(MODEL, None)
+
+
+def fake_gateway(summaries):
+    """Gateway cujo chat_completion devolve o resumo seguinte da lista e registra as mensagens recebidas."""
+    calls = []
+
+    async def chat_completion(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=summaries[len(calls) - 1]))])
+
+    return SimpleNamespace(chat_completion=chat_completion), calls
+
+
+@pytest.mark.asyncio
+async def test_long_conversation_stays_within_the_token_budget(monkeypatch):
+    gateway, calls = fake_gateway([f"resumo {i}" for i in range(100)])
+    monkeypatch.setattr(session_memory.llm_gateway, "get_llm_gateway", lambda: gateway)
+    memory = SessionMemory(MemorySessionStore(), budget=40, summary_max_tokens=10, turn_max_tokens=20, model=MODEL)
+
+    sizes = []
+    for i in range(30):
+        await memory.record("u1", "s1", f"pergunta {i}", f"resposta número {i} com cinco palavras")
+        await memory.drain()
+        history = await memory.history("u1", "s1")
+        sizes.append(sum(len(m["content"].split()) for m in history.messages()))
+
+    history = await memory.history("u1", "s1")
+    assert history.summary.startswith("resumo") # turnos antigos fundidos no resumo
+    assert history.turns[-1].question == "pergunta 29" # o turno mais recente sempre está lá
+    assert max(sizes[5:]) <= 40 + len("Resumo da conversa até aqui:".split()) # tamanho do prompt não cresce
+    assert memory.compactions == len(calls) and 0 < len(calls) < 30 # compacta em blocos, não a cada turno
+    assert "Novos turnos:" in calls[-1]["messages"][1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_summary_falls_back_to_extractive_text_when_the_llm_fails(monkeypatch):
+    gateway = SimpleNamespace(chat_completion=AsyncMock(side_effect=RuntimeError("fora do ar")))
+    monkeypatch.setattr(session_memory.llm_gateway, "get_llm_gateway", lambda: gateway)
+    memory = SessionMemory(MemorySessionStore(), budget=14, summary_max_tokens=4, model=MODEL)
+    await memory.record("u1", "s1", "primeira pergunta", "primeira resposta com mais palavras") # 7 tokens
+    await memory.record("u1", "s1", "segunda pergunta", "segunda resposta bem mais longa aqui") # 8 tokens: passa de 14
+    await memory.drain()
+    history = await memory.history("u1", "s1")
+    assert history.summary == "Usuário: primeira pergunta [...]" # extrativo, cortado em summary_max_tokens
+    assert [turn.question for turn in history.turns] == ["segunda pergunta"]
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_scoped_by_user_and_evicted_by_lru_and_ttl():
+    now = [0.0]
+    store = MemorySessionStore(max_sessions=2, ttl_seconds=60, timer=lambda: now[0])
+    memory = SessionMemory(store, model=MODEL)
+    await memory.record("u1", "s", "q", "a")
+    assert (await memory.history("u2", "s")).is_empty() # mesmo session_id, outro usuário
+
+    await memory.record("u1", "outra", "q", "a")
+    await memory.history("u1", "s") # "s" passa a ser a mais recente
+    await memory.record("u1", "terceira", "q", "a") # cheio: sai a menos usada ("outra")
+    assert (await memory.history("u1", "outra")).is_empty()
+    assert not (await memory.history("u1", "s")).is_empty()
+
+    now[0] = 61
+    assert (await memory.history("u1", "s")).is_empty() # ociosa por mais que o TTL
+    assert len(store) == 0
+
+
+def test_long_answers_are_truncated_to_the_turn_limit():
+    memory = SessionMemory(MemorySessionStore(), turn_max_tokens=10, model=MODEL)
+    turn = memory.make_turn("qual o prazo?", "palavra " * 50)
+    assert turn.tokens <= 10 and turn.answer.endswith(context_packer.TRUNCATION_MARKER.strip())
+
+
+@pytest.mark.asyncio
+async def test_turns_are_tokenized_off_the_event_loop(monkeypatch):
+    memory = SessionMemory(MemorySessionStore(), model=MODEL)
+    threads = []
+    make_turn = memory.make_turn
+    monkeypatch.setattr(memory, "make_turn", lambda q, a: threads.append(threading.get_ident()) or make_turn(q, a))
+    await memory.record("u1", "s", "pergunta", "resposta")
+    assert threads and threads[0] != threading.get_ident()
+    assert (await memory.history("u1", "s")).turns[0].answer == "resposta"
+
+@pytest.mark.asyncio
+async def test_rag_query_with_session_sends_history_and_records_the_turn(monkeypatch):
+    memory = SessionMemory(MemorySessionStore(), model=MODEL)
+    session_memory.set_session_memory(memory)
+    await memory.store.append("u1", "s1", Turn("O que é o Atlas?", "Um app de IA.", 8))
+    seen = []
+
+    async def fake_query(question, history=None, user_id=None):
+        seen.append(history)
+        return "Custa zero.", []
+
+    monkeypatch.setattr(rag_service, "_query_knowledge_base", fake_query)
+    try:
+        answer, _ = await rag_service.query_knowledge_base("E quanto custa?", user_id="u1", session_id="s1")
+        await rag_service.query_knowledge_base("E quanto custa?") # sem sessão: nada é lido nem gravado
+    finally:
+        session_memory.set_session_memory(None)
+
+    assert answer == "Custa zero."
+    assert [m["content"] for m in seen[0].messages()] == ["O que é o Atlas?", "Um app de IA."]
+    assert seen[1] is None
+    history = await memory.history("u1", "s1")
+    assert [turn.question for turn in history.turns] == ["O que é o Atlas?", "E quanto custa?"]
+
+    messages = rag_service._build_messages("E quanto custa?", PackedContext(text="ctx"), history)
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "assistant", "user"]
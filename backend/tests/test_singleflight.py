@@ -0,0 +1,100 @@
+# backend/tests/test_singleflight.py
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from app.services import feedback_analyzer_service, llm_gateway
+from app.services.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("teste")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "resultado"
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+    assert results == ["resultado"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"inflight": 0, "executions": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    flight = SingleFlight("teste")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("falhou")
+
+    results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.do("k", succeed) == "ok" # Falhas não ficam memorizadas
+
+
+@pytest.mark.asyncio
+async def test_first_caller_cancellation_does_not_fail_the_others():
+    flight = SingleFlight("teste")
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return 42
+
+    first = asyncio.ensure_future(flight.do("k", work))
+    second = asyncio.ensure_future(flight.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    assert await second == 42
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_execution_is_cancelled_when_every_caller_gives_up():
+    flight = SingleFlight("teste")
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    callers = [asyncio.ensure_future(flight.do("k", work)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert not flight.is_inflight("k")
+
+
+@pytest.mark.asyncio
+async def test_duplicate_feedback_requests_make_one_llm_call(monkeypatch):
+    await feedback_analyzer_service.invalidate_feedback_cache()
+    calls = []
+
+    async def fake_create(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        content = '{"sentiment": "Negativo", "summary": "Travou.", "topics": ["app"]}'
+        return MagicMock(usage=None, choices=[MagicMock(message=MagicMock(content=content))])
+
+    client = MagicMock()
+    client.chat.completions.create = fake_create
+    monkeypatch.setattr(llm_gateway, "_gateway", llm_gateway.LLMGateway(client=client))
+
+    results = await asyncio.gather(*(feedback_analyzer_service.analyze_feedback_text("O app  travou") for _ in range(3)))
+    assert len(calls) == 1
+    assert results[0] == results[1] == results[2]
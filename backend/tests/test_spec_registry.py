@@ -0,0 +1,96 @@
+# backend/tests/test_spec_registry.py
+import os
+import asyncio
+import pytest
+
+from app.services.spec_registry import SpecNotFoundError, SpecRegistry, get_spec_registry
+
+PY_SPEC = """
+from pydantic import BaseModel
+
+class ProductSpec(BaseModel):
+    name: str
+    price: float
+"""
+
+RAIL_SPEC = """<rail version="0.1">
+<output>
+    <string name="title" />
+    <list name="tags"><string /></list>
+    <integer name="score" required="false" />
+</output>
+</rail>
+"""
+
+
+def write(path, content, mtime=None):
+    path.write_text(content, encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_discovers_python_and_rail_specs(tmp_path):
+    write(tmp_path / "products.py", PY_SPEC)
+    write(tmp_path / "article.rail", RAIL_SPEC)
+    registry = SpecRegistry(str(tmp_path))
+
+    assert registry.names() == ["ProductSpec", "article"]
+    assert registry.get("ProductSpec").validate({"name": "x", "price": "9.5"}) == {"name": "x", "price": 9.5}
+    rail = registry.get("article.rail")
+    assert rail.kind == "rail"
+    assert rail.validate({"title": "t", "tags": ["a"]}) == {"title": "t", "tags": ["a"], "score": None}
+
+
+def test_unknown_spec_is_rejected_without_rescanning(tmp_path, monkeypatch):
+    write(tmp_path / "products.py", PY_SPEC)
+    registry = SpecRegistry(str(tmp_path), reload_interval_seconds=3600)
+    registry.refresh()
+    monkeypatch.setattr(registry, "_spec_files", lambda: pytest.fail("não deveria acessar o disco"))
+
+    with pytest.raises(SpecNotFoundError):
+        registry.get("NaoExiste")
+    assert registry.get("ProductSpec").name == "ProductSpec"
+
+
+def test_hot_reload_only_recompiles_changed_files(tmp_path):
+    write(tmp_path / "products.py", PY_SPEC, mtime=1_000)
+    write(tmp_path / "article.rail", RAIL_SPEC, mtime=1_000)
+    registry = SpecRegistry(str(tmp_path), reload_interval_seconds=0.0001)
+    first = registry.get("ProductSpec")
+    assert registry.compilations == 2
+
+    registry.refresh()
+    assert registry.compilations == 2 and registry.get("ProductSpec") is first
+
+    write(tmp_path / "products.py", PY_SPEC.replace("ProductSpec", "ItemSpec"), mtime=2_000)
+    registry.refresh()
+    assert registry.compilations == 3
+    assert registry.names() == ["ItemSpec", "article"]
+
+
+@pytest.mark.asyncio
+async def test_background_watch_picks_up_changes_and_get_never_scans(tmp_path, monkeypatch):
+    write(tmp_path / "products.py", PY_SPEC)
+    registry = SpecRegistry(str(tmp_path), reload_interval_seconds=0.01)
+    registry.refresh()
+    scans = []
+    scan = registry._spec_files
+    monkeypatch.setattr(registry, "_spec_files", lambda: scans.append(True) or scan())
+
+    for _ in range(50):
+        assert registry.get("ProductSpec").name == "ProductSpec"
+    assert scans == [] # get() é só uma consulta ao dicionário
+
+    watcher = asyncio.create_task(registry.watch())
+    write(tmp_path / "article.rail", RAIL_SPEC)
+    for _ in range(200):
+        if "article" in registry.names():
+            break
+        await asyncio.sleep(0.01)
+    watcher.cancel()
+    assert registry.names() == ["ProductSpec", "article"]
+
+
+def test_bundled_user_profile_spec():
+    spec = get_spec_registry().get("UserProfileSpec")
+    assert spec.validate(spec.example())["name"] == "Placeholder User"
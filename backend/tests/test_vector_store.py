@@ -0,0 +1,299 @@
+# backend/tests/test_vector_store.py
+import pytest
+import numpy as np
+
+from app.services.ingestion_service import Chunk, chunk_content_hash
+from app.services.vector_store import LocalVectorStore
+
+pytestmark = pytest.mark.asyncio
+
+DIM = 8
+
+
+def make_chunks(texts, source="doc.md"):
+    return [Chunk(content=t, metadata={"source": source, "chunk": i}, content_hash=chunk_content_hash(source, t)) for i, t in enumerate(texts)]
+
+
+def unit(index):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[index] = 1.0
+    return vector
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+async def test_append_search_and_reload_snapshot(tmp_path, dtype):
+    store = LocalVectorStore(str(tmp_path), DIM, dtype)
+    await store.startup()
+    assert not store.is_ready()
+
+    assert await store.write(make_chunks(["zero", "um", "dois"]), np.stack([unit(0), unit(1), unit(2)])) == 3
+    results = await store.search(unit(1), k=2)
+    assert results[0].content == "um"
+    assert results[0].similarity == pytest.approx(1.0, abs=1e-3)
+    await store.shutdown()
+
+    reloaded = LocalVectorStore(str(tmp_path), DIM, dtype)
+    await reloaded.startup()
+    assert reloaded.live_count == 3
+    assert (await reloaded.search(unit(2), k=1))[0].content == "dois"
+    await reloaded.shutdown()
+
+
+async def test_appends_after_last_snapshot_are_recovered_on_load(tmp_path):
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    await store.write(make_chunks(["zero"]), np.stack([unit(0)]))
+    await store.flush()
+    await store.write(make_chunks(["três"], source="outro.md"), np.stack([unit(3)]))
+    # Simula queda: nenhum snapshot após o segundo append
+    store._writer.flush()
+
+    recovered = LocalVectorStore(str(tmp_path), DIM)
+    await recovered.startup()
+    assert recovered.live_count == 2
+    assert (await recovered.search(unit(3), k=1))[0].content == "três"
+    await recovered.shutdown()
+
+
+async def test_prune_and_metadata_filter(tmp_path):
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    await store.write(make_chunks(["a", "b"], source="x.md"), np.stack([unit(0), unit(1)]))
+    await store.write(make_chunks(["c"], source="y.md"), np.stack([unit(0) + unit(1)]))
+
+    filtered = await store.search(unit(0), k=3, filter_metadata={"source": "y.md"})
+    assert [r.content for r in filtered] == ["c"]
+
+    keep = {chunk_content_hash("x.md", "a")}
+    assert await store.prune("x.md", keep) == 1
+    assert await store.existing_hashes([chunk_content_hash("x.md", "b")]) == set()
+    assert [r.content for r in await store.search(unit(0), k=3)] == ["a", "c"]
+    await store.shutdown()
+
+    reloaded = LocalVectorStore(str(tmp_path), DIM)
+    await reloaded.startup()
+    assert reloaded.live_count == 2
+    await reloaded.shutdown()
+
+
+async def test_searches_wait_for_writes_and_run_alongside_appends(tmp_path):
+    import asyncio
+    import threading
+
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    await store.write(make_chunks(["zero"]), np.stack([unit(0)]))
+
+    # Escrita em andamento (ex: resize/save do grafo em outra thread): a busca espera, sem bloquear o loop
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_write_lock():
+        with store._rw.write():
+            locked.set()
+            release.wait()
+
+    holder = asyncio.get_running_loop().run_in_executor(None, hold_write_lock)
+    await asyncio.to_thread(locked.wait)
+    search = asyncio.ensure_future(store.search(unit(0), k=1))
+    await asyncio.sleep(0.05)
+    assert not search.done()
+    release.set()
+    await holder
+    assert (await search)[0].content == "zero"
+
+    # Appends (com resize do grafo) e remoções concorrentes com muitas buscas
+    async def writes():
+        for i in range(20):
+            await store.write(make_chunks([f"doc {i}"], source=f"s{i}.md"), np.stack([unit(i % DIM) + 0.01 * unit((i + 1) % DIM)]))
+            if i % 5 == 4:
+                await store.prune(f"s{i - 1}.md", set())
+
+    results = await asyncio.gather(writes(), *(store.search(unit(i % DIM), k=3) for i in range(50)))
+    assert all(isinstance(found, list) for found in results[1:])
+    assert store.live_count == 21 - 4
+    await store.shutdown()
+
+
+async def test_pgvector_search_sends_the_filter_as_a_dict(monkeypatch):
+    from app import clients
+    from app.services.vector_store import PgVectorStore
+
+    calls = []
+
+    class FakePool:
+        async def fetch(self, query, *args):
+            calls.append(args)
+            return []
+
+    monkeypatch.setattr(clients, "get_db_pool", lambda: FakePool())
+    await PgVectorStore().search(unit(0), k=3, filter_metadata={"source": "a.md"})
+    await PgVectorStore().search(unit(0), k=3)
+    # Uma string já serializada viraria um jsonb string no codec do pool e `@>` nunca casaria
+    assert calls[0][3] == {"source": "a.md"} and calls[1][3] == {}
+
+
+async def test_local_vector_store_uses_the_resolved_local_embedding_dim(tmp_path, monkeypatch):
+    from app.services import embedding_service, vector_store
+    from app.services.embedding_service import EmbeddingBackend, EmbeddingEngine, set_embedding_engine
+
+    class NativeDimBackend(EmbeddingBackend):
+        name, model, dim = "local", "fake-minilm", 384 # EMBEDDING_DIM=0: dimensão nativa do modelo
+
+        async def embed_batch(self, texts):
+            return np.stack([np.eye(384, dtype=np.float32)[len(t) % 384] for t in texts])
+
+    monkeypatch.setattr(embedding_service, "EMBEDDING_DIM", 0)
+    monkeypatch.setattr(vector_store, "VECTOR_BACKEND", "local")
+    monkeypatch.setattr(vector_store, "VECTOR_LOCAL_DIR", str(tmp_path))
+    engine = EmbeddingEngine(NativeDimBackend(), max_wait_ms=0)
+    set_embedding_engine(engine)
+    vector_store.set_vector_store(None)
+    try:
+        store = vector_store.get_vector_store()
+        assert store.dim == 384
+        await store.startup()
+        texts = ["um", "dois"]
+        assert await store.write(make_chunks(texts), await engine.embed_many(texts)) == 2
+        results = await store.search(await engine.embed("um"), k=1)
+        assert [r.content for r in results] == ["um"]
+        await store.shutdown()
+    finally:
+        vector_store.set_vector_store(None)
+        set_embedding_engine(None)
+    with pytest.raises(ValueError):
+        LocalVectorStore(str(tmp_path), 0)
+
+
+async def test_rag_query_uses_the_local_backend_when_ready(tmp_path, monkeypatch):
+    from app.services import rag_service, vector_store
+    from app.services.embedding_service import EmbeddingBackend, EmbeddingEngine, set_embedding_engine
+
+    class OneHotBackend(EmbeddingBackend):
+        name, model, dim = "fake", "fake", DIM
+
+        async def embed_batch(self, texts):
+            return np.stack([unit(len(t) % DIM) for t in texts])
+
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    await store.write(make_chunks(["Supabase usa Postgres."]), np.stack([unit(len("pergunta?") % DIM)]))
+    vector_store.set_vector_store(store)
+    set_embedding_engine(EmbeddingEngine(OneHotBackend(), max_wait_ms=0))
+
+    async def fake_generate(question, packed, history=None):
+        return f"Resposta com {len(packed.chunks)} fonte(s)"
+
+    monkeypatch.setattr(rag_service, "_generate_answer", fake_generate)
+    try:
+        answer, sources = await rag_service.query_knowledge_base("pergunta?")
+    finally:
+        vector_store.set_vector_store(None)
+        set_embedding_engine(None)
+        await store.shutdown()
+
+    assert answer == "Resposta com 1 fonte(s)"
+    assert sources[0]["source"] == "doc.md"
+    assert sources[0]["tokens"] > 0
+
+
+async def test_pgvector_quantized_search_uses_the_two_stage_function(monkeypatch):
+    from app import clients
+    from app.services.vector_store import PgVectorStore
+
+    calls = []
+
+    class FakePool:
+        async def fetch(self, query, *args):
+            calls.append((query, args))
+            return [{"id": 7, "content": "c", "metadata": {"source": "a.md"}, "similarity": 0.9}]
+
+    monkeypatch.setattr(clients, "get_db_pool", lambda: FakePool())
+    await PgVectorStore().search(unit(0), k=5, filter_metadata={"source": "a.md"})
+    results = await PgVectorStore(quantization="binary", candidate_factor=500).search(unit(0), k=5)
+
+    assert "match_documents($1::vector" in calls[0][0] and len(calls[0][1]) == 4
+    assert calls[0][1][3] == {"source": "a.md"} # dict: o codec jsonb do pool serializa
+    assert "match_documents_quantized(" in calls[1][0]
+    assert calls[1][1][4:] == (1000, "binary") # candidatos limitados ao máximo do hnsw.ef_search
+    assert results[0].id == 7
+    with pytest.raises(ValueError):
+        PgVectorStore(quantization="int4")
+
+
+async def test_private_documents_are_visible_only_to_their_owner(tmp_path):
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    private = [Chunk(content="nota da ana", metadata={"source": "items/1", "user_id": "ana"}, content_hash="h1")]
+    await store.write(private, np.stack([unit(0)]))
+    await store.write(make_chunks(["manual"]), np.stack([unit(0) + unit(1)]))
+
+    assert [r.content for r in await store.search(unit(0), k=2)] == ["manual"]
+    assert [r.content for r in await store.search(unit(0), k=2, filter_metadata={"user_id": "bia"})] == ["manual"]
+    owner = await store.search(unit(0), k=2, filter_metadata={"user_id": "ana"})
+    assert [r.content for r in owner] == ["nota da ana", "manual"]
+    await store.shutdown()
+
+
+async def test_filtered_search_widens_until_k_results_survive(tmp_path):
+    from datetime import datetime, timedelta, timezone
+    from app.services.vector_store import SearchFilter
+
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    # 30 documentos compartilhados perto da pergunta e, mais longe, os únicos que passam no filtro
+    await store.write(make_chunks([f"perto {i}" for i in range(30)]), np.stack([unit(0) + 0.01 * i * unit(2) for i in range(30)]))
+    tagged = [
+        Chunk(content=f"nota {i}", metadata={"source": "items/1", "user_id": "ana", "tags": ["casa"] if i else ["trabalho"]}, content_hash=f"n{i}")
+        for i in range(3)
+    ]
+    await store.write(tagged, np.stack([unit(0) + unit(1) + 0.1 * i * unit(3) for i in range(3)]))
+
+    owner_only = await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(user_id="ana", owner_only=True))
+    assert [r.content for r in owner_only] == ["nota 0", "nota 1", "nota 2"] # fora dos 3 * overfetch primeiros vizinhos
+    by_tag = await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(user_id="ana", tags=("casa",)))
+    assert [r.content for r in by_tag] == ["nota 1", "nota 2"] # sem documentos suficientes: cobre o índice inteiro
+    assert await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(user_id="bia", owner_only=True)) == []
+    assert len(await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(sources=("doc.md",)))) == 3
+
+    now = datetime.now(timezone.utc)
+    assert len(await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(created_after=now - timedelta(minutes=1)))) == 3
+    assert await store.search_filtered(unit(0), k=3, search_filter=SearchFilter(created_before=now - timedelta(minutes=1))) == []
+    await store.shutdown()
+
+
+async def test_filtered_search_stops_widening_after_max_rounds(tmp_path, monkeypatch):
+    from app.services import vector_store
+    from app.services.vector_store import SearchFilter
+
+    store = LocalVectorStore(str(tmp_path), DIM)
+    await store.startup()
+    await store.write(make_chunks([f"perto {i}" for i in range(30)]), np.stack([unit(0) + 0.01 * i * unit(2) for i in range(30)]))
+    await store.write([Chunk(content="nota", metadata={"source": "items/1", "user_id": "ana"}, content_hash="n")], np.stack([unit(0) + unit(1)]))
+    owner_only = SearchFilter(user_id="ana", owner_only=True)
+
+    monkeypatch.setattr(vector_store, "VECTOR_FILTER_MAX_ROUNDS", 2)
+    assert await store.search_filtered(unit(0), k=1, search_filter=owner_only) == [] # 4 e 8 vizinhos: a nota está mais longe
+
+    monkeypatch.setattr(vector_store, "VECTOR_FILTER_MAX_ROUNDS", 10)
+    assert [r.content for r in await store.search_filtered(unit(0), k=1, search_filter=owner_only)] == ["nota"]
+    await store.shutdown()
+
+
+async def test_pgvector_filtered_search_calls_match_documents_filtered(monkeypatch):
+    from app import clients
+    from app.services.vector_store import PgVectorStore, SearchFilter
+
+    calls = []
+
+    class FakePool:
+        async def fetch(self, query, *args):
+            calls.append((query, args))
+            return []
+
+    monkeypatch.setattr(clients, "get_db_pool", lambda: FakePool())
+    await PgVectorStore().search_filtered(unit(0), 5, SearchFilter(user_id="ana", tags=("casa",), metadata={"kind": "item"}))
+    await PgVectorStore(quantization="halfvec", candidate_factor=4).search_filtered(unit(0), 5, SearchFilter(owner_only=True))
+
+    assert "match_documents_filtered($1::vector" in calls[0][0]
+    assert calls[0][1][3:] == ({"kind": "item", "user_id": "ana"}, None, ["casa"], None, None, False, "none", 5, 1000)
+    assert calls[1][1][3] == {} and calls[1][1][8:11] == (True, "halfvec", 20)
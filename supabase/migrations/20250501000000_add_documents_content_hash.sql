@@ -0,0 +1,15 @@
+-- Ingestão incremental do RAG: hash de conteúdo por chunk em public.documents.
+
+-- sha256 hex de (fonte || '\n' || conteúdo), calculado pelo backend (app/services/ingestion_service.py).
+-- Permite pular chunks já indexados e fazer COPY em massa com ON CONFLICT DO NOTHING.
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+COMMENT ON COLUMN public.documents.content_hash IS 'sha256 (hex) of metadata source + newline + content; used for incremental ingestion.';
+
+-- Preenche o hash das linhas existentes com a mesma fórmula usada pelo backend.
+UPDATE public.documents
+SET content_hash = encode(sha256(convert_to(coalesce(metadata->>'source', '') || E'\n' || content, 'UTF8')), 'hex')
+WHERE content_hash IS NULL;
+
+-- Índice único: acelera a checagem "já indexado?" e garante idempotência das re-execuções.
+CREATE UNIQUE INDEX IF NOT EXISTS documents_content_hash_idx ON public.documents (content_hash);
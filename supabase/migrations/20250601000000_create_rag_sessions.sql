@@ -0,0 +1,24 @@
+-- Memória de conversa do RAG por sessão (RAG_SESSION_BACKEND=postgres).
+
+-- Uma linha por (usuário, session_id): resumo acumulado + turnos recentes, mantidos dentro de um
+-- orçamento de tokens pelo backend (app/services/session_memory.py). Compartilhada entre workers.
+CREATE TABLE IF NOT EXISTS public.rag_sessions (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_tokens INTEGER NOT NULL DEFAULT 0,
+    turns JSONB NOT NULL DEFAULT '[]'::jsonb, -- [{"question", "answer", "tokens"}], do mais antigo ao mais novo
+    compactions INTEGER NOT NULL DEFAULT 0, -- versão do resumo (compactação otimista)
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, session_id)
+);
+
+COMMENT ON TABLE public.rag_sessions IS 'Bounded RAG conversation memory per user session (rolling summary + recent turns).';
+
+-- Limpeza periódica de sessões ociosas (DELETE ... WHERE updated_at < now() - ttl).
+CREATE INDEX IF NOT EXISTS rag_sessions_updated_at_idx ON public.rag_sessions (updated_at);
+
+-- Acessada só pelo backend (conexão direta); nenhum acesso pela API pública do Supabase.
+ALTER TABLE public.rag_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.rag_sessions FORCE ROW LEVEL SECURITY;
+CREATE POLICY "Allow service_role to manage rag sessions" ON public.rag_sessions FOR ALL USING (auth.role() = 'service_role');
@@ -0,0 +1,83 @@
+-- Busca vetorial quantizada em duas etapas sobre public.documents (VECTOR_PG_QUANTIZATION no backend).
+-- Requer pgvector >= 0.7.0 (tipos halfvec/bit e binary_quantize).
+
+-- Os índices são de expressão sobre a coluna `embedding` existente: nenhuma coluna nova, a ingestão
+-- (COPY de vector(1536)) não muda e os vetores completos continuam disponíveis para o rescoring exato.
+--
+-- Tamanho aproximado por vetor de 1536 dimensões no grafo HNSW (sem contar os vizinhos):
+--   vector(1536)  float32  6144 bytes  (documents_embedding_hnsw_idx, atual)
+--   halfvec(1536) float16  3072 bytes  (metade; recall praticamente igual)
+--   bit(1536)     1 bit     192 bytes  (32x menor; precisa de mais candidatos no rescoring)
+-- pgvector não tem um tipo int8; halfvec e bit são as representações compactas indexáveis.
+
+-- Índices (CONCURRENTLY não roda dentro da transação da migration; em tabelas grandes, crie-os
+-- manualmente com CREATE INDEX CONCURRENTLY e maintenance_work_mem alto para acelerar o build).
+CREATE INDEX IF NOT EXISTS documents_embedding_halfvec_hnsw_idx
+  ON public.documents USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops);
+CREATE INDEX IF NOT EXISTS documents_embedding_binary_hnsw_idx
+  ON public.documents USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops);
+
+-- Depois de validar recall/latência com `python -m benchmarks.quantization` e passar o backend para
+-- VECTOR_PG_QUANTIZATION=halfvec|binary, o índice float32 (e um dos quantizados) pode ser removido
+-- para liberar memória: match_documents continua funcionando, com varredura sequencial.
+-- DROP INDEX IF EXISTS documents_embedding_hnsw_idx;
+
+----------------------------------------
+-- Função de busca em duas etapas
+----------------------------------------
+-- 1. Candidatos: os `candidate_count` vizinhos mais próximos na representação quantizada
+--    (a expressão do ORDER BY é idêntica à do índice, então ele é usado).
+-- 2. Rescoring: similaridade de cosseno exata com os vetores completos dos candidatos, limiar e top `match_count`.
+-- `candidate_count` controla recall x latência; hnsw.ef_search é ajustado para que o índice entregue todos os candidatos.
+CREATE OR REPLACE FUNCTION match_documents_quantized (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  filter_metadata jsonb DEFAULT '{}'::jsonb,
+  candidate_count int DEFAULT 100,
+  quantization text DEFAULT 'halfvec' -- 'halfvec' ou 'binary'
+)
+RETURNS TABLE (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql VOLATILE -- VOLATILE: ajusta hnsw.ef_search (set_config local à transação)
+AS $$
+#variable_conflict use_column
+BEGIN
+  PERFORM set_config('hnsw.ef_search', least(greatest(candidate_count, 40), 1000)::text, true);
+  IF quantization = 'halfvec' THEN
+    RETURN QUERY
+    SELECT c.id, c.content, c.metadata, 1 - (c.embedding <=> query_embedding) AS similarity
+    FROM (
+      SELECT d.id, d.content, d.metadata, d.embedding
+      FROM public.documents d
+      WHERE d.metadata @> filter_metadata
+      ORDER BY d.embedding::halfvec(1536) <=> query_embedding::halfvec(1536)
+      LIMIT candidate_count
+    ) c
+    WHERE 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+  ELSIF quantization = 'binary' THEN
+    RETURN QUERY
+    SELECT c.id, c.content, c.metadata, 1 - (c.embedding <=> query_embedding) AS similarity
+    FROM (
+      SELECT d.id, d.content, d.metadata, d.embedding
+      FROM public.documents d
+      WHERE d.metadata @> filter_metadata
+      ORDER BY binary_quantize(d.embedding)::bit(1536) <~> binary_quantize(query_embedding)::bit(1536)
+      LIMIT candidate_count
+    ) c
+    WHERE 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+  ELSE
+    RAISE EXCEPTION 'quantization desconhecida: % (use halfvec ou binary)', quantization;
+  END IF;
+END;
+$$;
+
+COMMENT ON FUNCTION match_documents_quantized IS 'Two-stage vector search: quantized HNSW candidate scan (halfvec or binary) followed by exact cosine rescoring.';
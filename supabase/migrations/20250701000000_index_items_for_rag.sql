@@ -0,0 +1,130 @@
+-- Indexação contínua de public.items no RAG (app/services/items_indexer.py).
+
+----------------------------------------
+-- Notificações de alteração em public.items
+----------------------------------------
+-- O payload leva só o id e a operação (limite de 8000 bytes do NOTIFY); o worker relê o item.
+-- NOTIFY é transacional: só é entregue no COMMIT e é descartado em ROLLBACK.
+CREATE OR REPLACE FUNCTION public.notify_items_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM pg_notify(
+    'items_changed', -- ITEMS_INDEX_CHANNEL no backend
+    json_build_object('id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END, 'op', TG_OP)::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS items_changed_insert_delete ON public.items;
+CREATE TRIGGER items_changed_insert_delete
+  AFTER INSERT OR DELETE ON public.items
+  FOR EACH ROW EXECUTE FUNCTION public.notify_items_changed();
+
+-- Updates que não mudam o texto indexado nem o dono (ex: is_complete) não geram notificação.
+DROP TRIGGER IF EXISTS items_changed_update ON public.items;
+CREATE TRIGGER items_changed_update
+  AFTER UPDATE OF title, description, user_id ON public.items
+  FOR EACH ROW
+  WHEN (OLD.title IS DISTINCT FROM NEW.title OR OLD.description IS DISTINCT FROM NEW.description OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+  EXECUTE FUNCTION public.notify_items_changed();
+
+----------------------------------------
+-- Chunks de itens em public.documents
+----------------------------------------
+-- metadata: {"source": "items/<id>", "kind": "item", "item_id", "user_id", "item_hash", "title", "chunk"}.
+-- Índice parcial: substituir/remover os chunks de um item e a reconciliação não varrem a tabela inteira.
+CREATE INDEX IF NOT EXISTS documents_item_id_idx ON public.documents ((metadata->>'item_id')) WHERE metadata ? 'item_id';
+
+-- Documentos com metadata.user_id são privados do dono, também pela API do Supabase.
+DROP POLICY IF EXISTS "Allow authenticated users to read documents" ON public.documents;
+CREATE POLICY "Allow authenticated users to read documents" ON public.documents FOR SELECT
+  USING (auth.role() = 'authenticated' AND (NOT (metadata ? 'user_id') OR metadata->>'user_id' = auth.uid()::text));
+
+----------------------------------------
+-- Visibilidade na busca vetorial
+----------------------------------------
+-- A chave user_id do filtro não restringe aos documentos do usuário: define quem está buscando.
+-- Documentos compartilhados (sem user_id) aparecem sempre; privados, só para o dono. Sem user_id no
+-- filtro, nenhum documento privado é retornado. As demais chaves continuam com `@>`.
+CREATE OR REPLACE FUNCTION match_documents (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  filter_metadata jsonb DEFAULT '{}'::jsonb
+)
+RETURNS TABLE (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE sql STABLE PARALLEL SAFE
+AS $$
+  SELECT
+    documents.id,
+    documents.content,
+    documents.metadata,
+    1 - (documents.embedding <=> query_embedding) AS similarity
+  FROM documents
+  WHERE metadata @> (filter_metadata - 'user_id')
+    AND (NOT (metadata ? 'user_id') OR metadata->'user_id' = filter_metadata->'user_id')
+    AND 1 - (documents.embedding <=> query_embedding) > match_threshold
+  ORDER BY similarity DESC
+  LIMIT match_count;
+$$;
+
+CREATE OR REPLACE FUNCTION match_documents_quantized (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  filter_metadata jsonb DEFAULT '{}'::jsonb,
+  candidate_count int DEFAULT 100,
+  quantization text DEFAULT 'halfvec'
+)
+RETURNS TABLE (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql VOLATILE
+AS $$
+#variable_conflict use_column
+BEGIN
+  PERFORM set_config('hnsw.ef_search', least(greatest(candidate_count, 40), 1000)::text, true);
+  IF quantization = 'halfvec' THEN
+    RETURN QUERY
+    SELECT c.id, c.content, c.metadata, 1 - (c.embedding <=> query_embedding) AS similarity
+    FROM (
+      SELECT d.id, d.content, d.metadata, d.embedding
+      FROM public.documents d
+      WHERE d.metadata @> (filter_metadata - 'user_id')
+        AND (NOT (d.metadata ? 'user_id') OR d.metadata->'user_id' = filter_metadata->'user_id')
+      ORDER BY d.embedding::halfvec(1536) <=> query_embedding::halfvec(1536)
+      LIMIT candidate_count
+    ) c
+    WHERE 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+  ELSIF quantization = 'binary' THEN
+    RETURN QUERY
+    SELECT c.id, c.content, c.metadata, 1 - (c.embedding <=> query_embedding) AS similarity
+    FROM (
+      SELECT d.id, d.content, d.metadata, d.embedding
+      FROM public.documents d
+      WHERE d.metadata @> (filter_metadata - 'user_id')
+        AND (NOT (d.metadata ? 'user_id') OR d.metadata->'user_id' = filter_metadata->'user_id')
+      ORDER BY binary_quantize(d.embedding)::bit(1536) <~> binary_quantize(query_embedding)::bit(1536)
+      LIMIT candidate_count
+    ) c
+    WHERE 1 - (c.embedding <=> query_embedding) > match_threshold
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count;
+  ELSE
+    RAISE EXCEPTION 'quantization desconhecida: % (use halfvec ou binary)', quantization;
+  END IF;
+END;
+$$;
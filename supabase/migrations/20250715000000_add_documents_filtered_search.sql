@@ -0,0 +1,160 @@
+-- Busca vetorial por tenant com filtros aplicados dentro da varredura do índice (VectorStore.search_filtered).
+--
+-- Com `WHERE ... ORDER BY embedding <=> q LIMIT k`, o índice HNSW entrega só hnsw.ef_search vizinhos e o
+-- filtro é aplicado sobre eles: um filtro seletivo (um usuário, uma fonte) devolve menos de k linhas.
+-- match_documents_filtered separa a busca em duas partes, cada uma com o índice mais adequado:
+--   - compartilhados (sem metadata.user_id): HNSW global, filtros aplicados na própria varredura;
+--   - privados do usuário: índice por dono abaixo (exato e barato para tenants pequenos) ou, para
+--     tenants grandes, um HNSW parcial só com os documentos deles (create_tenant_vector_index).
+-- Se o resultado tiver menos de k linhas, a busca é refeita com hnsw.ef_search dobrado (ampliação
+-- iterativa) até `max_ef_search`. Com pgvector >= 0.8 o próprio índice continua a varredura
+-- (hnsw.iterative_scan) e a primeira rodada já basta.
+
+-- Documentos privados por dono (parte "privados" da busca e limpeza por usuário).
+CREATE INDEX IF NOT EXISTS documents_owner_idx ON public.documents ((metadata->>'user_id')) WHERE metadata ? 'user_id';
+
+----------------------------------------
+-- Função de busca filtrada
+----------------------------------------
+-- filter_metadata: como em match_documents (user_id = quem busca; demais chaves com `@>`).
+-- sources/tags: qualquer um dos valores (metadata.source / metadata.tags). created_after/before: created_at em [after, before).
+-- owner_only: só os documentos privados do usuário. quantization/candidate_count: como em match_documents_quantized.
+CREATE OR REPLACE FUNCTION match_documents_filtered (
+  query_embedding vector(1536),
+  match_threshold float,
+  match_count int,
+  filter_metadata jsonb DEFAULT '{}'::jsonb,
+  sources text[] DEFAULT NULL,
+  tags text[] DEFAULT NULL,
+  created_after timestamptz DEFAULT NULL,
+  created_before timestamptz DEFAULT NULL,
+  owner_only boolean DEFAULT false,
+  quantization text DEFAULT 'none', -- 'none', 'halfvec' ou 'binary'
+  candidate_count int DEFAULT 0,
+  max_ef_search int DEFAULT 1000
+)
+RETURNS TABLE (
+  id bigint,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql VOLATILE -- VOLATILE: ajusta hnsw.ef_search (set_config local à transação)
+AS $$
+#variable_conflict use_column
+DECLARE
+  owner text := filter_metadata->>'user_id';
+  order_expr text;
+  filters text;
+  branches text[] := '{}';
+  branch_limit int := greatest(match_count, candidate_count);
+  ef int;
+  ids bigint[];
+BEGIN
+  IF match_count <= 0 THEN
+    RETURN;
+  END IF;
+  -- Mesmas expressões dos índices HNSW (senão o índice não é usado)
+  order_expr := CASE quantization
+    WHEN 'none' THEN 'd.embedding <=> $1'
+    WHEN 'halfvec' THEN 'd.embedding::halfvec(1536) <=> $1::halfvec(1536)'
+    WHEN 'binary' THEN 'binary_quantize(d.embedding)::bit(1536) <~> binary_quantize($1)::bit(1536)'
+  END;
+  IF order_expr IS NULL THEN
+    RAISE EXCEPTION 'quantization desconhecida: % (use none, halfvec ou binary)', quantization;
+  END IF;
+
+  -- Valores como literais (%L): cada execução é planejada com eles, o que permite usar os índices parciais por tenant
+  filters := format('d.metadata @> %L::jsonb', filter_metadata - 'user_id');
+  IF sources IS NOT NULL THEN
+    filters := filters || format(' AND d.metadata->>''source'' = ANY (%L::text[])', sources);
+  END IF;
+  IF tags IS NOT NULL THEN
+    filters := filters || format(' AND d.metadata->''tags'' ?| %L::text[]', tags);
+  END IF;
+  IF created_after IS NOT NULL THEN
+    filters := filters || format(' AND d.created_at >= %L::timestamptz', created_after);
+  END IF;
+  IF created_before IS NOT NULL THEN
+    filters := filters || format(' AND d.created_at < %L::timestamptz', created_before);
+  END IF;
+
+  IF NOT owner_only THEN
+    branches := branches || format(
+      '(SELECT d.id, d.embedding <=> $1 AS distance FROM public.documents d'
+      ' WHERE NOT (d.metadata ? ''user_id'') AND %s ORDER BY %s LIMIT %s)',
+      filters, order_expr, branch_limit
+    );
+  END IF;
+  IF owner IS NOT NULL THEN
+    branches := branches || format(
+      '(SELECT d.id, d.embedding <=> $1 AS distance FROM public.documents d'
+      ' WHERE d.metadata ? ''user_id'' AND d.metadata->>''user_id'' = %L AND %s ORDER BY %s LIMIT %s)',
+      owner, filters, order_expr, branch_limit
+    );
+  END IF;
+  IF cardinality(branches) = 0 THEN
+    RETURN; -- owner_only sem usuário
+  END IF;
+
+  IF (SELECT string_to_array(extversion, '.')::int[] >= '{0,8,0}' FROM pg_extension WHERE extname = 'vector') THEN
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true); -- a ordem exata é refeita abaixo
+  END IF;
+  ef := least(greatest(branch_limit * 2, 40), max_ef_search);
+  LOOP
+    PERFORM set_config('hnsw.ef_search', ef::text, true);
+    -- Candidatos das partes reordenados pela distância exata; só os ids (o conteúdo é lido uma vez no fim)
+    EXECUTE format(
+      'SELECT array_agg(c.id ORDER BY c.distance) FROM (SELECT u.id, u.distance FROM (%s) u ORDER BY u.distance LIMIT %s) c',
+      array_to_string(branches, ' UNION ALL '), match_count
+    ) INTO ids USING query_embedding;
+    EXIT WHEN coalesce(cardinality(ids), 0) >= match_count OR ef >= max_ef_search;
+    ef := least(ef * 2, max_ef_search);
+  END LOOP;
+
+  RETURN QUERY
+  SELECT d.id, d.content, d.metadata, 1 - (d.embedding <=> query_embedding) AS similarity
+  FROM public.documents d
+  WHERE d.id = ANY (coalesce(ids, '{}'::bigint[]))
+    AND 1 - (d.embedding <=> query_embedding) > match_threshold
+  ORDER BY d.embedding <=> query_embedding;
+END;
+$$;
+
+COMMENT ON FUNCTION match_documents_filtered IS 'Tenant-scoped vector search: metadata/source/tag/date filters applied inside the ANN scan, widening hnsw.ef_search until match_count rows survive.';
+
+----------------------------------------
+-- Índices HNSW parciais para tenants grandes (opcional)
+----------------------------------------
+-- Um usuário com muitos documentos privados ganha um grafo só dele: a parte "privados" da busca deixa de
+-- ordenar todas as linhas do usuário e passa a ser uma varredura HNSW. Uso (service_role):
+--   SELECT public.create_tenant_vector_index('<uuid do usuário>');
+-- Em tabelas grandes, prefira rodar o CREATE INDEX CONCURRENTLY gerado por esta função manualmente.
+CREATE OR REPLACE FUNCTION public.create_tenant_vector_index(tenant_id uuid)
+RETURNS text
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  index_name text := 'documents_tenant_' || replace(tenant_id::text, '-', '') || '_hnsw_idx';
+BEGIN
+  -- O predicado é o mesmo da parte "privados" de match_documents_filtered, para o planner poder usá-lo
+  EXECUTE format(
+    'CREATE INDEX IF NOT EXISTS %I ON public.documents USING hnsw (embedding vector_cosine_ops)'
+    ' WHERE metadata ? ''user_id'' AND metadata->>''user_id'' = %L',
+    index_name, tenant_id::text
+  );
+  RETURN index_name;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.drop_tenant_vector_index(tenant_id uuid)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  EXECUTE format('DROP INDEX IF EXISTS public.%I', 'documents_tenant_' || replace(tenant_id::text, '-', '') || '_hnsw_idx');
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.create_tenant_vector_index(uuid) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.drop_tenant_vector_index(uuid) FROM PUBLIC, anon, authenticated;